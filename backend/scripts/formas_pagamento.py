@@ -35,8 +35,15 @@ from typing import Dict, List, Optional, Any
 
 import pandas as pd
 import requests
-from lxml import etree
-from requests.auth import HTTPBasicAuth
+
+from microvix_checkpoint import paginar_incremental
+from microvix_client import (
+    MicrovixErro,
+    executar_por_cnpj,
+    post_microvix,
+    resposta_para_dataframe,
+)
+from microvix_janelas import baixar_em_janelas, carregar_histograma, planejar_janelas
 
 # ============================================================
 # ✅ CONFIGURAÇÃO DE URL AUTOMÁTICA (HÍBRIDA)
@@ -217,16 +224,7 @@ else:
 # ===========================================
 # 🔐 CONFIGURAÇÕES API
 # ===========================================
-USUARIO = "linx_export"
-SENHA = "linx_export"
-CHAVE = "2618f2b2-8f1d-4502-8321-342dc2cd1470"
-URL = "https://webapi.microvix.com.br/1.0/api/integracao"
-
-HEADERS = {
-    "Content-Type": "application/xml; charset=utf-8",
-    "Accept": "application/xml"
-}
-AUTH = HTTPBasicAuth(USUARIO, SENHA)
+# Credenciais, URL e sessão HTTP da Microvix ficam em microvix_client.py.
 
 # ===========================================
 # 📁 CAMINHOS
@@ -328,39 +326,13 @@ def safe_datetime(series: pd.Series) -> pd.Series:
     return pd.to_datetime(series, errors="coerce")
 
 
-def montar_xml(cnpj: str, metodo: str, parametros: Optional[Dict[str, str]] = None):
-    if parametros is None:
-        parametros = {}
-
-    params = f"""
-        <Parameter id="chave">{CHAVE}</Parameter>
-        <Parameter id="cnpjEmp">{cnpj}</Parameter>
-    """
-    for k, v in parametros.items():
-        params += f'<Parameter id="{k}">{v}</Parameter>'
-
-    return f"""<?xml version="1.0" encoding="utf-8"?>
-<LinxMicrovix>
-  <Authentication user="{USUARIO}" password="{SENHA}" />
-  <ResponseFormat>xml</ResponseFormat>
-  <Command>
-    <Name>{metodo}</Name>
-    <Parameters>{params}</Parameters>
-  </Command>
-</LinxMicrovix>"""
+def montar_parametros(cnpj: str, parametros: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    return {"cnpjEmp": cnpj, **(parametros or {})}
 
 
 def chamar_api(cnpj: str, metodo: str, parametros: Optional[Dict[str, str]] = None, timeout=180) -> pd.DataFrame:
-    xml = montar_xml(cnpj, metodo, parametros)
-
     try:
-        r = requests.post(
-            URL,
-            data=xml.encode("utf-8"),
-            headers=HEADERS,
-            auth=AUTH,
-            timeout=timeout
-        )
+        r = post_microvix(metodo, montar_parametros(cnpj, parametros), timeout=timeout)
 
         if r.status_code != 200:
             logger.warning(
@@ -369,36 +341,21 @@ def chamar_api(cnpj: str, metodo: str, parametros: Optional[Dict[str, str]] = No
             )
             return pd.DataFrame()
 
-        content = r.content
-        if content.startswith(b"\xef\xbb\xbf"):
-            content = content.lstrip(b"\xef\xbb\xbf")
-
         try:
-            root = etree.fromstring(content)
-        except Exception as ex:
+            df = resposta_para_dataframe(r.content)
+        except MicrovixErro:
             logger.warning(
-                "Falha parse XML em %s (%s): %s | Resposta: %s",
-                metodo, cnpj, ex, _preview_text(r.text, 900)
+                "ResponseSuccess=false em %s (%s). Resposta: %s",
+                metodo, cnpj, _preview_text(r.text, 900)
             )
             return pd.DataFrame()
-
-        ok_nodes = root.xpath(".//ResponseSuccess/text()")
-        if ok_nodes and ok_nodes[0].strip().lower() == "false":
+        except Exception as ex:
             logger.warning(
-                "ResponseSuccess=false em %s (%s). Resposta: %s",
-                metodo, cnpj, _preview_text(r.text, 900)
+                "Falha parse XML em %s (%s): %s | Resposta: %s",
+                metodo, cnpj, ex, _preview_text(r.text, 900)
             )
             return pd.DataFrame()
 
-        cols = [d.text for d in root.xpath(".//C[last()]/D")]
-        rows = root.xpath(".//R")
-
-        data = []
-        for rr in rows:
-            vals = [d.text for d in rr.xpath("./D")]
-            data.append(dict(zip(cols, vals)))
-
-        df = pd.DataFrame(data)
         if df.empty:
             logger.info("%s (%s) retornou 0 linhas.", metodo, cnpj)
         else:
@@ -415,38 +372,71 @@ def chamar_api(cnpj: str, metodo: str, parametros: Optional[Dict[str, str]] = No
 # ===========================================
 # 🔄 PAGINAÇÃO / TIMESTAMP
 # ===========================================
-def extrair_com_janelas(cnpj: str, metodo: str, params_base: Optional[Dict[str, str]] = None, sleep_s: float = 0.6) -> pd.DataFrame:
+def extrair_com_janelas(cnpj: str, metodo: str, params_base: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """
+    Baixa os meses de JANELAS. Cada mês é pré-dividido pelo histograma de
+    densidade do método/loja (microvix_janelas) e as janelas resultantes são
+    pedidas em paralelo; uma janela que ainda vier cheia é dividida sob
+    demanda.
+    """
     if params_base is None:
         params_base = {}
 
-    partes = []
+    histograma = carregar_histograma(metodo, cnpj)
+    janelas = [
+        janela
+        for d_ini, d_fim in JANELAS
+        for janela in planejar_janelas(metodo, cnpj, d_ini, d_fim, histograma=histograma)
+    ]
 
-    for d_ini, d_fim in JANELAS:
+    def buscar(d_ini, d_fim) -> pd.DataFrame:
         params = dict(params_base)
-        params["data_inicial"] = d_ini
-        params["data_fim"] = d_fim
+        params["data_inicial"] = d_ini.isoformat()
+        params["data_fim"] = d_fim.isoformat()
 
         df = chamar_api(cnpj, metodo, params)
         if not df.empty:
-            df["__janela_ini"] = d_ini
-            df["__janela_fim"] = d_fim
-            partes.append(df)
-
-        time.sleep(sleep_s)
-
-    if partes:
-        return pd.concat(partes, ignore_index=True)
+            df["__janela_ini"] = params["data_inicial"]
+            df["__janela_fim"] = params["data_fim"]
+        return df
 
-    return pd.DataFrame()
+    df = baixar_em_janelas(metodo, cnpj, janelas, buscar)
+    return df if df is not None else pd.DataFrame()
 
 
-def extrair_por_timestamp(cnpj: str, metodo: str, params_fixos: Optional[Dict[str, str]] = None, sleep_s: float = 0.5, max_loops: int = 1000) -> pd.DataFrame:
+def extrair_por_timestamp(
+    cnpj: str,
+    metodo: str,
+    params_fixos: Optional[Dict[str, str]] = None,
+    max_loops: int = 1000,
+    chaves: Optional[List[str]] = None,
+) -> pd.DataFrame:
     """
     Para métodos orientados a timestamp, como LinxPlanosParcelas.
+
+    Com `chaves`, a paginação recomeça do último timestamp salvo em
+    microvix_checkpoint e as linhas novas são mescladas no snapshot local
+    por essas colunas.
     """
     if params_fixos is None:
         params_fixos = {}
 
+    if chaves:
+        def buscar_pagina(ts_pagina: int) -> pd.DataFrame:
+            params = dict(params_fixos)
+            params["timestamp"] = str(ts_pagina)
+            df = chamar_api(cnpj, metodo, params)
+            df.columns = [str(c).lower() for c in df.columns]
+            return df
+
+        return paginar_incremental(
+            metodo,
+            cnpj,
+            buscar_pagina,
+            chaves,
+            max_paginas=max_loops,
+        )
+
     ts = 0
     partes = []
     loops = 0
@@ -475,7 +465,6 @@ def extrair_por_timestamp(cnpj: str, metodo: str, params_fixos: Optional[Dict[st
             break
 
         ts = novo_ts
-        time.sleep(sleep_s)
 
     if partes:
         out = pd.concat(partes, ignore_index=True)
@@ -952,121 +941,135 @@ def recriar_pagamentos_consolidados(conn: sqlite3.Connection):
 
 
 # ===========================================
-# 🚀 EXTRAÇÃO E SINCRONIZAÇÃO
+# 🏪 EXTRAÇÃO POR CNPJ
 # ===========================================
-if __name__ == "__main__":
-    todos_mov_resumo = []
-    todos_mov_planos = []
-    todos_mov_cartoes = []
-    todos_planos_parcelas = []
-
-    for cnpj in CNPJS:
-        logger.info("============================================")
-        logger.info("Processando CNPJ %s", cnpj)
-
-        # -----------------------------
-        # 1) LinxMovimento
-        # -----------------------------
-        logger.info("Extraindo LinxMovimento...")
-        df_mov = extrair_com_janelas(
-            cnpj,
-            "LinxMovimento",
-            params_base={
-                "timestamp": "0",
-                "hora_inicial": "00:00",
-                "hora_fim": "23:59",
-            },
-            sleep_s=0.8
-        )
-
-        if not df_mov.empty:
-            df_mov_norm = normalizar_movimento_resumo(df_mov)
-            if not df_mov_norm.empty:
-                todos_mov_resumo.append(df_mov_norm)
-                logger.info("LinxMovimento normalizado: %d linhas", len(df_mov_norm))
+def extrair_cnpj(cnpj: str) -> Dict[str, pd.DataFrame]:
+    """
+    Extrai e normaliza os quatro métodos de pagamento de uma loja.
 
-        time.sleep(1.2)
+    As lojas rodam em paralelo (executar_por_cnpj). O espaçamento entre as
+    chamadas é feito pelo limitador global do cliente Microvix, não por
+    pausas fixas entre métodos.
+    """
+    resultado: Dict[str, pd.DataFrame] = {}
+
+    logger.info("============================================")
+    logger.info("Processando CNPJ %s", cnpj)
+
+    # -----------------------------
+    # 1) LinxMovimento
+    # -----------------------------
+    logger.info("Extraindo LinxMovimento...")
+    df_mov = extrair_com_janelas(
+        cnpj,
+        "LinxMovimento",
+        params_base={
+            "timestamp": "0",
+            "hora_inicial": "00:00",
+            "hora_fim": "23:59",
+        }
+    )
 
-        # -----------------------------
-        # 2) LinxMovimentoPlanos
-        # -----------------------------
-        logger.info("Extraindo LinxMovimentoPlanos...")
-        df_planos = extrair_com_janelas(
-            cnpj,
-            "LinxMovimentoPlanos",
-            params_base={
-                "hora_inicial": "00:00",
-                "hora_fim": "23:59",
-                "diferenciar_avista": "1",
-                "timestamp": "0"
-            },
-            sleep_s=0.8
-        )
+    if not df_mov.empty:
+        df_mov_norm = normalizar_movimento_resumo(df_mov)
+        if not df_mov_norm.empty:
+            resultado["movimento_resumo"] = df_mov_norm
+            logger.info("LinxMovimento normalizado: %d linhas", len(df_mov_norm))
+
+    # -----------------------------
+    # 2) LinxMovimentoPlanos
+    # -----------------------------
+    logger.info("Extraindo LinxMovimentoPlanos...")
+    df_planos = extrair_com_janelas(
+        cnpj,
+        "LinxMovimentoPlanos",
+        params_base={
+            "hora_inicial": "00:00",
+            "hora_fim": "23:59",
+            "diferenciar_avista": "1",
+            "timestamp": "0"
+        }
+    )
 
-        if not df_planos.empty:
-            df_planos_norm = normalizar_movimento_planos(df_planos)
-            if not df_planos_norm.empty:
-                todos_mov_planos.append(df_planos_norm)
-                logger.info("LinxMovimentoPlanos normalizado: %d linhas", len(df_planos_norm))
-
-                cols_debug = [c for c in [
-                    "cnpj_emp", "identificador", "plano", "desc_plano", "total",
-                    "qtde_parcelas", "forma_pgto", "tipo_transacao", "ordem_cartao"
-                ] if c in df_planos_norm.columns]
-
-                if cols_debug:
-                    logger.info(
-                        "Amostra LinxMovimentoPlanos:\n%s",
-                        df_planos_norm[cols_debug].head(10).to_string(index=False)
-                    )
-            else:
-                logger.warning("LinxMovimentoPlanos veio, mas ficou vazio após normalização.")
+    if not df_planos.empty:
+        df_planos_norm = normalizar_movimento_planos(df_planos)
+        if not df_planos_norm.empty:
+            resultado["movimento_planos"] = df_planos_norm
+            logger.info("LinxMovimentoPlanos normalizado: %d linhas", len(df_planos_norm))
+
+            cols_debug = [c for c in [
+                "cnpj_emp", "identificador", "plano", "desc_plano", "total",
+                "qtde_parcelas", "forma_pgto", "tipo_transacao", "ordem_cartao"
+            ] if c in df_planos_norm.columns]
+
+            if cols_debug:
+                logger.info(
+                    "Amostra LinxMovimentoPlanos:\n%s",
+                    df_planos_norm[cols_debug].head(10).to_string(index=False)
+                )
         else:
-            logger.warning("LinxMovimentoPlanos não retornou dados para %s.", cnpj)
-
-        time.sleep(1.2)
+            logger.warning("LinxMovimentoPlanos veio, mas ficou vazio após normalização.")
+    else:
+        logger.warning("LinxMovimentoPlanos não retornou dados para %s.", cnpj)
+
+    # -----------------------------
+    # 3) LinxMovimentoCartoes
+    # -----------------------------
+    logger.info("Extraindo LinxMovimentoCartoes...")
+    df_cartoes = extrair_com_janelas(
+        cnpj,
+        "LinxMovimentoCartoes",
+        params_base={
+            "timestamp": "0",
+            "apenas_com_faturas": "0"
+        }
+    )
 
-        # -----------------------------
-        # 3) LinxMovimentoCartoes
-        # -----------------------------
-        logger.info("Extraindo LinxMovimentoCartoes...")
-        df_cartoes = extrair_com_janelas(
-            cnpj,
-            "LinxMovimentoCartoes",
-            params_base={
-                "timestamp": "0",
-                "apenas_com_faturas": "0"
-            },
-            sleep_s=0.8
-        )
+    if not df_cartoes.empty:
+        df_cartoes_norm = normalizar_movimento_cartoes(df_cartoes)
+        if not df_cartoes_norm.empty:
+            resultado["movimento_cartoes"] = df_cartoes_norm
+            logger.info("LinxMovimentoCartoes normalizado: %d linhas", len(df_cartoes_norm))
+
+    # -----------------------------
+    # 4) LinxPlanosParcelas
+    # -----------------------------
+    logger.info("Extraindo LinxPlanosParcelas...")
+    df_parcelas = extrair_por_timestamp(
+        cnpj,
+        "LinxPlanosParcelas",
+        params_fixos={},
+        max_loops=50,
+        chaves=["id_planos_parcelas"],
+    )
 
-        if not df_cartoes.empty:
-            df_cartoes_norm = normalizar_movimento_cartoes(df_cartoes)
-            if not df_cartoes_norm.empty:
-                todos_mov_cartoes.append(df_cartoes_norm)
-                logger.info("LinxMovimentoCartoes normalizado: %d linhas", len(df_cartoes_norm))
+    if not df_parcelas.empty:
+        df_parcelas_norm = normalizar_planos_parcelas(df_parcelas, cnpj)
+        if not df_parcelas_norm.empty:
+            resultado["planos_parcelas"] = df_parcelas_norm
+            logger.info("LinxPlanosParcelas normalizado: %d linhas", len(df_parcelas_norm))
 
-        time.sleep(1.2)
+    return resultado
 
-        # -----------------------------
-        # 4) LinxPlanosParcelas
-        # -----------------------------
-        logger.info("Extraindo LinxPlanosParcelas...")
-        df_parcelas = extrair_por_timestamp(
-            cnpj,
-            "LinxPlanosParcelas",
-            params_fixos={},
-            sleep_s=0.5,
-            max_loops=50
-        )
 
-        if not df_parcelas.empty:
-            df_parcelas_norm = normalizar_planos_parcelas(df_parcelas, cnpj)
-            if not df_parcelas_norm.empty:
-                todos_planos_parcelas.append(df_parcelas_norm)
-                logger.info("LinxPlanosParcelas normalizado: %d linhas", len(df_parcelas_norm))
+# ===========================================
+# 🚀 EXTRAÇÃO E SINCRONIZAÇÃO
+# ===========================================
+if __name__ == "__main__":
+    todos_mov_resumo = []
+    todos_mov_planos = []
+    todos_mov_cartoes = []
+    todos_planos_parcelas = []
 
-        time.sleep(1.5)
+    for resultado_cnpj in executar_por_cnpj(extrair_cnpj, CNPJS):
+        if "movimento_resumo" in resultado_cnpj:
+            todos_mov_resumo.append(resultado_cnpj["movimento_resumo"])
+        if "movimento_planos" in resultado_cnpj:
+            todos_mov_planos.append(resultado_cnpj["movimento_planos"])
+        if "movimento_cartoes" in resultado_cnpj:
+            todos_mov_cartoes.append(resultado_cnpj["movimento_cartoes"])
+        if "planos_parcelas" in resultado_cnpj:
+            todos_planos_parcelas.append(resultado_cnpj["planos_parcelas"])
 
     # ===========================================
     # 💾 CONSOLIDA E GRAVA
@@ -0,0 +1,276 @@
+# ===========================================
+# 📚 CATÁLOGO LOCAL DE PRODUTOS (LINXPRODUTOS)
+#
+# O catálogo era baixado inteiro (2015 -> hoje) a cada sincronização: a
+# primeira chamada sempre batia no limite de 4.900 linhas e o intervalo era
+# dividido recursivamente até cobrir todos os produtos.
+#
+# Aqui os produtos ficam em um SQLite local, um registro por cod_produto,
+# junto com o maior dt_update já visto. Cada sincronização pede apenas
+# dt_update_inicio >= último dt_update e grava os produtos alterados.
+#
+# Estoque, vendas e custos leem o mesmo catálogo por carregar_catalogo().
+# Apague o arquivo (ou use MICROVIX_CATALOGO_RESET=true) para forçar uma
+# carga completa.
+# ===========================================
+
+import json
+import os
+import sqlite3
+from datetime import date, datetime
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from microvix_client import post_microvix, resposta_para_dataframe
+from microvix_janelas import (
+    LIMITE_LINHAS_MICROVIX,
+    baixar_em_janelas,
+    planejar_janelas,
+)
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+CATALOGO_DB = Path(
+    os.getenv(
+        "MICROVIX_CATALOGO_DB",
+        str(SCRIPT_DIR / "catalogo_produtos_microvix.sqlite3"),
+    )
+)
+CATALOGO_RESET = (
+    os.getenv("MICROVIX_CATALOGO_RESET", "false").strip().lower()
+    in {"1", "true", "sim", "s"}
+)
+
+# Primeira data usada quando o catálogo local ainda está vazio.
+CATALOGO_DATA_INICIAL = date(2015, 1, 1)
+
+# A API devolve no máximo ~5.000 linhas por chamada de LinxProdutos.
+CATALOGO_LIMITE_LINHAS = LIMITE_LINHAS_MICROVIX
+
+
+def log(msg):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+# ===========================================
+# 🗃️ SQLITE
+# ===========================================
+def conectar_catalogo() -> sqlite3.Connection:
+    CATALOGO_DB.parent.mkdir(parents=True, exist_ok=True)
+
+    conexao = sqlite3.connect(CATALOGO_DB, timeout=60)
+    conexao.execute("PRAGMA journal_mode=WAL")
+    conexao.execute("PRAGMA synchronous=NORMAL")
+    conexao.execute(
+        """
+        CREATE TABLE IF NOT EXISTS produto_microvix (
+            cod_produto INTEGER PRIMARY KEY,
+            dt_update TEXT,
+            dados TEXT NOT NULL
+        )
+        """
+    )
+    conexao.execute(
+        """
+        CREATE TABLE IF NOT EXISTS catalogo_estado (
+            chave TEXT PRIMARY KEY,
+            valor TEXT NOT NULL
+        )
+        """
+    )
+    conexao.commit()
+    return conexao
+
+
+def ler_ultimo_dt_update(conexao: sqlite3.Connection) -> Optional[date]:
+    linha = conexao.execute(
+        "SELECT valor FROM catalogo_estado WHERE chave = 'ultimo_dt_update'"
+    ).fetchone()
+
+    if linha is None:
+        return None
+
+    try:
+        return datetime.strptime(linha[0][:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def gravar_produtos(
+    conexao: sqlite3.Connection,
+    df: pd.DataFrame,
+    ultimo_dt_update: date,
+) -> int:
+    """
+    Grava os produtos alterados e o novo dt_update na mesma transação.
+    Um produto só é substituído por uma versão de dt_update igual ou maior.
+    """
+    if df.empty or "cod_produto" not in df.columns:
+        registros = []
+    else:
+        base = df.copy()
+        base["cod_produto"] = pd.to_numeric(base["cod_produto"], errors="coerce")
+        base = base.dropna(subset=["cod_produto"])
+
+        dt_update = (
+            base["dt_update"].astype("string").fillna("")
+            if "dt_update" in base.columns
+            else pd.Series("", index=base.index)
+        )
+        dados = base.astype(object).where(base.notna(), None).to_dict("records")
+
+        registros = [
+            (
+                int(cod),
+                dt,
+                json.dumps(linha, ensure_ascii=False, default=str),
+            )
+            for cod, dt, linha in zip(base["cod_produto"], dt_update, dados)
+        ]
+
+    with conexao:
+        conexao.executemany(
+            """
+            INSERT INTO produto_microvix (cod_produto, dt_update, dados)
+            VALUES (?, ?, ?)
+            ON CONFLICT(cod_produto) DO UPDATE SET
+                dt_update = excluded.dt_update,
+                dados = excluded.dados
+            WHERE COALESCE(excluded.dt_update, '') >= COALESCE(produto_microvix.dt_update, '')
+            """,
+            registros,
+        )
+        conexao.execute(
+            """
+            INSERT INTO catalogo_estado (chave, valor)
+            VALUES ('ultimo_dt_update', ?)
+            ON CONFLICT(chave) DO UPDATE SET valor = excluded.valor
+            """,
+            (ultimo_dt_update.isoformat(),),
+        )
+
+    return len(registros)
+
+
+def carregar_catalogo() -> pd.DataFrame:
+    """
+    Devolve o catálogo local completo, com as colunas de LinxProdutos em
+    minúsculas e um registro por cod_produto.
+    """
+    if not CATALOGO_DB.exists():
+        return pd.DataFrame()
+
+    conexao = conectar_catalogo()
+    try:
+        linhas = conexao.execute(
+            "SELECT dados FROM produto_microvix ORDER BY cod_produto"
+        ).fetchall()
+    finally:
+        conexao.close()
+
+    if not linhas:
+        return pd.DataFrame()
+
+    df = pd.DataFrame.from_records([json.loads(linha[0]) for linha in linhas])
+    df["cod_produto"] = pd.to_numeric(df["cod_produto"], errors="coerce")
+    return df
+
+
+# ===========================================
+# 🌐 DOWNLOAD DO DELTA
+# ===========================================
+def chamar_api_catalogo(cnpj, dt_ini, dt_fim):
+    params = {
+        "cnpjEmp": cnpj,
+        "dt_update_inicio": dt_ini,
+        "dt_update_fim": dt_fim,
+    }
+    try:
+        r = post_microvix("LinxProdutos", params, timeout=300)
+        if r.status_code != 200:
+            return None
+        return resposta_para_dataframe(r.content)
+    except:
+        return None
+
+
+def baixar_intervalo(cnpj, dt_ini, dt_fim):
+    """
+    Baixa [dt_ini, dt_fim] em janelas planejadas pelo histograma de
+    densidade (microvix_janelas). Devolve None se alguma janela falhar, para
+    que o marco de dt_update não avance por cima de produtos não baixados.
+    """
+    janelas = planejar_janelas("LinxProdutos", cnpj, dt_ini, dt_fim, CATALOGO_LIMITE_LINHAS)
+    if len(janelas) > 1:
+        log(f"🗓️ Catálogo {dt_ini} a {dt_fim} planejado em {len(janelas)} janelas.")
+
+    def buscar(ini, fim):
+        df = chamar_api_catalogo(cnpj, ini, fim)
+        if df is None:
+            log(f"⚠️ Falha ao baixar LinxProdutos de {ini} a {fim}.")
+        elif len(df) > 0:
+            log(f"   📅 {ini} a {fim}: {len(df)} produtos.")
+        return df
+
+    return baixar_em_janelas(
+        "LinxProdutos",
+        cnpj,
+        janelas,
+        buscar,
+        limite=CATALOGO_LIMITE_LINHAS,
+        colunas_data=["dt_update"],
+    )
+
+
+def _maior_dt_update(df: pd.DataFrame) -> Optional[date]:
+    if df.empty or "dt_update" not in df.columns:
+        return None
+
+    datas = pd.to_datetime(df["dt_update"], errors="coerce", format="mixed").dropna()
+    if datas.empty:
+        return None
+
+    return datas.max().date()
+
+
+def atualizar_catalogo(cnpj: str) -> pd.DataFrame:
+    """
+    Baixa só os produtos alterados desde o último dt_update gravado e
+    devolve o catálogo local completo.
+
+    O filtro da API é por dia, então o dia do último dt_update é pedido de
+    novo: produtos alterados mais tarde nesse mesmo dia não se perdem.
+    """
+    conexao = conectar_catalogo()
+    try:
+        if CATALOGO_RESET:
+            with conexao:
+                conexao.execute("DELETE FROM produto_microvix")
+                conexao.execute("DELETE FROM catalogo_estado")
+
+        ultimo = ler_ultimo_dt_update(conexao)
+        inicio = ultimo or CATALOGO_DATA_INICIAL
+        fim = datetime.now().date()
+
+        if ultimo:
+            log(f"📚 Catálogo local atualizado até {ultimo}; buscando alterações até {fim}...")
+        else:
+            log("📚 Catálogo local vazio; baixando catálogo completo...")
+
+        df = baixar_intervalo(cnpj, inicio, fim)
+        if df is None:
+            # Mantém o catálogo e o marco atuais; a próxima execução repete o delta.
+            return carregar_catalogo()
+
+        if not df.empty:
+            df.columns = [c.lower() for c in df.columns]
+
+        # Sem dt_update legível, o próprio dia da sincronização vira o marco.
+        novo_ultimo = max(filter(None, [ultimo, _maior_dt_update(df)]), default=fim)
+        qtd = gravar_produtos(conexao, df, novo_ultimo)
+        log(f"   ✅ Catálogo local: {qtd} produtos novos/alterados.")
+    finally:
+        conexao.close()
+
+    return carregar_catalogo()
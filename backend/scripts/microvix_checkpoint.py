@@ -0,0 +1,245 @@
+# ===========================================
+# 📌 CHECKPOINTS DE TIMESTAMP DA MICROVIX
+#
+# Métodos paginados por timestamp (LinxProdutosDetalhes, LinxProdutosSerial,
+# LinxPlanosParcelas, LinxNaturezaOperacao...) recomeçavam sempre em
+# timestamp=0 e baixavam o histórico inteiro a cada execução.
+#
+# Aqui guardamos, por (método, CNPJ, escopo):
+#   - o último timestamp devolvido pela API;
+#   - o snapshot local já mesclado das linhas recebidas.
+#
+# A execução seguinte pede apenas timestamp > último, mescla as linhas novas
+# no snapshot pela chave natural do método e devolve o resultado completo.
+# Apague o arquivo (ou use MICROVIX_CHECKPOINT_RESET=true) para forçar uma
+# carga completa.
+# ===========================================
+
+import io
+import os
+import sqlite3
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional, Sequence
+
+import pandas as pd
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+CHECKPOINT_DB = Path(
+    os.getenv(
+        "MICROVIX_CHECKPOINT_DB",
+        str(SCRIPT_DIR / "microvix_checkpoints.sqlite3"),
+    )
+)
+CHECKPOINT_RESET = (
+    os.getenv("MICROVIX_CHECKPOINT_RESET", "false").strip().lower()
+    in {"1", "true", "sim", "s"}
+)
+
+
+def conectar_checkpoints() -> sqlite3.Connection:
+    CHECKPOINT_DB.parent.mkdir(parents=True, exist_ok=True)
+
+    # Cada thread abre a própria conexão; o timeout cobre a espera pelo lock
+    # de escrita quando várias lojas terminam ao mesmo tempo.
+    conexao = sqlite3.connect(CHECKPOINT_DB, timeout=60)
+    conexao.execute("PRAGMA journal_mode=WAL")
+    conexao.execute("PRAGMA synchronous=NORMAL")
+    conexao.execute(
+        """
+        CREATE TABLE IF NOT EXISTS checkpoint_microvix (
+            metodo TEXT NOT NULL,
+            cnpj TEXT NOT NULL,
+            escopo TEXT NOT NULL,
+            ultimo_timestamp INTEGER NOT NULL,
+            snapshot BLOB,
+            linhas INTEGER NOT NULL,
+            atualizado_em TEXT NOT NULL,
+            PRIMARY KEY (metodo, cnpj, escopo)
+        )
+        """
+    )
+    conexao.commit()
+    return conexao
+
+
+def _serializar(df: pd.DataFrame) -> bytes:
+    return zlib.compress(
+        df.to_json(orient="split", index=False, date_format="iso").encode("utf-8")
+    )
+
+
+def _desserializar(blob: Optional[bytes]) -> pd.DataFrame:
+    if not blob:
+        return pd.DataFrame()
+
+    return pd.read_json(
+        io.StringIO(zlib.decompress(blob).decode("utf-8")),
+        orient="split",
+        dtype=False,
+        convert_dates=False,
+    )
+
+
+def carregar_checkpoint(
+    metodo: str,
+    cnpj: str,
+    escopo: str = "",
+) -> tuple[int, pd.DataFrame]:
+    """
+    Devolve (último timestamp, snapshot) ou (0, vazio) se não houver.
+    """
+    if CHECKPOINT_RESET:
+        return 0, pd.DataFrame()
+
+    conexao = conectar_checkpoints()
+    try:
+        linha = conexao.execute(
+            """
+            SELECT ultimo_timestamp, snapshot
+            FROM checkpoint_microvix
+            WHERE metodo = ? AND cnpj = ? AND escopo = ?
+            """,
+            (metodo, cnpj, escopo),
+        ).fetchone()
+    finally:
+        conexao.close()
+
+    if linha is None:
+        return 0, pd.DataFrame()
+
+    try:
+        return int(linha[0]), _desserializar(linha[1])
+    except Exception:
+        # Snapshot ilegível: recomeça do zero em vez de mesclar lixo.
+        return 0, pd.DataFrame()
+
+
+def salvar_checkpoint(
+    metodo: str,
+    cnpj: str,
+    ultimo_timestamp: int,
+    snapshot: pd.DataFrame,
+    escopo: str = "",
+) -> None:
+    conexao = conectar_checkpoints()
+    try:
+        conexao.execute(
+            """
+            INSERT INTO checkpoint_microvix (
+                metodo, cnpj, escopo, ultimo_timestamp,
+                snapshot, linhas, atualizado_em
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(metodo, cnpj, escopo) DO UPDATE SET
+                ultimo_timestamp = excluded.ultimo_timestamp,
+                snapshot = excluded.snapshot,
+                linhas = excluded.linhas,
+                atualizado_em = excluded.atualizado_em
+            """,
+            (
+                metodo,
+                cnpj,
+                escopo,
+                int(ultimo_timestamp),
+                _serializar(snapshot),
+                int(len(snapshot)),
+                datetime.now().isoformat(timespec="seconds"),
+            ),
+        )
+        conexao.commit()
+    finally:
+        conexao.close()
+
+
+def mesclar_snapshot(
+    snapshot: pd.DataFrame,
+    novos: pd.DataFrame,
+    chaves: Sequence[str],
+) -> pd.DataFrame:
+    """
+    Junta as linhas novas ao snapshot. Para a mesma chave vale a linha de
+    maior timestamp (e, no empate, a mais recente).
+    """
+    if snapshot.empty:
+        base = novos
+    elif novos.empty:
+        base = snapshot
+    else:
+        base = pd.concat(
+            [snapshot.astype(object), novos.astype(object)],
+            ignore_index=True,
+            sort=False,
+        )
+
+    if base.empty:
+        return base
+
+    chaves = [coluna for coluna in chaves if coluna in base.columns]
+
+    if "timestamp" in base.columns:
+        ordem = pd.to_numeric(base["timestamp"], errors="coerce")
+        base = base.iloc[ordem.argsort(kind="stable")]
+
+    if chaves:
+        base = base.drop_duplicates(subset=chaves, keep="last")
+    else:
+        base = base.drop_duplicates(keep="last")
+
+    return base.reset_index(drop=True)
+
+
+def _proximo_timestamp(df: pd.DataFrame, timestamp_atual: int) -> Optional[int]:
+    if df.empty or "timestamp" not in df.columns:
+        return None
+
+    ts = pd.to_numeric(df["timestamp"], errors="coerce").dropna()
+    if ts.empty:
+        return None
+
+    novo = int(ts.max())
+    return novo if novo > timestamp_atual else None
+
+
+def paginar_incremental(
+    metodo: str,
+    cnpj: str,
+    buscar_pagina: Callable[[int], pd.DataFrame],
+    chaves: Sequence[str],
+    escopo: str = "",
+    max_paginas: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Pagina um método Microvix a partir do último checkpoint salvo.
+
+    `buscar_pagina(timestamp)` deve devolver a página da API com as colunas
+    já em minúsculas. O resultado é o snapshot completo (antigo + novas
+    linhas), e o checkpoint só é gravado depois que a paginação termina,
+    então uma execução interrompida não perde linhas.
+    """
+    ts_inicial, snapshot = carregar_checkpoint(metodo, cnpj, escopo)
+    ts = ts_inicial
+    paginas: list[pd.DataFrame] = []
+
+    while max_paginas is None or len(paginas) < max_paginas:
+        pagina = buscar_pagina(ts)
+        if pagina is None or pagina.empty:
+            break
+
+        paginas.append(pagina)
+
+        proximo = _proximo_timestamp(pagina, ts)
+        if proximo is None:
+            break
+
+        ts = proximo
+
+    if not paginas:
+        return snapshot
+
+    novos = pd.concat(paginas, ignore_index=True, sort=False)
+    ultimo = _proximo_timestamp(novos, ts_inicial) or ts_inicial
+    resultado = mesclar_snapshot(snapshot, novos, chaves)
+    salvar_checkpoint(metodo, cnpj, ultimo, resultado, escopo)
+    return resultado
@@ -0,0 +1,315 @@
+# ===========================================
+# 🔌 CLIENTE COMPARTILHADO DA API MICROVIX
+#
+# Todos os sincronizadores (estoque, formas de pagamento, vendas) usam este
+# módulo para falar com webapi.microvix.com.br.
+#
+# - Uma única requests.Session com pool de conexões keep-alive, para que as
+#   milhares de páginas de uma sincronização não paguem um novo handshake
+#   TCP+TLS a cada chamada.
+# - O pool é dimensionado pelo nível de concorrência (MICROVIX_MAX_CONEXOES).
+# - Respostas comprimidas (gzip/deflate) são negociadas no Accept-Encoding.
+# - O envelope XML é pré-montado uma vez; cada chamada só acrescenta o nome
+#   do método e os parâmetros.
+# - As respostas <C>/<R>/<D> são decodificadas em streaming (iterparse),
+#   preenchendo uma lista por coluna, sem montar a árvore inteira.
+# - Um único limitador token-bucket controla o ritmo de TODAS as chamadas
+#   do processo (MICROVIX_REQ_POR_SEGUNDO), substituindo os time.sleep
+#   fixos entre páginas. Assim várias lojas podem ser extraídas ao mesmo
+#   tempo (MICROVIX_WORKERS) sem ultrapassar o limite real da API.
+# ===========================================
+
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Optional, TypeVar
+from xml.sax.saxutils import escape
+
+import pandas as pd
+import requests
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+# === CREDENCIAIS MICROVIX ===
+USUARIO = "linx_export"
+SENHA   = "linx_export"
+CHAVE   = "2618f2b2-8f1d-4502-8321-342dc2cd1470"
+URL     = "https://webapi.microvix.com.br/1.0/api/integracao"
+
+# Quantas lojas são extraídas ao mesmo tempo.
+MICROVIX_WORKERS = max(1, int(os.getenv("MICROVIX_WORKERS", "4")))
+
+# Quantidade máxima de conexões simultâneas mantidas abertas com a Microvix.
+# Acompanha o número de workers que extraem lojas em paralelo.
+MICROVIX_MAX_CONEXOES = max(
+    1,
+    int(os.getenv("MICROVIX_MAX_CONEXOES", str(MICROVIX_WORKERS))),
+)
+
+# Orçamento global de requisições por segundo e rajada permitida.
+MICROVIX_REQ_POR_SEGUNDO = float(os.getenv("MICROVIX_REQ_POR_SEGUNDO", "5"))
+MICROVIX_RAJADA = max(1, int(os.getenv("MICROVIX_RAJADA", "5")))
+
+HEADERS_MICROVIX = {
+    "Content-Type": "application/xml; charset=utf-8",
+    "Accept": "application/xml",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+}
+
+# ===========================================
+# 🧾 ENVELOPE XML PRÉ-MONTADO
+# ===========================================
+# As partes fixas do envelope (autenticação e chave) são escapadas uma única
+# vez na importação do módulo.
+_ATRIBUTO_ESCAPE = {'"': "&quot;"}
+
+_ENVELOPE_INICIO = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    "<LinxMicrovix>"
+    f'<Authentication user="{escape(USUARIO, _ATRIBUTO_ESCAPE)}" '
+    f'password="{escape(SENHA, _ATRIBUTO_ESCAPE)}" />'
+    "<ResponseFormat>xml</ResponseFormat>"
+    "<Command><Name>"
+)
+_ENVELOPE_PARAMETROS = (
+    "</Name><Parameters>"
+    f'<Parameter id="chave">{escape(CHAVE)}</Parameter>'
+)
+_ENVELOPE_FIM = "</Parameters></Command></LinxMicrovix>"
+
+
+def montar_envelope(
+    metodo: str,
+    parametros: Optional[dict[str, Any]] = None,
+) -> bytes:
+    """
+    Monta o corpo XML de uma chamada Microvix já codificado em UTF-8.
+
+    Parâmetros com valor None são ignorados. A chave de integração é sempre
+    enviada como primeiro parâmetro.
+    """
+    partes = [_ENVELOPE_INICIO, escape(str(metodo)), _ENVELOPE_PARAMETROS]
+
+    for chave, valor in (parametros or {}).items():
+        if valor is None:
+            continue
+        partes.append(
+            f'<Parameter id="{escape(str(chave), _ATRIBUTO_ESCAPE)}">'
+            f"{escape(str(valor))}</Parameter>"
+        )
+
+    partes.append(_ENVELOPE_FIM)
+    return "".join(partes).encode("utf-8")
+
+
+# ===========================================
+# ⏱️ LIMITADOR GLOBAL DE REQUISIÇÕES
+# ===========================================
+class LimitadorTaxa:
+    """
+    Token bucket thread-safe.
+
+    Cada chamada a aguardar() consome uma ficha. As fichas são repostas a
+    `taxa` por segundo até o limite de `capacidade`. Quem chega sem ficha
+    reserva a próxima e dorme fora do lock, então as threads saem em fila
+    espaçadas por 1/taxa segundos.
+    """
+
+    def __init__(self, taxa: float, capacidade: int = 1):
+        self.taxa = float(taxa)
+        self.capacidade = float(max(1, capacidade))
+        self._fichas = self.capacidade
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def aguardar(self) -> None:
+        if self.taxa <= 0:
+            return
+
+        with self._lock:
+            agora = time.monotonic()
+            self._fichas = min(
+                self.capacidade,
+                self._fichas + (agora - self._ultimo) * self.taxa,
+            )
+            self._ultimo = agora
+            self._fichas -= 1
+            espera = -self._fichas / self.taxa if self._fichas < 0 else 0.0
+
+        if espera > 0:
+            time.sleep(espera)
+
+
+limitador = LimitadorTaxa(MICROVIX_REQ_POR_SEGUNDO, MICROVIX_RAJADA)
+
+
+# ===========================================
+# 🔁 SESSÃO HTTP COMPARTILHADA
+# ===========================================
+_sessao: Optional[requests.Session] = None
+_sessao_lock = threading.Lock()
+
+
+def criar_sessao(max_conexoes: int = MICROVIX_MAX_CONEXOES) -> requests.Session:
+    sessao = requests.Session()
+    sessao.auth = HTTPBasicAuth(USUARIO, SENHA)
+    sessao.headers.update(HEADERS_MICROVIX)
+
+    adaptador = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=max_conexoes,
+        pool_block=True,
+    )
+    sessao.mount("https://", adaptador)
+    sessao.mount("http://", adaptador)
+    return sessao
+
+
+def obter_sessao() -> requests.Session:
+    """
+    Devolve a sessão Microvix do processo, criando-a na primeira chamada.
+    """
+    global _sessao
+
+    if _sessao is None:
+        with _sessao_lock:
+            if _sessao is None:
+                _sessao = criar_sessao()
+
+    return _sessao
+
+
+def fechar_sessao() -> None:
+    global _sessao
+
+    with _sessao_lock:
+        if _sessao is not None:
+            _sessao.close()
+            _sessao = None
+
+
+def post_microvix(
+    metodo: str,
+    parametros: Optional[dict[str, Any]] = None,
+    timeout: Any = 180,
+) -> requests.Response:
+    """
+    Executa um método Microvix pela sessão compartilhada.
+
+    A chamada passa antes pelo limitador global. A resposta HTTP é devolvida
+    sem tratamento para que cada script mantenha a própria política de log
+    e de erro.
+    """
+    limitador.aguardar()
+    return obter_sessao().post(
+        URL,
+        data=montar_envelope(metodo, parametros),
+        timeout=timeout,
+    )
+
+
+# ===========================================
+# 🏪 EXTRAÇÃO CONCORRENTE POR LOJA
+# ===========================================
+T = TypeVar("T")
+
+
+def executar_por_cnpj(
+    funcao: Callable[[str], T],
+    cnpjs: Iterable[str],
+    max_workers: int = MICROVIX_WORKERS,
+) -> list[T]:
+    """
+    Executa `funcao(cnpj)` para cada loja em um pool limitado de threads.
+
+    Os resultados voltam na mesma ordem de `cnpjs`. O ritmo das chamadas à
+    API continua sendo controlado pelo limitador global.
+    """
+    cnpjs = list(cnpjs)
+
+    if max_workers <= 1 or len(cnpjs) <= 1:
+        return [funcao(cnpj) for cnpj in cnpjs]
+
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(cnpjs)),
+        thread_name_prefix="microvix",
+    ) as executor:
+        return list(executor.map(funcao, cnpjs))
+
+
+# ===========================================
+# 📥 DECODIFICAÇÃO DAS RESPOSTAS
+# ===========================================
+class MicrovixErro(RuntimeError):
+    """ResponseSuccess=false devolvido pela API."""
+
+
+_TAGS_RESPOSTA = ("C", "R", "ResponseSuccess", "ResponseMessage")
+
+
+def resposta_para_dataframe(conteudo: bytes) -> pd.DataFrame:
+    """
+    Converte a resposta XML da Microvix em DataFrame, coluna a coluna.
+
+    O XML é lido com iterparse: os valores de cada <R> são copiados e o
+    elemento é descartado em seguida, então a árvore nunca fica inteira em
+    memória. No fim as linhas são transpostas em uma lista por coluna.
+    Nomes repetidos no cabeçalho <C> seguem o antigo dict(zip(...)): vale o
+    último valor presente na linha.
+
+    Levanta MicrovixErro quando ResponseSuccess=false e
+    etree.XMLSyntaxError quando o conteúdo não é XML válido.
+    """
+    if conteudo.startswith(b"\xef\xbb\xbf"):
+        conteudo = conteudo[3:]
+
+    sucesso: Optional[str] = None
+    mensagem: Optional[str] = None
+    nomes: list[Any] = []
+    linhas: list[list[Any]] = []
+
+    for _, elemento in etree.iterparse(
+        io.BytesIO(conteudo),
+        events=("end",),
+        tag=_TAGS_RESPOSTA,
+    ):
+        tag = elemento.tag
+
+        if tag == "R":
+            linhas.append([item.text for item in elemento])
+        elif tag == "C":
+            nomes = [item.text for item in elemento]
+        elif tag == "ResponseSuccess":
+            sucesso = (elemento.text or "").strip().lower()
+        else:
+            mensagem = elemento.text
+
+        elemento.clear(keep_tail=False)
+        while elemento.getprevious() is not None:
+            del elemento.getparent()[0]
+
+    if sucesso == "false":
+        raise MicrovixErro(mensagem or "Sem mensagem")
+
+    if not nomes or not linhas:
+        return pd.DataFrame()
+
+    largura = len(nomes)
+    completas = all(len(linha) == largura for linha in linhas)
+
+    if completas and len(set(nomes)) == largura:
+        return pd.DataFrame(dict(zip(nomes, zip(*linhas))), columns=nomes)
+
+    if not completas:
+        # Linhas curtas ou longas são raras; mantêm a semântica de zip().
+        linhas = [
+            [dict(zip(nomes, linha)).get(nome) for nome in nomes]
+            for linha in linhas
+        ]
+
+    dados = dict(zip(nomes, zip(*linhas)))
+    return pd.DataFrame(dados, columns=list(dados))
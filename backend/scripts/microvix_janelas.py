@@ -0,0 +1,295 @@
+# ===========================================
+# 🗓️ PLANEJADOR DE JANELAS DE DATA DA MICROVIX
+#
+# Vários métodos (LinxProdutos, LinxMovimento...) devolvem no máximo ~5.000
+# linhas por chamada. A estratégia antiga pedia o intervalo inteiro, só
+# descobria que ele estava cheio depois de baixar 4.900+ linhas, descartava
+# esse download e pedia as duas metades, que ainda repetiam o dia do meio.
+#
+# Aqui guardamos um histograma de linhas por dia (por método e escopo) das
+# execuções anteriores:
+#   - o intervalo é pré-dividido em janelas que devem caber abaixo do limite;
+#   - as janelas são baixadas em paralelo (o ritmo continua com o limitador
+#     global do microvix_client);
+#   - uma janela que ainda vier cheia é dividida sob demanda em duas metades
+#     sem dia repetido, e o histograma aprende com o resultado.
+# ===========================================
+
+import os
+import sqlite3
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Sequence, Union
+
+import pandas as pd
+
+from microvix_client import MICROVIX_WORKERS
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+JANELAS_DB = Path(
+    os.getenv(
+        "MICROVIX_JANELAS_DB",
+        str(SCRIPT_DIR / "densidade_janelas_microvix.sqlite3"),
+    )
+)
+
+# Linhas devolvidas a partir das quais a resposta é considerada truncada.
+LIMITE_LINHAS_MICROVIX = 4900
+
+# Fração do limite usada ao planejar, para absorver o crescimento desde a
+# última medição.
+OCUPACAO_ALVO = float(os.getenv("MICROVIX_JANELAS_OCUPACAO", "0.8"))
+
+# Colunas de data procuradas (nesta ordem) para montar o histograma diário.
+COLUNAS_DATA_PADRAO = ("dt_update", "data_documento", "data_lancamento")
+
+DataLike = Union[date, datetime, str]
+Janela = tuple[date, date]
+
+
+def log(msg):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+
+def para_data(valor: DataLike) -> date:
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return datetime.strptime(str(valor)[:10], "%Y-%m-%d").date()
+
+
+def _dias(inicio: date, fim: date) -> Iterable[date]:
+    for n in range((fim - inicio).days + 1):
+        yield inicio + timedelta(days=n)
+
+
+# ===========================================
+# 🗃️ HISTOGRAMA PERSISTIDO
+# ===========================================
+def conectar_histograma() -> sqlite3.Connection:
+    JANELAS_DB.parent.mkdir(parents=True, exist_ok=True)
+
+    conexao = sqlite3.connect(JANELAS_DB, timeout=60)
+    conexao.execute("PRAGMA journal_mode=WAL")
+    conexao.execute("PRAGMA synchronous=NORMAL")
+    conexao.execute(
+        """
+        CREATE TABLE IF NOT EXISTS densidade_microvix (
+            metodo TEXT NOT NULL,
+            escopo TEXT NOT NULL,
+            dia TEXT NOT NULL,
+            linhas INTEGER NOT NULL,
+            atualizado_em TEXT NOT NULL,
+            PRIMARY KEY (metodo, escopo, dia)
+        )
+        """
+    )
+    conexao.commit()
+    return conexao
+
+
+def carregar_histograma(metodo: str, escopo: str) -> dict[date, int]:
+    conexao = conectar_histograma()
+    try:
+        linhas = conexao.execute(
+            """
+            SELECT dia, linhas
+            FROM densidade_microvix
+            WHERE metodo = ? AND escopo = ?
+            """,
+            (metodo, escopo),
+        ).fetchall()
+    finally:
+        conexao.close()
+
+    return {para_data(dia): int(qtd) for dia, qtd in linhas}
+
+
+def salvar_histograma(metodo: str, escopo: str, contagens: dict[date, int]) -> None:
+    if not contagens:
+        return
+
+    agora = datetime.now().isoformat(timespec="seconds")
+    conexao = conectar_histograma()
+    try:
+        with conexao:
+            conexao.executemany(
+                """
+                INSERT INTO densidade_microvix (metodo, escopo, dia, linhas, atualizado_em)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(metodo, escopo, dia) DO UPDATE SET
+                    linhas = excluded.linhas,
+                    atualizado_em = excluded.atualizado_em
+                """,
+                [
+                    (metodo, escopo, dia.isoformat(), int(qtd), agora)
+                    for dia, qtd in contagens.items()
+                ],
+            )
+    finally:
+        conexao.close()
+
+
+def contar_por_dia(
+    df: pd.DataFrame,
+    inicio: date,
+    fim: date,
+    colunas_data: Sequence[str] = COLUNAS_DATA_PADRAO,
+) -> dict[date, int]:
+    """
+    Linhas por dia de uma janela baixada por completo. Sem coluna de data
+    reconhecível, o total é distribuído igualmente entre os dias.
+    """
+    dias = list(_dias(inicio, fim))
+    contagens = dict.fromkeys(dias, 0)
+
+    colunas = {str(c).lower(): c for c in df.columns}
+    coluna = next((colunas[c] for c in colunas_data if c in colunas), None)
+
+    if coluna is not None:
+        datas = pd.to_datetime(df[coluna], errors="coerce", format="mixed").dt.date
+        for dia, qtd in datas.value_counts().items():
+            if dia in contagens:
+                contagens[dia] = int(qtd)
+        return contagens
+
+    media = -(-len(df) // len(dias))
+    return dict.fromkeys(dias, media)
+
+
+# ===========================================
+# 📐 PLANEJAMENTO
+# ===========================================
+def planejar_janelas(
+    metodo: str,
+    escopo: str,
+    inicio: DataLike,
+    fim: DataLike,
+    limite: int = LIMITE_LINHAS_MICROVIX,
+    histograma: Optional[dict[date, int]] = None,
+) -> list[Janela]:
+    """
+    Divide [inicio, fim] em janelas contíguas, sem dias repetidos, cuja soma
+    estimada de linhas fica abaixo de limite * OCUPACAO_ALVO.
+
+    Dias sem histórico usam a média dos dias conhecidos; sem histórico
+    nenhum, o intervalo sai em uma única janela.
+    """
+    inicio, fim = para_data(inicio), para_data(fim)
+    if fim < inicio:
+        return []
+
+    if histograma is None:
+        histograma = carregar_histograma(metodo, escopo)
+
+    padrao = (
+        sum(histograma.values()) / len(histograma)
+        if histograma
+        else 0.0
+    )
+    alvo = max(1.0, limite * OCUPACAO_ALVO)
+
+    janelas: list[Janela] = []
+    abertura = inicio
+    soma = 0.0
+
+    for dia in _dias(inicio, fim):
+        estimado = histograma.get(dia, padrao)
+        if dia > abertura and soma + estimado > alvo:
+            janelas.append((abertura, dia - timedelta(days=1)))
+            abertura = dia
+            soma = 0.0
+        soma += estimado
+
+    janelas.append((abertura, fim))
+    return janelas
+
+
+def dividir_janela(inicio: date, fim: date) -> Optional[tuple[Janela, Janela]]:
+    """
+    Metades sem sobreposição; None quando a janela tem um único dia.
+    """
+    if fim <= inicio:
+        return None
+
+    meio = inicio + timedelta(days=(fim - inicio).days // 2)
+    return (inicio, meio), (meio + timedelta(days=1), fim)
+
+
+# ===========================================
+# 🚚 DOWNLOAD PARALELO
+# ===========================================
+def baixar_em_janelas(
+    metodo: str,
+    escopo: str,
+    janelas: Sequence[Janela],
+    buscar: Callable[[date, date], Optional[pd.DataFrame]],
+    limite: int = LIMITE_LINHAS_MICROVIX,
+    colunas_data: Sequence[str] = COLUNAS_DATA_PADRAO,
+    max_workers: int = MICROVIX_WORKERS,
+) -> Optional[pd.DataFrame]:
+    """
+    Baixa as janelas em paralelo com `buscar(inicio, fim)`.
+
+    Janelas que voltam com `limite` linhas ou mais são divididas e pedidas
+    de novo. O resultado segue a ordem das datas. Devolve None se alguma
+    chamada falhar (buscar devolveu None), para que quem chama não avance
+    marcos de sincronização por cima de dados faltantes.
+    """
+    if not janelas:
+        return pd.DataFrame()
+
+    partes: dict[Janela, pd.DataFrame] = {}
+    contagens: dict[date, int] = {}
+    falhou = False
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(janelas))),
+        thread_name_prefix="microvix-janela",
+    ) as executor:
+        pendentes = {
+            executor.submit(buscar, ini, fim): (ini, fim)
+            for ini, fim in janelas
+        }
+
+        while pendentes:
+            concluidos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+
+            for futuro in concluidos:
+                ini, fim = pendentes.pop(futuro)
+
+                try:
+                    df = futuro.result()
+                except Exception as e:
+                    log(f"⚠️ {metodo} {escopo} {ini} a {fim}: {e}")
+                    df = None
+
+                if df is None:
+                    falhou = True
+                    continue
+
+                metades = dividir_janela(ini, fim) if len(df) >= limite else None
+                if metades:
+                    log(f"🔁 {metodo} {ini} a {fim} cheio ({len(df)} linhas); dividindo em {metades[0][1]} | {metades[1][0]}.")
+                    for meia in metades:
+                        pendentes[executor.submit(buscar, *meia)] = meia
+                    continue
+
+                if len(df) >= limite:
+                    log(f"⚠️ {metodo} {escopo} {ini}: dia único continua cheio ({len(df)} linhas).")
+
+                partes[(ini, fim)] = df
+                contagens.update(contar_por_dia(df, ini, fim, colunas_data))
+
+    salvar_histograma(metodo, escopo, contagens)
+
+    if falhou:
+        return None
+
+    dfs = [partes[j] for j in sorted(partes) if not partes[j].empty]
+    if not dfs:
+        return pd.DataFrame()
+
+    return pd.concat(dfs, ignore_index=True)
@@ -3,27 +3,37 @@
 # ===========================================
 
 import requests
-from requests.auth import HTTPBasicAuth
-from lxml import etree
+import numpy as np
 import pandas as pd
 from datetime import date, datetime, timedelta
 import os
 import sys
 import time
 import json
+import hashlib
+import zlib
 import sqlite3
 import uuid
 import re
+import threading
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any
-from xml.sax.saxutils import escape
+from typing import Any, Callable
+
+from microvix_catalogo import atualizar_catalogo
+from microvix_checkpoint import paginar_incremental
+from microvix_client import (
+    MICROVIX_WORKERS,
+    MicrovixErro,
+    executar_por_cnpj,
+    post_microvix,
+    resposta_para_dataframe,
+)
 
 # === CREDENCIAIS MICROVIX ===
-USUARIO = "linx_export"
-SENHA   = "linx_export"
-CHAVE   = "2618f2b2-8f1d-4502-8321-342dc2cd1470"
-URL     = "https://webapi.microvix.com.br/1.0/api/integracao"
+# Usuário, senha, chave e URL ficam em microvix_client.py, compartilhados
+# por todos os sincronizadores.
 API_STOCK_SYNC_URL = "https://telefluxo-aplicacao.onrender.com/stock/sync"
 
 # CNPJ PRINCIPAL PARA O CONTEXTO DO CATÁLOGO
@@ -32,9 +42,6 @@ CNPJ_CONTEXTO = "12309173001309"
 # ✅ NOVO: caminho do Excel de classificação
 EXCEL_CLASSIFICACAO = r"C:\Users\Usuario\Desktop\TeleFluxo_Instalador\database\em_linha.xlsx"
 
-headers = {"Content-Type": "application/xml; charset=utf-8", "Accept": "application/xml"}
-auth    = HTTPBasicAuth(USUARIO, SENHA)
-
 # === CUSTO REAL POR IMEI ===
 #
 # A API não devolve o custo dentro de LinxProdutosSerial. O custo correto é
@@ -75,16 +82,49 @@ CUSTO_IMEI_MAPAS_CSV = [
 # Se ainda houver IMEIs sem custo após ler os caches, o histórico é pesquisado
 # por janelas crescentes. A primeira janela resolve compras recentes sem baixar
 # anos de movimentos. As demais só são executadas para IMEIs ainda faltantes.
+#
+# Toda página de LinxMovimentoSerial baixada nessas janelas fica no índice
+# local movimento_serial (serial -> cnpj, identificador, transação, data).
+# movimento_serial_cobertura guarda, por loja, as faixas de datas já varridas
+# e o último timestamp de cada uma: uma faixa coberta não é varrida de novo,
+# só consultada por timestamp > último para trazer movimentos novos.
 CUSTO_IMEI_DATA_MINIMA = date(2015, 1, 1)
 CUSTO_IMEI_LIMITES_DIAS = (120, 365, 1095)
 CUSTO_IMEI_ATUALIZAR_API = (
     os.getenv("CUSTO_IMEI_ATUALIZAR_API", "true").strip().lower()
     not in {"0", "false", "nao", "não", "n"}
 )
-CUSTO_IMEI_TEMPO_ESPERA_API = float(
-    os.getenv("CUSTO_IMEI_TEMPO_ESPERA_API", "0.08")
+
+# IMEIs sem nota de compra (transferências de fora do grupo, estoque
+# legado) ficam em custo_imei_miss com as janelas já pesquisadas. A janela
+# só é pesquisada de novo para o serial depois do backoff (dobra a cada
+# tentativa, de CUSTO_IMEI_MISS_BACKOFF_HORAS até
+# CUSTO_IMEI_MISS_BACKOFF_MAX_DIAS) ou quando o índice local ganhar
+# movimentos novos desse serial.
+CUSTO_IMEI_MISS_BACKOFF_HORAS = max(
+    1.0,
+    float(os.getenv("CUSTO_IMEI_MISS_BACKOFF_HORAS", "24")),
+)
+CUSTO_IMEI_MISS_BACKOFF_MAX_DIAS = max(
+    1.0,
+    float(os.getenv("CUSTO_IMEI_MISS_BACKOFF_MAX_DIAS", "30")),
+)
+
+# Documentos de compra (LinxMovimento) ainda fora do cache são baixados em
+# paralelo; o ritmo das chamadas continua com o limitador global.
+CUSTO_IMEI_DOCUMENTOS_WORKERS = max(
+    1,
+    int(os.getenv("CUSTO_IMEI_DOCUMENTOS_WORKERS", str(MICROVIX_WORKERS))),
 )
 
+# Os documentos ficam em documento_movimento_colunar como um blob zlib de
+# JSON por coluna ({"colunas": [...], "valores": [[coluna 1], ...]}): o nome
+# de cada coluna aparece uma vez, não uma vez por item. Linhas gravadas em
+# outra versão do formato são ignoradas e o documento é baixado de novo.
+# A tabela antiga documento_movimento (JSON por linha) é migrada aos
+# poucos, conforme os documentos são pedidos.
+DOCUMENTO_MOVIMENTO_VERSAO = 1
+
 # === 🏪 MAPEAMENTO DE LOJAS ===
 LOJAS_NOME = {
     "12309173001309": "ARAGUAIA SHOPPING", "12309173000418": "BOULEVARD SHOPPING",
@@ -106,7 +146,20 @@ JANELA_DIAS_MOV = 365
 
 # ✅ NOVO: comportamento padrão do estoque
 ESTOQUE_MODO_COMPLETO = True
-TEMPO_ESPERA_API = 0.1
+
+# Chave natural das linhas de LinxProdutosDetalhes no snapshot incremental
+# (as colunas ausentes na resposta são ignoradas).
+CHAVES_SNAPSHOT_DETALHES = [
+    "cod_produto",
+    "cod_deposito",
+    "id_deposito",
+    "deposito",
+    "tipo_estoque",
+]
+
+# O intervalo entre páginas não é mais um sleep fixo: todas as chamadas
+# passam pelo limitador global de microvix_client (MICROVIX_REQ_POR_SEGUNDO)
+# e as lojas são extraídas em paralelo (MICROVIX_WORKERS).
 
 # ===========================================
 # 🛠️ FUNÇÕES AUXILIARES
@@ -251,40 +304,89 @@ def normalizar_tipo_estoque(valor):
     return "ESTOQUE"
 
 
-def identificar_tipo_estoque_linha(row):
-    candidatos_exatos = [
-        "tipo_estoque",
-        "estoque_tipo",
-        "stock_type",
-        "tipo_saldo",
-        "deposito",
-        "nome_deposito",
-        "descricao_deposito",
-        "desc_deposito",
-        "deposito_descricao",
-        "local_estoque",
-        "origem_estoque",
-        "classificacao_estoque",
-        "status_estoque",
-        "aba_origem",
-        "sheet_name",
-    ]
+# Tabela de acentos de normalizar_tipo_estoque para a versão em Series.
+_ACENTOS_TIPO_ESTOQUE = str.maketrans("ÁÃÂÀÉÊÍÓÔÕÚÇ", "AAAAEEIOOOUC")
+
+# Colunas que podem indicar o tipo de estoque, na ordem de prioridade.
+CANDIDATOS_TIPO_ESTOQUE = [
+    "tipo_estoque",
+    "estoque_tipo",
+    "stock_type",
+    "tipo_saldo",
+    "deposito",
+    "nome_deposito",
+    "descricao_deposito",
+    "desc_deposito",
+    "deposito_descricao",
+    "local_estoque",
+    "origem_estoque",
+    "classificacao_estoque",
+    "status_estoque",
+    "aba_origem",
+    "sheet_name",
+]
+TERMOS_COLUNA_TIPO_ESTOQUE = ["deposit", "estoque", "amostra", "doa", "mostruario"]
+
+
+def normalizar_tipo_estoque_serie(serie):
+    """
+    Mesmo resultado de normalizar_tipo_estoque, aplicado à coluna inteira.
+    """
+    serie = serie.astype(object)
+    texto = (
+        serie.where(serie.notna() & serie.astype(bool), "")
+        .astype(str)
+        .str.strip()
+        .str.upper()
+        .str.translate(_ACENTOS_TIPO_ESTOQUE)
+    )
+
+    amostra = texto.str.contains("AMOSTRA|MOSTRUARIO|DEMONSTRACAO|EXPOSICAO", regex=True)
+    doa = (
+        texto.eq("DOA")
+        | texto.str.startswith("DOA ")
+        | texto.str.endswith(" DOA")
+        | texto.str.contains(" D.O.A", regex=False)
+    )
+
+    tipos = pd.Series("ESTOQUE", index=serie.index, dtype=object)
+    tipos[doa] = "DOA"
+    tipos[amostra] = "AMOSTRA"
+    return tipos
+
 
-    for coluna in candidatos_exatos:
-        if coluna in row.index:
-            tipo = normalizar_tipo_estoque(row.get(coluna))
-            if tipo != "ESTOQUE":
-                return tipo
+def identificar_tipo_estoque(df):
+    """
+    TIPO_ESTOQUE de cada linha: o primeiro tipo diferente de ESTOQUE
+    encontrado nas colunas candidatas (nomes exatos primeiro, depois
+    qualquer coluna cujo nome sugira depósito/estoque).
+    """
+    colunas = [c for c in CANDIDATOS_TIPO_ESTOQUE if c in df.columns]
 
     # Fallback para bases que trazem a informação em uma coluna com outro nome.
-    for coluna in row.index:
-        nome_coluna = str(coluna or "").strip().lower()
-        if any(termo in nome_coluna for termo in ["deposit", "estoque", "amostra", "doa", "mostruario"]):
-            tipo = normalizar_tipo_estoque(row.get(coluna))
-            if tipo != "ESTOQUE":
-                return tipo
+    colunas += [
+        c for c in df.columns
+        if c not in colunas
+        and any(termo in str(c or "").strip().lower() for termo in TERMOS_COLUNA_TIPO_ESTOQUE)
+    ]
 
-    return "ESTOQUE"
+    tipos = pd.Series("ESTOQUE", index=df.index, dtype=object)
+    pendentes = pd.Series(True, index=df.index)
+
+    for coluna in dict.fromkeys(colunas):
+        valores = df[coluna]
+        if isinstance(valores, pd.DataFrame):
+            valores = valores.iloc[:, 0]
+
+        tipo_coluna = normalizar_tipo_estoque_serie(valores)
+        encontrados = pendentes & tipo_coluna.ne("ESTOQUE")
+        tipos[encontrados] = tipo_coluna[encontrados]
+        pendentes &= ~encontrados
+
+        if not pendentes.any():
+            break
+
+    return tipos
 
 def _primeira_coluna_existente(df, candidatos):
     mapa = {str(c).strip().lower(): c for c in df.columns}
@@ -316,33 +418,52 @@ def expandir_quantidades_por_tipo(df):
     if not any([col_estoque, col_amostra, col_doa]):
         return df
 
-    linhas = []
-    for _, row in df.iterrows():
-        quantidade_generica = float(to_float([row.get("QUANTIDADE", row.get("quantidade", 0))]).iloc[0])
+    base = df.reset_index(drop=True)
+    zeros = pd.Series(0.0, index=base.index)
 
-        quantidades = {
-            "ESTOQUE": float(to_float([row.get(col_estoque, quantidade_generica) if col_estoque else quantidade_generica]).iloc[0]),
-            "AMOSTRA": float(to_float([row.get(col_amostra, 0) if col_amostra else 0]).iloc[0]),
-            "DOA": float(to_float([row.get(col_doa, 0) if col_doa else 0]).iloc[0]),
-        }
+    if "QUANTIDADE" in base.columns:
+        quantidade_generica = to_float(base["QUANTIDADE"])
+    elif "quantidade" in base.columns:
+        quantidade_generica = to_float(base["quantidade"])
+    else:
+        quantidade_generica = zeros
+
+    # Uma coluna por tipo, na ordem em que as linhas são geradas.
+    quantidades = pd.DataFrame({
+        "ESTOQUE": to_float(base[col_estoque]) if col_estoque else quantidade_generica,
+        "AMOSTRA": to_float(base[col_amostra]) if col_amostra else zeros,
+        "DOA": to_float(base[col_doa]) if col_doa else zeros,
+    })
+
+    longo = (
+        quantidades.rename_axis("POSICAO")
+        .reset_index()
+        .melt(id_vars="POSICAO", var_name="TIPO", value_name="QTD")
+    )
+    longo["ORDEM"] = longo["TIPO"].map({"ESTOQUE": 0, "AMOSTRA": 1, "DOA": 2})
+    longo = longo[longo["QTD"] > 0]
 
-        adicionou = False
-        for tipo, quantidade in quantidades.items():
-            if quantidade <= 0:
-                continue
-            nova = row.copy()
-            nova["TIPO_ESTOQUE"] = tipo
-            nova["QUANTIDADE"] = quantidade
-            linhas.append(nova)
-            adicionou = True
+    # Linhas sem nenhuma quantidade positiva seguem com o tipo já informado.
+    sem_quantidade = base.index.difference(longo["POSICAO"])
+    if "TIPO_ESTOQUE" in base.columns:
+        tipo_atual = normalizar_tipo_estoque_serie(base.loc[sem_quantidade, "TIPO_ESTOQUE"])
+    else:
+        tipo_atual = pd.Series("ESTOQUE", index=sem_quantidade, dtype=object)
+
+    restantes = pd.DataFrame({
+        "POSICAO": sem_quantidade,
+        "TIPO": tipo_atual.to_numpy(),
+        "QTD": quantidade_generica[sem_quantidade].to_numpy(),
+        "ORDEM": 0,
+    })
 
-        if not adicionou:
-            nova = row.copy()
-            nova["TIPO_ESTOQUE"] = normalizar_tipo_estoque(row.get("TIPO_ESTOQUE", "ESTOQUE"))
-            nova["QUANTIDADE"] = quantidade_generica
-            linhas.append(nova)
+    linhas = pd.concat([longo, restantes], ignore_index=True)
+    linhas = linhas.sort_values(["POSICAO", "ORDEM"], kind="stable", ignore_index=True)
 
-    return pd.DataFrame(linhas)
+    resultado = df.iloc[linhas["POSICAO"].to_numpy()].copy()
+    resultado["TIPO_ESTOQUE"] = linhas["TIPO"].to_numpy()
+    resultado["QUANTIDADE"] = linhas["QTD"].to_numpy()
+    return resultado
 
 
 # ✅ NOVO: helper para paginação segura por timestamp
@@ -367,30 +488,7 @@ def obter_proximo_timestamp(df, timestamp_atual):
 # 💰 CUSTO REAL DA COMPRA POR IMEI
 # ===========================================
 def resposta_api_para_dataframe(conteudo: bytes) -> pd.DataFrame:
-    root = etree.fromstring(conteudo)
-
-    sucesso = root.xpath(".//ResponseSuccess/text()")
-    if sucesso and sucesso[0].strip().lower() == "false":
-        mensagem = root.xpath(".//ResponseMessage/text()")
-        detalhe = mensagem[0] if mensagem else "Sem mensagem"
-        raise RuntimeError(detalhe)
-
-    colunas = [item.text for item in root.xpath(".//C[last()]/D")]
-    linhas = root.xpath(".//R")
-
-    if not colunas or not linhas:
-        return pd.DataFrame()
-
-    dados = [
-        dict(
-            zip(
-                colunas,
-                [item.text for item in linha.xpath("./D")],
-            )
-        )
-        for linha in linhas
-    ]
-    resultado = pd.DataFrame(dados)
+    resultado = resposta_para_dataframe(conteudo)
     resultado.columns = [
         str(coluna).strip().lower()
         for coluna in resultado.columns
@@ -398,46 +496,24 @@ def resposta_api_para_dataframe(conteudo: bytes) -> pd.DataFrame:
     return resultado
 
 
-def chamar_api_metodo(
+def consultar_api_metodo(
     metodo: str,
     parametros: dict[str, Any],
     timeout: int = 180,
-) -> pd.DataFrame:
-    parametros_xml = "".join(
-        f'<Parameter id="{escape(str(chave))}">'
-        f"{escape(str(valor))}</Parameter>"
-        for chave, valor in parametros.items()
-        if valor is not None
-    )
-
-    xml = f"""<?xml version="1.0" encoding="utf-8"?>
-    <LinxMicrovix>
-      <Authentication user="{escape(str(USUARIO))}" password="{escape(str(SENHA))}" />
-      <ResponseFormat>xml</ResponseFormat>
-      <Command>
-        <Name>{escape(str(metodo))}</Name>
-        <Parameters>
-          <Parameter id="chave">{escape(str(CHAVE))}</Parameter>
-          {parametros_xml}
-        </Parameters>
-      </Command>
-    </LinxMicrovix>"""
-
+) -> pd.DataFrame | None:
+    """
+    Como chamar_api_metodo, mas devolve None quando a chamada falha, para
+    quem precisa distinguir erro de resposta vazia.
+    """
     try:
-        resposta = requests.post(
-            URL,
-            data=xml.encode("utf-8"),
-            headers=headers,
-            auth=auth,
-            timeout=timeout,
-        )
+        resposta = post_microvix(metodo, parametros, timeout=timeout)
 
         if resposta.status_code != 200:
             log(
                 f"❌ HTTP {resposta.status_code} em {metodo} "
                 f"| params={parametros}"
             )
-            return pd.DataFrame()
+            return None
 
         return resposta_api_para_dataframe(resposta.content)
     except Exception as erro:
@@ -445,13 +521,24 @@ def chamar_api_metodo(
             f"❌ Falha em {metodo} | params={parametros} "
             f"| erro={erro}"
         )
-        return pd.DataFrame()
+        return None
+
+
+def chamar_api_metodo(
+    metodo: str,
+    parametros: dict[str, Any],
+    timeout: int = 180,
+) -> pd.DataFrame:
+    resultado = consultar_api_metodo(metodo, parametros, timeout=timeout)
+    return pd.DataFrame() if resultado is None else resultado
 
 
 def inicializar_cache_custos() -> sqlite3.Connection:
     CUSTO_IMEI_CACHE.parent.mkdir(parents=True, exist_ok=True)
 
-    conexao = sqlite3.connect(CUSTO_IMEI_CACHE)
+    # As threads de atualizar_indice_seriais gravam por esta conexão,
+    # sempre sob uma trava.
+    conexao = sqlite3.connect(CUSTO_IMEI_CACHE, check_same_thread=False)
     conexao.row_factory = sqlite3.Row
     conexao.execute("PRAGMA journal_mode=WAL")
     conexao.execute("PRAGMA synchronous=NORMAL")
@@ -480,6 +567,21 @@ def inicializar_cache_custos() -> sqlite3.Connection:
             PRIMARY KEY (cnpj_emp, identificador)
         );
 
+        CREATE TABLE IF NOT EXISTS documento_movimento_colunar (
+            cnpj_emp TEXT NOT NULL,
+            identificador TEXT NOT NULL,
+            versao INTEGER NOT NULL,
+            payload BLOB NOT NULL,
+            consultado_em TEXT NOT NULL,
+            PRIMARY KEY (cnpj_emp, identificador)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_documento_movimento_colunar_identificador
+        ON documento_movimento_colunar (identificador);
+
+        CREATE INDEX IF NOT EXISTS idx_documento_movimento_identificador
+        ON documento_movimento (identificador);
+
         CREATE TABLE IF NOT EXISTS cache_meta (
             chave TEXT PRIMARY KEY,
             valor TEXT,
@@ -488,6 +590,42 @@ def inicializar_cache_custos() -> sqlite3.Connection:
 
         CREATE INDEX IF NOT EXISTS idx_custo_imei_produto
         ON custo_imei (codigo_produto);
+
+        CREATE TABLE IF NOT EXISTS movimento_serial (
+            serial_normalizado TEXT NOT NULL,
+            cnpj_emp TEXT NOT NULL,
+            identificador TEXT NOT NULL,
+            transacao TEXT NOT NULL,
+            data_movimento TEXT,
+            janela_data_inicial TEXT NOT NULL,
+            janela_data_final TEXT NOT NULL,
+            timestamp INTEGER,
+            PRIMARY KEY (cnpj_emp, identificador, transacao, serial_normalizado)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_movimento_serial_serial
+        ON movimento_serial (serial_normalizado);
+
+        CREATE TABLE IF NOT EXISTS custo_imei_miss (
+            serial_normalizado TEXT NOT NULL,
+            janela INTEGER NOT NULL,
+            janela_data_inicial TEXT NOT NULL,
+            janela_data_final TEXT NOT NULL,
+            tentativas INTEGER NOT NULL,
+            movimentos_conhecidos INTEGER NOT NULL,
+            pesquisado_em TEXT NOT NULL,
+            proxima_tentativa TEXT NOT NULL,
+            PRIMARY KEY (serial_normalizado, janela)
+        );
+
+        CREATE TABLE IF NOT EXISTS movimento_serial_cobertura (
+            cnpj_emp TEXT NOT NULL,
+            data_inicial TEXT NOT NULL,
+            data_final TEXT NOT NULL,
+            ultimo_timestamp INTEGER NOT NULL,
+            atualizado_em TEXT NOT NULL,
+            PRIMARY KEY (cnpj_emp, data_inicial)
+        );
         """
     )
     conexao.commit()
@@ -913,436 +1051,945 @@ def gerar_janelas_historicas() -> list[tuple[date, date]]:
     return janelas
 
 
-def buscar_movimentos_seriais_janela(
-    seriais_alvo: set[str],
+FaixaCobertura = list[Any]  # [data_inicial, data_final, ultimo_timestamp]
+
+# Colunas de LinxMovimentoSerial procuradas (nesta ordem) para a data do
+# movimento gravada no índice.
+COLUNAS_DATA_MOVIMENTO_SERIAL = (
+    "data_documento",
+    "data_lancamento",
+    "data_movimento",
+    "dt_insert",
+)
+
+
+def paginar_movimento_serial(
+    cnpj: str,
     data_inicial: date,
     data_final: date,
-) -> pd.DataFrame:
-    encontrados: list[pd.DataFrame] = []
+    gravar_linhas: Callable[[list[tuple]], None],
+    timestamp_inicial: int = 0,
+) -> tuple[int | None, bool]:
+    """
+    Percorre as páginas de LinxMovimentoSerial da loja no intervalo, a
+    partir de timestamp_inicial, e entrega as linhas do índice de cada
+    página a `gravar_linhas` assim que ela chega: só uma página fica em
+    memória por loja. Devolve o maior timestamp recebido (None se nenhuma
+    linha voltou) e se a paginação foi até o fim sem erro de API.
+    """
+    ts = timestamp_inicial
+    completa = True
+    nome_loja = LOJAS_NOME.get(cnpj, cnpj)
 
-    for indice, cnpj in enumerate(CNPJS):
-        ts = 0
-        nome_loja = LOJAS_NOME.get(cnpj, cnpj)
+    log(
+        f"   🔎 Histórico de seriais {CNPJS.index(cnpj) + 1}/{len(CNPJS)} "
+        f"| {nome_loja} | {data_inicial} a {data_final}"
+        + (f" | timestamp > {timestamp_inicial}" if timestamp_inicial else "")
+    )
 
-        log(
-            f"   🔎 Histórico de seriais {indice + 1}/{len(CNPJS)} "
-            f"| {nome_loja} | {data_inicial} a {data_final}"
+    while True:
+        pagina = consultar_api_metodo(
+            "LinxMovimentoSerial",
+            {
+                "cnpjEmp": cnpj,
+                "data_inicial": data_inicial.isoformat(),
+                "data_fim": data_final.isoformat(),
+                "timestamp": str(ts),
+            },
         )
 
-        while True:
-            pagina = chamar_api_metodo(
-                "LinxMovimentoSerial",
-                {
-                    "cnpjEmp": cnpj,
-                    "data_inicial": data_inicial.isoformat(),
-                    "data_fim": data_final.isoformat(),
-                    "timestamp": str(ts),
-                },
-            )
+        if pagina is None:
+            completa = False
+            break
 
-            if pagina.empty:
-                break
+        if pagina.empty:
+            break
 
-            proximo_ts = obter_proximo_timestamp(pagina, ts)
+        gravar_linhas(linhas_indice_seriais(pagina, cnpj, data_inicial, data_final))
 
-            if "serial" in pagina.columns:
-                pagina["serial_normalizado"] = (
-                    pagina["serial"].map(normalizar_serial)
-                )
-                filtrada = pagina[
-                    pagina["serial_normalizado"].isin(seriais_alvo)
-                ].copy()
-
-                if not filtrada.empty:
-                    filtrada["cnpj_consultado"] = cnpj
-                    filtrada["janela_data_inicial"] = (
-                        data_inicial.isoformat()
-                    )
-                    filtrada["janela_data_final"] = (
-                        data_final.isoformat()
-                    )
-                    encontrados.append(filtrada)
+        proximo_ts = obter_proximo_timestamp(pagina, ts)
+        if proximo_ts is None:
+            break
 
-            if proximo_ts is None:
-                break
+        ts = proximo_ts
 
-            ts = proximo_ts
-            time.sleep(CUSTO_IMEI_TEMPO_ESPERA_API)
+    return ts if ts > timestamp_inicial else None, completa
 
-    if not encontrados:
-        return pd.DataFrame()
 
-    resultado = pd.concat(
-        encontrados,
-        ignore_index=True,
-        sort=False,
+def linhas_indice_seriais(
+    pagina: pd.DataFrame,
+    cnpj: str,
+    data_inicial: date,
+    data_final: date,
+) -> list[tuple]:
+    if pagina.empty or "serial" not in pagina.columns:
+        return []
+
+    def coluna(nome: str) -> pd.Series:
+        if nome in pagina.columns:
+            return pagina[nome].astype(object).where(pagina[nome].notna(), "")
+        return pd.Series("", index=pagina.index, dtype=object)
+
+    seriais = coluna("serial")
+    normalizados = {valor: normalizar_serial(valor) for valor in seriais.unique()}
+    transacoes = coluna("transacao")
+    transacoes_norm = {
+        valor: normalizar_codigo_produto(valor)
+        for valor in transacoes.unique()
+    }
+
+    coluna_data = next(
+        (c for c in COLUNAS_DATA_MOVIMENTO_SERIAL if c in pagina.columns),
+        None,
+    )
+    datas = coluna(coluna_data) if coluna_data else coluna("")
+    timestamps = (
+        pd.to_numeric(pagina["timestamp"], errors="coerce")
+        if "timestamp" in pagina.columns
+        else pd.Series(float("nan"), index=pagina.index)
     )
-    chaves = [
-        coluna
-        for coluna in [
-            "cnpj_consultado",
-            "identificador",
-            "transacao",
-            "serial_normalizado",
-        ]
-        if coluna in resultado.columns
-    ]
 
-    if chaves:
-        resultado = resultado.drop_duplicates(
-            subset=chaves,
-            keep="last",
+    return [
+        (
+            normalizados[serial],
+            cnpj,
+            str(identificador).strip(),
+            transacoes_norm[transacao],
+            str(data_movimento).strip(),
+            data_inicial.isoformat(),
+            data_final.isoformat(),
+            None if pd.isna(ts) else int(ts),
         )
-
-    return resultado
+        for serial, identificador, transacao, data_movimento, ts in zip(
+            seriais,
+            coluna("identificador"),
+            transacoes,
+            datas,
+            timestamps,
+        )
+        if normalizados[serial] and str(identificador).strip()
+    ]
 
 
-def obter_documento_movimento(
+def carregar_cobertura_seriais(
     conexao: sqlite3.Connection,
-    cnpj: str,
-    identificador: str,
-    data_inicial: str,
-    data_final: str,
-) -> pd.DataFrame:
-    cache = conexao.execute(
-        """
-        SELECT payload_json
-        FROM documento_movimento
-        WHERE cnpj_emp = ? AND identificador = ?
-        """,
-        (cnpj, identificador),
-    ).fetchone()
-
-    if cache is not None:
-        try:
-            registros = json.loads(cache["payload_json"])
-            if isinstance(registros, list):
-                return pd.DataFrame(registros)
-        except Exception:
-            pass
-
-    documento = chamar_api_metodo(
-        "LinxMovimento",
-        {
-            "cnpjEmp": cnpj,
-            "data_inicial": data_inicial,
-            "data_fim": data_final,
-            "timestamp": "0",
-            "identificador": identificador,
-        },
-    )
-
-    if documento.empty:
-        return documento
+) -> dict[str, list[FaixaCobertura]]:
+    cobertura: dict[str, list[FaixaCobertura]] = {}
 
-    conexao.execute(
+    for linha in conexao.execute(
         """
-        INSERT INTO documento_movimento (
-            cnpj_emp,
-            identificador,
-            payload_json,
-            consultado_em
+        SELECT cnpj_emp, data_inicial, data_final, ultimo_timestamp
+        FROM movimento_serial_cobertura
+        ORDER BY cnpj_emp, data_inicial
+        """
+    ):
+        cobertura.setdefault(linha["cnpj_emp"], []).append(
+            [
+                date.fromisoformat(linha["data_inicial"]),
+                date.fromisoformat(linha["data_final"]),
+                int(linha["ultimo_timestamp"]),
+            ]
         )
-        VALUES (?, ?, ?, ?)
-        ON CONFLICT(cnpj_emp, identificador) DO UPDATE SET
-            payload_json = excluded.payload_json,
-            consultado_em = excluded.consultado_em
-        """,
-        (
-            cnpj,
-            identificador,
-            json.dumps(
-                documento.astype(object).where(
-                    pd.notnull(documento),
-                    None,
-                ).to_dict(orient="records"),
-                ensure_ascii=False,
-                default=str,
-            ),
-            datetime.now().isoformat(timespec="seconds"),
-        ),
-    )
-    conexao.commit()
-    return documento
-
 
-def classificar_compra_original(
-    linha: pd.Series,
-) -> tuple[bool, int, str]:
-    operacao = normalizar_texto_custo(linha.get("operacao"))
-    tipo_transacao = normalizar_texto_custo(
-        linha.get("tipo_transacao")
-    )
-    natureza = normalizar_texto_custo(
-        linha.get("natureza_operacao")
-    )
-    cfop = normalizar_texto_custo(linha.get("id_cfop"))
-    desc_cfop = normalizar_texto_custo(linha.get("desc_cfop"))
-    conjunto = f"{natureza} {desc_cfop} {cfop}"
+    return cobertura
 
-    if valor_booleano_verdadeiro(linha.get("cancelado")):
-        return False, 99, "CANCELADO"
 
-    if valor_booleano_verdadeiro(linha.get("excluido")):
-        return False, 99, "EXCLUIDO"
+def faixas_descobertas(
+    faixas: list[FaixaCobertura],
+    data_inicial: date,
+    data_final: date,
+) -> list[tuple[date, date]]:
+    descobertas: list[tuple[date, date]] = []
+    cursor = data_inicial
 
-    eh_entrada = (
-        operacao == "E"
-        or operacao.startswith("E ")
-        or "(E)" in operacao
-        or "ENTRADA" in operacao
-    )
-    if not eh_entrada:
-        return False, 99, "NAO_E_ENTRADA"
-
-    termos_descartar = (
-        "TRANSFER",
-        "AJUSTE",
-        "DEVOLU",
-        "REMESSA",
-        "CONSIGN",
-        "BONIFICACAO",
-    )
-    if tipo_transacao in {"D", "T", "J"}:
-        return False, 99, "TRANSFERENCIA_OU_AJUSTE"
-
-    if any(termo in conjunto for termo in termos_descartar):
-        return False, 99, "NATUREZA_NAO_E_COMPRA"
-
-    termos_compra = (
-        "COMPRA",
-        "COMERCIALIZACAO",
-        "REVENDA",
-        "AQUISICAO",
-        "IMPORTACAO",
-        "MERCADORIA PARA REVENDA",
-    )
-    if any(termo in conjunto for termo in termos_compra):
-        return True, 0, "COMPRA_EXPLICITA"
+    for inicio, fim, _ in sorted(faixas):
+        if fim < cursor:
+            continue
+        if inicio > data_final:
+            break
+        if inicio > cursor:
+            descobertas.append((cursor, inicio - timedelta(days=1)))
+        cursor = max(cursor, fim + timedelta(days=1))
 
-    cfop_numerico = re.sub(r"\D", "", cfop)
-    if cfop_numerico.startswith(("1", "2", "3")):
-        return True, 1, "COMPRA_POR_CFOP"
+    if cursor <= data_final:
+        descobertas.append((cursor, data_final))
 
-    return True, 2, "ENTRADA_NAO_CLASSIFICADA"
+    return descobertas
 
 
-def extrair_custo_compra(
-    linha: pd.Series,
-) -> tuple[float, str]:
-    preco_unitario = numero_api(linha.get("preco_unitario"))
-    if preco_unitario > 0:
-        return round(preco_unitario, 4), "preco_unitario"
+def mesclar_faixas(faixas: list[FaixaCobertura]) -> list[FaixaCobertura]:
+    """
+    Une faixas sobrepostas ou vizinhas. A faixa unida fica com o menor
+    timestamp entre as partes, para que a próxima consulta incremental não
+    pule movimentos novos de nenhuma delas. Timestamp 0 marca uma faixa que
+    estava vazia quando foi varrida e não limita a faixa unida; faixas cuja
+    varredura falhou nunca chegam aqui (ver varrer_loja_indice).
+    """
+    mescladas: list[FaixaCobertura] = []
 
-    quantidade = abs(numero_api(linha.get("quantidade")))
-    divisor = quantidade if quantidade > 0 else 1.0
+    for inicio, fim, ts in sorted(faixas):
+        if mescladas and inicio <= mescladas[-1][1] + timedelta(days=1):
+            anterior = mescladas[-1][2]
+            mescladas[-1][1] = max(mescladas[-1][1], fim)
+            mescladas[-1][2] = min(anterior, ts) if anterior and ts else anterior or ts
+        else:
+            mescladas.append([inicio, fim, ts])
 
-    valor_total_unitario = (
-        numero_api(linha.get("valor_total")) / divisor
-    )
-    if valor_total_unitario > 0:
-        return round(valor_total_unitario, 4), "valor_total/quantidade"
+    return mescladas
 
-    valor_liquido_unitario = (
-        numero_api(linha.get("valor_liquido")) / divisor
-    )
-    if valor_liquido_unitario > 0:
-        return (
-            round(valor_liquido_unitario, 4),
-            "valor_liquido/quantidade",
-        )
 
-    return 0.0, ""
+def varrer_loja_indice(
+    cnpj: str,
+    faixas: list[FaixaCobertura],
+    data_inicial: date,
+    data_final: date,
+    atualizar: bool,
+    gravar_linhas: Callable[[list[tuple]], None],
+) -> list[FaixaCobertura]:
+    """
+    Roda em uma thread por loja: as linhas do índice vão para
+    `gravar_linhas` página a página e a função devolve as faixas de
+    cobertura novas da loja, gravadas depois pela thread principal.
+
+    Faixas já cobertas que tocam a janela são atualizadas por timestamp
+    (se `atualizar`); só os trechos nunca varridos são pedidos do zero.
+    Um trecho novo cuja paginação falhou não vira cobertura: com timestamp
+    0 ele seria absorvido pela faixa vizinha e os movimentos antigos nunca
+    seriam baixados. Fica descoberto e é pedido de novo na próxima execução.
+    """
+    faixas = [list(faixa) for faixa in faixas]
 
+    if atualizar:
+        for faixa in faixas:
+            inicio, fim, ultimo_ts = faixa
+            if fim < data_inicial or inicio > data_final:
+                continue
 
-def data_ordenacao_movimento(linha: pd.Series) -> pd.Timestamp:
-    for campo in ("data_lancamento", "data_documento", "dt_insert"):
-        valor = linha.get(campo)
-        if valor is None or str(valor).strip() == "":
-            continue
-        convertido = pd.to_datetime(valor, errors="coerce")
-        if not pd.isna(convertido):
-            return convertido
-    return pd.Timestamp.max
+            # As páginas chegam em ordem de timestamp: mesmo com erro no
+            # meio, o cursor pode avançar até a última página recebida.
+            maior_ts, _ = paginar_movimento_serial(
+                cnpj, inicio, fim, gravar_linhas, ultimo_ts
+            )
+            if maior_ts is not None:
+                faixa[2] = max(ultimo_ts, maior_ts)
 
+    for inicio, fim in faixas_descobertas(faixas, data_inicial, data_final):
+        maior_ts, completa = paginar_movimento_serial(cnpj, inicio, fim, gravar_linhas)
+        if completa:
+            faixas.append([inicio, fim, maior_ts or 0])
 
-def resolver_custos_dos_movimentos(
-    conexao: sqlite3.Connection,
-    movimentos_serial: pd.DataFrame,
-    produto_por_serial: dict[str, str],
-) -> int:
-    if movimentos_serial.empty:
-        return 0
+    return mesclar_faixas(faixas)
 
-    candidatos_por_serial: dict[str, list[dict[str, Any]]] = {}
-    chaves_documentos: dict[
-        tuple[str, str, str, str, str],
-        set[str],
-    ] = {}
 
-    for _, movimento in movimentos_serial.iterrows():
-        serial = normalizar_serial(
-            movimento.get("serial_normalizado")
-            or movimento.get("serial")
-        )
-        cnpj = str(
-            movimento.get("cnpj_consultado")
-            or movimento.get("cnpj_emp")
-            or ""
-        ).strip()
-        identificador = str(
-            movimento.get("identificador") or ""
-        ).strip()
-        transacao = normalizar_codigo_produto(
-            movimento.get("transacao")
-        )
-        data_inicial = str(
-            movimento.get("janela_data_inicial") or ""
-        )
-        data_final = str(
-            movimento.get("janela_data_final") or ""
-        )
+def atualizar_indice_seriais(
+    conexao: sqlite3.Connection,
+    data_inicial: date,
+    data_final: date,
+    lojas_atualizadas: set[str],
+) -> None:
+    """
+    Garante que [data_inicial, data_final] está no índice movimento_serial
+    para todas as lojas. Cada loja tem suas faixas já cobertas atualizadas
+    por timestamp uma vez por execução (lojas_atualizadas).
 
-        if not serial or not cnpj or not identificador:
-            continue
+    As threads gravam as linhas do índice página a página (o pico de
+    memória é uma página por loja); a cobertura só é gravada no fim, então
+    uma execução interrompida no meio apenas repete a varredura depois.
+    """
+    cobertura = carregar_cobertura_seriais(conexao)
+    trava = threading.Lock()
 
-        chave = (
-            cnpj,
-            identificador,
-            transacao,
-            data_inicial,
-            data_final,
-        )
-        chaves_documentos.setdefault(chave, set()).add(serial)
+    def gravar_linhas(linhas: list[tuple]) -> None:
+        if not linhas:
+            return
 
-    total_documentos = len(chaves_documentos)
+        with trava, conexao:
+            conexao.executemany(
+                """
+                INSERT INTO movimento_serial (
+                    serial_normalizado,
+                    cnpj_emp,
+                    identificador,
+                    transacao,
+                    data_movimento,
+                    janela_data_inicial,
+                    janela_data_final,
+                    timestamp
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(cnpj_emp, identificador, transacao, serial_normalizado)
+                DO UPDATE SET
+                    data_movimento = excluded.data_movimento,
+                    janela_data_inicial = excluded.janela_data_inicial,
+                    janela_data_final = excluded.janela_data_final,
+                    timestamp = excluded.timestamp
+                """,
+                linhas,
+            )
 
-    for indice, (
-        (
-            cnpj,
-            identificador,
-            transacao,
-            data_inicial,
-            data_final,
-        ),
-        seriais,
-    ) in enumerate(chaves_documentos.items()):
-        log(
-            f"      📄 Documento {indice + 1}/{total_documentos} "
-            f"| {identificador}"
-        )
-        documento = obter_documento_movimento(
-            conexao,
+    def varrer(cnpj: str) -> list[FaixaCobertura]:
+        return varrer_loja_indice(
             cnpj,
-            identificador,
+            cobertura.get(cnpj, []),
             data_inicial,
             data_final,
+            atualizar=cnpj not in lojas_atualizadas,
+            gravar_linhas=gravar_linhas,
         )
 
-        if documento.empty:
-            continue
+    resultados = executar_por_cnpj(varrer, CNPJS)
+    agora = datetime.now().isoformat(timespec="seconds")
 
-        if "transacao" in documento.columns and transacao:
-            transacoes = documento["transacao"].map(
-                normalizar_codigo_produto
+    with conexao:
+        for cnpj, faixas in zip(CNPJS, resultados):
+            conexao.execute(
+                "DELETE FROM movimento_serial_cobertura WHERE cnpj_emp = ?",
+                (cnpj,),
             )
-            por_transacao = documento[transacoes == transacao].copy()
-            if not por_transacao.empty:
-                documento = por_transacao
-
-        for serial in seriais:
-            codigo_esperado = produto_por_serial.get(serial, "")
-            linhas_serial = documento
-
-            if codigo_esperado and "cod_produto" in documento.columns:
-                codigos = documento["cod_produto"].map(
-                    normalizar_codigo_produto
-                )
-                por_produto = documento[
-                    codigos == codigo_esperado
-                ].copy()
-                if not por_produto.empty:
-                    linhas_serial = por_produto
-
-            for _, linha in linhas_serial.iterrows():
-                valida, prioridade, tipo_candidato = (
-                    classificar_compra_original(linha)
+            conexao.executemany(
+                """
+                INSERT INTO movimento_serial_cobertura (
+                    cnpj_emp,
+                    data_inicial,
+                    data_final,
+                    ultimo_timestamp,
+                    atualizado_em
                 )
-                if not valida:
-                    continue
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [
+                    (cnpj, inicio.isoformat(), fim.isoformat(), int(ts), agora)
+                    for inicio, fim, ts in faixas
+                ],
+            )
 
-                custo, campo_origem = extrair_custo_compra(linha)
-                if custo <= 0:
-                    continue
+    lojas_atualizadas.update(CNPJS)
 
-                candidatos_por_serial.setdefault(serial, []).append(
-                    {
-                        "serial": serial,
-                        "codigo_produto": (
-                            normalizar_codigo_produto(
-                                linha.get("cod_produto")
-                            )
-                            or codigo_esperado
-                        ),
-                        "custo": custo,
-                        "documento": str(
-                            linha.get("documento") or ""
-                        ).strip(),
-                        "serie": str(
-                            linha.get("serie") or ""
-                        ).strip(),
-                        "data_entrada": str(
-                            linha.get("data_lancamento")
-                            or linha.get("data_documento")
-                            or ""
-                        ).strip(),
-                        "cnpj": cnpj,
-                        "identificador": identificador,
-                        "transacao": (
-                            normalizar_codigo_produto(
-                                linha.get("transacao")
-                            )
-                            or transacao
-                        ),
-                        "campo_origem": campo_origem,
-                        "prioridade": prioridade,
-                        "tipo_candidato": tipo_candidato,
-                        "data_ordenacao": data_ordenacao_movimento(
-                            linha
-                        ),
-                    }
-                )
 
+def consultar_indice_seriais(
+    conexao: sqlite3.Connection,
+    seriais: set[str],
+) -> pd.DataFrame:
+    """
+    Movimentos do índice local para os seriais pedidos, com as mesmas
+    colunas que resolver_custos_dos_movimentos espera.
+    """
+    linhas = []
+    lista = sorted(seriais)
+    tamanho_lote = 800
+
+    for inicio in range(0, len(lista), tamanho_lote):
+        lote = lista[inicio: inicio + tamanho_lote]
+        placeholders = ",".join("?" for _ in lote)
+        linhas.extend(
+            conexao.execute(
+                f"""
+                SELECT
+                    serial_normalizado,
+                    cnpj_emp AS cnpj_consultado,
+                    identificador,
+                    transacao,
+                    janela_data_inicial,
+                    janela_data_final
+                FROM movimento_serial
+                WHERE serial_normalizado IN ({placeholders})
+                """,
+                lote,
+            ).fetchall()
+        )
+
+    return pd.DataFrame(
+        [dict(linha) for linha in linhas],
+        columns=[
+            "serial_normalizado",
+            "cnpj_consultado",
+            "identificador",
+            "transacao",
+            "janela_data_inicial",
+            "janela_data_final",
+        ],
+    )
+
+
+ChaveDocumento = tuple[str, str]
+
+
+def compactar_documento(documento: pd.DataFrame) -> bytes:
+    valores = documento.astype(object).where(pd.notnull(documento), None)
+    return zlib.compress(
+        json.dumps(
+            {
+                "colunas": [str(coluna) for coluna in documento.columns],
+                "valores": valores.to_numpy().T.tolist(),
+            },
+            ensure_ascii=False,
+            default=str,
+            separators=(",", ":"),
+        ).encode("utf-8")
+    )
+
+
+def descompactar_documento(payload: bytes) -> pd.DataFrame:
+    dados = json.loads(zlib.decompress(payload))
+    return pd.DataFrame(dict(zip(dados["colunas"], dados["valores"])))
+
+
+def carregar_documentos_cache(
+    conexao: sqlite3.Connection,
+    chaves: set[ChaveDocumento],
+) -> dict[ChaveDocumento, pd.DataFrame]:
+    """
+    Lê do cache todos os documentos pedidos, em uma consulta por lote de
+    identificadores.
+
+    Documentos que só existem no formato antigo (documento_movimento, JSON
+    por linha) são convertidos e regravados no formato colunar.
+    """
+    documentos: dict[ChaveDocumento, pd.DataFrame] = {}
+    identificadores = {identificador for _, identificador in chaves}
+
+    for linha in _consultar_em_lotes(
+        conexao,
+        """
+        SELECT cnpj_emp, identificador, versao, payload
+        FROM documento_movimento_colunar
+        WHERE identificador IN ({placeholders})
+        """,
+        identificadores,
+    ):
+        chave = (linha["cnpj_emp"], linha["identificador"])
+        if chave not in chaves or linha["versao"] != DOCUMENTO_MOVIMENTO_VERSAO:
+            continue
+
+        try:
+            documentos[chave] = descompactar_documento(linha["payload"])
+        except Exception:
+            pass
+
+    legados: dict[ChaveDocumento, pd.DataFrame] = {}
+
+    for linha in _consultar_em_lotes(
+        conexao,
+        """
+        SELECT cnpj_emp, identificador, payload_json
+        FROM documento_movimento
+        WHERE identificador IN ({placeholders})
+        """,
+        {identificador for _, identificador in chaves - documentos.keys()},
+    ):
+        chave = (linha["cnpj_emp"], linha["identificador"])
+        if chave not in chaves or chave in documentos:
+            continue
+
+        try:
+            registros = json.loads(linha["payload_json"])
+            if isinstance(registros, list):
+                legados[chave] = pd.DataFrame(registros)
+        except Exception:
+            pass
+
+    if legados:
+        gravar_documentos_movimento(conexao, legados)
+        documentos.update(legados)
+
+    return documentos
+
+
+def baixar_documento_movimento(
+    cnpj: str,
+    identificador: str,
+    data_inicial: str,
+    data_final: str,
+) -> pd.DataFrame:
+    return chamar_api_metodo(
+        "LinxMovimento",
+        {
+            "cnpjEmp": cnpj,
+            "data_inicial": data_inicial,
+            "data_fim": data_final,
+            "timestamp": "0",
+            "identificador": identificador,
+        },
+    )
+
+
+def gravar_documentos_movimento(
+    conexao: sqlite3.Connection,
+    documentos: dict[ChaveDocumento, pd.DataFrame],
+) -> None:
+    """
+    Grava todos os documentos baixados em uma única transação, no formato
+    colunar, e tira as mesmas chaves da tabela antiga.
+    """
     agora = datetime.now().isoformat(timespec="seconds")
-    registros = []
+    registros = [
+        (
+            cnpj,
+            identificador,
+            DOCUMENTO_MOVIMENTO_VERSAO,
+            compactar_documento(documento),
+            agora,
+        )
+        for (cnpj, identificador), documento in documentos.items()
+        if not documento.empty
+    ]
+
+    if not registros:
+        return
 
-    for serial, candidatos in candidatos_por_serial.items():
-        candidatos.sort(
-            key=lambda item: (
-                item["prioridade"],
-                item["data_ordenacao"],
-                item["documento"],
+    with conexao:
+        conexao.executemany(
+            """
+            INSERT INTO documento_movimento_colunar (
+                cnpj_emp,
+                identificador,
+                versao,
+                payload,
+                consultado_em
             )
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(cnpj_emp, identificador) DO UPDATE SET
+                versao = excluded.versao,
+                payload = excluded.payload,
+                consultado_em = excluded.consultado_em
+            """,
+            registros,
         )
-        escolhido = candidatos[0]
-        registros.append(
-            (
-                serial,
-                escolhido["codigo_produto"],
-                escolhido["custo"],
-                escolhido["documento"],
-                escolhido["serie"],
-                escolhido["data_entrada"],
-                escolhido["cnpj"],
-                escolhido["identificador"],
-                escolhido["transacao"],
-                (
-                    f"{escolhido['campo_origem']}::"
-                    f"{escolhido['tipo_candidato']}"
-                ),
-                agora,
-            )
+        conexao.executemany(
+            """
+            DELETE FROM documento_movimento
+            WHERE cnpj_emp = ? AND identificador = ?
+            """,
+            [registro[:2] for registro in registros],
+        )
+
+
+def obter_documentos_movimento(
+    conexao: sqlite3.Connection,
+    janelas_por_documento: dict[ChaveDocumento, tuple[str, str]],
+) -> dict[ChaveDocumento, pd.DataFrame]:
+    """
+    Devolve os documentos LinxMovimento pedidos, por (cnpj, identificador).
+
+    Os que já estão no cache vêm de uma leitura em lote; os demais são
+    baixados em um pool limitado de threads (CUSTO_IMEI_DOCUMENTOS_WORKERS)
+    e gravados juntos no fim. Documentos que voltam vazios (falha ou
+    inexistentes) não entram no cache e são pedidos de novo na próxima
+    execução.
+    """
+    documentos = carregar_documentos_cache(
+        conexao,
+        set(janelas_por_documento),
+    )
+    pendentes: dict[ChaveDocumento, tuple[str, str]] = {
+        chave: janela
+        for chave, janela in janelas_por_documento.items()
+        if chave not in documentos
+    }
+
+    if not pendentes:
+        return documentos
+
+    log(
+        f"      📄 Documentos de compra: {len(documentos)} no cache, "
+        f"{len(pendentes)} para baixar..."
+    )
+
+    baixados: dict[ChaveDocumento, pd.DataFrame] = {}
+
+    with ThreadPoolExecutor(
+        max_workers=min(CUSTO_IMEI_DOCUMENTOS_WORKERS, len(pendentes)),
+        thread_name_prefix="microvix-documento",
+    ) as executor:
+        futuros = {
+            executor.submit(
+                baixar_documento_movimento,
+                cnpj,
+                identificador,
+                data_inicial,
+                data_final,
+            ): (cnpj, identificador)
+            for (cnpj, identificador), (data_inicial, data_final)
+            in pendentes.items()
+        }
+
+        for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+            baixados[futuros[futuro]] = futuro.result()
+
+            if concluidos % 50 == 0 or concluidos == len(futuros):
+                log(
+                    f"      📄 Documentos baixados: "
+                    f"{concluidos}/{len(futuros)}"
+                )
+
+    gravar_documentos_movimento(conexao, baixados)
+    documentos.update(baixados)
+    return documentos
+
+
+# Termos procurados em "natureza desc_cfop cfop" das entradas.
+TERMOS_NAO_COMPRA = (
+    "TRANSFER",
+    "AJUSTE",
+    "DEVOLU",
+    "REMESSA",
+    "CONSIGN",
+    "BONIFICACAO",
+)
+TERMOS_COMPRA = (
+    "COMPRA",
+    "COMERCIALIZACAO",
+    "REVENDA",
+    "AQUISICAO",
+    "IMPORTACAO",
+    "MERCADORIA PARA REVENDA",
+)
+
+# Campos de data do LinxMovimento usados (nesta ordem) para desempatar
+# candidatos da mesma prioridade.
+CAMPOS_DATA_MOVIMENTO = ("data_lancamento", "data_documento", "dt_insert")
+
+
+def mapear_valores_unicos(serie: pd.Series, funcao) -> pd.Series:
+    """
+    Aplica `funcao` uma vez por valor distinto da coluna. As linhas de um
+    documento repetem os mesmos textos e números, então normalizar e
+    converter só os valores distintos evita o custo por linha.
+
+    Valores ausentes (None ou NaN) chegam à função como None.
+    """
+    codigos, unicos = pd.factorize(serie)
+    valores = [funcao(valor) for valor in unicos] + [funcao(None)]
+
+    resultado = np.empty(len(valores), dtype=object)
+    resultado[:] = valores
+    return pd.Series(resultado[codigos], index=serie.index, dtype=object)
+
+
+def coluna_documento(documento: pd.DataFrame, nome: str) -> pd.Series:
+    if nome in documento.columns:
+        return documento[nome].astype(object)
+    return pd.Series(None, index=documento.index, dtype=object)
+
+
+def primeiro_preenchido(*colunas: pd.Series) -> pd.Series:
+    """
+    O `a or b or ...` de cada linha: o primeiro valor não vazio entre as
+    colunas, ou o da última.
+    """
+    resultado = colunas[-1]
+    for coluna in reversed(colunas[:-1]):
+        preenchido = mapear_valores_unicos(coluna, bool).astype(bool)
+        resultado = coluna.where(preenchido, resultado)
+    return resultado
+
+
+def _texto_limpo(valor: Any) -> str:
+    return str(valor or "").strip()
+
+
+def _data_movimento(valor: Any) -> Any:
+    if valor is None or str(valor).strip() == "":
+        return pd.NaT
+    return pd.to_datetime(valor, errors="coerce")
+
+
+def classificar_compras(documento: pd.DataFrame) -> pd.DataFrame:
+    """
+    Classifica todas as linhas de um documento LinxMovimento de uma vez.
+
+    Para cada linha devolve se ela é candidata a compra original
+    (valida), a prioridade (0 = compra explícita, 1 = CFOP de entrada,
+    2 = entrada não classificada, 99 = descartada) e o motivo, o custo
+    unitário com o campo de origem, a data usada no desempate e os textos
+    gravados em custo_imei.
+
+    O custo vem de preco_unitario; sem ele, de valor_total ou valor_liquido
+    dividido pela quantidade. preco_custo e custo_medio não entram.
+    """
+    def texto(nome: str) -> pd.Series:
+        return mapear_valores_unicos(
+            coluna_documento(documento, nome),
+            normalizar_texto_custo,
+        ).astype(str)
+
+    def numero(nome: str) -> pd.Series:
+        return mapear_valores_unicos(
+            coluna_documento(documento, nome),
+            numero_api,
+        ).astype(float)
+
+    def booleano(nome: str) -> pd.Series:
+        return mapear_valores_unicos(
+            coluna_documento(documento, nome),
+            valor_booleano_verdadeiro,
+        ).astype(bool)
+
+    operacao = texto("operacao")
+    tipo_transacao = texto("tipo_transacao")
+    cfop = texto("id_cfop")
+    conjunto = texto("natureza_operacao") + " " + texto("desc_cfop") + " " + cfop
+
+    eh_entrada = (
+        operacao.eq("E")
+        | operacao.str.startswith("E ")
+        | operacao.str.contains("(E)", regex=False)
+        | operacao.str.contains("ENTRADA", regex=False)
+    )
+
+    def contem_algum(termos: tuple[str, ...]) -> pd.Series:
+        return conjunto.str.contains("|".join(map(re.escape, termos)), regex=True)
+
+    # Mesma ordem de avaliação da regra por linha: vale a primeira que casar.
+    regras = [
+        (booleano("cancelado"), False, 99, "CANCELADO"),
+        (booleano("excluido"), False, 99, "EXCLUIDO"),
+        (~eh_entrada, False, 99, "NAO_E_ENTRADA"),
+        (tipo_transacao.isin({"D", "T", "J"}), False, 99, "TRANSFERENCIA_OU_AJUSTE"),
+        (contem_algum(TERMOS_NAO_COMPRA), False, 99, "NATUREZA_NAO_E_COMPRA"),
+        (contem_algum(TERMOS_COMPRA), True, 0, "COMPRA_EXPLICITA"),
+        (
+            cfop.str.replace(r"\D", "", regex=True).str.match(r"[123]"),
+            True,
+            1,
+            "COMPRA_POR_CFOP",
+        ),
+    ]
+    condicoes = [regra[0].to_numpy(dtype=bool) for regra in regras]
+
+    preco_unitario = numero("preco_unitario")
+    quantidade = numero("quantidade").abs()
+    divisor = quantidade.where(quantidade > 0, 1.0)
+    valor_total = numero("valor_total") / divisor
+    valor_liquido = numero("valor_liquido") / divisor
+    fontes_custo = [
+        (preco_unitario, "preco_unitario"),
+        (valor_total, "valor_total/quantidade"),
+        (valor_liquido, "valor_liquido/quantidade"),
+    ]
+    tem_custo = [(valor > 0).to_numpy() for valor, _ in fontes_custo]
+
+    datas = pd.Series(pd.Timestamp.max, index=documento.index, dtype=object)
+    for campo in reversed(CAMPOS_DATA_MOVIMENTO):
+        convertida = mapear_valores_unicos(
+            coluna_documento(documento, campo),
+            _data_movimento,
         )
+        datas = convertida.where(convertida.notna(), datas)
+
+    data_entrada = mapear_valores_unicos(
+        primeiro_preenchido(
+            coluna_documento(documento, "data_lancamento"),
+            coluna_documento(documento, "data_documento"),
+        ),
+        _texto_limpo,
+    )
+
+    return pd.DataFrame(
+        {
+            "valida": np.select(condicoes, [r[1] for r in regras], True),
+            "prioridade": np.select(condicoes, [r[2] for r in regras], 2),
+            "tipo_candidato": np.select(
+                condicoes,
+                [r[3] for r in regras],
+                "ENTRADA_NAO_CLASSIFICADA",
+            ),
+            "custo": np.select(
+                tem_custo,
+                [valor.round(4).to_numpy() for valor, _ in fontes_custo],
+                0.0,
+            ),
+            "campo_origem": np.select(
+                tem_custo,
+                [campo for _, campo in fontes_custo],
+                "",
+            ),
+            "data_ordenacao": datas.to_numpy(),
+            "codigo_linha": mapear_valores_unicos(
+                coluna_documento(documento, "cod_produto"),
+                normalizar_codigo_produto,
+            ).to_numpy(),
+            "transacao_linha": mapear_valores_unicos(
+                coluna_documento(documento, "transacao"),
+                normalizar_codigo_produto,
+            ).to_numpy(),
+            "documento": mapear_valores_unicos(
+                coluna_documento(documento, "documento"),
+                _texto_limpo,
+            ).to_numpy(),
+            "serie": mapear_valores_unicos(
+                coluna_documento(documento, "serie"),
+                _texto_limpo,
+            ).to_numpy(),
+            "data_entrada": data_entrada.to_numpy(),
+        }
+    )
+
+
+def resolver_custos_dos_movimentos(
+    conexao: sqlite3.Connection,
+    movimentos_serial: pd.DataFrame,
+    produto_por_serial: dict[str, str],
+) -> int:
+    if movimentos_serial.empty:
+        return 0
+
+    def coluna(nome: str) -> pd.Series:
+        return coluna_documento(movimentos_serial, nome)
+
+    movimentos = pd.DataFrame(
+        {
+            "serial": mapear_valores_unicos(
+                primeiro_preenchido(coluna("serial_normalizado"), coluna("serial")),
+                normalizar_serial,
+            ),
+            "cnpj": mapear_valores_unicos(
+                primeiro_preenchido(coluna("cnpj_consultado"), coluna("cnpj_emp")),
+                _texto_limpo,
+            ),
+            "identificador": mapear_valores_unicos(
+                coluna("identificador"),
+                _texto_limpo,
+            ),
+            "transacao_chave": mapear_valores_unicos(
+                coluna("transacao"),
+                normalizar_codigo_produto,
+            ),
+            "data_inicial": mapear_valores_unicos(
+                coluna("janela_data_inicial"),
+                lambda valor: str(valor or ""),
+            ),
+            "data_final": mapear_valores_unicos(
+                coluna("janela_data_final"),
+                lambda valor: str(valor or ""),
+            ),
+        }
+    )
+    movimentos = movimentos[
+        movimentos["serial"].ne("")
+        & movimentos["cnpj"].ne("")
+        & movimentos["identificador"].ne("")
+    ]
+
+    if movimentos.empty:
+        return 0
+
+    # Um mesmo documento pode aparecer em mais de uma janela ou transação;
+    # é baixado uma vez só, com a primeira janela em que apareceu.
+    janelas = movimentos.drop_duplicates(subset=["cnpj", "identificador"])
+    janelas_por_documento: dict[ChaveDocumento, tuple[str, str]] = {
+        (cnpj, identificador): (data_inicial, data_final)
+        for cnpj, identificador, data_inicial, data_final in zip(
+            janelas["cnpj"],
+            janelas["identificador"],
+            janelas["data_inicial"],
+            janelas["data_final"],
+        )
+    }
+
+    documentos = obter_documentos_movimento(
+        conexao,
+        janelas_por_documento,
+    )
+
+    # Cada linha de documento é classificada uma vez, não uma vez por
+    # serial que aponta para o documento.
+    partes = [
+        classificar_compras(documento).assign(
+            cnpj=cnpj,
+            identificador=identificador,
+        )
+        for (cnpj, identificador), documento in documentos.items()
+        if not documento.empty
+    ]
+    if not partes:
+        return 0
+
+    linhas = pd.concat(partes, ignore_index=True)
+    linhas["linha_ordem"] = np.arange(len(linhas))
+
+    # Lista de seriais: um par por (documento, transação, serial), com o
+    # produto esperado do serial. Os pares seguem a ordem em que cada
+    # documento/transação apareceu, que decide os empates.
+    grupo = ["cnpj", "identificador", "transacao_chave"]
+    movimentos = movimentos.assign(
+        chave_ordem=movimentos.groupby(
+            grupo + ["data_inicial", "data_final"],
+            sort=False,
+        ).ngroup()
+    ).sort_values("chave_ordem", kind="stable")
+    pares = movimentos.drop_duplicates(
+        subset=grupo + ["serial"],
+        ignore_index=True,
+    )[grupo + ["serial"]]
+    pares["codigo_esperado"] = pares["serial"].map(produto_por_serial).fillna("")
+    pares["par_ordem"] = np.arange(len(pares))
+
+    # Dentro do documento ficam só as linhas da transação do serial, se
+    # houver alguma.
+    base = pares[grupo].drop_duplicates().merge(
+        linhas,
+        on=["cnpj", "identificador"],
+    )
+    da_transacao = (
+        base["transacao_chave"].ne("")
+        & base["transacao_linha"].eq(base["transacao_chave"])
+    )
+    base = base[
+        da_transacao
+        | ~da_transacao.groupby([base[c] for c in grupo]).transform("any")
+    ]
+
+    # Depois, só as linhas do produto do serial; sem nenhuma, o serial
+    # fica com todas as linhas da transação.
+    por_produto = pares[pares["codigo_esperado"].ne("")].merge(
+        base,
+        left_on=grupo + ["codigo_esperado"],
+        right_on=grupo + ["codigo_linha"],
+    )
+    sem_produto = pares[
+        ~pares["par_ordem"].isin(por_produto["par_ordem"])
+    ].merge(base, on=grupo)
+
+    candidatos = pd.concat([por_produto, sem_produto], ignore_index=True)
+    candidatos = candidatos[candidatos["valida"] & (candidatos["custo"] > 0)]
+
+    if candidatos.empty:
+        return 0
+
+    # Melhor candidato por serial: menor prioridade, depois a entrada mais
+    # antiga e o documento; no empate, a ordem dos documentos.
+    escolhidos = (
+        candidatos.sort_values(["par_ordem", "linha_ordem"])
+        .sort_values(
+            ["serial", "prioridade", "data_ordenacao", "documento"],
+            kind="stable",
+        )
+        .drop_duplicates(subset=["serial"])
+    )
+
+    agora = datetime.now().isoformat(timespec="seconds")
+    registros = list(
+        zip(
+            escolhidos["serial"],
+            escolhidos["codigo_linha"].where(
+                escolhidos["codigo_linha"].ne(""),
+                escolhidos["codigo_esperado"],
+            ),
+            escolhidos["custo"].astype(float),
+            escolhidos["documento"],
+            escolhidos["serie"],
+            escolhidos["data_entrada"],
+            escolhidos["cnpj"],
+            escolhidos["identificador"],
+            escolhidos["transacao_linha"].where(
+                escolhidos["transacao_linha"].ne(""),
+                escolhidos["transacao_chave"],
+            ),
+            escolhidos["campo_origem"] + "::" + escolhidos["tipo_candidato"],
+            [agora] * len(escolhidos),
+        )
+    )
 
     conexao.executemany(
         """
@@ -1359,28 +2006,211 @@ def resolver_custos_dos_movimentos(
             campo_origem,
             atualizado_em
         )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(serial_normalizado) DO UPDATE SET
-            codigo_produto = excluded.codigo_produto,
-            custo_aquisicao = excluded.custo_aquisicao,
-            documento = excluded.documento,
-            serie = excluded.serie,
-            data_entrada = excluded.data_entrada,
-            cnpj_compra = excluded.cnpj_compra,
-            identificador = excluded.identificador,
-            transacao = excluded.transacao,
-            campo_origem = excluded.campo_origem,
-            atualizado_em = excluded.atualizado_em
-        """,
-        registros,
-    )
-    conexao.commit()
-    return len(registros)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(serial_normalizado) DO UPDATE SET
+            codigo_produto = excluded.codigo_produto,
+            custo_aquisicao = excluded.custo_aquisicao,
+            documento = excluded.documento,
+            serie = excluded.serie,
+            data_entrada = excluded.data_entrada,
+            cnpj_compra = excluded.cnpj_compra,
+            identificador = excluded.identificador,
+            transacao = excluded.transacao,
+            campo_origem = excluded.campo_origem,
+            atualizado_em = excluded.atualizado_em
+        """,
+        registros,
+    )
+    conexao.commit()
+    return len(registros)
+
+
+def _consultar_em_lotes(
+    conexao: sqlite3.Connection,
+    consulta: str,
+    valores: set[str],
+) -> list[sqlite3.Row]:
+    """
+    Roda `consulta` (com {placeholders} no IN) em lotes de valores.
+    """
+    linhas: list[sqlite3.Row] = []
+    lista = sorted(valores)
+    tamanho_lote = 800
+
+    for inicio in range(0, len(lista), tamanho_lote):
+        lote = lista[inicio: inicio + tamanho_lote]
+        placeholders = ",".join("?" for _ in lote)
+        linhas.extend(
+            conexao.execute(
+                consulta.format(placeholders=placeholders),
+                lote,
+            ).fetchall()
+        )
+
+    return linhas
+
+
+def contar_movimentos_indice(
+    conexao: sqlite3.Connection,
+    seriais: set[str],
+) -> dict[str, int]:
+    return {
+        linha["serial_normalizado"]: int(linha["total"])
+        for linha in _consultar_em_lotes(
+            conexao,
+            """
+            SELECT serial_normalizado, COUNT(*) AS total
+            FROM movimento_serial
+            WHERE serial_normalizado IN ({placeholders})
+            GROUP BY serial_normalizado
+            """,
+            seriais,
+        )
+    }
+
+
+def carregar_misses_custo(
+    conexao: sqlite3.Connection,
+    seriais: set[str],
+) -> dict[str, dict[int, sqlite3.Row]]:
+    misses: dict[str, dict[int, sqlite3.Row]] = {}
+
+    for linha in _consultar_em_lotes(
+        conexao,
+        """
+        SELECT *
+        FROM custo_imei_miss
+        WHERE serial_normalizado IN ({placeholders})
+        """,
+        seriais,
+    ):
+        misses.setdefault(linha["serial_normalizado"], {})[
+            int(linha["janela"])
+        ] = linha
+
+    return misses
+
+
+def miss_em_backoff(
+    miss: sqlite3.Row | None,
+    movimentos_conhecidos: int,
+    agora: datetime,
+) -> bool:
+    """
+    A janela continua pulada enquanto o backoff não venceu e o índice não
+    ganhou movimentos novos do serial desde a última pesquisa.
+    """
+    if miss is None:
+        return False
+
+    return (
+        datetime.fromisoformat(miss["proxima_tentativa"]) > agora
+        and int(miss["movimentos_conhecidos"]) == movimentos_conhecidos
+    )
+
+
+def registrar_misses_custo(
+    conexao: sqlite3.Connection,
+    seriais: set[str],
+    janela: int,
+    data_inicial: date,
+    data_final: date,
+    misses: dict[str, dict[int, sqlite3.Row]],
+) -> None:
+    if not seriais:
+        return
+
+    agora = datetime.now()
+    contagens = contar_movimentos_indice(conexao, seriais)
+    registros = []
+
+    for serial in seriais:
+        anterior = misses.get(serial, {}).get(janela)
+        tentativas = (int(anterior["tentativas"]) if anterior else 0) + 1
+        espera = min(
+            timedelta(hours=CUSTO_IMEI_MISS_BACKOFF_HORAS * 2 ** (tentativas - 1)),
+            timedelta(days=CUSTO_IMEI_MISS_BACKOFF_MAX_DIAS),
+        )
+        registros.append(
+            (
+                serial,
+                janela,
+                data_inicial.isoformat(),
+                data_final.isoformat(),
+                tentativas,
+                contagens.get(serial, 0),
+                agora.isoformat(timespec="seconds"),
+                (agora + espera).isoformat(timespec="seconds"),
+            )
+        )
+
+    with conexao:
+        conexao.executemany(
+            """
+            INSERT INTO custo_imei_miss (
+                serial_normalizado,
+                janela,
+                janela_data_inicial,
+                janela_data_final,
+                tentativas,
+                movimentos_conhecidos,
+                pesquisado_em,
+                proxima_tentativa
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(serial_normalizado, janela) DO UPDATE SET
+                janela_data_inicial = excluded.janela_data_inicial,
+                janela_data_final = excluded.janela_data_final,
+                tentativas = excluded.tentativas,
+                movimentos_conhecidos = excluded.movimentos_conhecidos,
+                pesquisado_em = excluded.pesquisado_em,
+                proxima_tentativa = excluded.proxima_tentativa
+            """,
+            registros,
+        )
+
+
+def remover_misses_custo(
+    conexao: sqlite3.Connection,
+    seriais: set[str],
+) -> None:
+    if not seriais:
+        return
+
+    with conexao:
+        conexao.executemany(
+            "DELETE FROM custo_imei_miss WHERE serial_normalizado = ?",
+            [(serial,) for serial in seriais],
+        )
+
+
+def proximas_buscas_custo(
+    conexao: sqlite3.Connection,
+    seriais: set[str],
+) -> dict[str, str]:
+    """
+    Data da próxima pesquisa de cada serial sem custo (a janela que vence
+    primeiro), para a auditoria.
+    """
+    return {
+        linha["serial_normalizado"]: linha["proxima"]
+        for linha in _consultar_em_lotes(
+            conexao,
+            """
+            SELECT serial_normalizado, MIN(proxima_tentativa) AS proxima
+            FROM custo_imei_miss
+            WHERE serial_normalizado IN ({placeholders})
+            GROUP BY serial_normalizado
+            """,
+            seriais,
+        )
+    }
 
 
 def salvar_auditoria_custos_imei(
     df_seriais: pd.DataFrame,
     mapa_custos: dict[str, dict[str, Any]],
+    proximas_buscas: dict[str, str] | None = None,
 ) -> None:
     if df_seriais.empty:
         return
@@ -1438,6 +2268,11 @@ def salvar_auditoria_custos_imei(
                     if custo
                     else ""
                 ),
+                "PROXIMA_BUSCA_CUSTO": (
+                    ""
+                    if custo
+                    else (proximas_buscas or {}).get(serial, "")
+                ),
             }
         )
 
@@ -1506,22 +2341,75 @@ def obter_mapa_custos_imei(
         )
 
         if faltantes and CUSTO_IMEI_ATUALIZAR_API:
-            for data_inicial, data_final in gerar_janelas_historicas():
+            lojas_atualizadas: set[str] = set()
+            movimentos_vistos: set[tuple[str, str, str, str]] = set()
+            misses = carregar_misses_custo(conexao, faltantes)
+            agora = datetime.now()
+
+            def fora_do_backoff(janela: int) -> set[str]:
+                movimentos_conhecidos = contar_movimentos_indice(conexao, faltantes)
+                return {
+                    serial
+                    for serial in faltantes
+                    if not miss_em_backoff(
+                        misses.get(serial, {}).get(janela),
+                        movimentos_conhecidos.get(serial, 0),
+                        agora,
+                    )
+                }
+
+            for janela, (data_inicial, data_final) in enumerate(
+                gerar_janelas_historicas()
+            ):
                 if not faltantes:
                     break
 
-                log(
-                    f"🔄 Procurando {len(faltantes)} IMEIs sem custo "
-                    f"entre {data_inicial} e {data_final}..."
-                )
-                movimentos = buscar_movimentos_seriais_janela(
-                    faltantes,
+                # O índice é atualizado antes de decidir o backoff: os
+                # movimentos novos que ele trouxer tiram o serial do backoff
+                # já nesta janela. É barato, porque só pede os trechos nunca
+                # varridos e, uma vez por execução, o que passou do cursor
+                # das faixas cobertas.
+                atualizar_indice_seriais(
+                    conexao,
                     data_inicial,
                     data_final,
+                    lojas_atualizadas,
+                )
+
+                alvo = fora_do_backoff(janela)
+                adiados = len(faltantes) - len(alvo)
+
+                if not alvo:
+                    log(
+                        f"⏭️ {adiados} IMEIs sem custo já pesquisados entre "
+                        f"{data_inicial} e {data_final}; janela pulada até o "
+                        f"fim do backoff."
+                    )
+                    continue
+
+                log(
+                    f"🔄 Procurando {len(alvo)} IMEIs sem custo "
+                    f"entre {data_inicial} e {data_final}"
+                    + (f" ({adiados} em backoff)..." if adiados else "...")
+                )
+
+                # O índice responde por todas as faixas já cobertas; só os
+                # movimentos ainda não avaliados nesta execução seguem.
+                movimentos = consultar_indice_seriais(conexao, alvo)
+                chaves = list(
+                    zip(
+                        movimentos["cnpj_consultado"],
+                        movimentos["identificador"],
+                        movimentos["transacao"],
+                        movimentos["serial_normalizado"],
+                    )
                 )
+                novos = [chave not in movimentos_vistos for chave in chaves]
+                movimentos_vistos.update(chaves)
+
                 resolvidos = resolver_custos_dos_movimentos(
                     conexao,
-                    movimentos,
+                    movimentos.loc[novos],
                     produto_por_serial,
                 )
 
@@ -1529,7 +2417,16 @@ def obter_mapa_custos_imei(
                     conexao,
                     seriais_atuais,
                 )
+                remover_misses_custo(conexao, alvo & set(mapa))
                 faltantes = seriais_atuais - set(mapa)
+                registrar_misses_custo(
+                    conexao,
+                    alvo & faltantes,
+                    janela,
+                    data_inicial,
+                    data_final,
+                    misses,
+                )
 
                 log(
                     f"   ✅ Novos custos resolvidos: {resolvidos} "
@@ -1539,6 +2436,7 @@ def obter_mapa_custos_imei(
         salvar_auditoria_custos_imei(
             df_seriais,
             mapa,
+            proximas_buscas_custo(conexao, faltantes),
         )
 
         percentual = (
@@ -1653,62 +2551,12 @@ def carregar_classificacoes_excel():
 # ===========================================
 # 1. EXTRAÇÃO DE CADASTRO (LINX PRODUTOS)
 # ===========================================
-def chamar_api_catalogo(dt_ini, dt_fim):
-    xml = f"""<?xml version="1.0" encoding="utf-8"?>
-    <LinxMicrovix>
-      <Authentication user="{USUARIO}" password="{SENHA}" />
-      <ResponseFormat>xml</ResponseFormat>
-      <Command>
-        <Name>LinxProdutos</Name>
-        <Parameters>
-          <Parameter id="chave">{CHAVE}</Parameter>
-          <Parameter id="cnpjEmp">{CNPJ_CONTEXTO}</Parameter>
-          <Parameter id="dt_update_inicio">{dt_ini}</Parameter>
-          <Parameter id="dt_update_fim">{dt_fim}</Parameter>
-        </Parameters>
-      </Command>
-    </LinxMicrovix>"""
-    try:
-        r = requests.post(URL, data=xml.encode("utf-8"), headers=headers, auth=auth, timeout=300)
-        if r.status_code != 200:
-            return None
-        root = etree.fromstring(r.content)
-        success = root.xpath(".//ResponseSuccess/text()")
-        if success and success[0].lower() == "false":
-            return None
-        cols = [d.text for d in root.xpath(".//C[last()]/D")]
-        rows = root.xpath(".//R")
-        data = [dict(zip(cols, [d.text for d in rr.xpath('./D')])) for rr in rows]
-        return pd.DataFrame(data)
-    except:
-        return None
-
-def baixar_intervalo_recursivo(dt_ini, dt_fim):
-    df = chamar_api_catalogo(dt_ini, dt_fim)
-    if df is None:
-        return pd.DataFrame()
-    qtd = len(df)
-    if qtd >= 4900:
-        dt_ini_dt = datetime.combine(dt_ini, datetime.min.time()) if isinstance(dt_ini, datetime) else datetime.strptime(str(dt_ini), "%Y-%m-%d")
-        dt_fim_dt = datetime.combine(dt_fim, datetime.min.time()) if isinstance(dt_fim, datetime) else datetime.strptime(str(dt_fim), "%Y-%m-%d")
-        meio_dt = dt_ini_dt + (dt_fim_dt - dt_ini_dt) / 2
-        meio = meio_dt.date()
-        log(f"🔁 Dividindo intervalo cheio: {dt_ini} -> {meio} -> {dt_fim}")
-        df1 = baixar_intervalo_recursivo(dt_ini, meio)
-        df2 = baixar_intervalo_recursivo(meio, dt_fim)
-        return pd.concat([df1, df2], ignore_index=True)
-    if qtd > 0:
-        log(f"   📅 {dt_ini} a {dt_fim}: {qtd} produtos.")
-    return df
-
 def extrair_catalogo_completo():
-    log("📚 Iniciando download do catálogo...")
-    inicio = datetime(2015, 1, 1).date()
-    fim = datetime.now().date()
-    df = baixar_intervalo_recursivo(inicio, fim)
+    # Só o delta desde o último dt_update é baixado; o restante vem do
+    # catálogo local compartilhado (microvix_catalogo.py).
+    df = atualizar_catalogo(CNPJ_CONTEXTO)
     if df.empty:
         return pd.DataFrame()
-    df.columns = [c.lower() for c in df.columns]
 
     if "cod_produto" in df.columns:
         df["cod_produto"] = pd.to_numeric(df["cod_produto"], errors="coerce")
@@ -1739,19 +2587,8 @@ def extrair_catalogo_completo():
 # 2. EXTRAÇÃO DE ESTOQUE AGREGADO
 # ===========================================
 def chamar_api_detalhes(parametros):
-    params_xml = "".join([f'<Parameter id="{k}">{v}</Parameter>' for k, v in parametros.items()])
-    xml = f"""<?xml version="1.0" encoding="utf-8"?>
-    <LinxMicrovix>
-      <Authentication user="{USUARIO}" password="{SENHA}" />
-      <ResponseFormat>xml</ResponseFormat>
-      <Command>
-        <Name>LinxProdutosDetalhes</Name>
-        <Parameters><Parameter id="chave">{CHAVE}</Parameter>{params_xml}</Parameters>
-      </Command>
-    </LinxMicrovix>"""
-
     try:
-        r = requests.post(URL, data=xml.encode("utf-8"), headers=headers, auth=auth, timeout=120)
+        r = post_microvix("LinxProdutosDetalhes", parametros, timeout=120)
 
         if r.status_code != 200:
             log(f"❌ HTTP {r.status_code} em LinxProdutosDetalhes | params={parametros}")
@@ -1761,12 +2598,9 @@ def chamar_api_detalhes(parametros):
                 pass
             return pd.DataFrame()
 
-        root = etree.fromstring(r.content)
-
-        success = root.xpath(".//ResponseSuccess/text()")
-        if success and success[0].strip().lower() == "false":
-            msg = root.xpath(".//ResponseMessage/text()")
-            erro = msg[0] if msg else "Sem mensagem"
+        try:
+            df = resposta_para_dataframe(r.content)
+        except MicrovixErro as erro:
             log(f"❌ ResponseSuccess=false em LinxProdutosDetalhes | params={parametros} | msg={erro}")
             try:
                 log(r.text[:1000])
@@ -1774,15 +2608,10 @@ def chamar_api_detalhes(parametros):
                 pass
             return pd.DataFrame()
 
-        cols = [d.text for d in root.xpath(".//C[last()]/D")]
-        rows = root.xpath(".//R")
-
-        if not rows:
+        if df.empty:
             log(f"⚠️ LinxProdutosDetalhes sem linhas | params={parametros}")
-            return pd.DataFrame()
 
-        data = [dict(zip(cols, [d.text for d in rr.xpath('./D')])) for rr in rows]
-        return pd.DataFrame(data)
+        return df
 
     except Exception as e:
         log(f"❌ Exceção em chamar_api_detalhes: {e} | params={parametros}")
@@ -1801,26 +2630,27 @@ def extrair_estoque(cnpj, modo_completo=False):
 
     if modo_completo:
         log(f"   📦 Extraindo estoque COMPLETO da loja {LOJAS_NOME.get(cnpj, cnpj)}...")
-        while True:
-            params = {
+
+        # A carga completa parte do último timestamp salvo para a loja e
+        # mescla só as linhas alteradas no snapshot local.
+        def buscar_pagina(ts_pagina):
+            df = chamar_api_detalhes({
                 "cnpjEmp": cnpj,
-                "timestamp": str(ts),
+                "timestamp": str(ts_pagina),
                 "retornar_saldo_zero": "1"
-            }
-
-            df = chamar_api_detalhes(params)
-            if df.empty:
-                break
-
+            })
             df.columns = [c.lower() for c in df.columns]
-            dfs.append(df)
-
-            novo_ts = obter_proximo_timestamp(df, ts)
-            if novo_ts is None:
-                break
+            return df
 
-            ts = novo_ts
-            time.sleep(TEMPO_ESPERA_API)
+        df = paginar_incremental(
+            "LinxProdutosDetalhes",
+            cnpj,
+            buscar_pagina,
+            CHAVES_SNAPSHOT_DETALHES,
+            escopo="retornar_saldo_zero",
+        )
+        if not df.empty:
+            dfs.append(df)
 
     else:
         log(f"   📅 Extraindo estoque por movimentação ({JANELA_DIAS_MOV} dias) da loja {LOJAS_NOME.get(cnpj, cnpj)}...")
@@ -1844,7 +2674,6 @@ def extrair_estoque(cnpj, modo_completo=False):
                 break
 
             ts = novo_ts
-            time.sleep(TEMPO_ESPERA_API)
 
         # fallback automático pro modo completo
         if not dfs:
@@ -1865,7 +2694,7 @@ def extrair_estoque(cnpj, modo_completo=False):
 
     # Mantém uma linha por produto e tipo de estoque. Sem o tipo na chave,
     # ESTOQUE, AMOSTRA e DOA poderiam ser misturados ou sobrescritos.
-    base["TIPO_ESTOQUE"] = base.apply(identificar_tipo_estoque_linha, axis=1)
+    base["TIPO_ESTOQUE"] = identificar_tipo_estoque(base)
     base = base.drop_duplicates(subset=["cod_produto", "TIPO_ESTOQUE"], keep="first")
     base["CNPJ_ORIGEM"] = cnpj
     base["NOME_FANTASIA"] = LOJAS_NOME.get(cnpj, f"LOJA {cnpj[-4:]}")
@@ -1885,52 +2714,38 @@ def extrair_estoque(cnpj, modo_completo=False):
 # 3. EXTRAÇÃO DE SERIAIS (IMEI) - NOVIDADE!
 # ===========================================
 def chamar_api_seriais(parametros):
-    params_xml = "".join([f'<Parameter id="{k}">{v}</Parameter>' for k, v in parametros.items()])
-    xml = f"""<?xml version="1.0" encoding="utf-8"?>
-    <LinxMicrovix>
-      <Authentication user="{USUARIO}" password="{SENHA}" />
-      <ResponseFormat>xml</ResponseFormat>
-      <Command>
-        <Name>LinxProdutosSerial</Name>
-        <Parameters><Parameter id="chave">{CHAVE}</Parameter>{params_xml}</Parameters>
-      </Command>
-    </LinxMicrovix>"""
     try:
-        r = requests.post(URL, data=xml.encode("utf-8"), headers=headers, auth=auth, timeout=120)
+        r = post_microvix("LinxProdutosSerial", parametros, timeout=120)
         if r.status_code != 200:
             return pd.DataFrame()
-        root = etree.fromstring(r.content)
-        cols = [d.text for d in root.xpath(".//C[last()]/D")]
-        rows = root.xpath(".//R")
-        data = [dict(zip(cols, [d.text for d in rr.xpath('./D')])) for rr in rows]
-        return pd.DataFrame(data)
+        return resposta_para_dataframe(r.content)
     except:
         return pd.DataFrame()
 
 def extrair_seriais_loja(cnpj):
-    dfs = []
-    ts = 0
-    while True:
-        params = {"cnpjEmp": cnpj, "timestamp": str(ts)}
-        df = chamar_api_seriais(params)
-        if df.empty:
-            break
+    def buscar_pagina(ts_pagina):
+        df = chamar_api_seriais({"cnpjEmp": cnpj, "timestamp": str(ts_pagina)})
         df.columns = [c.lower() for c in df.columns]
+        return df
 
-        # Filtra apenas IMEIs que estão efetivamente em estoque (saldo = True ou 1)
-        if "saldo" in df.columns:
-            df = df[df["saldo"].astype(str).str.lower().isin(["true", "1", "s", "sim", "1.0"])]
-
-        dfs.append(df)
+    # O snapshot guarda todas as linhas (inclusive saldo falso) para que um
+    # IMEI que saiu da loja seja atualizado pelo delta seguinte.
+    snapshot = paginar_incremental(
+        "LinxProdutosSerial",
+        cnpj,
+        buscar_pagina,
+        ["serial"],
+    )
+    if snapshot.empty:
+        return pd.DataFrame()
 
-        novo_ts = obter_proximo_timestamp(df, ts)
-        if novo_ts is None:
-            break
+    dfs = [snapshot]
 
-        ts = novo_ts
-        time.sleep(TEMPO_ESPERA_API)
+    # Filtra apenas IMEIs que estão efetivamente em estoque (saldo = True ou 1)
+    if "saldo" in snapshot.columns:
+        dfs = [snapshot[snapshot["saldo"].astype(str).str.lower().isin(["true", "1", "s", "sim", "1.0"])]]
 
-    if not dfs:
+    if dfs[0].empty:
         return pd.DataFrame()
 
     base = pd.concat(dfs, ignore_index=True)
@@ -1943,6 +2758,19 @@ def extrair_seriais_loja(cnpj):
     base["CNPJ_ORIGEM"] = cnpj
     return base
 
+def extrair_loja(cnpj):
+    """
+    Estoque agregado e IMEIs de uma loja. Executada em paralelo por main().
+    """
+    log(f"[{CNPJS.index(cnpj) + 1}/{len(CNPJS)}] CNPJ: {cnpj}...")
+
+    # ✅ ALTERADO: agora busca estoque completo por padrão, sem quebrar o modo antigo
+    df_est = extrair_estoque(cnpj, modo_completo=False)
+
+    # Puxa os IMEIs
+    df_ser = extrair_seriais_loja(cnpj)
+    return df_est, df_ser
+
 # ===========================================
 # 4. SALVAR NA NUVEM VIA API (EM LOTES)
 # ===========================================
@@ -2010,6 +2838,229 @@ def encontrar_valores_invalidos(lote):
     return problemas
 
 
+# ===========================================
+# 🔁 CARGA DELTA DO ESTOQUE
+# ===========================================
+# Em vez de apagar e recarregar a tabela Stock inteira, guardamos o hash de
+# cada linha enviada no último push bem-sucedido, por
+# (CNPJ_ORIGEM, CODIGO_PRODUTO, TIPO_ESTOQUE, SERIAL), e enviamos para
+# /stock/sync/delta apenas as chaves novas, alteradas ou removidas.
+# STOCK_SYNC_MODO=completo força o reset-e-recarga antigo.
+STOCK_SYNC_MODO = os.getenv("STOCK_SYNC_MODO", "delta").strip().lower()
+STOCK_SYNC_SNAPSHOT = Path(
+    os.getenv(
+        "STOCK_SYNC_SNAPSHOT",
+        str(SCRIPT_DIR / "estoque_enviado.sqlite3"),
+    )
+)
+STOCK_SYNC_DELTA_LOTE = 100
+STOCK_SYNC_DELTA_LOTE_REMOCOES = 500
+
+
+def conectar_snapshot_envio() -> sqlite3.Connection:
+    STOCK_SYNC_SNAPSHOT.parent.mkdir(parents=True, exist_ok=True)
+    conexao = sqlite3.connect(STOCK_SYNC_SNAPSHOT, timeout=60)
+    conexao.execute(
+        """
+        CREATE TABLE IF NOT EXISTS estoque_enviado (
+            chave TEXT PRIMARY KEY,
+            hash TEXT NOT NULL
+        )
+        """
+    )
+    conexao.execute(
+        """
+        CREATE TABLE IF NOT EXISTS estoque_enviado_meta (
+            campo TEXT PRIMARY KEY,
+            valor TEXT NOT NULL
+        )
+        """
+    )
+    conexao.commit()
+    return conexao
+
+
+def carregar_snapshot_envio(base_url: str) -> dict[str, str] | None:
+    """
+    Hashes do último push completo para a mesma URL, ou None quando ainda
+    não houve push (ou ele foi para outro backend).
+    """
+    if not STOCK_SYNC_SNAPSHOT.exists():
+        return None
+
+    conexao = conectar_snapshot_envio()
+    try:
+        meta = dict(conexao.execute("SELECT campo, valor FROM estoque_enviado_meta"))
+        if meta.get("base_url") != base_url:
+            return None
+        return dict(conexao.execute("SELECT chave, hash FROM estoque_enviado"))
+    finally:
+        conexao.close()
+
+
+def salvar_snapshot_envio(base_url: str, snapshot: dict[str, str]) -> None:
+    conexao = conectar_snapshot_envio()
+    try:
+        with conexao:
+            conexao.execute("DELETE FROM estoque_enviado")
+            conexao.executemany(
+                "INSERT INTO estoque_enviado (chave, hash) VALUES (?, ?)",
+                snapshot.items(),
+            )
+            conexao.executemany(
+                """
+                INSERT INTO estoque_enviado_meta (campo, valor) VALUES (?, ?)
+                ON CONFLICT(campo) DO UPDATE SET valor = excluded.valor
+                """,
+                [
+                    ("base_url", base_url),
+                    ("atualizado_em", datetime.now().isoformat(timespec="seconds")),
+                ],
+            )
+    finally:
+        conexao.close()
+
+
+def chave_registro_estoque(registro: dict) -> str:
+    return json.dumps(
+        [
+            registro.get("CNPJ_ORIGEM"),
+            registro.get("CODIGO_PRODUTO"),
+            normalizar_tipo_estoque(registro.get("TIPO_ESTOQUE", "ESTOQUE")),
+            str(registro.get("SERIAL") or "").strip(),
+        ],
+        ensure_ascii=False,
+    )
+
+
+def agrupar_registros_por_chave(registros: list[dict]) -> tuple[dict[str, list[dict]], dict[str, str]]:
+    """
+    Agrupa as linhas pela chave de envio e calcula o hash de cada grupo.
+    Uma chave com várias linhas é tratada como uma unidade: o servidor
+    substitui todas as linhas dela de uma vez.
+    """
+    grupos: dict[str, list[dict]] = {}
+    for registro in registros:
+        grupos.setdefault(chave_registro_estoque(registro), []).append(registro)
+
+    hashes = {
+        chave: hashlib.sha1(
+            json.dumps(linhas, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        ).hexdigest()
+        for chave, linhas in grupos.items()
+    }
+    return grupos, hashes
+
+
+def postar_lote_estoque(url: str, payload: Any, descricao: str) -> requests.Response | None:
+    """
+    POST com até 5 tentativas. Devolve a última resposta (ou None se todas
+    as tentativas falharam por erro de rede).
+    """
+    response = None
+    for attempt in range(1, 6):
+        try:
+            response = requests.post(url, json=payload, timeout=120)
+            if 200 <= response.status_code < 300 or response.status_code == 404:
+                return response
+
+            log(f"      ⚠️ Erro no {descricao} (Tentativa {attempt}): {response.status_code} {(response.text or '')[:300]}")
+        except Exception as e:
+            log(f"      ⚠️ Falha ao enviar {descricao} (Tentativa {attempt}): {e}")
+
+        time.sleep(5)
+
+    return response
+
+
+def enviar_delta_para_api(
+    base_url: str,
+    grupos: dict[str, list[dict]],
+    hashes: dict[str, str],
+    snapshot: dict[str, str],
+) -> bool | None:
+    """
+    Envia apenas as chaves alteradas. Devolve None se o backend ainda não
+    tiver a rota /stock/sync/delta (quem chama volta para a carga completa).
+    """
+    alteradas = [chave for chave, valor in hashes.items() if snapshot.get(chave) != valor]
+    removidas = [chave for chave in snapshot if chave not in hashes]
+
+    log(
+        f"🔁 Delta de estoque: {len(alteradas)} chaves novas/alteradas, "
+        f"{len(removidas)} removidas, {len(hashes) - len(alteradas)} sem mudança."
+    )
+
+    campos_chave = ["CNPJ_ORIGEM", "CODIGO_PRODUTO", "TIPO_ESTOQUE", "SERIAL"]
+
+    def chave_para_remocao(chave: str) -> dict:
+        return dict(zip(campos_chave, json.loads(chave)))
+
+    # Um IMEI que mudou de loja ou de tipo troca de chave: a chave antiga
+    # vai no mesmo lote da nova, e o servidor aplica as duas na mesma
+    # transação. Assim uma falha no meio do envio nunca deixa o aparelho
+    # em dois lugares.
+    removidas_por_serial: dict[str, list[str]] = {}
+    for chave in removidas:
+        serial = json.loads(chave)[3]
+        if serial:
+            removidas_por_serial.setdefault(serial, []).append(chave)
+
+    lotes_com_troca: list[dict] = []
+    atual: list[dict] = []
+    remocoes: list[dict] = []
+    for chave in alteradas:
+        # As linhas de uma chave precisam ir no mesmo lote, porque o
+        # servidor apaga a chave antes de inserir.
+        atual.extend(grupos[chave])
+        remocoes.extend(
+            chave_para_remocao(antiga)
+            for antiga in removidas_por_serial.pop(json.loads(chave)[3], [])
+        )
+        if len(atual) >= STOCK_SYNC_DELTA_LOTE:
+            lotes_com_troca.append({"upserts": atual, "deletes": remocoes})
+            atual, remocoes = [], []
+    if atual:
+        lotes_com_troca.append({"upserts": atual, "deletes": remocoes})
+
+    # As remoções sem substituta vão antes: nenhuma delas some de um lugar
+    # para reaparecer em outro.
+    restantes = [chave for chaves in removidas_por_serial.values() for chave in chaves]
+    restantes += [chave for chave in removidas if not json.loads(chave)[3]]
+    lotes: list[dict] = [
+        {
+            "upserts": [],
+            "deletes": [
+                chave_para_remocao(chave)
+                for chave in restantes[i: i + STOCK_SYNC_DELTA_LOTE_REMOCOES]
+            ],
+        }
+        for i in range(0, len(restantes), STOCK_SYNC_DELTA_LOTE_REMOCOES)
+    ]
+    lotes.extend(lotes_com_troca)
+
+    url_delta = f"{base_url}/delta"
+    for numero, lote in enumerate(lotes, start=1):
+        problemas = encontrar_valores_invalidos(lote["upserts"])
+        if problemas:
+            log(f"❌ Valores inválidos encontrados no lote delta {numero}: {problemas[:30]}")
+            return False
+
+        log(f"   📦 Enviando lote delta {numero}/{len(lotes)}...")
+        response = postar_lote_estoque(url_delta, lote, f"lote delta {numero}")
+
+        if response is not None and response.status_code == 404 and numero == 1:
+            log("⚠️ Backend sem /stock/sync/delta; usando carga completa.")
+            return None
+
+        if response is None or not 200 <= response.status_code < 300:
+            log(f"❌ Desistindo do lote delta {numero}; o próximo envio repete o delta.")
+            return False
+
+    log("✅ Delta de estoque aplicado na Produção.")
+    return True
+
+
 def enviar_para_api(dataframe):
     base_url = API_STOCK_SYNC_URL
 
@@ -2023,6 +3074,19 @@ def enviar_para_api(dataframe):
     dados_completos = dataframe.to_dict(orient="records")
     dados_completos = [limpar_registro_json(registro) for registro in dados_completos]
 
+    grupos, hashes = agrupar_registros_por_chave(dados_completos)
+
+    if STOCK_SYNC_MODO == "delta":
+        snapshot = carregar_snapshot_envio(base_url)
+        if snapshot is None:
+            log("ℹ️ Sem snapshot do último envio; fazendo carga completa.")
+        else:
+            resultado = enviar_delta_para_api(base_url, grupos, hashes, snapshot)
+            if resultado is not None:
+                if resultado:
+                    salvar_snapshot_envio(base_url, hashes)
+                return resultado
+
     # Divide os itens em pacotes de 100 para não pesar no Render
     BATCH_SIZE = 100
     total_lotes = (len(dados_completos) + BATCH_SIZE - 1) // BATCH_SIZE
@@ -2096,9 +3160,166 @@ def enviar_para_api(dataframe):
             log(f"❌ Desistindo do Lote {lote_num} após várias tentativas.")
             return False
 
+    salvar_snapshot_envio(base_url, hashes)
     log("✅ Sucesso Absoluto! Estoque e IMEIs atualizados na Produção.")
     return True
 
+# ===========================================
+# 🔍 DESDOBRAMENTO POR IMEI
+# ===========================================
+# Colunas de rastreio da compra preenchidas a partir de mapa_custos_imei.
+CAMPOS_COMPRA_IMEI = {
+    "CUSTO_SERIAL_ORIGEM": "campo_origem",
+    "DOCUMENTO_COMPRA": "documento",
+    "CNPJ_COMPRA": "cnpj_compra",
+    "IDENTIFICADOR_COMPRA": "identificador",
+    "TRANSACAO_COMPRA": "transacao",
+    "DATA_COMPRA": "data_entrada",
+}
+
+
+def custos_por_serial(seriais: pd.Series, mapa_custos_imei: dict) -> pd.DataFrame:
+    """
+    Colunas de custo de cada serial, consultando o mapa uma vez por IMEI
+    distinto.
+    """
+    colunas = ["CUSTO_SERIAL_ENTRADA", "CUSTO_SERIAL_STATUS", *CAMPOS_COMPRA_IMEI]
+    if seriais.empty:
+        return pd.DataFrame(columns=colunas, index=seriais.index)
+
+    chaves = seriais.map(normalizar_serial)
+    registros = {}
+    for chave in chaves.unique():
+        dados_custo = mapa_custos_imei.get(chave)
+        custo = numero_api(dados_custo.get("custo_aquisicao")) if dados_custo else 0.0
+        registros[chave] = [
+            custo,
+            "CUSTO_EXATO_ENCONTRADO" if custo > 0 else "CUSTO_NAO_ENCONTRADO",
+            *(
+                str(dados_custo.get(campo) or "") if dados_custo else ""
+                for campo in CAMPOS_COMPRA_IMEI.values()
+            ),
+        ]
+
+    tabela = pd.DataFrame.from_dict(registros, orient="index", columns=colunas)
+    resultado = tabela.reindex(chaves.to_numpy())
+    resultado.index = seriais.index
+    return resultado
+
+
+def desdobrar_por_imei(
+    df_estoque: pd.DataFrame,
+    df_seriais: pd.DataFrame,
+    mapa_custos_imei: dict,
+) -> pd.DataFrame:
+    """
+    Quebra cada linha de ESTOQUE em uma linha por IMEI (quantidade 1), até o
+    saldo da API, e acrescenta uma linha com o restante sem IMEI. AMOSTRA,
+    DOA e itens sem serial seguem como saldo agregado.
+
+    Os seriais são agrupados por (CNPJ_ORIGEM, codigoproduto) e cruzados com
+    o estoque por merge, em vez de filtrar df_seriais inteiro a cada linha.
+    """
+    estoque = df_estoque.reset_index(drop=True)
+    posicao = pd.RangeIndex(len(estoque))
+    qtd_total = estoque["QUANTIDADE"].astype(float)
+
+    if "TIPO_ESTOQUE" in estoque.columns:
+        tipos = estoque["TIPO_ESTOQUE"].astype(object)
+        tipo_estoque = tipos.map({t: normalizar_tipo_estoque(t) for t in tipos.unique()})
+    else:
+        tipo_estoque = pd.Series("ESTOQUE", index=posicao)
+
+    # Seriais limpos, sem vazios e sem repetição, na ordem original.
+    seriais = df_seriais[["CNPJ_ORIGEM", "codigoproduto", "serial"]].copy()
+    seriais["serial"] = seriais["serial"].astype(object).map(str).str.strip()
+    seriais = seriais[seriais["serial"].ne("")]
+    seriais = seriais.dropna(subset=["CNPJ_ORIGEM", "codigoproduto"])
+    seriais = seriais.drop_duplicates(ignore_index=True)
+    seriais["ORDEM_SERIAL"] = seriais.groupby(["CNPJ_ORIGEM", "codigoproduto"]).cumcount()
+    seriais["QTD_SERIAIS"] = seriais.groupby(["CNPJ_ORIGEM", "codigoproduto"])["serial"].transform("size")
+
+    elegiveis = estoque.loc[
+        tipo_estoque.eq("ESTOQUE") & qtd_total.gt(0),
+        ["CNPJ_ORIGEM", "CODIGO_PRODUTO"],
+    ].dropna()
+    elegiveis["POSICAO"] = elegiveis.index
+    elegiveis["LIMITE"] = qtd_total[elegiveis.index].astype(int)
+
+    cruzados = elegiveis.merge(
+        seriais,
+        left_on=["CNPJ_ORIGEM", "CODIGO_PRODUTO"],
+        right_on=["CNPJ_ORIGEM", "codigoproduto"],
+        how="inner",
+    )
+
+    # Divergência: mais seriais que o saldo da API (o excedente é descartado).
+    por_linha = cruzados.drop_duplicates("POSICAO").set_index("POSICAO")
+    for pos in por_linha.index[por_linha["QTD_SERIAIS"] > por_linha["LIMITE"]]:
+        log(
+            f"⚠️ Divergência de serial x saldo | Loja: {estoque.at[pos, 'NOME_FANTASIA']} "
+            f"| Produto: {estoque.at[pos, 'CODIGO_PRODUTO']} | Saldo API: {qtd_total[pos]} "
+            f"| Seriais: {por_linha.at[pos, 'QTD_SERIAIS']}"
+        )
+
+    # 1 linha por IMEI válido até o saldo da API.
+    com_imei = cruzados[cruzados["ORDEM_SERIAL"] < cruzados["LIMITE"]]
+    linhas_imei = pd.concat(
+        [
+            pd.DataFrame({
+                "POSICAO": com_imei["POSICAO"],
+                "ORDEM": com_imei["ORDEM_SERIAL"],
+                "QUANTIDADE": 1.0,
+                "SERIAL": com_imei["serial"],
+            }),
+            custos_por_serial(com_imei["serial"], mapa_custos_imei),
+        ],
+        axis=1,
+    )
+
+    # Se o sistema diz que tem 5, mas só achou 4 IMEIs, cria uma linha pro restante.
+    serializados = por_linha["QTD_SERIAIS"].clip(upper=por_linha["LIMITE"])
+    restante = qtd_total[serializados.index] - serializados
+    restante = restante[restante > 0]
+    linhas_restante = pd.DataFrame({
+        "POSICAO": restante.index,
+        "ORDEM": len(seriais) + 1,
+        "QUANTIDADE": restante.to_numpy(),
+    })
+
+    # Acessórios (ou itens sem IMEI) ficam na mesma linha somada.
+    sem_imei = posicao.difference(por_linha.index)
+    linhas_sem_imei = pd.DataFrame({
+        "POSICAO": sem_imei,
+        "ORDEM": 0,
+        "QUANTIDADE": qtd_total[sem_imei].to_numpy(),
+    })
+
+    partes = pd.concat(
+        [linhas_imei, linhas_restante, linhas_sem_imei],
+        ignore_index=True,
+    )
+    partes = partes.sort_values(["POSICAO", "ORDEM"], kind="stable", ignore_index=True)
+
+    padrao_sem_imei = {
+        "SERIAL": "",
+        "CUSTO_SERIAL_ENTRADA": 0.0,
+        "CUSTO_SERIAL_STATUS": "SEM_IMEI",
+        **dict.fromkeys(CAMPOS_COMPRA_IMEI, ""),
+    }
+    for coluna, valor in padrao_sem_imei.items():
+        if coluna not in partes.columns:
+            partes[coluna] = valor
+        else:
+            partes[coluna] = partes[coluna].astype(object).where(partes[coluna].notna(), valor)
+
+    # Mantém o índice original de cada linha de estoque, como no row.copy().
+    df_final = df_estoque.iloc[partes["POSICAO"].to_numpy()].copy()
+    for coluna in ["QUANTIDADE", *padrao_sem_imei]:
+        df_final[coluna] = partes[coluna].to_numpy()
+
+    return df_final
+
 # ===========================================
 # ▶ EXECUÇÃO PRINCIPAL
 # ===========================================
@@ -2116,19 +3337,15 @@ def main():
     log(f"✅ Catálogo OK: {len(catalogo)} produtos carregados.")
 
     # 2. Estoque Agregado e Seriais
+    # As lojas são extraídas em paralelo; o limitador global do cliente
+    # Microvix mantém o total de requisições dentro do orçamento da API.
     todos_dados = []
     todos_seriais = []
 
-    for i, cnpj in enumerate(CNPJS):
-        log(f"[{i+1}/{len(CNPJS)}] CNPJ: {cnpj}...")
-
-        # ✅ ALTERADO: agora busca estoque completo por padrão, sem quebrar o modo antigo
-        df_est = extrair_estoque(cnpj, modo_completo=False)
+    for df_est, df_ser in executar_por_cnpj(extrair_loja, CNPJS):
         if not df_est.empty:
             todos_dados.append(df_est)
 
-        # Puxa os IMEIs
-        df_ser = extrair_seriais_loja(cnpj)
         if not df_ser.empty:
             todos_seriais.append(df_ser)
 
@@ -2165,140 +3382,7 @@ def main():
 
     # 5. A MÁGICA: DESDOBRAMENTO POR IMEI + CUSTO DA COMPRA ORIGINAL
     log("🔍 Desdobrando itens com IMEI...")
-    linhas_expandidas = []
-
-    for _, row in df_estoque.iterrows():
-        cnpj = row["CNPJ_ORIGEM"]
-        cod = row["CODIGO_PRODUTO"]
-        qtd_total = float(row["QUANTIDADE"])
-
-        tipo_estoque = normalizar_tipo_estoque(row.get("TIPO_ESTOQUE", "ESTOQUE"))
-
-        # IMEI é usado apenas para o estoque normal. AMOSTRA e DOA permanecem
-        # como saldos agregados e nunca duplicam os seriais do estoque operacional.
-        if tipo_estoque == "ESTOQUE":
-            seriais_produto = df_seriais[
-                (df_seriais["CNPJ_ORIGEM"] == cnpj) &
-                (df_seriais["codigoproduto"] == cod)
-            ]["serial"].tolist()
-        else:
-            seriais_produto = []
-
-        # ✅ NOVO: limpa, deduplica e evita serial vazio
-        seriais_produto = list(dict.fromkeys(
-            [str(s).strip() for s in seriais_produto if str(s).strip()]
-        ))
-
-        if len(seriais_produto) > 0 and qtd_total > 0:
-            # ✅ NOVO: limita o número de seriais ao saldo da API, para não inflar quantidade
-            qtd_serializada = min(len(seriais_produto), int(qtd_total))
-
-            if len(seriais_produto) > int(qtd_total):
-                log(f"⚠️ Divergência de serial x saldo | Loja: {row['NOME_FANTASIA']} | Produto: {cod} | Saldo API: {qtd_total} | Seriais: {len(seriais_produto)}")
-
-            # Aparelho com IMEI encontrado! Quebra em 1 linha para cada IMEI válido até o saldo da API
-            for s in seriais_produto[:qtd_serializada]:
-                serial_normalizado = normalizar_serial(s)
-                dados_custo = mapa_custos_imei.get(
-                    serial_normalizado
-                )
-                custo_serial = (
-                    numero_api(
-                        dados_custo.get("custo_aquisicao")
-                    )
-                    if dados_custo
-                    else 0.0
-                )
-
-                nova_linha = row.copy()
-                nova_linha["QUANTIDADE"] = 1.0  # Cada IMEI é 1 unidade
-                nova_linha["SERIAL"] = s
-                nova_linha["CUSTO_SERIAL_ENTRADA"] = custo_serial
-                nova_linha["CUSTO_SERIAL_STATUS"] = (
-                    "CUSTO_EXATO_ENCONTRADO"
-                    if custo_serial > 0
-                    else "CUSTO_NAO_ENCONTRADO"
-                )
-                nova_linha["CUSTO_SERIAL_ORIGEM"] = (
-                    str(
-                        dados_custo.get("campo_origem")
-                        or ""
-                    )
-                    if dados_custo
-                    else ""
-                )
-                nova_linha["DOCUMENTO_COMPRA"] = (
-                    str(
-                        dados_custo.get("documento")
-                        or ""
-                    )
-                    if dados_custo
-                    else ""
-                )
-                nova_linha["CNPJ_COMPRA"] = (
-                    str(
-                        dados_custo.get("cnpj_compra")
-                        or ""
-                    )
-                    if dados_custo
-                    else ""
-                )
-                nova_linha["IDENTIFICADOR_COMPRA"] = (
-                    str(
-                        dados_custo.get("identificador")
-                        or ""
-                    )
-                    if dados_custo
-                    else ""
-                )
-                nova_linha["TRANSACAO_COMPRA"] = (
-                    str(
-                        dados_custo.get("transacao")
-                        or ""
-                    )
-                    if dados_custo
-                    else ""
-                )
-                nova_linha["DATA_COMPRA"] = (
-                    str(
-                        dados_custo.get("data_entrada")
-                        or ""
-                    )
-                    if dados_custo
-                    else ""
-                )
-                linhas_expandidas.append(nova_linha)
-
-            # Se o sistema diz que tem 5, mas só achou 4 IMEIs, cria uma linha pro restante
-            qtd_restante = max(qtd_total - qtd_serializada, 0)
-            if qtd_restante > 0:
-                nova_linha = row.copy()
-                nova_linha["QUANTIDADE"] = qtd_restante
-                nova_linha["SERIAL"] = ""
-                nova_linha["CUSTO_SERIAL_ENTRADA"] = 0.0
-                nova_linha["CUSTO_SERIAL_STATUS"] = "SEM_IMEI"
-                nova_linha["CUSTO_SERIAL_ORIGEM"] = ""
-                nova_linha["DOCUMENTO_COMPRA"] = ""
-                nova_linha["CNPJ_COMPRA"] = ""
-                nova_linha["IDENTIFICADOR_COMPRA"] = ""
-                nova_linha["TRANSACAO_COMPRA"] = ""
-                nova_linha["DATA_COMPRA"] = ""
-                linhas_expandidas.append(nova_linha)
-        else:
-            # Acessórios (ou itens sem IMEI) ficam na mesma linha somada
-            nova_linha = row.copy()
-            nova_linha["SERIAL"] = ""
-            nova_linha["CUSTO_SERIAL_ENTRADA"] = 0.0
-            nova_linha["CUSTO_SERIAL_STATUS"] = "SEM_IMEI"
-            nova_linha["CUSTO_SERIAL_ORIGEM"] = ""
-            nova_linha["DOCUMENTO_COMPRA"] = ""
-            nova_linha["CNPJ_COMPRA"] = ""
-            nova_linha["IDENTIFICADOR_COMPRA"] = ""
-            nova_linha["TRANSACAO_COMPRA"] = ""
-            nova_linha["DATA_COMPRA"] = ""
-            linhas_expandidas.append(nova_linha)
-
-    df_final = pd.DataFrame(linhas_expandidas)
+    df_final = desdobrar_por_imei(df_estoque, df_seriais, mapa_custos_imei)
 
     df_final["CUSTO_SERIAL_ENTRADA"] = to_float(
         df_final.get("CUSTO_SERIAL_ENTRADA", 0)
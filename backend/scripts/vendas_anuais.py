@@ -6,16 +6,18 @@
 # código não utilizado nessa data
 # ===========================================
 
-import requests
-from requests.auth import HTTPBasicAuth
 import pandas as pd
-from lxml import etree
 from datetime import datetime
-import sqlite3, os, time
+import sqlite3, os
 import logging
 import sys
 import calendar
 
+
+from microvix_catalogo import atualizar_catalogo
+from microvix_checkpoint import paginar_incremental
+from microvix_client import MicrovixErro, post_microvix, resposta_para_dataframe
+
 # --- Fixa o diretório de trabalho na pasta do script/EXE ---
 if getattr(sys, 'frozen', False):   # executável (PyInstaller)
     os.chdir(os.path.dirname(sys.executable))
@@ -23,14 +25,11 @@ else:   # script .py
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
 # === CONFIGURAÇÕES GERAIS ===
-USUARIO = "linx_export"
-SENHA = "linx_export"
-CHAVE = "2618f2b2-8f1d-4502-8321-342dc2cd1470"
-URL = "https://webapi.microvix.com.br/1.0/api/integracao"
-headers = {"Content-Type": "application/xml; charset=utf-8", "Accept": "application/xml"}
-auth = HTTPBasicAuth(USUARIO, SENHA)
+# Credenciais, URL e sessão HTTP da Microvix ficam em microvix_client.py.
 
 # === BANCOS LOCAIS ===
+# Os produtos vêm do catálogo local compartilhado (microvix_catalogo.py);
+# o banco antigo só é lido se o catálogo estiver vazio.
 CACHE_PRODUTOS   = r"C:\Users\Usuario\Desktop\API_LINX\data_bases\produtos_completos.db"
 CACHE_LOJAS      = r"C:\Users\Usuario\Desktop\API_LINX\data_bases\lojas_fixas.db"
 CACHE_IMEIS      = r"C:\Users\Usuario\Desktop\API_LINX\data_bases\serial_cache.db"
@@ -59,6 +58,9 @@ COLUNAS_FINAIS = [
 
 # === CACHE DE NATUREZAS POR CNPJ ===
 NATUREZAS_CACHE = {}
+
+# === CATÁLOGO DE PRODUTOS (ATUALIZADO UMA VEZ POR EXECUÇÃO) ===
+CATALOGO_CACHE = {}
 OPER_MAP = {
     "E":  "Entrada",
     "S":  "Saída",
@@ -143,93 +145,51 @@ def _preview_text(s, n=900):
     s = str(s)
     return s[:n] + ("..." if len(s) > n else "")
 
-def montar_xml(cnpj, metodo, d_ini, d_fim, parametros=None):
+def montar_parametros(cnpj, d_ini, d_fim, parametros=None):
     """
-    XML com janela definida (anual até mês passado).
+    Parâmetros com janela definida (anual até mês passado).
     ✅ Patch: garante timestamp=0 se não for passado.
     """
-    if parametros is None:
-        parametros = {}
-
-    parametros = dict(parametros)      # cópia
+    parametros = dict(parametros or {})      # cópia
     parametros.setdefault("timestamp", "0")  # ✅ garante
 
-    params = f"""
-        <Parameter id="chave">{CHAVE}</Parameter>
-        <Parameter id="cnpjEmp">{cnpj}</Parameter>
-        <Parameter id="data_inicial">{d_ini}</Parameter>
-        <Parameter id="data_fim">{d_fim}</Parameter>
-        <Parameter id="hora_inicial">00:00</Parameter>
-        <Parameter id="hora_fim">23:59</Parameter>
-    """
-    for k, v in parametros.items():
-        params += f'<Parameter id="{k}">{v}</Parameter>'
-
-    return f"""<?xml version="1.0" encoding="utf-8"?>
-<LinxMicrovix>
-  <Authentication user="{USUARIO}" password="{SENHA}" />
-  <ResponseFormat>xml</ResponseFormat>
-  <Command>
-    <Name>{metodo}</Name>
-    <Parameters>{params}</Parameters>
-  </Command>
-</LinxMicrovix>"""
-
-def xml_fix(cnpj, metodo, parametros=None):
-    """XML sem janela de datas (para métodos baseados em timestamp)."""
-    if parametros is None:
-        parametros = {}
-    params = f"""
-        <Parameter id="chave">{CHAVE}</Parameter>
-        <Parameter id="cnpjEmp">{cnpj}</Parameter>
-    """
-    for k, v in parametros.items():
-        params += f'<Parameter id="{k}">{v}</Parameter>'
-    return f"""<?xml version="1.0" encoding="utf-8"?>
-<LinxMicrovix>
-  <Authentication user="{USUARIO}" password="{SENHA}" />
-  <ResponseFormat>xml</ResponseFormat>
-  <Command>
-    <Name>{metodo}</Name>
-    <Parameters>{params}</Parameters>
-  </Command>
-</LinxMicrovix>"""
+    return {
+        "cnpjEmp": cnpj,
+        "data_inicial": d_ini,
+        "data_fim": d_fim,
+        "hora_inicial": "00:00",
+        "hora_fim": "23:59",
+        **parametros,
+    }
+
+def parametros_fix(cnpj, parametros=None):
+    """Parâmetros sem janela de datas (para métodos baseados em timestamp)."""
+    return {"cnpjEmp": cnpj, **(parametros or {})}
 
 def chamar_api(cnpj, metodo, parametros=None, usa_datas=True):
     """Chama API e retorna DataFrame."""
     if usa_datas:
-        xml = montar_xml(cnpj, metodo, DATA_INI, DATA_FIM, parametros)
+        params = montar_parametros(cnpj, DATA_INI, DATA_FIM, parametros)
     else:
-        xml = xml_fix(cnpj, metodo, parametros)
+        params = parametros_fix(cnpj, parametros)
 
     try:
-        r = requests.post(URL, data=xml.encode("utf-8"), headers=headers, auth=auth, timeout=180)
+        r = post_microvix(metodo, params, timeout=180)
 
         if r.status_code != 200:
             logger.warning(f"Status HTTP {r.status_code} para {metodo} ({cnpj}). Conteúdo: {_preview_text(r.text, 500)}")
             return pd.DataFrame()
 
-        # ✅ remove BOM se vier e parseia com segurança
-        content = r.content
-        if content.startswith(b"\xef\xbb\xbf"):
-            content = content.lstrip(b"\xef\xbb\xbf")
-
+        # ✅ o decodificador remove BOM se vier e parseia em streaming
         try:
-            root = etree.fromstring(content)
+            df = resposta_para_dataframe(r.content)
+        except MicrovixErro:
+            logger.warning(f"API retornou ResponseSuccess=false para {metodo} ({cnpj}). Resposta: {_preview_text(r.text, 900)}")
+            return pd.DataFrame()
         except Exception as ex_parse:
             logger.warning(f"Falha ao parsear XML em {metodo} ({cnpj}): {ex_parse}. Trecho: {_preview_text(r.text, 900)}")
             return pd.DataFrame()
 
-        ok_nodes = root.xpath(".//ResponseSuccess/text()")
-        if ok_nodes and ok_nodes[0].strip().lower() == "false":
-            logger.warning(f"API retornou ResponseSuccess=false para {metodo} ({cnpj}). Resposta: {_preview_text(r.text, 900)}")
-            return pd.DataFrame()
-
-        cols = [d.text for d in root.xpath(".//C[last()]/D") if d.text]
-        rows = root.xpath(".//R")
-        data = [dict(zip(cols, [d.text for d in rr.xpath('./D')])) for rr in rows]
-        df = pd.DataFrame(data)
-
         if df.empty:
             logger.warning(f"API {metodo} ({cnpj}) retornou 0 linhas. Resposta: {_preview_text(r.text, 900)}")
         else:
@@ -254,33 +214,46 @@ def carregar_sqlite(path, tabela):
     conn.close()
     return df
 
+# ------------------ Catálogo ------------------
+def carregar_produtos():
+    if "produtos" in CATALOGO_CACHE:
+        return CATALOGO_CACHE["produtos"]
+
+    # Só o delta desde o último dt_update é baixado, como no sync_estoque.
+    produtos = atualizar_catalogo(CNPJS[0])
+    if produtos.empty:
+        logger.warning("Catálogo local de produtos vazio; tentando o banco antigo de produtos.")
+        produtos = carregar_sqlite(CACHE_PRODUTOS, "produtos_completos")
+        produtos.columns = [c.lower() for c in produtos.columns]
+        if "cod_produto" in produtos.columns:
+            produtos["cod_produto"] = pd.to_numeric(produtos["cod_produto"], errors="coerce")
+
+    if produtos.empty or "cod_produto" not in produtos.columns:
+        logger.warning("Nenhum catálogo de produtos disponível: REFERENCIA, DESCRICAO e CATEGORIA ficarão vazias.")
+        produtos = pd.DataFrame()
+    else:
+        produtos["cod_produto"] = produtos["cod_produto"].astype("Int64").astype(str)
+
+    CATALOGO_CACHE["produtos"] = produtos
+    return produtos
+
 # ------------------ Naturezas ------------------
 def carregar_naturezas(cnpj):
     if cnpj in NATUREZAS_CACHE:
         return NATUREZAS_CACHE[cnpj]
 
-    todos = []
-    ts = 0
-    while True:
+    def buscar_pagina(ts):
         df_nat = chamar_api(cnpj, "LinxNaturezaOperacao", {"timestamp": str(ts)}, usa_datas=False)
-        if df_nat.empty:
-            break
         df_nat.columns = [c.lower() for c in df_nat.columns]
-        keep = [c for c in ["cod_natureza_operacao","descricao","operacao","timestamp"] if c in df_nat.columns]
-        if keep:
-            todos.append(df_nat[keep].copy())
-
-        if "timestamp" in df_nat.columns:
-            try:
-                ts = int(pd.to_numeric(df_nat["timestamp"], errors="coerce").max())
-            except Exception:
-                break
-        else:
-            break
-        time.sleep(0.3)
+        return df_nat
 
-    if todos:
-        nat = pd.concat(todos, ignore_index=True).drop_duplicates(subset=["cod_natureza_operacao"])
+    # Naturezas quase nunca mudam: só o delta desde o último checkpoint é baixado.
+    nat = paginar_incremental(
+        "LinxNaturezaOperacao", cnpj, buscar_pagina, ["cod_natureza_operacao"]
+    )
+    keep = [c for c in ["cod_natureza_operacao","descricao","operacao","timestamp"] if c in nat.columns]
+    if keep and "cod_natureza_operacao" in keep:
+        nat = nat[keep].copy()
     else:
         nat = pd.DataFrame(columns=["cod_natureza_operacao","descricao","operacao"])
     NATUREZAS_CACHE[cnpj] = nat
@@ -323,9 +296,9 @@ def enriquecer(df_mov, cnpj):
         df_mov = pd.merge(df_mov, lojas[["CNPJ", "NOME_FANTASIA"]],
                           left_on="cnpj_emp", right_on="CNPJ", how="left").drop(columns="CNPJ", errors="ignore")
 
-    produtos = carregar_sqlite(CACHE_PRODUTOS, "produtos_completos")
-    if not produtos.empty:
-        produtos.columns = [c.lower() for c in produtos.columns]
+    produtos = carregar_produtos()
+    if not produtos.empty and "cod_produto" in df_mov.columns:
+        df_mov["cod_produto"] = df_mov["cod_produto"].astype(str)
         keep = [c for c in ["cod_produto","referencia","nome","descricao_basica","desc_setor","categoria"] if c in produtos.columns]
         df_mov = pd.merge(df_mov, produtos[keep], on="cod_produto", how="left")
         df_mov["REFERENCIA"] = df_mov.get("referencia")
@@ -405,7 +378,7 @@ logger.info(f"Extração multi-CNPJ (vendas de {DATA_INI} até {DATA_FIM}) para
 for cnpj in CNPJS:
     logger.info("Buscando vendas para CNPJ %s ...", cnpj)
 
-    # ✅ timestamp=0 é injetado automaticamente pelo montar_xml()
+    # ✅ timestamp=0 é injetado automaticamente pelo montar_parametros()
     df = chamar_api(cnpj, "LinxMovimento", parametros=None, usa_datas=True)
 
     if not df.empty:
@@ -416,8 +389,6 @@ for cnpj in CNPJS:
     else:
         logger.warning("Nenhum dado retornado para %s neste período.", cnpj)
 
-    time.sleep(2)
-
 if not todos:
     logger.error("Nenhum dado retornado em nenhum CNPJ. Encerrando.")
     print("❌ Nenhum dado retornado em nenhum CNPJ.")
@@ -0,0 +1,611 @@
+# ===========================================
+# ⏱️ BENCHMARK DO MOTOR DE RECEBIMENTOS STONE
+#
+# Gera planilhas sintéticas (BASE TRATADA + EXTRATO BANCARIO) no tamanho
+# pedido, com débito, PIX, crédito à vista e parcelado misturados e os
+# formatos bagunçados de dinheiro e data que chegam das lojas, e mede cada
+# etapa do stone_recebimentos_engine:
+#   prepare_base, prepare_extrato, build_conciliacao, build_calendar_daily,
+#   build_monthly, build_pareamento, build_json_response e write_json.
+#
+# O tempo de cada etapa é o menor entre STONE_BENCH_REPETICOES execuções;
+# o pico de memória vem de uma execução à parte com tracemalloc (que pesa
+# no tempo e por isso não entra na medição). Com --salvar-baseline o
+# resultado vira a referência; nas execuções seguintes cada etapa é
+# comparada com ela e o script sai com código 1 se alguma piorar mais que
+# STONE_BENCH_TOLERANCIA.
+#
+# Uso:
+#   python stone_benchmark.py [1k 10k 100k 1M] [--planilha] [--salvar-baseline]
+#
+# --planilha grava a planilha .xlsx e mede também read_workbook (lento
+# acima de ~100k linhas); sem ela os DataFrames vão direto para o motor,
+# com as mesmas colunas object que read_alias_columns devolve.
+# ===========================================
+
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import stone_recebimentos_engine as engine
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+BASELINE_PATH = Path(
+    os.getenv("STONE_BENCH_BASELINE", str(SCRIPT_DIR / "stone_benchmark_baseline.json"))
+)
+BENCH_SEED = int(os.getenv("STONE_BENCH_SEED", "42"))
+BENCH_REPETICOES = max(1, int(os.getenv("STONE_BENCH_REPETICOES", "3")))
+
+# Piora relativa tolerada em relação ao baseline (0.25 = 25%). Etapas que
+# levam menos de BENCH_TEMPO_MINIMO segundos no baseline só oscilam e
+# não são comparadas.
+BENCH_TOLERANCIA = float(os.getenv("STONE_BENCH_TOLERANCIA", "0.25"))
+BENCH_TEMPO_MINIMO = 0.05
+
+TAMANHOS_PADRAO = [1_000, 10_000, 100_000]
+INICIO_VENDAS = np.datetime64("2025-01-01")
+DIAS_VENDAS = 365
+
+# Variações de texto reais de cada modalidade; todas caem na mesma regra
+# depois de normalize_text.
+PRODUTOS = {
+    "debito": ["DÉBITO", "Débito", " debito ", "DEBITO"],
+    "pix": ["PIX", "Pix", "pix "],
+    "credito": ["CRÉDITO", "Crédito", "credito", "CREDITO PARCELADO"],
+    "outro": ["Voucher", "BOLETO", ""],
+}
+MODALIDADES = ["debito", "pix", "credito_1x", "parcelado", "outro"]
+PESOS_MODALIDADES = [0.30, 0.25, 0.20, 0.22, 0.03]
+BANDEIRAS = np.array(["VISA", "MASTERCARD", "ELO", "AMEX", None], dtype=object)
+
+# Dias corridos até o crédito no extrato (antes do ajuste de dia útil).
+PRAZO_EXTRATO = {"debito": 31, "pix": 1, "credito_1x": 60}
+
+
+def log(msg: str) -> None:
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}", flush=True)
+
+
+def parse_tamanho(texto: str) -> int:
+    texto = texto.strip().lower().replace("_", "")
+    multiplicador = 1
+
+    if texto.endswith("k"):
+        texto, multiplicador = texto[:-1], 1_000
+    elif texto.endswith("m"):
+        texto, multiplicador = texto[:-1], 1_000_000
+
+    return int(float(texto) * multiplicador)
+
+
+def rotulo_tamanho(n: int) -> str:
+    if n >= 1_000_000 and n % 1_000_000 == 0:
+        return f"{n // 1_000_000}M"
+    if n >= 1_000 and n % 1_000 == 0:
+        return f"{n // 1_000}k"
+    return str(n)
+
+
+# ===========================================
+# 🧪 GERADOR SINTÉTICO
+# ===========================================
+def _texto_br(valores: np.ndarray) -> List[str]:
+    return [
+        f"{v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        for v in valores
+    ]
+
+
+def formatar_dinheiro(valores: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Mistura número puro, "1.234,56", "R$ 1234,56", "1234.56" e uma fração
+    pequena de lixo ("abc", vazio), como nas planilhas exportadas à mão.
+    """
+    saida = valores.astype(object)
+    formato = rng.choice(6, size=len(valores), p=[0.40, 0.25, 0.15, 0.15, 0.03, 0.02])
+
+    pos = np.flatnonzero(formato == 1)
+    saida[pos] = _texto_br(valores[pos])
+
+    pos = np.flatnonzero(formato == 2)
+    saida[pos] = [f"R$ {v:.2f}".replace(".", ",") for v in valores[pos]]
+
+    pos = np.flatnonzero(formato == 3)
+    saida[pos] = [f"{v:.2f}" for v in valores[pos]]
+
+    saida[formato == 4] = "abc"
+    saida[formato == 5] = None
+    return saida
+
+
+def formatar_datas(dias: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Mistura datetime, "dd/mm/aaaa", serial do Excel, ISO e uma fração
+    pequena de datas inválidas ou vazias.
+    """
+    datas = pd.DatetimeIndex(dias.astype("datetime64[ns]"))
+    saida = datas.to_pydatetime().astype(object)
+    formato = rng.choice(6, size=len(dias), p=[0.45, 0.25, 0.12, 0.13, 0.03, 0.02])
+
+    pos = np.flatnonzero(formato == 1)
+    saida[pos] = datas[pos].strftime("%d/%m/%Y").to_numpy()
+
+    pos = np.flatnonzero(formato == 2)
+    saida[pos] = (dias[pos] - np.datetime64("1899-12-30")).astype(np.int64)
+
+    pos = np.flatnonzero(formato == 3)
+    saida[pos] = datas[pos].strftime("%Y-%m-%d").to_numpy()
+
+    saida[formato == 4] = "xx/xx"
+    saida[formato == 5] = None
+    return saida
+
+
+def _sortear(opcoes: List[str], tamanho: int, rng: np.random.Generator) -> np.ndarray:
+    return np.asarray(opcoes, dtype=object)[rng.integers(0, len(opcoes), tamanho)]
+
+
+def gerar_base(n: int, rng: np.random.Generator) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
+    """
+    BASE TRATADA com n vendas. Devolve também os valores limpos (data,
+    líquido, parcela, modalidade) para montar um extrato coerente.
+    """
+    modalidade = rng.choice(len(MODALIDADES), size=n, p=PESOS_MODALIDADES)
+    dias = INICIO_VENDAS + rng.integers(0, DIAS_VENDAS, n).astype("timedelta64[D]")
+    liquido = np.round(rng.lognormal(4.5, 1.0, n), 2)
+
+    parcelas = np.ones(n, dtype=np.int64)
+    eh_parcelado = modalidade == MODALIDADES.index("parcelado")
+    parcelas[eh_parcelado] = rng.integers(2, 13, int(eh_parcelado.sum()))
+    vlr_parcela = np.round(liquido / parcelas, 2)
+
+    produto = np.empty(n, dtype=object)
+    for codigo, nome in enumerate(MODALIDADES):
+        pos = np.flatnonzero(modalidade == codigo)
+        chave = "credito" if nome in {"credito_1x", "parcelado"} else nome
+        produto[pos] = _sortear(PRODUTOS[chave], len(pos), rng)
+
+    # N DE PARCELAS chega como número, texto ou "6x"; vazio vira 1 no motor.
+    parcelas_texto = parcelas.astype(object)
+    formato = rng.choice(4, size=n, p=[0.6, 0.25, 0.1, 0.05])
+    pos = np.flatnonzero(formato == 1)
+    parcelas_texto[pos] = parcelas[pos].astype(str).astype(object)
+    pos = np.flatnonzero(formato == 2)
+    parcelas_texto[pos] = [f"{p}x" for p in parcelas[pos]]
+    parcelas_texto[(formato == 3) & ~eh_parcelado] = None
+
+    base = pd.DataFrame(
+        {
+            "Data de Venda": formatar_datas(dias, rng),
+            "Valor Líquido": formatar_dinheiro(liquido, rng),
+            "Vlr Parcela": formatar_dinheiro(vlr_parcela, rng),
+            "Produto": produto,
+            "N de Parcelas": parcelas_texto,
+            "Documento": np.char.add("NSU", np.arange(1, n + 1).astype(str)).astype(object),
+            "Bandeira": BANDEIRAS[rng.integers(0, len(BANDEIRAS), n)],
+        }
+    )
+
+    limpos = {
+        "modalidade": modalidade,
+        "dias": dias,
+        "liquido": liquido,
+        "parcelas": parcelas,
+        "vlr_parcela": vlr_parcela,
+    }
+    return base, limpos
+
+
+def gerar_extrato(limpos: Dict[str, np.ndarray], rng: np.random.Generator) -> pd.DataFrame:
+    """
+    EXTRATO BANCARIO com um crédito por parcela de ~90% das vendas, no
+    prazo da modalidade mais 0-3 dias de atraso e alguns centavos de
+    diferença, mais 5% de lançamentos avulsos (tarifas, estornos, TEDs).
+    """
+    modalidade = limpos["modalidade"]
+    parcelado = MODALIDADES.index("parcelado")
+
+    prazo = np.zeros(len(modalidade), dtype=np.int64)
+    for nome, dias_prazo in PRAZO_EXTRATO.items():
+        prazo[modalidade == MODALIDADES.index(nome)] = dias_prazo
+
+    validas = (modalidade != MODALIDADES.index("outro")) & (rng.random(len(modalidade)) < 0.9)
+    pos = np.flatnonzero(validas)
+
+    repeticoes = np.where(modalidade[pos] == parcelado, limpos["parcelas"][pos], 1)
+    linhas = np.repeat(pos, repeticoes)
+    # Número da parcela (1..N) de cada linha repetida.
+    parcela = np.arange(len(linhas)) - np.repeat(np.cumsum(repeticoes) - repeticoes, repeticoes) + 1
+
+    eh_parcelado = modalidade[linhas] == parcelado
+    offset = np.where(eh_parcelado, parcela * 30 + 30, prazo[linhas])
+    offset = offset + rng.choice(4, size=len(linhas), p=[0.7, 0.15, 0.1, 0.05])
+    dias = limpos["dias"][linhas] + offset.astype("timedelta64[D]")
+
+    valor = np.where(eh_parcelado, limpos["vlr_parcela"][linhas], limpos["liquido"][linhas])
+    centavos = rng.choice(3, size=len(linhas), p=[0.85, 0.1, 0.05]) - 1
+    valor = np.round(valor + centavos * 0.01, 2)
+
+    avulsos = max(1, len(linhas) // 20)
+    dias_avulsos = INICIO_VENDAS + rng.integers(0, DIAS_VENDAS + 400, avulsos).astype("timedelta64[D]")
+    valor_avulso = np.round(rng.uniform(-500, 5000, avulsos), 2)
+
+    dias = np.concatenate([dias, dias_avulsos])
+    valor = np.concatenate([valor, valor_avulso])
+    descricao = np.concatenate(
+        [
+            np.char.add("CRED STONE ", linhas.astype(str)).astype(object),
+            _sortear(["TARIFA", "ESTORNO", "TED RECEBIDA", "ALUGUEL POS"], avulsos, rng),
+        ]
+    )
+
+    ordem = np.argsort(dias, kind="stable")
+    return pd.DataFrame(
+        {
+            "Data": formatar_datas(dias[ordem], rng),
+            "Valor": formatar_dinheiro(valor[ordem], rng),
+            "Descrição": descricao[ordem],
+        }
+    )
+
+
+def gerar_planilha(n: int, seed: int = BENCH_SEED) -> Dict[str, Any]:
+    """
+    Frames no mesmo formato de read_workbook: colunas object, como o
+    read_alias_columns lê com dtype=object.
+    """
+    rng = np.random.default_rng(seed + n)
+    base, limpos = gerar_base(n, rng)
+    extrato = gerar_extrato(limpos, rng)
+
+    return {
+        "sheet_base": engine.SHEET_BASE_CANDIDATES[0],
+        "sheet_extrato": engine.SHEET_EXTRATO_CANDIDATES[0],
+        "df_base": base,
+        "df_extrato": extrato,
+    }
+
+
+def gravar_planilha(frames: Dict[str, Any], path: Path) -> None:
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        frames["df_base"].to_excel(writer, sheet_name=frames["sheet_base"], index=False)
+        frames["df_extrato"].to_excel(writer, sheet_name=frames["sheet_extrato"], index=False)
+
+
+# ===========================================
+# 📏 MEDIÇÃO
+# ===========================================
+class _ContadorBytes(io.TextIOBase):
+    """Destino de write_json que só conta o tamanho do payload."""
+
+    def __init__(self) -> None:
+        self.total = 0
+
+    def write(self, texto: str) -> int:
+        self.total += len(texto.encode("utf-8"))
+        return len(texto)
+
+
+def executar_etapas(
+    frames: Dict[str, Any],
+    calendar: np.busdaycalendar,
+    medir: Callable[[str, Callable[[], Any]], Any],
+    planilha: Optional[Path] = None,
+) -> Dict[str, Any]:
+    """
+    O mesmo encadeamento de process_file, sem caches, com cada etapa
+    passando por `medir(nome, função)`.
+    """
+    if planilha is not None:
+        frames = medir("read_workbook", lambda: engine.read_workbook(planilha))
+
+    validas, descartadas = medir("prepare_base", lambda: engine.prepare_base(frames["df_base"], calendar))
+    extr = medir("prepare_extrato", lambda: engine.prepare_extrato(frames["df_extrato"]))
+
+    conciliacao = medir(
+        "build_conciliacao",
+        lambda: engine.build_conciliacao(
+            engine.build_previsto_concatenado(validas),
+            engine.build_extrato_concatenado(extr),
+        ),
+    )
+    daily_calendar = medir("build_calendar_daily", lambda: engine.build_calendar_daily(conciliacao))
+    mensal = medir("build_monthly", lambda: engine.build_monthly(daily_calendar, extr))
+    pareados, previstos_sem_par, extrato_sem_par = medir(
+        "build_pareamento", lambda: engine.build_pareamento(validas, extr)
+    )
+
+    response = medir(
+        "build_json_response",
+        lambda: engine.build_json_response(
+            input_path=planilha or Path("sintetico.xlsx"),
+            file_digest="0" * 64,
+            base_sheet_name=frames["sheet_base"],
+            extrato_sheet_name=frames["sheet_extrato"],
+            validas=validas,
+            descartadas=descartadas,
+            extr=extr,
+            conciliacao=conciliacao,
+            daily_calendar=daily_calendar,
+            mensal=mensal,
+            pareados=pareados,
+            previstos_sem_par=previstos_sem_par,
+            extrato_sem_par=extrato_sem_par,
+        ),
+    )
+
+    contador = _ContadorBytes()
+    medir("write_json", lambda: engine.write_json(response, contador))
+
+    return {
+        "linhasPrevistas": int(len(validas)),
+        "linhasDescartadas": int(len(descartadas)),
+        "linhasExtrato": int(len(extr)),
+        "dias": int(len(daily_calendar)),
+        "pares": int(len(pareados)),
+        "payloadBytes": contador.total,
+    }
+
+
+def medir_tempos(
+    frames: Dict[str, Any],
+    calendar: np.busdaycalendar,
+    repeticoes: int,
+    planilha: Optional[Path] = None,
+) -> Tuple[Dict[str, float], Dict[str, Any]]:
+    tempos: Dict[str, float] = {}
+    contagens: Dict[str, Any] = {}
+
+    def medir(nome: str, funcao: Callable[[], Any]) -> Any:
+        inicio = time.perf_counter()
+        resultado = funcao()
+        decorrido = time.perf_counter() - inicio
+        tempos[nome] = min(tempos.get(nome, decorrido), decorrido)
+        return resultado
+
+    for _ in range(repeticoes):
+        gc.collect()
+        contagens = executar_etapas(frames, calendar, medir, planilha)
+
+    return tempos, contagens
+
+
+def medir_memoria(
+    frames: Dict[str, Any],
+    calendar: np.busdaycalendar,
+    planilha: Optional[Path] = None,
+) -> Dict[str, float]:
+    """
+    Pico de memória alocada (MB) dentro de cada etapa, acima do que já
+    estava alocado ao entrar nela. numpy e pandas registram seus buffers no
+    tracemalloc, então os arrays entram na conta.
+    """
+    picos: Dict[str, float] = {}
+
+    def medir(nome: str, funcao: Callable[[], Any]) -> Any:
+        atual, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        resultado = funcao()
+        _, pico = tracemalloc.get_traced_memory()
+        picos[nome] = round((pico - atual) / 1024 / 1024, 2)
+        return resultado
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        executar_etapas(frames, calendar, medir, planilha)
+    finally:
+        tracemalloc.stop()
+
+    return picos
+
+
+def pico_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS.
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(pico / divisor, 1)
+
+
+def rodar_tamanho(
+    n: int,
+    calendar: np.busdaycalendar,
+    repeticoes: int,
+    com_planilha: bool,
+    com_memoria: bool,
+) -> Dict[str, Any]:
+    inicio = time.perf_counter()
+    frames = gerar_planilha(n)
+    log(
+        f"🧪 {rotulo_tamanho(n)}: {len(frames['df_base'])} vendas e "
+        f"{len(frames['df_extrato'])} lançamentos gerados em {time.perf_counter() - inicio:.1f}s."
+    )
+
+    with tempfile.TemporaryDirectory(prefix="stone_bench_") as pasta:
+        planilha = None
+        if com_planilha:
+            planilha = Path(pasta) / f"stone_{rotulo_tamanho(n)}.xlsx"
+            gravar_planilha(frames, planilha)
+            log(f"   📄 Planilha gravada ({planilha.stat().st_size / 1024 / 1024:.1f} MB).")
+
+        tempos, contagens = medir_tempos(frames, calendar, repeticoes, planilha)
+        memoria = medir_memoria(frames, calendar, planilha) if com_memoria else {}
+
+    return {
+        "vendas": n,
+        "tempos": {nome: round(valor, 4) for nome, valor in tempos.items()},
+        "tempoTotal": round(sum(tempos.values()), 4),
+        "memoriaPicoMB": memoria,
+        "memoriaPicoTotalMB": max(memoria.values()) if memoria else None,
+        **contagens,
+    }
+
+
+# ===========================================
+# 📊 BASELINE E RELATÓRIO
+# ===========================================
+def carregar_baseline(path: Path = BASELINE_PATH) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        log(f"⚠️ Baseline ilegível em {path}; ignorando.")
+        return {}
+
+
+def salvar_baseline(resultado: Dict[str, Any], path: Path = BASELINE_PATH) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(resultado, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def comparar_com_baseline(
+    resultado: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerancia: float = BENCH_TOLERANCIA,
+) -> List[str]:
+    """
+    Etapas (e picos de memória) que pioraram mais que `tolerancia` em
+    relação ao baseline, por tamanho.
+    """
+    regressoes: List[str] = []
+    anteriores = baseline.get("tamanhos", {})
+
+    for rotulo, atual in resultado["tamanhos"].items():
+        anterior = anteriores.get(rotulo)
+        if not anterior:
+            continue
+
+        for etapa, tempo in atual["tempos"].items():
+            referencia = anterior.get("tempos", {}).get(etapa)
+            if referencia is None or referencia < BENCH_TEMPO_MINIMO:
+                continue
+            if tempo > referencia * (1 + tolerancia):
+                regressoes.append(
+                    f"{rotulo} {etapa}: {tempo:.3f}s (baseline {referencia:.3f}s, "
+                    f"+{(tempo / referencia - 1) * 100:.0f}%)"
+                )
+
+        for etapa, pico in atual.get("memoriaPicoMB", {}).items():
+            referencia = anterior.get("memoriaPicoMB", {}).get(etapa)
+            if not referencia or referencia < 1:
+                continue
+            if pico > referencia * (1 + tolerancia):
+                regressoes.append(
+                    f"{rotulo} {etapa}: {pico:.1f} MB (baseline {referencia:.1f} MB, "
+                    f"+{(pico / referencia - 1) * 100:.0f}%)"
+                )
+
+    return regressoes
+
+
+def imprimir_relatorio(resultado: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    anteriores = baseline.get("tamanhos", {})
+
+    for rotulo, atual in resultado["tamanhos"].items():
+        anterior = anteriores.get(rotulo, {})
+        print()
+        print(
+            f"== {rotulo} vendas | {atual['linhasPrevistas']} parcelas previstas | "
+            f"{atual['linhasExtrato']} lançamentos | {atual['pares']} pares | "
+            f"payload {atual['payloadBytes'] / 1024:.0f} KB"
+        )
+        print(f"{'etapa':<22}{'tempo (s)':>12}{'baseline':>12}{'var.':>8}{'pico (MB)':>12}")
+
+        for etapa, tempo in atual["tempos"].items():
+            referencia = anterior.get("tempos", {}).get(etapa)
+            variacao = f"{(tempo / referencia - 1) * 100:+.0f}%" if referencia else ""
+            pico = atual["memoriaPicoMB"].get(etapa)
+            print(
+                f"{etapa:<22}{tempo:>12.4f}"
+                f"{(f'{referencia:.4f}' if referencia is not None else '-'):>12}"
+                f"{variacao:>8}"
+                f"{(f'{pico:.1f}' if pico is not None else '-'):>12}"
+            )
+
+        print(f"{'total':<22}{atual['tempoTotal']:>12.4f}")
+
+    if resultado.get("picoRssMB") is not None:
+        print()
+        print(f"Pico de RSS do processo: {resultado['picoRssMB']} MB")
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    com_planilha = "--planilha" in args
+    salvar = "--salvar-baseline" in args
+    com_memoria = "--sem-memoria" not in args
+    tamanhos = [parse_tamanho(a) for a in args if not a.startswith("--")] or TAMANHOS_PADRAO
+
+    calendar = engine.get_business_calendar()
+
+    resultado: Dict[str, Any] = {
+        "geradoEm": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "maquina": platform.machine(),
+        "cpus": os.cpu_count(),
+        "seed": BENCH_SEED,
+        "repeticoes": BENCH_REPETICOES,
+        "planilha": com_planilha,
+        "tamanhos": {},
+    }
+
+    for n in tamanhos:
+        resultado["tamanhos"][rotulo_tamanho(n)] = rodar_tamanho(
+            n, calendar, BENCH_REPETICOES, com_planilha, com_memoria
+        )
+
+    resultado["picoRssMB"] = pico_rss_mb()
+
+    baseline = carregar_baseline()
+    imprimir_relatorio(resultado, baseline)
+
+    if salvar:
+        # Mescla por tamanho: salvar só o 1M não apaga o baseline de 1k.
+        baseline.update({k: v for k, v in resultado.items() if k != "tamanhos"})
+        baseline.setdefault("tamanhos", {}).update(resultado["tamanhos"])
+        salvar_baseline(baseline)
+        log(f"💾 Baseline salvo em {BASELINE_PATH}.")
+        return
+
+    if not baseline:
+        log("ℹ️ Sem baseline; rode com --salvar-baseline para criar um.")
+        return
+
+    regressoes = comparar_com_baseline(resultado, baseline)
+    if regressoes:
+        print()
+        log(f"🚨 {len(regressoes)} regressão(ões) acima de {BENCH_TOLERANCIA:.0%}:")
+        for linha in regressoes:
+            print(f"   - {linha}")
+        sys.exit(1)
+
+    log(f"✅ Nenhuma etapa piorou mais que {BENCH_TOLERANCIA:.0%} em relação ao baseline.")
+
+
+if __name__ == "__main__":
+    main()
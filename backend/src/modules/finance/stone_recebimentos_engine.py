@@ -1,29 +1,196 @@
+import gzip
+import hashlib
+import importlib.util
 import json
 import os
+import re
 import sys
 import traceback
 import unicodedata
-from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
-import requests
 
 
 SHEET_BASE_CANDIDATES = ["BASE TRATADA"]
 SHEET_EXTRATO_CANDIDATES = ["EXTRATO BANCARIO", "EXTRATO_BANCARIO"]
 
-HOLIDAY_API_URL = "https://date.nager.at/api/v3/PublicHolidays/{year}/BR"
-REQUEST_TIMEOUT = 20
-HOLIDAY_CACHE_FILENAME = "feriados_cache_br.json"
+# Feriados gerados localmente, sem consulta externa: nacionais fixos e móveis
+# (Carnaval, Sexta-feira Santa e Corpus Christi, a partir da Páscoa).
+# STONE_FERIADOS_UF acrescenta os feriados estaduais das UFs listadas
+# (ex.: "PE,CE") e ADDITIONAL_MANUAL_HOLIDAYS cobre datas avulsas.
+NATIONAL_FIXED_HOLIDAYS = [
+    (1, 1),    # Confraternização Universal
+    (4, 21),   # Tiradentes
+    (5, 1),    # Dia do Trabalho
+    (9, 7),    # Independência
+    (10, 12),  # Nossa Senhora Aparecida
+    (11, 2),   # Finados
+    (11, 15),  # Proclamação da República
+    (12, 25),  # Natal
+]
+CONSCIENCIA_NEGRA_DESDE = 2024  # 20/11, nacional pela Lei 14.759/2023
+
+# Dias contados a partir do domingo de Páscoa.
+EASTER_HOLIDAY_OFFSETS = [
+    -48,  # Segunda-feira de Carnaval
+    -47,  # Terça-feira de Carnaval
+    -2,   # Sexta-feira Santa
+    60,   # Corpus Christi
+]
+
+REGIONAL_HOLIDAYS: Dict[str, List[Tuple[int, int]]] = {
+    "AC": [(6, 15)],
+    "AL": [(9, 16)],
+    "AM": [(9, 5)],
+    "AP": [(3, 19)],
+    "BA": [(7, 2)],
+    "CE": [(3, 25)],
+    "DF": [(11, 30)],
+    "MA": [(7, 28)],
+    "MS": [(10, 11)],
+    "PA": [(8, 15)],
+    "PB": [(8, 5)],
+    "PE": [(3, 6)],
+    "PI": [(10, 19)],
+    "PR": [(12, 19)],
+    "RJ": [(4, 23)],
+    "RN": [(10, 3)],
+    "RO": [(1, 4)],
+    "RR": [(10, 5)],
+    "RS": [(9, 20)],
+    "SE": [(7, 8)],
+    "SP": [(7, 9)],
+    "TO": [(10, 5)],
+}
+HOLIDAY_REGIONS = [
+    uf.strip().upper()
+    for uf in os.getenv("STONE_FERIADOS_UF", "").split(",")
+    if uf.strip()
+]
+
+# Anos cobertos pelo calendário de dias úteis do processo.
+HOLIDAY_CALENDAR_YEARS = range(1990, 2101)
 
 ADDITIONAL_MANUAL_HOLIDAYS: List[str] = []
 EXTRATO_ONLY_POSITIVE_VALUES = True
 
+# Regras de recebimento, avaliadas na ordem: vale a primeira que casar.
+#   produto / bandeira: regex sobre o texto normalizado (normalize_text);
+#                       bandeira None aceita qualquer uma.
+#   parcelas:           faixa (mín, máx) de N DE PARCELAS; máx None = sem teto.
+#   parcelado:          abre uma linha por parcela, cada uma com VLR PARCELA.
+#   prazo_base:         dias corridos após o início da contagem, somados a
+#                       prazo_por_parcela x PARCELA_ATUAL.
+#   prazo_delay:        dias corridos após a liquidação.
+#   roll:               ajuste de dia não útil do np.busday_offset.
+#   descricao:          texto de REGRA_APLICADA; {parcela} vira "N/TOTAL".
+# STONE_REGRAS_RECEBIMENTO aponta para um JSON com uma lista no mesmo
+# formato que substitui esta tabela (outra adquirente, contrato com
+# antecipação etc.).
+RECEIVABLE_RULES: List[Dict[str, Any]] = [
+    {
+        "id": "CREDITO_PARCELADO",
+        "produto": "CREDITO",
+        "bandeira": None,
+        "parcelas": (2, None),
+        "parcelado": True,
+        "prazo_base": 0,
+        "prazo_por_parcela": 30,
+        "prazo_delay": 30,
+        "roll": "forward",
+        "descricao": "CRÉDITO PARCELADO {parcela} = D+(parcela x 30) + 30 corridos → recebimento no próximo útil",
+    },
+    {
+        "id": "CREDITO_1X",
+        "produto": "CREDITO",
+        "bandeira": None,
+        "parcelas": (1, 1),
+        "parcelado": False,
+        "prazo_base": 30,
+        "prazo_por_parcela": 0,
+        "prazo_delay": 30,
+        "roll": "forward",
+        "descricao": "CRÉDITO 1X = D+30 + 30 corridos → recebimento no próximo útil",
+    },
+    {
+        "id": "PIX",
+        "produto": "PIX",
+        "bandeira": None,
+        "parcelas": (1, None),
+        "parcelado": False,
+        "prazo_base": 1,
+        "prazo_por_parcela": 0,
+        "prazo_delay": 0,
+        "roll": "forward",
+        "descricao": "PIX = D+1 corrido → recebimento no próximo útil",
+    },
+    {
+        "id": "DEBITO",
+        "produto": "DEBITO",
+        "bandeira": None,
+        "parcelas": (1, None),
+        "parcelado": False,
+        "prazo_base": 1,
+        "prazo_por_parcela": 0,
+        "prazo_delay": 30,
+        "roll": "forward",
+        "descricao": "DÉBITO = D+1 + 30 corridos → recebimento no próximo útil",
+    },
+]
+RECEIVABLE_RULES_PATH = os.getenv("STONE_REGRAS_RECEBIMENTO", "").strip()
+
 MAX_DETALHES_POR_DIA = 30
 MAX_DESCARTADAS_RETORNO = 200
+MAX_PENDENCIAS_RETORNO = 500
+
+# Pareamento parcela a parcela (previsto x extrato). Um lançamento do extrato
+# é par de uma parcela prevista quando data e valor ficam dentro das
+# tolerâncias; componentes ambíguos com até STONE_MATCH_BUCKET_OTIMO parcelas
+# (e lançamentos) são resolvidos pela atribuição ótima, os maiores no guloso.
+# Cada grupo de (dia, valor) guarda no máximo STONE_MATCH_MAX_CANDIDATOS
+# arestas, as mais baratas.
+MATCH_TOLERANCIA_DIAS = max(0, int(os.getenv("STONE_MATCH_TOLERANCIA_DIAS", "3")))
+MATCH_TOLERANCIA_VALOR = max(0.0, float(os.getenv("STONE_MATCH_TOLERANCIA_VALOR", "0.01")))
+MATCH_BUCKET_OTIMO = max(1, int(os.getenv("STONE_MATCH_BUCKET_OTIMO", "8")))
+MATCH_MAX_CANDIDATOS = max(1, int(os.getenv("STONE_MATCH_MAX_CANDIDATOS", "16")))
+
+# Cache por conteúdo (SHA-256 do arquivo) em get_cache_dir()/resultados.
+# Suba STONE_PARSER_VERSION quando a leitura das abas mudar (invalida as abas
+# lidas e os resultados) e STONE_RULES_VERSION quando regras de recebimento,
+# conciliação ou o formato do JSON mudarem (só os resultados são refeitos; as
+# abas lidas são reaproveitadas sem abrir o Excel de novo).
+STONE_PARSER_VERSION = "1"
+STONE_RULES_VERSION = "3"
+RESULT_CACHE_DIRNAME = "resultados"
+RESULT_CACHE_ENABLED = (
+    os.getenv("STONE_RESULT_CACHE", "true").strip().lower() not in {"0", "false", "nao", "não"}
+)
+RESULT_CACHE_MAX_BYTES = int(float(os.getenv("STONE_RESULT_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+# Os lançamentos de cada dia não vão mais no JSON principal: o diário leva só
+# totais e quantidades, e os detalhes são pedidos por dia (--detalhes ou
+# cmd "detalhes" no worker) usando o arquivoId devolvido no resultado.
+# STONE_DETALHES_INLINE=true volta a mandar detalhesPrevisto/detalhesExtrato.
+# Sem cache em disco (STONE_RESULT_CACHE=false) os detalhes não sobrevivem ao
+# processo, então o padrão passa a ser mandá-los no JSON principal.
+DETAILS_INLINE = os.getenv(
+    "STONE_DETALHES_INLINE", "false" if RESULT_CACHE_ENABLED else "true"
+).strip().lower() in {"1", "true", "sim", "s"}
+DETAILS_MEMORY_ENTRIES = 4
+
+# O JSON de saída é serializado em blocos: listas grandes saem em pedaços
+# desse tamanho, sem montar a string inteira em memória. Não é streaming:
+# o resultado já está completo antes da escrita e o server.ts lê tudo.
+JSON_CHUNK_ROWS = 500
+
+# Modo lote (--lote): várias planilhas (uma por loja) em paralelo.
+BATCH_WORKERS = max(1, int(os.getenv("STONE_LOTE_WORKERS", str(min(8, os.cpu_count() or 1)))))
+WORKBOOK_SUFFIXES = {".xlsb", ".xlsx", ".xlsm"}
 
 
 BASE_COL_ALIASES = {
@@ -115,6 +282,9 @@ EXTRATO_COL_ALIASES = {
     ],
 }
 
+BASE_REQUIRED_FIELDS = {"data_venda", "valor_liquido", "produto", "parcelas"}
+EXTRATO_REQUIRED_FIELDS = {"data_extrato"}
+
 WEEKDAY_PT = {
     0: "Segunda-Feira",
     1: "Terça-Feira",
@@ -148,6 +318,16 @@ def normalize_text(text: Any) -> str:
 
 
 def get_engine(path: Path) -> Optional[str]:
+    # python-calamine (opcional) lê .xlsx/.xlsm/.xlsb em Rust e é bem mais
+    # rápido que openpyxl/pyxlsb. STONE_EXCEL_ENGINE força um leitor
+    # ("default" mantém a escolha do pandas).
+    forced = os.getenv("STONE_EXCEL_ENGINE", "").strip().lower()
+    if forced:
+        return None if forced == "default" else forced
+
+    if importlib.util.find_spec("python_calamine") is not None:
+        return "calamine"
+
     if path.suffix.lower() == ".xlsb":
         return "pyxlsb"
     return None
@@ -201,6 +381,31 @@ def find_column(df: pd.DataFrame, aliases: List[str], required: bool = True) ->
     return None
 
 
+def read_alias_columns(
+    xls: pd.ExcelFile,
+    sheet_name: str,
+    aliases: Dict[str, List[str]],
+    required: set,
+) -> pd.DataFrame:
+    """
+    Lê só as colunas encontradas por `aliases` em uma planilha já aberta.
+    O cabeçalho é lido antes e resolvido com find_column, então as colunas
+    escolhidas (e os nomes delas) são as mesmas que a aba inteira daria.
+    """
+    header = xls.parse(sheet_name, nrows=0)
+    columns = list(header.columns)
+
+    found = [
+        find_column(header, field_aliases, required=field in required)
+        for field, field_aliases in aliases.items()
+    ]
+    positions = sorted({columns.index(col) for col in found if col is not None})
+
+    df = xls.parse(sheet_name, usecols=positions, dtype=object)
+    df.columns = [columns[i] for i in positions]
+    return df
+
+
 def get_series(df: pd.DataFrame, col_name: Any) -> pd.Series:
     if col_name is None:
         return pd.Series([None] * len(df), index=df.index)
@@ -242,8 +447,110 @@ def parse_money(value: Any) -> float:
         return np.nan
 
 
+_NUMERIC_SCALAR_TYPES = (int, float, np.integer, np.floating)
+
+
+def _is_numeric_scalar_mask(values: np.ndarray) -> np.ndarray:
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if kind in ("string", "empty"):
+        return np.zeros(len(values), dtype=bool)
+    if kind in ("floating", "integer", "mixed-integer-float"):
+        return np.ones(len(values), dtype=bool)
+
+    return np.fromiter(
+        (isinstance(v, _NUMERIC_SCALAR_TYPES) for v in values),
+        dtype=bool,
+        count=len(values),
+    )
+
+
+def _ascii_mask(arr: np.ndarray) -> np.ndarray:
+    width = arr.dtype.itemsize // 4
+    if width == 0:
+        return np.ones(len(arr), dtype=bool)
+    return arr.view(np.uint32).reshape(len(arr), width).max(axis=1) < 128
+
+
 def parse_money_series(series: pd.Series) -> pd.Series:
-    return series.apply(parse_money)
+    """
+    parse_money aplicado à coluna inteira: os mesmos passos de normalização
+    rodam como operações de texto do numpy. Decimais simples são
+    convertidos em uma passada; só o que sobra (ex.: "1_000", "1e3") passa
+    por float() um a um.
+    """
+    if series.empty:
+        return series.apply(parse_money)
+
+    if pd.api.types.is_bool_dtype(series.dtype) or (
+        pd.api.types.is_numeric_dtype(series.dtype)
+        and not pd.api.types.is_complex_dtype(series.dtype)
+    ):
+        return series.astype(float)
+
+    values = series.to_numpy(dtype=object)
+    out = np.full(len(values), np.nan)
+
+    missing = np.asarray(pd.isna(values), dtype=bool)
+    numeric = _is_numeric_scalar_mask(values) & ~missing
+    if numeric.any():
+        out[numeric] = values[numeric].astype(float)
+
+    text_idx = np.flatnonzero(~missing & ~numeric)
+    if len(text_idx) == 0:
+        return pd.Series(out, index=series.index, name=series.name)
+
+    texts = [v if type(v) is str else str(v) for v in values[text_idx]]
+    s = np.array(texts, dtype=str)
+
+    # Strings de largura fixa do numpy perdem os NULs do fim; esses valores
+    # raros ficam com o parser elemento a elemento.
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    exact = np.char.str_len(s) == lengths
+
+    s = np.char.strip(s)
+    for token in ("R$", "r$", " ", "\u00A0"):
+        has_token = np.char.find(s, token) >= 0
+        if has_token.any():
+            s[has_token] = np.char.replace(s[has_token], token, "")
+
+    parens = np.char.startswith(s, "(") & np.char.endswith(s, ")")
+    if parens.any():
+        s[parens] = ["-" + v[1:-1] for v in s[parens].tolist()]
+
+    has_comma = np.char.find(s, ",") >= 0
+    both = has_comma & (np.char.find(s, ".") >= 0)
+    if both.any():
+        s[both] = np.char.replace(s[both], ".", "")
+    if has_comma.any():
+        s[has_comma] = np.char.replace(s[has_comma], ",", ".")
+
+    # Decimal simples: sinal opcional, dígitos ASCII e no máximo um ponto.
+    unsigned = s.copy()
+    for sign in ("-", "+"):
+        has_sign = np.char.startswith(s, sign)
+        if has_sign.any():
+            unsigned[has_sign] = np.char.replace(s[has_sign], sign, "", 1)
+    plain = (
+        exact
+        & _ascii_mask(s)
+        & np.char.isdecimal(np.char.replace(unsigned, ".", "", 1))
+    )
+
+    parsed = np.full(len(s), np.nan)
+    if plain.any():
+        parsed[plain] = s[plain].astype(np.float64)
+
+    for i in np.flatnonzero(~plain):
+        if not exact[i]:
+            parsed[i] = parse_money(values[text_idx[i]])
+            continue
+        try:
+            parsed[i] = float(s[i])
+        except ValueError:
+            pass
+
+    out[text_idx] = parsed
+    return pd.Series(out, index=series.index, name=series.name)
 
 
 def _parse_single_date(value: Any) -> Any:
@@ -319,8 +626,170 @@ def _parse_single_date(value: Any) -> Any:
     return dt.normalize()
 
 
+# (regex sobre o texto limpo, formato do strptime) na ordem em que
+# _parse_single_date tenta. Só textos exatamente nesse formato seguem pelo
+# caminho vetorizado.
+_DATE_STRING_FORMATS = [
+    (r"[0-9]{1,2}/[0-9]{1,2}/[0-9]{4} [0-9]{1,2}:[0-9]{1,2}:[0-9]{1,2}", "%d/%m/%Y %H:%M:%S"),
+    (r"[0-9]{1,2}/[0-9]{1,2}/[0-9]{4} [0-9]{1,2}:[0-9]{1,2}", "%d/%m/%Y %H:%M"),
+    (r"[0-9]{1,2}/[0-9]{1,2}/[0-9]{4}", "%d/%m/%Y"),
+    (r"[0-9]{4}/[0-9]{1,2}/[0-9]{1,2} [0-9]{1,2}:[0-9]{1,2}:[0-9]{1,2}", "%Y/%m/%d %H:%M:%S"),
+    (r"[0-9]{4}/[0-9]{1,2}/[0-9]{1,2} [0-9]{1,2}:[0-9]{1,2}", "%Y/%m/%d %H:%M"),
+    (r"[0-9]{4}/[0-9]{1,2}/[0-9]{1,2}", "%Y/%m/%d"),
+    (r"[0-9]{8}", "%Y%m%d"),
+]
+
+_DATE_UNIT_RANK = {"s": 0, "ms": 1, "us": 2, "ns": 3}
+_EXCEL_EPOCH = np.datetime64("1899-12-30", "D")
+
+
+def _positions_mask(n: int, positions: np.ndarray) -> np.ndarray:
+    mask = np.zeros(n, dtype=bool)
+    mask[positions] = True
+    return mask
+
+
 def parse_date_series(series: pd.Series) -> pd.Series:
-    return series.apply(_parse_single_date)
+    """
+    _parse_single_date aplicado à coluna inteira.
+
+    Datas e datetimes nativos, códigos numéricos e os formatos de texto
+    mais comuns são convertidos em bloco; o resto (e qualquer falha em
+    bloco) passa por _parse_single_date, então os valores são os mesmos da
+    versão elemento a elemento. A unidade do resultado é a que o
+    Series.apply inferiria: a mais fina entre os valores lidos, "s" quando
+    todos são NaT.
+    """
+    if series.empty:
+        return series.apply(_parse_single_date)
+
+    if isinstance(series.dtype, pd.DatetimeTZDtype):
+        return series.apply(_parse_single_date)
+
+    if pd.api.types.is_datetime64_dtype(series.dtype) and series.notna().any():
+        return series.dt.normalize()
+
+    values = series.to_numpy(dtype=object)
+    n = len(values)
+    out = np.full(n, np.datetime64("NaT"), dtype="datetime64[us]")
+    units: set = set()
+
+    missing = np.asarray(pd.isna(values), dtype=bool)
+    if pd.api.types.infer_dtype(values, skipna=True) == "string":
+        is_naive_datetime = np.zeros(n, dtype=bool)
+        is_date = np.zeros(n, dtype=bool)
+        is_number = np.zeros(n, dtype=bool)
+        is_text = ~missing
+    else:
+        is_naive_datetime = np.fromiter(
+            (
+                isinstance(v, datetime) and not isinstance(v, pd.Timestamp) and v.tzinfo is None
+                for v in values
+            ),
+            dtype=bool,
+            count=n,
+        )
+        is_date = np.fromiter(
+            (isinstance(v, date) and not isinstance(v, datetime) for v in values),
+            dtype=bool,
+            count=n,
+        )
+        is_number = _is_numeric_scalar_mask(values)
+        is_text = np.fromiter((isinstance(v, str) for v in values), dtype=bool, count=n)
+
+        # pd.NaT também é uma instância de datetime.
+        is_naive_datetime &= ~missing
+        is_date &= ~missing
+        is_number &= ~missing
+        is_text &= ~missing
+
+    fallback = ~(missing | is_naive_datetime | is_date | is_number | is_text)
+
+    def assign(mask: np.ndarray, parsed: np.ndarray, unit: str) -> None:
+        if not mask.any():
+            return
+        out[mask] = parsed
+        if not np.isnat(parsed).all():
+            units.add(unit)
+
+    if is_naive_datetime.any():
+        parsed = pd.to_datetime(values[is_naive_datetime]).to_numpy(dtype="datetime64[us]")
+        assign(is_naive_datetime, parsed.astype("datetime64[D]"), "s")
+
+    if is_date.any():
+        parsed = pd.to_datetime(values[is_date]).to_numpy(dtype="datetime64[us]")
+        assign(is_date, parsed.astype("datetime64[D]"), "s")
+
+    if is_number.any():
+        idx = np.flatnonzero(is_number)
+        num = values[idx].astype(float)
+        finite = np.isfinite(num)
+        # Só valores abaixo de 1e13 caem em alguma das faixas; o corte evita
+        # overflow na conversão dos demais para int64.
+        whole = np.trunc(np.where(finite & (np.abs(num) < 1e15), num, 0)).astype(np.int64)
+
+        excel = finite & (num >= 20000) & (num <= 80000)
+        epoch_ms = finite & (num >= 1_000_000_000_000) & (num <= 9_999_999_999_999)
+        epoch_s = finite & (num >= 1_000_000_000) & (num <= 9_999_999_999)
+        yyyymmdd = finite & (num >= 19_000_000) & (num <= 29_999_999) & (num == whole)
+
+        assign(_positions_mask(n, idx[excel]), _EXCEL_EPOCH + whole[excel].astype("timedelta64[D]"), "us")
+        assign(
+            _positions_mask(n, idx[epoch_ms]),
+            whole[epoch_ms].astype("datetime64[ms]").astype("datetime64[D]"),
+            "ms",
+        )
+        assign(
+            _positions_mask(n, idx[epoch_s]),
+            whole[epoch_s].astype("datetime64[s]").astype("datetime64[D]"),
+            "s",
+        )
+        if yyyymmdd.any():
+            parsed = pd.to_datetime(
+                whole[yyyymmdd].astype(str), format="%Y%m%d", errors="coerce"
+            ).to_numpy(dtype="datetime64[us]")
+            assign(_positions_mask(n, idx[yyyymmdd]), parsed, "us")
+
+    if is_text.any():
+        idx = np.flatnonzero(is_text)
+        cleaned = (
+            pd.Series(values[idx], dtype=object)
+            .str.strip()
+            .str.replace(".", "/", regex=False)
+            .str.replace("-", "/", regex=False)
+        )
+        pending = cleaned.ne("").to_numpy(dtype=bool, copy=True)
+
+        for pattern, fmt in _DATE_STRING_FORMATS:
+            if not pending.any():
+                break
+            hit = pending & cleaned.str.fullmatch(pattern).to_numpy(dtype=bool)
+            if not hit.any():
+                continue
+
+            parsed = pd.to_datetime(
+                cleaned[hit], format=fmt, errors="coerce"
+            ).to_numpy(dtype="datetime64[us]").astype("datetime64[D]")
+            ok = ~np.isnat(parsed)
+            assign(_positions_mask(n, idx[hit][ok]), parsed[ok], "s")
+
+            # Falhas em bloco (ex.: 31/02) ficam para o parser elemento a elemento.
+            fallback[idx[hit][~ok]] = True
+            pending &= ~hit
+
+        fallback[idx[pending]] = True
+
+    for i in np.flatnonzero(fallback):
+        parsed = _parse_single_date(values[i])
+        if pd.isna(parsed):
+            continue
+        if parsed.tz is not None:
+            return series.apply(_parse_single_date)
+        out[i] = parsed.to_datetime64()
+        units.add(parsed.unit)
+
+    unit = max(units, key=_DATE_UNIT_RANK.__getitem__) if units else "s"
+    return pd.Series(out.astype(f"datetime64[{unit}]"), index=series.index, name=series.name)
 
 
 def parse_int_safe(value: Any, default: int = 1) -> int:
@@ -348,61 +817,58 @@ def is_business_day(d: date, holidays: set) -> bool:
     return d.weekday() < 5 and d not in holidays
 
 
-def load_holiday_cache(cache_path: Path) -> Dict[str, Any]:
-    if cache_path.exists():
-        try:
-            return json.loads(cache_path.read_text(encoding="utf-8"))
-        except Exception:
-            return {}
+def easter_sunday(year: int) -> date:
+    """
+    Domingo de Páscoa no calendário gregoriano (algoritmo de Meeus/Jones/Butcher).
+    """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
 
-    return {}
 
+def brazilian_holidays(year: int, regions: Iterable[str] = ()) -> set:
+    holidays = {date(year, month, day) for month, day in NATIONAL_FIXED_HOLIDAYS}
 
-def save_holiday_cache(cache_path: Path, cache: Dict[str, Any]) -> None:
-    try:
-        cache_path.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8")
-    except Exception as exc:
-        log(f"AVISO: não foi possível salvar cache de feriados: {exc}")
-
+    if year >= CONSCIENCIA_NEGRA_DESDE:
+        holidays.add(date(year, 11, 20))
 
-def fetch_holidays_for_year(year: int) -> List[str]:
-    url = HOLIDAY_API_URL.format(year=year)
-    response = requests.get(url, timeout=REQUEST_TIMEOUT)
-    response.raise_for_status()
-    payload = response.json()
+    easter = easter_sunday(year)
+    holidays.update(easter + timedelta(days=offset) for offset in EASTER_HOLIDAY_OFFSETS)
 
-    dates = []
+    for uf in regions:
+        holidays.update(date(year, month, day) for month, day in REGIONAL_HOLIDAYS.get(uf, []))
 
-    for item in payload:
-        dt = item.get("date")
+    return holidays
 
-        if dt:
-            dates.append(dt)
 
-    return sorted(set(dates))
+# Feriados e calendário de dias úteis já montados neste processo. No modo
+# worker o mesmo processo atende várias planilhas sem refazer nada disso.
+_HOLIDAYS_BY_YEAR: Dict[int, set] = {}
+_BUSINESS_CALENDAR: Optional[np.busdaycalendar] = None
 
 
 def load_holidays(years: List[int]) -> set:
-    cache_path = get_cache_dir() / HOLIDAY_CACHE_FILENAME
-    cache = load_holiday_cache(cache_path)
     holidays = set()
 
     for year in sorted(set(int(y) for y in years)):
-        year_key = str(year)
-
-        if year_key not in cache:
-            try:
-                log(f"Consultando feriados do ano {year} na API...")
-                cache[year_key] = fetch_holidays_for_year(year)
-            except Exception as exc:
-                log(f"AVISO: não foi possível consultar feriados de {year}: {exc}")
-                cache[year_key] = []
-
-        for iso_date in cache.get(year_key, []):
-            try:
-                holidays.add(pd.to_datetime(iso_date).date())
-            except Exception:
-                pass
+        if year not in _HOLIDAYS_BY_YEAR:
+            _HOLIDAYS_BY_YEAR[year] = brazilian_holidays(year, HOLIDAY_REGIONS)
+
+        holidays |= _HOLIDAYS_BY_YEAR[year]
+
+    return holidays | manual_holidays()
+
+
+def manual_holidays() -> set:
+    holidays = set()
 
     for iso_date in ADDITIONAL_MANUAL_HOLIDAYS:
         try:
@@ -410,10 +876,169 @@ def load_holidays(years: List[int]) -> set:
         except Exception:
             pass
 
-    save_holiday_cache(cache_path, cache)
     return holidays
 
 
+def get_business_calendar() -> np.busdaycalendar:
+    """
+    Calendário de dias úteis (seg-sex menos feriados) de HOLIDAY_CALENDAR_YEARS,
+    montado uma única vez por processo.
+    """
+    global _BUSINESS_CALENDAR
+
+    if _BUSINESS_CALENDAR is None:
+        unknown = [uf for uf in HOLIDAY_REGIONS if uf not in REGIONAL_HOLIDAYS]
+        if unknown:
+            log(f"AVISO: UFs sem feriados estaduais cadastrados: {unknown}")
+
+        holidays = load_holidays(list(HOLIDAY_CALENDAR_YEARS))
+        _BUSINESS_CALENDAR = np.busdaycalendar(
+            weekmask="1111100",
+            holidays=np.array(sorted(holidays), dtype="datetime64[D]"),
+        )
+
+    return _BUSINESS_CALENDAR
+
+
+_COMPILED_RULES: Optional[Dict[str, Any]] = None
+
+_RULE_ROLLS = {"forward", "following", "backward", "preceding", "modifiedfollowing", "modifiedpreceding"}
+
+
+def load_receivable_rules() -> List[Dict[str, Any]]:
+    if not RECEIVABLE_RULES_PATH:
+        return RECEIVABLE_RULES
+
+    with open(RECEIVABLE_RULES_PATH, "r", encoding="utf-8") as f:
+        rules = json.load(f)
+
+    if not isinstance(rules, list) or not rules:
+        raise ValueError(f"STONE_REGRAS_RECEBIMENTO deve conter uma lista de regras: {RECEIVABLE_RULES_PATH}")
+
+    return rules
+
+
+def compile_receivable_rules(rules: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Converte a tabela de regras em arrays indexados pelo número da regra.
+
+    Os arrays têm uma posição extra no fim para "nenhuma regra", então o
+    id -1 devolvido por resolve_rule_ids já cai nela ao indexar.
+    """
+    regras = []
+
+    for n, rule in enumerate(rules):
+        rule_id = str(rule.get("id") or f"REGRA_{n + 1}")
+        roll = str(rule.get("roll", "forward"))
+
+        if roll not in _RULE_ROLLS:
+            raise ValueError(f"Regra {rule_id}: roll inválido '{roll}'.")
+
+        parcelas_min, parcelas_max = rule.get("parcelas") or (1, None)
+        descricao = str(rule.get("descricao") or rule_id)
+        prefixo, marcador, sufixo = descricao.partition("{parcela}")
+
+        regras.append(
+            {
+                "id": rule_id,
+                "produto": re.compile(str(rule["produto"])),
+                "bandeira": re.compile(str(rule["bandeira"])) if rule.get("bandeira") else None,
+                "parcelas_min": int(parcelas_min or 1),
+                "parcelas_max": int(parcelas_max) if parcelas_max is not None else None,
+                "parcelado": bool(rule.get("parcelado", False)),
+                "prazo_base": int(rule.get("prazo_base", 0)),
+                "prazo_por_parcela": int(rule.get("prazo_por_parcela", 0)),
+                "prazo_delay": int(rule.get("prazo_delay", 0)),
+                "roll": roll,
+                "prefixo": prefixo,
+                "mostra_parcela": bool(marcador),
+                "sufixo": sufixo,
+                "descricao": descricao,
+            }
+        )
+
+    def coluna(campo: str, vazio: Any, dtype: Any) -> np.ndarray:
+        return np.array([r[campo] for r in regras] + [vazio], dtype=dtype)
+
+    return {
+        "regras": regras,
+        "parcelado": coluna("parcelado", False, bool),
+        "prazo_base": coluna("prazo_base", 0, np.int64),
+        "prazo_por_parcela": coluna("prazo_por_parcela", 0, np.int64),
+        "prazo_delay": coluna("prazo_delay", 0, np.int64),
+        "roll": coluna("roll", "forward", object),
+        "prefixo": coluna("prefixo", "", object),
+        "mostra_parcela": coluna("mostra_parcela", False, bool),
+        "sufixo": coluna("sufixo", "", object),
+    }
+
+
+def get_receivable_rules() -> Dict[str, Any]:
+    global _COMPILED_RULES
+
+    if _COMPILED_RULES is None:
+        _COMPILED_RULES = compile_receivable_rules(load_receivable_rules())
+
+    return _COMPILED_RULES
+
+
+def rules_digest(compiled: Dict[str, Any]) -> str:
+    return hashlib.sha256(
+        json.dumps(
+            [
+                {k: (v.pattern if isinstance(v, re.Pattern) else v) for k, v in regra.items()}
+                for regra in compiled["regras"]
+            ],
+            sort_keys=True,
+            ensure_ascii=False,
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def resolve_rule_ids(
+    compiled: Dict[str, Any],
+    produto_norm: pd.Series,
+    bandeira_norm: pd.Series,
+    parcelas: pd.Series,
+) -> np.ndarray:
+    """
+    Número da primeira regra que casa com cada linha, ou -1.
+
+    As regras só são testadas nas combinações distintas de (produto,
+    bandeira, parcelas); as linhas recebem o resultado por indexação.
+    """
+    codes, uniques = pd.MultiIndex.from_arrays(
+        [produto_norm.to_numpy(), bandeira_norm.to_numpy(), parcelas.to_numpy()]
+    ).factorize()
+
+    ids = []
+
+    for produto, bandeira, total in uniques:
+        encontrada = -1
+
+        for n, regra in enumerate(compiled["regras"]):
+            if not regra["produto"].search(produto):
+                continue
+            if regra["bandeira"] is not None and not regra["bandeira"].search(bandeira):
+                continue
+            if total < regra["parcelas_min"]:
+                continue
+            if regra["parcelas_max"] is not None and total > regra["parcelas_max"]:
+                continue
+            encontrada = n
+            break
+
+        ids.append(encontrada)
+
+    return np.asarray(ids, dtype=np.int64)[codes]
+
+
+def normalize_text_series(series: pd.Series) -> pd.Series:
+    codes, uniques = pd.factorize(series)
+    normalizados = np.array([normalize_text(u) for u in uniques] + [""], dtype=object)
+    return pd.Series(normalizados[codes], index=series.index, dtype=str)
+
+
 def status_from_diff(diff: float) -> str:
     if pd.isna(diff):
         return ""
@@ -424,38 +1049,59 @@ def status_from_diff(diff: float) -> str:
     return "PGT MAIOR" if diff > 0 else "PGT MENOR"
 
 
+def status_from_diff_series(diff: pd.Series) -> np.ndarray:
+    """
+    status_from_diff aplicado à coluna inteira.
+    """
+    values = pd.to_numeric(diff, errors="coerce").to_numpy(dtype=float)
+
+    return np.select(
+        [np.isnan(values), np.abs(values) < 0.005, values > 0],
+        ["", "OK", "PGT MAIOR"],
+        default="PGT MENOR",
+    )
+
+
 def calcular_fluxo_recebimento_vetorizado(
     data_venda: pd.Series,
     prazo_base: np.ndarray,
     prazo_delay: np.ndarray,
-    holidays: set,
+    calendar: Optional[np.busdaycalendar] = None,
+    roll: Optional[np.ndarray] = None,
 ) -> Tuple[pd.DatetimeIndex, pd.DatetimeIndex, pd.DatetimeIndex]:
+    if calendar is None:
+        calendar = get_business_calendar()
+
     datas = pd.to_datetime(data_venda, errors="coerce").values.astype("datetime64[D]")
     base = np.asarray(prazo_base, dtype="timedelta64[D]")
     delay = np.asarray(prazo_delay, dtype="timedelta64[D]")
 
-    holiday_values = []
+    if roll is None:
+        roll = np.full(len(datas), "forward", dtype=object)
 
-    for h in sorted(holidays):
-        try:
-            holiday_values.append(np.datetime64(pd.Timestamp(h).date(), "D"))
-        except Exception:
-            pass
+    inicio = np.empty_like(datas)
+    liquidacao = np.empty_like(datas)
+    recebimento = np.empty_like(datas)
 
-    holidays_np = np.array(holiday_values, dtype="datetime64[D]")
+    # Um passe por modo de ajuste presente (no máximo os seis do numpy).
+    for modo in pd.unique(roll):
+        sel = roll == modo
 
-    inicio = np.busday_offset(datas, 0, roll="forward", holidays=holidays_np)
+        inicio[sel] = np.busday_offset(datas[sel], 0, roll=modo, busdaycal=calendar)
 
-    liquidacao_candidata = inicio + base
-    liquidacao = np.busday_offset(liquidacao_candidata, 0, roll="forward", holidays=holidays_np)
+        liquidacao_candidata = inicio[sel] + base[sel]
+        liquidacao[sel] = np.busday_offset(liquidacao_candidata, 0, roll=modo, busdaycal=calendar)
 
-    recebimento_candidato = liquidacao + delay
-    recebimento = np.busday_offset(recebimento_candidato, 0, roll="forward", holidays=holidays_np)
+        recebimento_candidato = liquidacao[sel] + delay[sel]
+        recebimento[sel] = np.busday_offset(recebimento_candidato, 0, roll=modo, busdaycal=calendar)
 
     return pd.to_datetime(inicio), pd.to_datetime(liquidacao), pd.to_datetime(recebimento)
 
 
-def prepare_base(df_base: pd.DataFrame, holidays: set) -> Tuple[pd.DataFrame, pd.DataFrame]:
+def prepare_base(
+    df_base: pd.DataFrame,
+    calendar: Optional[np.busdaycalendar] = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
     base = df_base.copy()
     base = base.dropna(how="all").reset_index(drop=True)
 
@@ -477,7 +1123,7 @@ def prepare_base(df_base: pd.DataFrame, holidays: set) -> Tuple[pd.DataFrame, pd
         base["VALOR_PARCELA_ORIGINAL"] = np.nan
 
     base["PRODUTO"] = get_series(base, col_produto).astype(str).str.strip()
-    base["PRODUTO_NORM"] = base["PRODUTO"].apply(normalize_text)
+    base["PRODUTO_NORM"] = normalize_text_series(base["PRODUTO"])
     base["TOTAL_PARCELAS"] = get_series(base, col_parcelas).apply(lambda x: parse_int_safe(x, 1))
     base["DOCUMENTO"] = get_series(base, col_documento).fillna("").astype(str).str.strip()
     base["BANDEIRA"] = get_series(base, col_bandeira).fillna("").astype(str).str.strip()
@@ -533,12 +1179,18 @@ def prepare_base(df_base: pd.DataFrame, holidays: set) -> Tuple[pd.DataFrame, pd
 
         return validas, descartadas.reset_index(drop=True)
 
-    base_valid["EH_CREDITO"] = base_valid["PRODUTO_NORM"].str.contains("CREDITO", na=False)
-    base_valid["EH_DEBITO"] = base_valid["PRODUTO_NORM"].str.contains("DEBITO", na=False)
-    base_valid["EH_PIX"] = base_valid["PRODUTO_NORM"].str.contains("PIX", na=False)
+    regras = get_receivable_rules()
+
+    base_valid["REGRA_ID"] = resolve_rule_ids(
+        regras,
+        base_valid["PRODUTO_NORM"],
+        normalize_text_series(base_valid["BANDEIRA"]),
+        base_valid["TOTAL_PARCELAS"],
+    )
+    base_valid["PARCELADO"] = regras["parcelado"][base_valid["REGRA_ID"].to_numpy()]
 
     base_valid["QTD_LINHAS_PREVISTAS"] = np.where(
-        base_valid["EH_CREDITO"] & (base_valid["TOTAL_PARCELAS"] > 1),
+        base_valid["PARCELADO"] & (base_valid["TOTAL_PARCELAS"] > 1),
         base_valid["TOTAL_PARCELAS"],
         1,
     ).astype(int)
@@ -553,9 +1205,8 @@ def prepare_base(df_base: pd.DataFrame, holidays: set) -> Tuple[pd.DataFrame, pd
         "VALOR_VENDA_LIQUIDO",
         "VALOR_PARCELA_ORIGINAL",
         "TOTAL_PARCELAS",
-        "EH_CREDITO",
-        "EH_DEBITO",
-        "EH_PIX",
+        "REGRA_ID",
+        "PARCELADO",
         "QTD_LINHAS_PREVISTAS",
     ]
 
@@ -580,7 +1231,7 @@ def prepare_base(df_base: pd.DataFrame, holidays: set) -> Tuple[pd.DataFrame, pd
         / expanded.loc[mask_sem_parcela, "TOTAL_PARCELAS"].astype(float)
     )
 
-    parcelado_mask = expanded["EH_CREDITO"] & (expanded["TOTAL_PARCELAS"] > 1)
+    parcelado_mask = expanded["PARCELADO"] & (expanded["TOTAL_PARCELAS"] > 1)
 
     expanded["VALOR_LIQUIDO"] = expanded["VALOR_VENDA_LIQUIDO"].astype(float).round(2)
 
@@ -600,48 +1251,37 @@ def prepare_base(df_base: pd.DataFrame, holidays: set) -> Tuple[pd.DataFrame, pd
         )
     ).round(2)
 
-    expanded["PRAZO_BASE_DIAS_CORRIDOS"] = np.nan
-    expanded["PRAZO_DELAY_DIAS_CORRIDOS"] = np.nan
-    expanded["REGRA_APLICADA"] = ""
-    expanded["MOTIVO_DESCARTE"] = ""
+    # Prazos e textos por indexação nos arrays da tabela compilada: o número
+    # de operações não depende de quantas regras existem.
+    regra_id = expanded["REGRA_ID"].to_numpy()
+    parcela_atual = expanded["PARCELA_ATUAL"].to_numpy()
+    mask_prod_invalido = regra_id < 0
 
-    mask_debito = expanded["EH_DEBITO"]
-    mask_pix = expanded["EH_PIX"]
-    mask_credito = expanded["EH_CREDITO"]
-    mask_credito_1x = mask_credito & (expanded["TOTAL_PARCELAS"] <= 1)
-    mask_credito_parc = mask_credito & (expanded["TOTAL_PARCELAS"] > 1)
-    mask_prod_invalido = ~(mask_debito | mask_pix | mask_credito)
-
-    expanded.loc[mask_debito, "PRAZO_BASE_DIAS_CORRIDOS"] = 1
-    expanded.loc[mask_debito, "PRAZO_DELAY_DIAS_CORRIDOS"] = 30
-    expanded.loc[mask_debito, "REGRA_APLICADA"] = (
-        "DÉBITO = D+1 + 30 corridos → recebimento no próximo útil"
+    expanded["PRAZO_BASE_DIAS_CORRIDOS"] = np.where(
+        mask_prod_invalido,
+        np.nan,
+        regras["prazo_base"][regra_id] + regras["prazo_por_parcela"][regra_id] * parcela_atual,
     )
-
-    expanded.loc[mask_pix, "PRAZO_BASE_DIAS_CORRIDOS"] = 1
-    expanded.loc[mask_pix, "PRAZO_DELAY_DIAS_CORRIDOS"] = 0
-    expanded.loc[mask_pix, "REGRA_APLICADA"] = "PIX = D+1 corrido → recebimento no próximo útil"
-
-    expanded.loc[mask_credito_1x, "PRAZO_BASE_DIAS_CORRIDOS"] = 30
-    expanded.loc[mask_credito_1x, "PRAZO_DELAY_DIAS_CORRIDOS"] = 30
-    expanded.loc[mask_credito_1x, "REGRA_APLICADA"] = (
-        "CRÉDITO 1X = D+30 + 30 corridos → recebimento no próximo útil"
+    expanded["PRAZO_DELAY_DIAS_CORRIDOS"] = np.where(
+        mask_prod_invalido,
+        np.nan,
+        regras["prazo_delay"][regra_id],
     )
+    expanded["ROLL"] = regras["roll"][regra_id]
 
-    expanded.loc[mask_credito_parc, "PRAZO_BASE_DIAS_CORRIDOS"] = (
-        expanded.loc[mask_credito_parc, "PARCELA_ATUAL"].astype(int) * 30
+    texto_parcela = np.where(
+        regras["mostra_parcela"][regra_id],
+        expanded["PARCELA_ATUAL"].astype(str) + "/" + expanded["TOTAL_PARCELAS"].astype(str),
+        "",
     )
-
-    expanded.loc[mask_credito_parc, "PRAZO_DELAY_DIAS_CORRIDOS"] = 30
-
-    expanded.loc[mask_credito_parc, "REGRA_APLICADA"] = (
-        "CRÉDITO PARCELADO "
-        + expanded.loc[mask_credito_parc, "PARCELA_ATUAL"].astype(str)
-        + "/"
-        + expanded.loc[mask_credito_parc, "TOTAL_PARCELAS"].astype(str)
-        + " = D+(parcela x 30) + 30 corridos → recebimento no próximo útil"
+    expanded["REGRA_APLICADA"] = (
+        pd.Series(regras["prefixo"][regra_id], index=expanded.index, dtype=str)
+        + texto_parcela
+        + pd.Series(regras["sufixo"][regra_id], index=expanded.index, dtype=str)
     )
+    expanded["MOTIVO_DESCARTE"] = ""
 
+    expanded.loc[mask_prod_invalido, "REGRA_APLICADA"] = ""
     expanded.loc[mask_prod_invalido, "MOTIVO_DESCARTE"] = (
         "Produto não suportado para regra de recebimento: "
         + expanded.loc[mask_prod_invalido, "PRODUTO"].astype(str)
@@ -667,7 +1307,8 @@ def prepare_base(df_base: pd.DataFrame, holidays: set) -> Tuple[pd.DataFrame, pd
             validas["DATA_VENDA"],
             validas["PRAZO_BASE_DIAS_CORRIDOS"].astype(int).to_numpy(),
             validas["PRAZO_DELAY_DIAS_CORRIDOS"].astype(int).to_numpy(),
-            holidays,
+            calendar,
+            validas["ROLL"].to_numpy(),
         )
     )
 
@@ -724,6 +1365,7 @@ def prepare_extrato(df_extrato: pd.DataFrame) -> pd.DataFrame:
     col_debito = find_column(extr, EXTRATO_COL_ALIASES["debito_extrato"], required=False)
     col_desc = find_column(extr, EXTRATO_COL_ALIASES["descricao"], required=False)
 
+    extr["LINHA_ORIGEM"] = np.arange(len(extr)) + 2
     extr["DATA_EXTRATO"] = parse_date_series(get_series(extr, col_data))
 
     if col_valor:
@@ -827,7 +1469,7 @@ def build_conciliacao(previsto_conc: pd.DataFrame, extrato_conc: pd.DataFrame) -
     conciliacao["QTD_PREVISTA"] = conciliacao["QTD_LANCAMENTOS_x"].fillna(0).astype(int)
     conciliacao["QTD_EXTRATO"] = conciliacao["QTD_LANCAMENTOS_y"].fillna(0).astype(int)
     conciliacao["DIFERENCA"] = conciliacao["VLR_EXTRATO"] - conciliacao["PROJETADO"]
-    conciliacao["STATUS"] = conciliacao["DIFERENCA"].apply(status_from_diff)
+    conciliacao["STATUS"] = status_from_diff_series(conciliacao["DIFERENCA"])
     conciliacao["DETALHES_PREVISTO"] = conciliacao["DETALHES"].fillna("")
     conciliacao["DETALHES_EXTRATO"] = conciliacao["DETALHES_EXTRATO"].fillna("")
 
@@ -850,6 +1492,406 @@ def build_conciliacao(previsto_conc: pd.DataFrame, extrato_conc: pd.DataFrame) -
     return conciliacao
 
 
+# ===========================================
+# PAREAMENTO PARCELA A PARCELA
+# ===========================================
+# build_conciliacao só compara totais por dia. Aqui cada parcela prevista é
+# pareada com um lançamento do extrato:
+#   1. pares exatos (mesmo dia, mesmo valor em centavos) saem de um merge
+#      por (dia, centavos, ordem dentro da chave);
+#   2. o resto é agrupado por (dia, centavos), já que parcelas com a mesma
+#      chave são intercambiáveis, e os grupos entram em um band join por
+#      faixas de dia e de valor (9 merges fixos), filtrado pelas tolerâncias
+#      e limitado a STONE_MATCH_MAX_CANDIDATOS arestas por grupo;
+#   3. componentes de uma aresta pareiam direto, componentes ambíguos
+#      pequenos recebem a atribuição ótima e os grandes a gulosa por custo,
+#      grupo a grupo.
+# O grafo tem O(n) arestas mesmo com milhares de parcelas do mesmo valor;
+# tudo fica em ordenações e merges, O(n log n) no número de linhas.
+def _dias_inteiros(values: Any) -> np.ndarray:
+    datas = pd.to_datetime(pd.Series(values), errors="coerce").to_numpy(dtype="datetime64[D]")
+    return datas.astype(np.int64)
+
+
+def _centavos(values: Any) -> np.ndarray:
+    return np.rint(pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float) * 100).astype(np.int64)
+
+
+def _pares_exatos(previsto: pd.DataFrame, extrato: pd.DataFrame) -> pd.DataFrame:
+    chaves = ["DIA", "CENTAVOS"]
+    previsto = previsto.assign(ORDEM=previsto.groupby(chaves, sort=False).cumcount())
+    extrato = extrato.assign(ORDEM=extrato.groupby(chaves, sort=False).cumcount())
+
+    pares = previsto[["I", *chaves, "ORDEM"]].merge(
+        extrato[["J", *chaves, "ORDEM"]],
+        on=[*chaves, "ORDEM"],
+    )
+
+    return pares[["I", "J"]]
+
+
+def _agrupar(tabela: pd.DataFrame, coluna: str) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Linhas com o mesmo (DIA, CENTAVOS) são intercambiáveis no pareamento.
+
+    Devolve uma linha por chave (GRUPO, DIA, CENTAVOS, QTD, PRIMEIRO, INICIO)
+    e os ids em ordem: os do grupo g ficam em membros[INICIO:INICIO + QTD].
+    """
+    ordenado = tabela.sort_values(["DIA", "CENTAVOS", coluna], kind="stable")
+    membros = ordenado[coluna].to_numpy(dtype=np.int64)
+
+    grupos = (
+        ordenado.groupby(["DIA", "CENTAVOS"], sort=False)[coluna]
+        .agg(QTD="size", PRIMEIRO="first")
+        .reset_index()
+    )
+    qtd = grupos["QTD"].to_numpy(dtype=np.int64)
+    grupos["INICIO"] = np.cumsum(qtd) - qtd
+    grupos["GRUPO"] = np.arange(len(grupos), dtype=np.int64)
+
+    return grupos, membros
+
+
+def _candidatos_tolerancia(
+    grupos_prev: pd.DataFrame,
+    grupos_extr: pd.DataFrame,
+    tolerancia_dias: int,
+    tolerancia_centavos: int,
+    limite: int = MATCH_MAX_CANDIDATOS,
+) -> pd.DataFrame:
+    """
+    Arestas (GI, GJ) entre grupos com |dias| <= tolerancia_dias e
+    |centavos| <= tolerancia_centavos, ordenadas por custo.
+
+    Com faixas de largura tolerância + 1, todo par válido cai na mesma faixa
+    ou na vizinha; cada deslocamento de faixa gera um merge por igualdade.
+    Como o merge é entre chaves distintas, cada grupo encontra no máximo
+    9 * (tolerancia_dias + 1) * (tolerancia_centavos + 1) grupos, por mais
+    parcelas que dividam o mesmo valor; depois cada grupo fica só com as
+    `limite` arestas mais baratas.
+    """
+    largura_dia = tolerancia_dias + 1
+    largura_valor = tolerancia_centavos + 1
+    colunas = ["GRUPO", "DIA", "CENTAVOS", "PRIMEIRO"]
+
+    esquerda = grupos_prev[colunas].assign(
+        FAIXA_DIA=grupos_prev["DIA"] // largura_dia,
+        FAIXA_VALOR=grupos_prev["CENTAVOS"] // largura_valor,
+    )
+    direita = grupos_extr[colunas].assign(
+        FAIXA_DIA=grupos_extr["DIA"] // largura_dia,
+        FAIXA_VALOR=grupos_extr["CENTAVOS"] // largura_valor,
+    )
+
+    partes = []
+
+    for desloc_dia in (-1, 0, 1):
+        for desloc_valor in (-1, 0, 1):
+            deslocado = direita.assign(
+                FAIXA_DIA=direita["FAIXA_DIA"] + desloc_dia,
+                FAIXA_VALOR=direita["FAIXA_VALOR"] + desloc_valor,
+            )
+            partes.append(
+                esquerda.merge(
+                    deslocado,
+                    on=["FAIXA_DIA", "FAIXA_VALOR"],
+                    suffixes=("_PREV", "_EXTR"),
+                )
+            )
+
+    candidatos = pd.concat(partes, ignore_index=True)
+
+    dias = (candidatos["DIA_EXTR"] - candidatos["DIA_PREV"]).abs()
+    centavos = (candidatos["CENTAVOS_EXTR"] - candidatos["CENTAVOS_PREV"]).abs()
+    dentro = (dias <= tolerancia_dias) & (centavos <= tolerancia_centavos)
+
+    candidatos = pd.DataFrame(
+        {
+            "GI": candidatos["GRUPO_PREV"][dentro],
+            "GJ": candidatos["GRUPO_EXTR"][dentro],
+            # Valor pesa mais que data: um centavo a mais perde para
+            # qualquer diferença de dias dentro da tolerância.
+            "CUSTO": centavos[dentro] * largura_dia + dias[dentro],
+            "PRIMEIRO_I": candidatos["PRIMEIRO_PREV"][dentro],
+            "PRIMEIRO_J": candidatos["PRIMEIRO_EXTR"][dentro],
+        }
+    ).sort_values(["CUSTO", "PRIMEIRO_I", "PRIMEIRO_J"], kind="stable")
+
+    # Teto de arestas por grupo dos dois lados: o grafo fica com no máximo
+    # `limite` arestas por grupo, mesmo com tolerâncias largas.
+    candidatos = candidatos[candidatos.groupby("GI", sort=False).cumcount() < limite]
+    candidatos = candidatos[candidatos.groupby("GJ", sort=False).cumcount() < limite]
+
+    return candidatos.reset_index(drop=True)
+
+
+def _componentes(esquerda: np.ndarray, direita: np.ndarray) -> np.ndarray:
+    """
+    Rótulo do componente conexo de cada aresta do grafo bipartido.
+
+    Hooking + pointer jumping em numpy: cada rodada pendura a raiz maior na
+    menor ao longo das arestas e comprime os caminhos; converge em poucas
+    rodadas mesmo com centenas de milhares de arestas.
+    """
+    deslocamento = int(esquerda.max()) + 1
+    origem = esquerda.astype(np.int64)
+    destino = direita.astype(np.int64) + deslocamento
+    rotulo = np.arange(deslocamento + int(direita.max()) + 1, dtype=np.int64)
+
+    while True:
+        raiz_origem = rotulo[origem]
+        raiz_destino = rotulo[destino]
+        menor = np.minimum(raiz_origem, raiz_destino)
+
+        if np.array_equal(raiz_origem, raiz_destino):
+            break
+
+        np.minimum.at(rotulo, raiz_origem, menor)
+        np.minimum.at(rotulo, raiz_destino, menor)
+
+        while True:
+            comprimido = rotulo[rotulo]
+            if np.array_equal(comprimido, rotulo):
+                break
+            rotulo = comprimido
+
+    return rotulo[origem]
+
+
+def _atribuicao_gulosa(
+    arestas: List[Tuple[int, int]],
+    qtd_prev: np.ndarray,
+    qtd_extr: np.ndarray,
+) -> List[Tuple[int, int, int, int, int]]:
+    """
+    Guloso por custo sobre as arestas entre grupos: cada aresta leva quantos
+    pares os dois grupos ainda comportam. Devolve blocos
+    (GI, OFFSET_I, GJ, OFFSET_J, QTD) para _expandir_blocos.
+    """
+    usados_i: Dict[int, int] = {}
+    usados_j: Dict[int, int] = {}
+    blocos = []
+
+    for gi, gj in arestas:
+        ja_i = usados_i.get(gi, 0)
+        ja_j = usados_j.get(gj, 0)
+        quantidade = min(int(qtd_prev[gi]) - ja_i, int(qtd_extr[gj]) - ja_j)
+        if quantidade <= 0:
+            continue
+        usados_i[gi] = ja_i + quantidade
+        usados_j[gj] = ja_j + quantidade
+        blocos.append((gi, ja_i, gj, ja_j, quantidade))
+
+    return blocos
+
+
+def _atribuicao_otima(arestas: List[Tuple[int, int, int]]) -> List[Tuple[int, int]]:
+    """
+    Máximo de pares e, entre esses, menor custo total. Programação dinâmica
+    sobre o conjunto de lançamentos já usados; só chamada com componentes
+    de até MATCH_BUCKET_OTIMO lançamentos.
+    """
+    linhas = sorted({i for i, _, _ in arestas})
+    colunas = sorted({j for _, j, _ in arestas})
+    bit = {j: 1 << n for n, j in enumerate(colunas)}
+
+    opcoes: Dict[int, List[Tuple[int, int]]] = {}
+    for i, j, custo in arestas:
+        opcoes.setdefault(i, []).append((j, custo))
+
+    # máscara -> ((-pares, custo), pares escolhidos)
+    estados: Dict[int, Tuple[Tuple[int, int], List[Tuple[int, int]]]] = {0: ((0, 0), [])}
+
+    for i in linhas:
+        proximos = dict(estados)
+        for mascara, ((neg_pares, custo_total), escolhidos) in estados.items():
+            for j, custo in opcoes.get(i, []):
+                if mascara & bit[j]:
+                    continue
+                nova = mascara | bit[j]
+                valor = (neg_pares - 1, custo_total + custo)
+                if nova not in proximos or valor < proximos[nova][0]:
+                    proximos[nova] = (valor, escolhidos + [(i, j)])
+        estados = proximos
+
+    return min(estados.values(), key=lambda estado: estado[0])[1]
+
+
+def _expandir_blocos(
+    blocos: pd.DataFrame,
+    grupos_prev: pd.DataFrame,
+    membros_prev: np.ndarray,
+    grupos_extr: pd.DataFrame,
+    membros_extr: np.ndarray,
+) -> pd.DataFrame:
+    """Blocos (GI, OFFSET_I, GJ, OFFSET_J, QTD) viram pares (I, J) na ordem dos membros."""
+    qtd = blocos["QTD"].to_numpy(dtype=np.int64)
+    passo = np.arange(int(qtd.sum()), dtype=np.int64) - np.repeat(np.cumsum(qtd) - qtd, qtd)
+
+    inicio_i = grupos_prev["INICIO"].to_numpy()[blocos["GI"].to_numpy(dtype=np.int64)]
+    inicio_j = grupos_extr["INICIO"].to_numpy()[blocos["GJ"].to_numpy(dtype=np.int64)]
+
+    posicao_i = np.repeat(inicio_i + blocos["OFFSET_I"].to_numpy(dtype=np.int64), qtd) + passo
+    posicao_j = np.repeat(inicio_j + blocos["OFFSET_J"].to_numpy(dtype=np.int64), qtd) + passo
+
+    return pd.DataFrame({"I": membros_prev[posicao_i], "J": membros_extr[posicao_j]})
+
+
+def _pares_tolerancia(
+    candidatos: pd.DataFrame,
+    grupos_prev: pd.DataFrame,
+    membros_prev: np.ndarray,
+    grupos_extr: pd.DataFrame,
+    membros_extr: np.ndarray,
+) -> pd.DataFrame:
+    if candidatos.empty:
+        return pd.DataFrame({"I": [], "J": []}, dtype=np.int64)
+
+    qtd_prev = grupos_prev["QTD"].to_numpy(dtype=np.int64)
+    qtd_extr = grupos_extr["QTD"].to_numpy(dtype=np.int64)
+    inicio_prev = grupos_prev["INICIO"].to_numpy(dtype=np.int64)
+    inicio_extr = grupos_extr["INICIO"].to_numpy(dtype=np.int64)
+
+    gi = candidatos["GI"].to_numpy(dtype=np.int64)
+    gj = candidatos["GJ"].to_numpy(dtype=np.int64)
+    candidatos = candidatos.assign(
+        COMPONENTE=_componentes(gi, gj),
+        QTD_I=qtd_prev[gi],
+        QTD_J=qtd_extr[gj],
+    )
+    arestas_por_componente = candidatos.groupby("COMPONENTE")["GI"].transform("size")
+
+    # Componente de uma aresta só: os dois grupos não têm concorrentes e
+    # pareiam na ordem dos membros, como nos exatos.
+    isolados = candidatos[arestas_por_componente == 1]
+    blocos: List[Tuple[int, int, int, int, int]] = list(
+        zip(
+            isolados["GI"].tolist(),
+            [0] * len(isolados),
+            isolados["GJ"].tolist(),
+            [0] * len(isolados),
+            np.minimum(isolados["QTD_I"], isolados["QTD_J"]).tolist(),
+        )
+    )
+
+    ambiguos = candidatos[arestas_por_componente > 1]
+    total_i = ambiguos.drop_duplicates(["COMPONENTE", "GI"]).groupby("COMPONENTE")["QTD_I"].sum()
+    total_j = ambiguos.drop_duplicates(["COMPONENTE", "GJ"]).groupby("COMPONENTE")["QTD_J"].sum()
+    pequenos = set(total_i.index[(total_i <= MATCH_BUCKET_OTIMO) & (total_j <= MATCH_BUCKET_OTIMO)])
+
+    escolhidos: List[Tuple[int, int]] = []
+
+    for componente, grupo in ambiguos.groupby("COMPONENTE", sort=False):
+        arestas_grupos = list(zip(grupo["GI"].tolist(), grupo["GJ"].tolist()))
+
+        if componente not in pequenos:
+            blocos.extend(_atribuicao_gulosa(arestas_grupos, qtd_prev, qtd_extr))
+            continue
+
+        # Componente pequeno: volta às parcelas e lançamentos individuais.
+        arestas = [
+            (int(i), int(j), custo)
+            for (g_i, g_j), custo in zip(arestas_grupos, grupo["CUSTO"].tolist())
+            for i in membros_prev[inicio_prev[g_i]:inicio_prev[g_i] + qtd_prev[g_i]]
+            for j in membros_extr[inicio_extr[g_j]:inicio_extr[g_j] + qtd_extr[g_j]]
+        ]
+        arestas.sort(key=lambda aresta: (aresta[2], aresta[0], aresta[1]))
+        escolhidos.extend(_atribuicao_otima(arestas))
+
+    pares = [
+        _expandir_blocos(
+            pd.DataFrame(blocos, columns=["GI", "OFFSET_I", "GJ", "OFFSET_J", "QTD"]),
+            grupos_prev,
+            membros_prev,
+            grupos_extr,
+            membros_extr,
+        )
+    ]
+
+    if escolhidos:
+        pares.append(pd.DataFrame(escolhidos, columns=["I", "J"]))
+
+    return pd.concat(pares, ignore_index=True)
+
+
+def build_pareamento(
+    validas: pd.DataFrame,
+    extr: pd.DataFrame,
+    tolerancia_dias: int = MATCH_TOLERANCIA_DIAS,
+    tolerancia_valor: float = MATCH_TOLERANCIA_VALOR,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Pareia parcelas previstas com lançamentos do extrato.
+
+    Devolve (pareados, previstos sem par, extrato sem par). Cada parcela e
+    cada lançamento aparecem em no máximo um par.
+    """
+    previsto = pd.DataFrame(
+        {
+            "I": np.arange(len(validas), dtype=np.int64),
+            "DIA": _dias_inteiros(validas["DATA_PREVISTA_RECEBIMENTO"]),
+            "CENTAVOS": _centavos(validas["VALOR_LIQUIDO"]),
+        }
+    )
+    extrato = pd.DataFrame(
+        {
+            "J": np.arange(len(extr), dtype=np.int64),
+            "DIA": _dias_inteiros(extr["DATA_EXTRATO"]),
+            "CENTAVOS": _centavos(extr["VALOR_EXTRATO"]),
+        }
+    )
+
+    exatos = _pares_exatos(previsto, extrato)
+
+    restante_prev = previsto[~previsto["I"].isin(exatos["I"])]
+    restante_extr = extrato[~extrato["J"].isin(exatos["J"])]
+
+    tolerancia_centavos = int(round(tolerancia_valor * 100))
+
+    if (tolerancia_dias or tolerancia_centavos) and not restante_prev.empty and not restante_extr.empty:
+        grupos_prev, membros_prev = _agrupar(restante_prev, "I")
+        grupos_extr, membros_extr = _agrupar(restante_extr, "J")
+        candidatos = _candidatos_tolerancia(
+            grupos_prev, grupos_extr, tolerancia_dias, tolerancia_centavos
+        )
+        aproximados = _pares_tolerancia(
+            candidatos, grupos_prev, membros_prev, grupos_extr, membros_extr
+        )
+    else:
+        aproximados = pd.DataFrame({"I": [], "J": []}, dtype=np.int64)
+
+    pares = pd.concat(
+        [exatos.assign(TIPO_PAREAMENTO="EXATO"), aproximados.assign(TIPO_PAREAMENTO="TOLERANCIA")],
+        ignore_index=True,
+    ).sort_values(["I", "J"])
+
+    i = pares["I"].to_numpy(dtype=np.int64)
+    j = pares["J"].to_numpy(dtype=np.int64)
+
+    lado_previsto = validas[
+        ["LINHA_ORIGEM", "DOCUMENTO", "PRODUTO", "PARCELA_ATUAL", "TOTAL_PARCELAS", "DATA_PREVISTA_RECEBIMENTO", "VALOR_LIQUIDO"]
+    ]
+    lado_extrato = extr[["LINHA_ORIGEM", "DATA_EXTRATO", "VALOR_EXTRATO", "DESCRICAO"]]
+
+    pareados = pd.concat(
+        [
+            lado_previsto.iloc[i].reset_index(drop=True),
+            lado_extrato.iloc[j].rename(columns={"LINHA_ORIGEM": "LINHA_EXTRATO"}).reset_index(drop=True),
+        ],
+        axis=1,
+    )
+    pareados["DIAS_DIFERENCA"] = extrato["DIA"].to_numpy()[j] - previsto["DIA"].to_numpy()[i]
+    pareados["VALOR_DIFERENCA"] = (
+        extrato["CENTAVOS"].to_numpy()[j] - previsto["CENTAVOS"].to_numpy()[i]
+    ) / 100
+    pareados["TIPO_PAREAMENTO"] = pares["TIPO_PAREAMENTO"].to_numpy()
+
+    previstos_sem_par = lado_previsto[~previsto["I"].isin(pares["I"]).to_numpy()].reset_index(drop=True)
+    extrato_sem_par = lado_extrato[~extrato["J"].isin(pares["J"]).to_numpy()].reset_index(drop=True)
+
+    return pareados, previstos_sem_par, extrato_sem_par
+
+
 def build_calendar_daily(conciliacao: pd.DataFrame) -> pd.DataFrame:
     min_date = conciliacao["DATA"].min()
     max_date = conciliacao["DATA"].max()
@@ -871,9 +1913,10 @@ def build_calendar_daily(conciliacao: pd.DataFrame) -> pd.DataFrame:
 
     hoje = pd.Timestamp("today").normalize()
 
-    out["STATUS"] = out.apply(
-        lambda row: "A RECEBER" if row["DATA"] > hoje else status_from_diff(row["DIFERENCA"]),
-        axis=1,
+    out["STATUS"] = np.where(
+        (out["DATA"] > hoje).to_numpy(),
+        "A RECEBER",
+        status_from_diff_series(out["DIFERENCA"]),
     )
 
     out["QTD_PREVISTA"] = out["QTD_PREVISTA"].fillna(0).astype(int)
@@ -885,75 +1928,100 @@ def build_calendar_daily(conciliacao: pd.DataFrame) -> pd.DataFrame:
 
 
 def build_monthly(calendar_daily: pd.DataFrame, extr: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    colunas = ["MES_REF", "MES", "PROJETADO", "VLR_EXTRATO", "DIFERENCA", "STATUS"]
+
+    if calendar_daily.empty:
+        return pd.DataFrame(columns=colunas)
+
     max_extrato_date = None
 
     if extr is not None and not extr.empty and "DATA_EXTRATO" in extr.columns:
         max_extrato_date = extr["DATA_EXTRATO"].max()
 
-    rows = []
-
-    for period, block in calendar_daily.groupby(calendar_daily["DATA"].dt.to_period("M")):
-        block_calc = block.copy()
-        status_forcado = None
+    periodo = calendar_daily["DATA"].dt.to_period("M")
+    projetado = calendar_daily["PROJETADO"]
+    vlr_extrato = calendar_daily["VLR_EXTRATO"]
 
-        if max_extrato_date is not None:
-            max_period = max_extrato_date.to_period("M")
+    if max_extrato_date is not None:
+        max_period = max_extrato_date.to_period("M")
 
-            if period == max_period:
-                block_calc = block_calc[block_calc["DATA"] <= max_extrato_date]
-            elif period > max_period:
-                status_forcado = "A RECEBER"
+        # No mês do último extrato só entram os dias até essa data.
+        fora = (periodo == max_period) & (calendar_daily["DATA"] > max_extrato_date)
+        projetado = projetado.mask(fora, 0.0)
+        vlr_extrato = vlr_extrato.mask(fora, 0.0)
 
-        projetado = float(block_calc["PROJETADO"].sum())
-        vlr_extrato = float(block_calc["VLR_EXTRATO"].sum())
-        diferenca = vlr_extrato - projetado
-        status = status_forcado if status_forcado else status_from_diff(diferenca)
+    mensal = (
+        pd.DataFrame({"PROJETADO": projetado, "VLR_EXTRATO": vlr_extrato})
+        .groupby(periodo.rename("MES_REF"), sort=True)
+        .sum()
+        .reset_index()
+    )
 
-        rows.append(
-            {
-                "MES_REF": period,
-                "MES": period.strftime("%m/%Y"),
-                "PROJETADO": projetado,
-                "VLR_EXTRATO": vlr_extrato,
-                "DIFERENCA": diferenca,
-                "STATUS": status,
-            }
+    mensal["PROJETADO"] = mensal["PROJETADO"].astype(float)
+    mensal["VLR_EXTRATO"] = mensal["VLR_EXTRATO"].astype(float)
+    mensal["MES"] = mensal["MES_REF"].dt.strftime("%m/%Y")
+    mensal["DIFERENCA"] = mensal["VLR_EXTRATO"] - mensal["PROJETADO"]
+    mensal["STATUS"] = status_from_diff_series(mensal["DIFERENCA"])
+
+    if max_extrato_date is not None:
+        mensal["STATUS"] = np.where(
+            (mensal["MES_REF"] > max_period).to_numpy(),
+            "A RECEBER",
+            mensal["STATUS"],
         )
 
-    mensal = pd.DataFrame(rows)
+    return mensal[colunas]
+
+
+def iso_date(value: Any) -> Optional[str]:
+    if value is None or pd.isna(value):
+        return None
+
+    try:
+        return pd.Timestamp(value).strftime("%Y-%m-%d")
+    except Exception:
+        return None
 
-    if mensal.empty:
-        return pd.DataFrame(columns=["MES_REF", "MES", "PROJETADO", "VLR_EXTRATO", "DIFERENCA", "STATUS"])
 
-    return mensal[["MES_REF", "MES", "PROJETADO", "VLR_EXTRATO", "DIFERENCA", "STATUS"]]
+# Serialização coluna a coluna: cada coluna vira uma lista Python de uma vez
+# e os registros são montados com zip, sem iterrows.
+def float_values(series: pd.Series) -> List[float]:
+    return series.fillna(0.0).astype(float).tolist()
 
 
-def to_float(value: Any) -> float:
-    if pd.isna(value):
-        return 0.0
+def int_values(series: pd.Series) -> List[int]:
+    return series.fillna(0).astype(int).tolist()
 
-    return float(value)
 
+def text_values(series: pd.Series) -> List[str]:
+    return series.fillna("").astype(str).tolist()
 
-def to_int(value: Any) -> int:
-    if pd.isna(value):
-        return 0
 
-    return int(value)
+def iso_date_values(series: pd.Series) -> List[Optional[str]]:
+    datas = pd.to_datetime(series, errors="coerce")
+    return datas.dt.strftime("%Y-%m-%d").astype(object).where(datas.notna(), None).tolist()
 
 
-def iso_date(value: Any) -> Optional[str]:
-    if value is None or pd.isna(value):
+def json_cell(value: Any) -> Any:
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return iso_date(value)
+    if pd.isna(value):
         return None
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return str(value)
 
-    try:
-        return pd.Timestamp(value).strftime("%Y-%m-%d")
-    except Exception:
-        return None
+
+def columns_to_records(columns: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*columns.values())]
 
 
 def build_json_response(
     input_path: Path,
+    file_digest: str,
     base_sheet_name: str,
     extrato_sheet_name: str,
     validas: pd.DataFrame,
@@ -962,66 +2030,92 @@ def build_json_response(
     conciliacao: pd.DataFrame,
     daily_calendar: pd.DataFrame,
     mensal: pd.DataFrame,
+    pareados: pd.DataFrame,
+    previstos_sem_par: pd.DataFrame,
+    extrato_sem_par: pd.DataFrame,
 ) -> Dict[str, Any]:
     total_projetado = float(daily_calendar["PROJETADO"].sum())
     total_extrato = float(daily_calendar["VLR_EXTRATO"].sum())
     diferenca_total = total_extrato - total_projetado
 
-    diario = []
-
-    for _, row in daily_calendar.iterrows():
-        diario.append(
-            {
-                "data": iso_date(row["DATA"]),
-                "mes": str(row["MES"] or ""),
-                "diaSemana": str(row["DIA_DA_SEMANA"] or ""),
-                "projetado": to_float(row["PROJETADO"]),
-                "vlrExtrato": to_float(row["VLR_EXTRATO"]),
-                "diferenca": to_float(row["DIFERENCA"]),
-                "status": str(row["STATUS"] or ""),
-                "qtdPrevista": to_int(row["QTD_PREVISTA"]),
-                "qtdExtrato": to_int(row["QTD_EXTRATO"]),
-                "detalhesPrevisto": str(row["DETALHES_PREVISTO"] or ""),
-                "detalhesExtrato": str(row["DETALHES_EXTRATO"] or ""),
-            }
-        )
-
-    mensal_json = []
+    diario = columns_to_records(
+        {
+            "data": iso_date_values(daily_calendar["DATA"]),
+            "mes": text_values(daily_calendar["MES"]),
+            "diaSemana": text_values(daily_calendar["DIA_DA_SEMANA"]),
+            "projetado": float_values(daily_calendar["PROJETADO"]),
+            "vlrExtrato": float_values(daily_calendar["VLR_EXTRATO"]),
+            "diferenca": float_values(daily_calendar["DIFERENCA"]),
+            "status": text_values(daily_calendar["STATUS"]),
+            "qtdPrevista": int_values(daily_calendar["QTD_PREVISTA"]),
+            "qtdExtrato": int_values(daily_calendar["QTD_EXTRATO"]),
+            **(
+                {
+                    "detalhesPrevisto": text_values(daily_calendar["DETALHES_PREVISTO"]),
+                    "detalhesExtrato": text_values(daily_calendar["DETALHES_EXTRATO"]),
+                }
+                if DETAILS_INLINE
+                else {}
+            ),
+        }
+    )
 
-    for _, row in mensal.iterrows():
-        mensal_json.append(
-            {
-                "mes": str(row["MES"] or ""),
-                "projetado": to_float(row["PROJETADO"]),
-                "vlrExtrato": to_float(row["VLR_EXTRATO"]),
-                "diferenca": to_float(row["DIFERENCA"]),
-                "status": str(row["STATUS"] or ""),
-            }
-        )
+    mensal_json = columns_to_records(
+        {
+            "mes": text_values(mensal["MES"]),
+            "projetado": float_values(mensal["PROJETADO"]),
+            "vlrExtrato": float_values(mensal["VLR_EXTRATO"]),
+            "diferenca": float_values(mensal["DIFERENCA"]),
+            "status": text_values(mensal["STATUS"]),
+        }
+    )
 
     descartadas_json = []
 
     if not descartadas.empty:
-        descartadas_preview = descartadas.head(MAX_DESCARTADAS_RETORNO).copy()
-
-        for _, row in descartadas_preview.iterrows():
-            item = {}
+        descartadas_preview = descartadas.head(MAX_DESCARTADAS_RETORNO)
+        # .values devolve as células com os mesmos tipos que o iterrows via.
+        valores = descartadas_preview.values
 
-            for col in descartadas_preview.columns:
-                value = row[col]
-
-                if isinstance(value, (pd.Timestamp, datetime, date)):
-                    item[str(col)] = iso_date(value)
-                elif pd.isna(value):
-                    item[str(col)] = None
-                elif isinstance(value, (np.integer,)):
-                    item[str(col)] = int(value)
-                elif isinstance(value, (np.floating,)):
-                    item[str(col)] = float(value)
-                else:
-                    item[str(col)] = str(value)
+        descartadas_json = columns_to_records(
+            {
+                str(col): [json_cell(value) for value in valores[:, j]]
+                for j, col in enumerate(descartadas_preview.columns)
+            }
+        )
 
-            descartadas_json.append(item)
+    previstos_pendentes = previstos_sem_par.head(MAX_PENDENCIAS_RETORNO)
+    extrato_pendente = extrato_sem_par.head(MAX_PENDENCIAS_RETORNO)
+
+    pareamento_json = {
+        "toleranciaDias": MATCH_TOLERANCIA_DIAS,
+        "toleranciaValor": MATCH_TOLERANCIA_VALOR,
+        "qtdPareados": int(len(pareados)),
+        "qtdPareadosExatos": int((pareados["TIPO_PAREAMENTO"] == "EXATO").sum()),
+        "qtdPrevistosSemPar": int(len(previstos_sem_par)),
+        "qtdExtratoSemPar": int(len(extrato_sem_par)),
+        "valorPrevistoSemPar": float(previstos_sem_par["VALOR_LIQUIDO"].sum()),
+        "valorExtratoSemPar": float(extrato_sem_par["VALOR_EXTRATO"].sum()),
+        "previstosSemPar": columns_to_records(
+            {
+                "linhaOrigem": int_values(previstos_pendentes["LINHA_ORIGEM"]),
+                "documento": text_values(previstos_pendentes["DOCUMENTO"]),
+                "produto": text_values(previstos_pendentes["PRODUTO"]),
+                "parcela": int_values(previstos_pendentes["PARCELA_ATUAL"]),
+                "totalParcelas": int_values(previstos_pendentes["TOTAL_PARCELAS"]),
+                "dataPrevista": iso_date_values(previstos_pendentes["DATA_PREVISTA_RECEBIMENTO"]),
+                "valor": float_values(previstos_pendentes["VALOR_LIQUIDO"]),
+            }
+        ),
+        "extratoSemPar": columns_to_records(
+            {
+                "linhaOrigem": int_values(extrato_pendente["LINHA_ORIGEM"]),
+                "data": iso_date_values(extrato_pendente["DATA_EXTRATO"]),
+                "valor": float_values(extrato_pendente["VALOR_EXTRATO"]),
+                "descricao": text_values(extrato_pendente["DESCRICAO"]),
+            }
+        ),
+    }
 
     periodo_inicio = iso_date(daily_calendar["DATA"].min())
     periodo_fim = iso_date(daily_calendar["DATA"].max())
@@ -1031,6 +2125,7 @@ def build_json_response(
         "generatedAt": datetime.utcnow().isoformat() + "Z",
         "processedBy": "python-stone",
         "fileName": input_path.name,
+        "arquivoId": file_digest,
         "resumo": {
             "totalProjetado": total_projetado,
             "totalExtrato": total_extrato,
@@ -1046,6 +2141,7 @@ def build_json_response(
         "mensal": mensal_json,
         "diario": diario,
         "descartadas": descartadas_json,
+        "pareamento": pareamento_json,
         "meta": {
             "baseSheetName": base_sheet_name,
             "extratoSheetName": extrato_sheet_name,
@@ -1058,12 +2154,253 @@ def build_json_response(
             "regraPix": "D+1 corrido, próximo dia útil",
             "regraCredito1x": "D+30 + 30 corridos, próximo dia útil",
             "regraCreditoParcelado": "cada parcela usa VLR PARCELA; parcela N recebe em D+(N x 30)+30, próximo dia útil",
+            "regrasRecebimento": [
+                {"id": regra["id"], "descricao": regra["descricao"]}
+                for regra in get_receivable_rules()["regras"]
+            ],
         },
     }
 
     return response
 
 
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def calendar_digest(calendar: np.busdaycalendar) -> str:
+    joined = ",".join(str(day) for day in calendar.holidays)
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+
+
+def matching_settings() -> Dict[str, Any]:
+    return {
+        "toleranciaDias": MATCH_TOLERANCIA_DIAS,
+        "toleranciaValor": MATCH_TOLERANCIA_VALOR,
+        "bucketOtimo": MATCH_BUCKET_OTIMO,
+        "maxCandidatos": MATCH_MAX_CANDIDATOS,
+    }
+
+
+def result_settings(calendar: np.busdaycalendar) -> Dict[str, Any]:
+    """
+    Tudo além do conteúdo do arquivo que muda o resultado. Um resultado em
+    cache só é reaproveitado com as mesmas configurações.
+    """
+    return {
+        "calendarDigest": calendar_digest(calendar),
+        "rulesDigest": rules_digest(get_receivable_rules()),
+        "matchSettings": matching_settings(),
+        "detalhesInline": DETAILS_INLINE,
+        "maxPendencias": MAX_PENDENCIAS_RETORNO,
+    }
+
+
+def get_result_cache_dir() -> Path:
+    cache_dir = get_cache_dir() / RESULT_CACHE_DIRNAME
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def frames_cache_path(file_digest: str) -> Path:
+    return get_result_cache_dir() / f"{file_digest}.p{STONE_PARSER_VERSION}.frames.pkl.gz"
+
+
+def result_cache_path(file_digest: str) -> Path:
+    return get_result_cache_dir() / (
+        f"{file_digest}.p{STONE_PARSER_VERSION}.r{STONE_RULES_VERSION}.result.json.gz"
+    )
+
+
+def cache_unit_paths(file_digest: str) -> List[Path]:
+    """
+    Resultado, detalhes e abas lidas de um arquivo formam uma unidade: são
+    tocados e podados juntos, para o resultado nunca sobreviver sem os
+    detalhes que o server.ts pede depois.
+    """
+    return [
+        path
+        for path in get_result_cache_dir().glob(f"{file_digest}.*")
+        if not path.name.endswith(".tmp")
+    ]
+
+
+def touch_cache_unit(file_digest: str) -> None:
+    for path in cache_unit_paths(file_digest):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+def prune_result_cache(max_bytes: int = RESULT_CACHE_MAX_BYTES) -> None:
+    """
+    Remove as unidades (todas as entradas de um arquivo) usadas há mais
+    tempo até o cache caber em max_bytes. Leituras tocam a unidade inteira,
+    então a ordem é LRU por arquivo.
+    """
+    units: Dict[str, List[Any]] = {}
+
+    for path in get_result_cache_dir().iterdir():
+        if path.name.endswith(".tmp"):
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        unit = units.setdefault(path.name.split(".", 1)[0], [0.0, 0, []])
+        unit[0] = max(unit[0], stat.st_mtime)
+        unit[1] += stat.st_size
+        unit[2].append(path)
+
+    total = sum(size for _, size, _ in units.values())
+
+    for _, size, paths in sorted(units.values(), key=lambda unit: unit[0]):
+        if total <= max_bytes:
+            break
+        for path in paths:
+            path.unlink(missing_ok=True)
+        total -= size
+
+
+def read_cache_entry(path: Path, loader) -> Any:
+    if not RESULT_CACHE_ENABLED or not path.exists():
+        return None
+
+    try:
+        value = loader(path)
+    except Exception as exc:
+        log(f"AVISO: cache ilegível ignorado ({path.name}): {exc}")
+        path.unlink(missing_ok=True)
+        return None
+
+    touch_cache_unit(path.name.split(".", 1)[0])
+    return value
+
+
+def write_cache_entry(path: Path, writer) -> None:
+    if not RESULT_CACHE_ENABLED:
+        return
+
+    # Escrita atômica: CLI e worker podem gravar a mesma entrada ao mesmo tempo.
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+
+    try:
+        writer(tmp_path)
+        os.replace(tmp_path, path)
+        prune_result_cache()
+    except Exception as exc:
+        log(f"AVISO: não foi possível salvar cache ({path.name}): {exc}")
+        tmp_path.unlink(missing_ok=True)
+
+
+def load_frames_cache(path: Path) -> Dict[str, Any]:
+    return pd.read_pickle(path, compression="gzip")
+
+
+def save_frames_cache(path: Path, frames: Dict[str, Any]) -> None:
+    write_cache_entry(
+        path,
+        lambda tmp: pd.to_pickle(frames, tmp, compression={"method": "gzip", "compresslevel": 1}),
+    )
+
+
+def details_cache_path(file_digest: str) -> Path:
+    return get_result_cache_dir() / (
+        f"{file_digest}.p{STONE_PARSER_VERSION}.r{STONE_RULES_VERSION}.details.pkl.gz"
+    )
+
+
+def load_result_cache(path: Path) -> Dict[str, Any]:
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def save_result_cache(path: Path, entry: Dict[str, Any]) -> None:
+    def writer(tmp: Path) -> None:
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=1) as handle:
+            json.dump(entry, handle, ensure_ascii=False, allow_nan=False)
+
+    write_cache_entry(path, writer)
+
+
+def read_workbook(input_path: Path) -> Dict[str, Any]:
+    engine = get_engine(input_path)
+
+    with pd.ExcelFile(input_path, engine=engine) as xls:
+        sheet_base = resolve_sheet_name(xls, SHEET_BASE_CANDIDATES)
+        sheet_extrato = resolve_sheet_name(xls, SHEET_EXTRATO_CANDIDATES)
+
+        log(f"Aba base localizada: {sheet_base}")
+        log(f"Aba extrato localizada: {sheet_extrato}")
+
+        return {
+            "sheet_base": sheet_base,
+            "sheet_extrato": sheet_extrato,
+            "df_base": read_alias_columns(xls, sheet_base, BASE_COL_ALIASES, BASE_REQUIRED_FIELDS),
+            "df_extrato": read_alias_columns(
+                xls, sheet_extrato, EXTRATO_COL_ALIASES, EXTRATO_REQUIRED_FIELDS
+            ),
+        }
+
+
+def holiday_years(df_base: pd.DataFrame) -> List[int]:
+    col_data_venda = find_column(df_base, BASE_COL_ALIASES["data_venda"])
+    anos_base = parse_date_series(get_series(df_base, col_data_venda)).dropna().dt.year.unique().tolist()
+
+    if not anos_base:
+        raise ValueError("Não foi possível identificar anos válidos na coluna de DATA DA VENDA.")
+
+    anos_feriados = set(int(y) for y in anos_base)
+    anos_feriados.update(int(y) + 1 for y in anos_base)
+    anos_feriados.update(int(y) + 2 for y in anos_base)
+
+    return sorted(anos_feriados)
+
+
+def refresh_cached_response(response: Dict[str, Any], input_path: Path) -> Dict[str, Any]:
+    response["generatedAt"] = datetime.utcnow().isoformat() + "Z"
+    response["fileName"] = input_path.name
+    response.setdefault("meta", {})["arquivoEntrada"] = input_path.name
+    return response
+
+
+def build_details_frames(validas: pd.DataFrame, extr: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Lançamentos completos (sem o corte de MAX_DETALHES_POR_DIA) ordenados
+    por data, para lookup_day_details fatiar um dia por busca binária.
+    """
+    previsto = pd.DataFrame(
+        {
+            "DATA": pd.to_datetime(validas["DATA_PREVISTA_RECEBIMENTO"], errors="coerce"),
+            "DETALHE": validas["DETALHE_CONCAT"].astype(str),
+            "VALOR": validas["VALOR_LIQUIDO"].astype(float),
+        }
+    )
+    extrato = pd.DataFrame(
+        {
+            "DATA": pd.to_datetime(extr["DATA_EXTRATO"], errors="coerce").dt.normalize(),
+            "DETALHE": extr["DESCRICAO"].astype(str),
+            "VALOR": extr["VALOR_EXTRATO"].astype(float),
+        }
+    )
+
+    return {
+        "previsto": previsto.sort_values("DATA", kind="stable").reset_index(drop=True),
+        "extrato": extrato.sort_values("DATA", kind="stable").reset_index(drop=True),
+    }
+
+
+def save_details_cache(path: Path, details: Dict[str, pd.DataFrame]) -> None:
+    save_frames_cache(path, details)
+
+
 def process_file(input_path: Path) -> Dict[str, Any]:
     if not input_path.exists():
         raise FileNotFoundError(f"Arquivo recebido do backend não encontrado: {input_path}")
@@ -1076,32 +2413,44 @@ def process_file(input_path: Path) -> Dict[str, Any]:
     log(f"Arquivo recebido: {input_path}")
     log(f"Tamanho: {input_path.stat().st_size} bytes")
 
-    engine = get_engine(input_path)
-    xls = pd.ExcelFile(input_path, engine=engine)
+    file_digest = file_sha256(input_path)
+    result_path = result_cache_path(file_digest)
+    cached = read_cache_entry(result_path, load_result_cache)
 
-    sheet_base = resolve_sheet_name(xls, SHEET_BASE_CANDIDATES)
-    sheet_extrato = resolve_sheet_name(xls, SHEET_EXTRATO_CANDIDATES)
+    calendar = get_business_calendar()
 
-    log(f"Aba base localizada: {sheet_base}")
-    log(f"Aba extrato localizada: {sheet_extrato}")
+    # Um resultado calculado com outro calendário (UF ou feriado manual
+    # novo), outra tabela de regras ou outras tolerâncias de pareamento
+    # não é reaproveitado.
+    if cached is not None and result_settings(calendar) == cached.get("settings"):
+        if DETAILS_INLINE or has_details(file_digest):
+            log(f"Resultado reaproveitado do cache ({file_digest[:12]}).")
+            log("=" * 80)
+            return refresh_cached_response(cached["response"], input_path)
 
-    df_base = pd.read_excel(input_path, sheet_name=sheet_base, engine=engine, dtype=object)
-    df_extrato = pd.read_excel(input_path, sheet_name=sheet_extrato, engine=engine, dtype=object)
+        # Sem os detalhes por dia o resultado não serve: a rota de detalhes
+        # falharia até o cache expirar. Recalcula tudo.
+        log(f"Detalhes ausentes no cache ({file_digest[:12]}); recalculando.")
 
-    col_data_venda = find_column(df_base, BASE_COL_ALIASES["data_venda"])
-    anos_base = parse_date_series(get_series(df_base, col_data_venda)).dropna().dt.year.unique().tolist()
+    frames_path = frames_cache_path(file_digest)
+    frames = read_cache_entry(frames_path, load_frames_cache)
 
-    if not anos_base:
-        raise ValueError("Não foi possível identificar anos válidos na coluna de DATA DA VENDA.")
+    if frames is None:
+        frames = read_workbook(input_path)
+        save_frames_cache(frames_path, frames)
+    else:
+        log(f"Abas reaproveitadas do cache ({file_digest[:12]}); planilha não relida.")
 
-    anos_feriados = set(int(y) for y in anos_base)
-    anos_feriados.update(int(y) + 1 for y in anos_base)
-    anos_feriados.update(int(y) + 2 for y in anos_base)
+    sheet_base = frames["sheet_base"]
+    sheet_extrato = frames["sheet_extrato"]
+    df_base = frames["df_base"]
+    df_extrato = frames["df_extrato"]
 
-    holidays = load_holidays(list(anos_feriados))
+    anos_feriados = holiday_years(df_base)
+    holidays = load_holidays(anos_feriados)
     log(f"Total de feriados carregados: {len(holidays)}")
 
-    validas, descartadas = prepare_base(df_base, holidays)
+    validas, descartadas = prepare_base(df_base, calendar)
 
     log(f"Linhas previstas válidas geradas: {len(validas)}")
     log(f"Linhas descartadas na base: {len(descartadas)}")
@@ -1117,6 +2466,12 @@ def process_file(input_path: Path) -> Dict[str, Any]:
     conciliacao = build_conciliacao(previsto_conc, extrato_conc)
     daily_calendar = build_calendar_daily(conciliacao)
     mensal = build_monthly(daily_calendar, extr)
+    pareados, previstos_sem_par, extrato_sem_par = build_pareamento(validas, extr)
+
+    log(
+        f"Pareamento: {len(pareados)} pares, {len(previstos_sem_par)} parcelas e "
+        f"{len(extrato_sem_par)} lançamentos do extrato sem par."
+    )
 
     log(
         f"Período consolidado: {daily_calendar['DATA'].min().date()} até {daily_calendar['DATA'].max().date()}"
@@ -1124,6 +2479,7 @@ def process_file(input_path: Path) -> Dict[str, Any]:
 
     response = build_json_response(
         input_path=input_path,
+        file_digest=file_digest,
         base_sheet_name=sheet_base,
         extrato_sheet_name=sheet_extrato,
         validas=validas,
@@ -1132,6 +2488,21 @@ def process_file(input_path: Path) -> Dict[str, Any]:
         conciliacao=conciliacao,
         daily_calendar=daily_calendar,
         mensal=mensal,
+        pareados=pareados,
+        previstos_sem_par=previstos_sem_par,
+        extrato_sem_par=extrato_sem_par,
+    )
+
+    details = build_details_frames(validas, extr)
+    remember_details(file_digest, details)
+    save_details_cache(details_cache_path(file_digest), details)
+
+    save_result_cache(
+        result_path,
+        {
+            "settings": result_settings(calendar),
+            "response": response,
+        },
     )
 
     log("Motor finalizado com sucesso.")
@@ -1140,28 +2511,385 @@ def process_file(input_path: Path) -> Dict[str, Any]:
     return response
 
 
+_DETAILS_BY_DIGEST: Dict[str, Dict[str, pd.DataFrame]] = {}
+
+
+def remember_details(file_digest: str, details: Dict[str, pd.DataFrame]) -> None:
+    # Poucos arquivos recentes ficam em memória no worker; o resto volta do disco.
+    _DETAILS_BY_DIGEST.pop(file_digest, None)
+    _DETAILS_BY_DIGEST[file_digest] = details
+
+    while len(_DETAILS_BY_DIGEST) > DETAILS_MEMORY_ENTRIES:
+        _DETAILS_BY_DIGEST.pop(next(iter(_DETAILS_BY_DIGEST)))
+
+
+def has_details(file_digest: str) -> bool:
+    return file_digest in _DETAILS_BY_DIGEST or details_cache_path(file_digest).exists()
+
+
+def load_details(file_digest: str) -> Dict[str, pd.DataFrame]:
+    if not re.fullmatch(r"[0-9a-f]{64}", str(file_digest)):
+        raise ValueError("arquivoId inválido.")
+
+    details = _DETAILS_BY_DIGEST.get(file_digest)
+
+    if details is None:
+        details_path = details_cache_path(file_digest)
+        details = read_cache_entry(details_path, load_frames_cache)
+
+        if details is None:
+            # Detalhes podados do cache: refaz a partir das abas já lidas.
+            frames = read_cache_entry(frames_cache_path(file_digest), load_frames_cache)
+
+            if frames is None:
+                raise ValueError(
+                    "Detalhes indisponíveis para este processamento. Processe a planilha novamente."
+                )
+
+            validas, _ = prepare_base(frames["df_base"], get_business_calendar())
+            extr = prepare_extrato(frames["df_extrato"])
+            details = build_details_frames(validas, extr)
+            save_details_cache(details_path, details)
+
+    remember_details(file_digest, details)
+    return details
+
+
+def lookup_day_details(file_digest: str, day: str) -> Dict[str, Any]:
+    """
+    Lançamentos previstos e do extrato de um dia do resultado `file_digest`.
+    """
+    data = pd.to_datetime(day, errors="coerce")
+
+    if pd.isna(data):
+        raise ValueError(f"Data inválida: {day}")
+
+    details = load_details(file_digest)
+    data = data.normalize()
+
+    def fatia(df: pd.DataFrame) -> List[Dict[str, Any]]:
+        inicio = int(df["DATA"].searchsorted(data, side="left"))
+        fim = int(df["DATA"].searchsorted(data, side="right"))
+        dia = df.iloc[inicio:fim]
+
+        return columns_to_records(
+            {
+                "detalhe": text_values(dia["DETALHE"]),
+                "valor": float_values(dia["VALOR"]),
+            }
+        )
+
+    return {
+        "ok": True,
+        "arquivoId": file_digest,
+        "data": data.strftime("%Y-%m-%d"),
+        "previsto": fatia(details["previsto"]),
+        "extrato": fatia(details["extrato"]),
+    }
+
+
+def write_json(value: Any, out: Any, chunk_rows: int = JSON_CHUNK_ROWS) -> None:
+    """
+    Serializa `value` como JSON em `out` sem montar a string inteira.
+
+    Dicionários saem chave a chave e listas longas em blocos de chunk_rows
+    itens; a maior string intermediária é a de um bloco, não a do payload.
+    """
+    def dumps(item: Any) -> str:
+        return json.dumps(item, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
+    if isinstance(value, dict):
+        out.write("{")
+        for n, (key, item) in enumerate(value.items()):
+            out.write(("," if n else "") + dumps(str(key)) + ":")
+            write_json(item, out, chunk_rows)
+        out.write("}")
+    elif isinstance(value, list) and len(value) > chunk_rows:
+        out.write("[")
+        for inicio in range(0, len(value), chunk_rows):
+            bloco = ",".join(dumps(item) for item in value[inicio:inicio + chunk_rows])
+            out.write(("," if inicio else "") + bloco)
+        out.write("]")
+    else:
+        out.write(dumps(value))
+
+
+# ===========================================
+# LOTE MULTILOJA
+# ===========================================
+def list_batch_inputs(inputs: List[str]) -> List[Path]:
+    """
+    Planilhas do lote: cada entrada é um arquivo ou um diretório (as
+    planilhas de primeiro nível, em ordem de nome).
+    """
+    paths: List[Path] = []
+
+    for item in inputs:
+        path = Path(item).resolve()
+
+        if path.is_dir():
+            paths.extend(
+                sorted(
+                    p for p in path.iterdir()
+                    if p.is_file() and p.suffix.lower() in WORKBOOK_SUFFIXES and not p.name.startswith("~$")
+                )
+            )
+        else:
+            paths.append(path)
+
+    if not paths:
+        raise ValueError("Nenhuma planilha .xlsb, .xlsx ou .xlsm encontrada para o lote.")
+
+    return list(dict.fromkeys(paths))
+
+
+def _init_batch_worker(holidays: np.ndarray) -> None:
+    # Todos os processos do pool usam o calendário montado no processo pai.
+    global _BUSINESS_CALENDAR
+    _BUSINESS_CALENDAR = np.busdaycalendar(weekmask="1111100", holidays=holidays)
+
+
+def _process_batch_item(path: str) -> Dict[str, Any]:
+    try:
+        return {"arquivo": Path(path).name, "ok": True, "result": process_file(Path(path))}
+    except Exception as exc:
+        return {"arquivo": Path(path).name, **error_payload(exc)}
+
+
+def build_batch_consolidado(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Diário e mensal da rede somando os resultados de cada loja.
+
+    O mensal soma os mensais das lojas (cada um já corta o mês do último
+    extrato da própria loja); um mês só fica "A RECEBER" quando está assim
+    em todas as lojas que o têm.
+    """
+    diarios = [pd.DataFrame(r["diario"]) for r in results if r.get("diario")]
+    mensais = [pd.DataFrame(r["mensal"]) for r in results if r.get("mensal")]
+
+    if not diarios:
+        return {"resumo": {}, "mensal": [], "diario": []}
+
+    diario = (
+        pd.concat(diarios, ignore_index=True)
+        .groupby("data", sort=True)
+        .agg(
+            mes=("mes", "first"),
+            diaSemana=("diaSemana", "first"),
+            projetado=("projetado", "sum"),
+            vlrExtrato=("vlrExtrato", "sum"),
+            qtdPrevista=("qtdPrevista", "sum"),
+            qtdExtrato=("qtdExtrato", "sum"),
+        )
+        .reset_index()
+    )
+    diario["diferenca"] = diario["vlrExtrato"] - diario["projetado"]
+
+    hoje = pd.Timestamp("today").normalize()
+    diario["status"] = np.where(
+        (pd.to_datetime(diario["data"]) > hoje).to_numpy(),
+        "A RECEBER",
+        status_from_diff_series(diario["diferenca"]),
+    )
+
+    mensal = pd.concat(mensais, ignore_index=True)
+    mensal["A_RECEBER"] = mensal["status"] == "A RECEBER"
+    mensal = (
+        mensal.groupby("mes", sort=False)
+        .agg(
+            projetado=("projetado", "sum"),
+            vlrExtrato=("vlrExtrato", "sum"),
+            aReceber=("A_RECEBER", "all"),
+        )
+        .reset_index()
+    )
+    mensal["diferenca"] = mensal["vlrExtrato"] - mensal["projetado"]
+    mensal["status"] = np.where(
+        mensal["aReceber"].to_numpy(),
+        "A RECEBER",
+        status_from_diff_series(mensal["diferenca"]),
+    )
+    mensal = mensal.iloc[
+        pd.to_datetime(mensal["mes"], format="%m/%Y").argsort(kind="stable")
+    ].reset_index(drop=True)
+
+    total_projetado = float(diario["projetado"].sum())
+    total_extrato = float(diario["vlrExtrato"].sum())
+
+    return {
+        "resumo": {
+            "lojas": len(diarios),
+            "totalProjetado": total_projetado,
+            "totalExtrato": total_extrato,
+            "diferencaTotal": total_extrato - total_projetado,
+            "diasOk": int((diario["status"] == "OK").sum()),
+            "diasPgtMaior": int((diario["status"] == "PGT MAIOR").sum()),
+            "diasPgtMenor": int((diario["status"] == "PGT MENOR").sum()),
+            "periodoInicio": str(diario["data"].iloc[0]),
+            "periodoFim": str(diario["data"].iloc[-1]),
+        },
+        "mensal": columns_to_records(
+            {
+                "mes": text_values(mensal["mes"]),
+                "projetado": float_values(mensal["projetado"]),
+                "vlrExtrato": float_values(mensal["vlrExtrato"]),
+                "diferenca": float_values(mensal["diferenca"]),
+                "status": text_values(mensal["status"]),
+            }
+        ),
+        "diario": columns_to_records(
+            {
+                "data": text_values(diario["data"]),
+                "mes": text_values(diario["mes"]),
+                "diaSemana": text_values(diario["diaSemana"]),
+                "projetado": float_values(diario["projetado"]),
+                "vlrExtrato": float_values(diario["vlrExtrato"]),
+                "diferenca": float_values(diario["diferenca"]),
+                "status": text_values(diario["status"]),
+                "qtdPrevista": int_values(diario["qtdPrevista"]),
+                "qtdExtrato": int_values(diario["qtdExtrato"]),
+            }
+        ),
+    }
+
+
+def process_batch(inputs: List[str], max_workers: int = BATCH_WORKERS) -> Dict[str, Any]:
+    """
+    Processa as planilhas de várias lojas em um ProcessPoolExecutor e
+    devolve o resultado de cada arquivo mais o consolidado da rede.
+
+    O calendário de dias úteis é montado uma vez aqui e enviado aos
+    processos do pool. Um arquivo com erro não derruba o lote: ele sai com
+    ok=false e fica fora do consolidado.
+    """
+    paths = list_batch_inputs(inputs)
+    calendar = get_business_calendar()
+    workers = max(1, min(max_workers, len(paths)))
+
+    log(f"Lote Stone: {len(paths)} planilhas em {workers} processos.")
+
+    if workers == 1:
+        arquivos = [_process_batch_item(str(path)) for path in paths]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_batch_worker,
+            initargs=(calendar.holidays,),
+        ) as executor:
+            arquivos = list(executor.map(_process_batch_item, [str(path) for path in paths]))
+
+    ok = [item["result"] for item in arquivos if item.get("ok")]
+    log(f"Lote Stone finalizado: {len(ok)} de {len(arquivos)} planilhas processadas.")
+
+    return {
+        "ok": bool(ok),
+        "generatedAt": datetime.utcnow().isoformat() + "Z",
+        "processedBy": "python-stone-lote",
+        "consolidado": build_batch_consolidado(ok),
+        "arquivos": arquivos,
+    }
+
+
+def error_payload(exc: Exception) -> Dict[str, Any]:
+    return {
+        "ok": False,
+        "error": str(exc),
+        "traceback": traceback.format_exc(),
+    }
+
+
+def run_worker() -> None:
+    """
+    Modo worker: processo de vida longa usado pelo server.ts.
+
+    Protocolo (JSON por linha):
+      stdin:  {"id": "...", "path": "/tmp/base.xlsb"}
+              {"id": "...", "cmd": "detalhes", "arquivoId": "...", "data": "2025-01-31"}
+      stdout: {"id": "...", "ok": true, "result": {...}}
+              {"id": "...", "ok": false, "error": "...", "traceback": "..."}
+
+    Os jobs são atendidos um de cada vez. Imports, feriados e calendário de
+    dias úteis ficam carregados entre os jobs. O processo termina quando o
+    stdin é fechado.
+    """
+    protocol_out = sys.stdout
+    # Qualquer print perdido durante um job vai para o stderr, sem
+    # corromper o protocolo.
+    sys.stdout = sys.stderr
+
+    log("Motor Stone em modo worker aguardando jobs.")
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        job_id = None
+        started = False
+
+        try:
+            job = json.loads(line)
+            job_id = job.get("id")
+
+            if job.get("cmd") == "ping":
+                response = {"id": job_id, "ok": True, "pong": True}
+            elif job.get("cmd") == "detalhes":
+                response = {
+                    "id": job_id,
+                    "ok": True,
+                    "result": lookup_day_details(str(job.get("arquivoId", "")), str(job.get("data", ""))),
+                }
+            else:
+                input_path = Path(job["path"]).resolve()
+                response = {"id": job_id, "ok": True, "result": process_file(input_path)}
+
+            started = True
+            write_json(response, protocol_out)
+            protocol_out.write("\n")
+        except Exception as exc:
+            if started:
+                # Linha parcial: o server.ts descarta e recebe o erro abaixo.
+                protocol_out.write("\n")
+            protocol_out.write(json.dumps({"id": job_id, **error_payload(exc)}, ensure_ascii=False) + "\n")
+
+        protocol_out.flush()
+
+
 def main() -> None:
+    if "--worker" in sys.argv[1:]:
+        run_worker()
+        return
+
     try:
         if len(sys.argv) < 2:
             raise ValueError(
                 "Caminho da planilha não informado. Uso correto: python stone_recebimentos_engine.py arquivo.xlsb"
             )
 
-        input_path = Path(sys.argv[1]).resolve()
-        result = process_file(input_path)
+        if sys.argv[1] == "--lote":
+            if len(sys.argv) < 3:
+                raise ValueError(
+                    "Uso correto: python stone_recebimentos_engine.py --lote <pasta|arquivo> [arquivo ...]"
+                )
+            result = process_batch(sys.argv[2:])
+        elif sys.argv[1] == "--detalhes":
+            if len(sys.argv) < 4:
+                raise ValueError(
+                    "Uso correto: python stone_recebimentos_engine.py --detalhes <arquivoId> <AAAA-MM-DD>"
+                )
+            result = lookup_day_details(sys.argv[2], sys.argv[3])
+        else:
+            input_path = Path(sys.argv[1]).resolve()
+            result = process_file(input_path)
 
-        print(json.dumps(result, ensure_ascii=False, allow_nan=False), flush=True)
+        write_json(result, sys.stdout)
+        sys.stdout.write("\n")
+        sys.stdout.flush()
 
     except Exception as exc:
-        error_payload = {
-            "ok": False,
-            "error": str(exc),
-            "traceback": traceback.format_exc(),
-        }
-
-        print(json.dumps(error_payload, ensure_ascii=False, allow_nan=False), flush=True)
+        print(json.dumps(error_payload(exc), ensure_ascii=False, allow_nan=False), flush=True)
         sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -521,16 +521,39 @@ function getPythonCommand(): string {
   return process.env.PYTHON_BIN || process.env.PYTHON || (process.platform === 'win32' ? 'python' : 'python3');
 }
 
-function runStoneRecebimentoEngine(filePath: string): Promise<any> {
+function getStoneRecebimentoEnginePath(): string {
+  return path.join(ROOT_DIR, 'src', 'modules', 'finance', 'stone_recebimentos_engine.py');
+}
+
+/*
+ * Tempo máximo de um job do motor Stone (planilha ou detalhes). Passado
+ * esse tempo o processo Python é morto, para que uma planilha travada ou
+ * patológica não segure os uploads seguintes.
+ */
+const STONE_ENGINE_TIMEOUT_MS =
+  Number(process.env.STONE_ENGINE_TIMEOUT_MS) > 0
+    ? Number(process.env.STONE_ENGINE_TIMEOUT_MS)
+    : 5 * 60 * 1000;
+
+function stoneEngineTimeoutMessage(): string {
+  return `O motor Stone passou de ${Math.round(STONE_ENGINE_TIMEOUT_MS / 1000)}s neste arquivo e foi interrompido.`;
+}
+
+/*
+ * Execução avulsa: um processo Python por chamada.
+ * Usada quando o worker está desligado (STONE_ENGINE_WORKER=false).
+ * args é [planilha] ou ['--detalhes', arquivoId, data].
+ */
+function runStoneRecebimentoEngineOnce(args: string[]): Promise<any> {
   return new Promise((resolve, reject) => {
-    const scriptPath = path.join(ROOT_DIR, 'src', 'modules', 'finance', 'stone_recebimentos_engine.py');
+    const scriptPath = getStoneRecebimentoEnginePath();
 
     if (!fs.existsSync(scriptPath)) {
       reject(new Error(`Motor Python não encontrado em: ${scriptPath}`));
       return;
     }
 
-    const child = spawn(getPythonCommand(), [scriptPath, filePath], {
+    const child = spawn(getPythonCommand(), [scriptPath, ...args], {
       cwd: ROOT_DIR,
       windowsHide: true,
       env: {
@@ -539,22 +562,44 @@ function runStoneRecebimentoEngine(filePath: string): Promise<any> {
       },
     });
 
-    let stdout = '';
+    // O motor escreve o JSON em blocos; os pedaços são juntados uma vez só
+    // no fim, sem concatenar string a cada chunk.
+    const stdoutChunks: Buffer[] = [];
     let stderr = '';
+    let timedOut = false;
 
-    child.stdout.on('data', (chunk) => {
-      stdout += chunk.toString('utf8');
+    const timer = setTimeout(() => {
+      timedOut = true;
+      child.kill('SIGKILL');
+    }, STONE_ENGINE_TIMEOUT_MS);
+
+    child.stdout.on('data', (chunk: Buffer) => {
+      stdoutChunks.push(chunk);
     });
 
-    child.stderr.on('data', (chunk) => {
-      stderr += chunk.toString('utf8');
+    // Com setEncoding o stream decodifica o UTF-8 por conta própria e não
+    // parte caracteres acentuados que caem na divisa entre dois blocos.
+    child.stderr.setEncoding('utf8');
+
+    child.stderr.on('data', (text: string) => {
+      stderr += text;
     });
 
     child.on('error', (error) => {
+      clearTimeout(timer);
       reject(error);
     });
 
     child.on('close', (code) => {
+      clearTimeout(timer);
+
+      if (timedOut) {
+        reject(new Error(stoneEngineTimeoutMessage()));
+        return;
+      }
+
+      const stdout = Buffer.concat(stdoutChunks).toString('utf8');
+
       if (code !== 0) {
         reject(new Error(stderr || stdout || `Motor Python finalizou com código ${code}.`));
         return;
@@ -574,6 +619,252 @@ function runStoneRecebimentoEngine(filePath: string): Promise<any> {
   });
 }
 
+/*
+ * Worker Python de vida longa para o motor Stone.
+ *
+ * O processo é iniciado com --worker e mantém pandas/numpy, feriados e o
+ * calendário de dias úteis carregados entre uploads. Cada job é uma linha
+ * JSON no stdin ({ id, path } ou { id, cmd: 'detalhes', arquivoId, data })
+ * e cada resposta uma linha JSON no stdout ({ id, ok, result } ou
+ * { id, ok: false, error }). Os jobs são atendidos em ordem, um de cada
+ * vez. Se o processo cair, os jobs pendentes são rejeitados e o próximo
+ * upload sobe um worker novo.
+ *
+ * O job em atendimento (o primeiro pendente) tem STONE_ENGINE_TIMEOUT_MS
+ * para responder. Se passar disso, o worker é morto e reiniciado: o job
+ * recebe o erro de tempo esgotado e os que esperavam na fila do processo
+ * morto são rejeitados pedindo novo envio.
+ */
+type StoneEngineJob = {
+  resolve: (value: any) => void;
+  reject: (error: Error) => void;
+  timer?: ReturnType<typeof setTimeout>;
+};
+
+class StoneEngineWorker {
+  private child: ReturnType<typeof spawn> | null = null;
+  private stderrTail = '';
+  private pending = new Map<string, StoneEngineJob>();
+
+  run(filePath: string): Promise<any> {
+    return this.send({ path: filePath });
+  }
+
+  detalhes(arquivoId: string, data: string): Promise<any> {
+    return this.send({ cmd: 'detalhes', arquivoId, data });
+  }
+
+  private send(job: Record<string, unknown>): Promise<any> {
+    return new Promise((resolve, reject) => {
+      let child: ReturnType<typeof spawn>;
+
+      try {
+        child = this.ensureStarted();
+      } catch (error: any) {
+        reject(error);
+        return;
+      }
+
+      const id = crypto.randomUUID();
+      this.pending.set(id, { resolve, reject });
+
+      try {
+        child.stdin?.write(`${JSON.stringify({ ...job, id })}\n`);
+      } catch (error: any) {
+        this.pending.delete(id);
+        reject(error);
+        return;
+      }
+
+      this.armTimer();
+    });
+  }
+
+  /*
+   * O relógio só corre para o job que o worker está atendendo; os demais
+   * ainda estão na fila do stdin.
+   */
+  private armTimer() {
+    const first = this.pending.entries().next();
+    if (first.done) {
+      return;
+    }
+
+    const [id, job] = first.value;
+    if (!job.timer) {
+      job.timer = setTimeout(() => this.expire(id), STONE_ENGINE_TIMEOUT_MS);
+    }
+  }
+
+  private expire(id: string) {
+    const child = this.child;
+    this.child = null;
+    child?.kill('SIGKILL');
+
+    console.error(`⚠️ Job ${id} do motor Stone passou do tempo limite; reiniciando o worker.`);
+
+    this.rejectPending((jobId) =>
+      jobId === id
+        ? new Error(stoneEngineTimeoutMessage())
+        : new Error(
+            'O motor Stone foi reiniciado porque outro arquivo passou do tempo limite. Envie este arquivo de novo.'
+          )
+    );
+
+    try {
+      this.ensureStarted();
+    } catch (error: any) {
+      console.error('⚠️ Não foi possível reiniciar o worker do motor Stone:', error?.message || error);
+    }
+  }
+
+  private rejectPending(errorFor: (id: string) => Error) {
+    const jobs = [...this.pending.entries()];
+    this.pending.clear();
+
+    for (const [id, job] of jobs) {
+      clearTimeout(job.timer);
+      job.reject(errorFor(id));
+    }
+  }
+
+  private ensureStarted(): ReturnType<typeof spawn> {
+    if (this.child && this.child.exitCode === null && !this.child.killed) {
+      return this.child;
+    }
+
+    const scriptPath = getStoneRecebimentoEnginePath();
+
+    if (!fs.existsSync(scriptPath)) {
+      throw new Error(`Motor Python não encontrado em: ${scriptPath}`);
+    }
+
+    const child = spawn(getPythonCommand(), [scriptPath, '--worker'], {
+      cwd: ROOT_DIR,
+      windowsHide: true,
+      env: {
+        ...process.env,
+        PYTHONIOENCODING: 'utf-8',
+      },
+    });
+
+    this.child = child;
+    this.stderrTail = '';
+
+    // A resposta de um job chega em vários blocos; só o bloco novo é
+    // varrido atrás do fim de linha e a linha é montada uma vez. Os blocos
+    // são de cada processo: a saída de um worker morto não se mistura com
+    // a do novo.
+    let chunks: Buffer[] = [];
+
+    child.stdout?.on('data', (chunk: Buffer) => {
+      if (this.child !== child) {
+        return;
+      }
+
+      let start = 0;
+      let newline = chunk.indexOf(0x0a);
+
+      while (newline >= 0) {
+        chunks.push(chunk.subarray(start, newline));
+        const line = Buffer.concat(chunks).toString('utf8').trim();
+        chunks = [];
+
+        if (line) {
+          this.handleLine(line);
+        }
+
+        start = newline + 1;
+        newline = chunk.indexOf(0x0a, start);
+      }
+
+      if (start < chunk.length) {
+        chunks.push(chunk.subarray(start));
+      }
+    });
+
+    // Com setEncoding o stream decodifica o UTF-8 por conta própria e não
+    // parte caracteres acentuados que caem na divisa entre dois blocos.
+    child.stderr?.setEncoding('utf8');
+
+    child.stderr?.on('data', (text: string) => {
+      process.stderr.write(text);
+      this.stderrTail = (this.stderrTail + text).slice(-4000);
+    });
+
+    // Um processo já substituído (morto por tempo esgotado) não mexe nos
+    // jobs do worker novo.
+    const fail = (error: Error) => {
+      if (this.child !== child) {
+        return;
+      }
+
+      this.child = null;
+      this.rejectPending(() => error);
+    };
+
+    child.on('error', (error) => fail(error));
+
+    // Worker morto entre ensureStarted e o write (import quebrado, OOM)
+    // gera EPIPE no stdin; sem este ouvinte o 'error' derrubaria o servidor.
+    child.stdin?.on('error', (error) => fail(error));
+
+    child.on('close', (code) => {
+      fail(
+        new Error(
+          this.stderrTail || `Motor Python (worker) finalizou com código ${code}.`
+        )
+      );
+    });
+
+    return child;
+  }
+
+  private handleLine(line: string) {
+    let payload: any;
+
+    try {
+      payload = JSON.parse(line);
+    } catch (error: any) {
+      console.error('⚠️ Linha inválida do motor Stone:', line.slice(0, 500));
+      return;
+    }
+
+    const job = this.pending.get(payload?.id);
+    if (!job) {
+      return;
+    }
+
+    clearTimeout(job.timer);
+    this.pending.delete(payload.id);
+    this.armTimer();
+
+    if (payload.ok) {
+      job.resolve(payload.result);
+    } else {
+      job.reject(new Error(payload.error || 'Erro no motor Python.'));
+    }
+  }
+}
+
+const stoneEngineWorker = new StoneEngineWorker();
+
+function runStoneRecebimentoEngine(filePath: string): Promise<any> {
+  if (process.env.STONE_ENGINE_WORKER === 'false') {
+    return runStoneRecebimentoEngineOnce([filePath]);
+  }
+
+  return stoneEngineWorker.run(filePath);
+}
+
+function runStoneRecebimentoDetalhes(arquivoId: string, data: string): Promise<any> {
+  if (process.env.STONE_ENGINE_WORKER === 'false') {
+    return runStoneRecebimentoEngineOnce(['--detalhes', arquivoId, data]);
+  }
+
+  return stoneEngineWorker.detalhes(arquivoId, data);
+}
+
 app.get('/api/financeiro/recebimento-cartao/ping', (_req: Request, res: Response) => {
   return res.json({
     ok: true,
@@ -589,10 +880,12 @@ type RecebimentoCartaoPersistido = {
   persistedAt: string;
   processedBy?: string;
   fileName?: string;
+  arquivoId?: string;
   resumo?: any;
   mensal?: any[];
   diario?: any[];
   descartadas?: any[];
+  pareamento?: any;
   meta?: any;
 };
 
@@ -649,7 +942,7 @@ function readRecebimentoCartaoCache(): RecebimentoCartaoPersistido | null {
 
 function saveRecebimentoCartaoCache(payload: RecebimentoCartaoPersistido) {
   const cachePath = getRecebimentoCartaoCachePath();
-  fs.writeFileSync(cachePath, JSON.stringify(payload, null, 2), 'utf8');
+  fs.writeFileSync(cachePath, JSON.stringify(payload), 'utf8');
 }
 
 function deleteRecebimentoCartaoCache() {
@@ -719,6 +1012,42 @@ app.delete('/api/financeiro/recebimento-cartao/ultimo', async (req: Request, res
   }
 });
 
+app.get('/api/financeiro/recebimento-cartao/detalhes', async (req: Request, res: Response) => {
+  try {
+    const userId = String(req.query.userId || '');
+
+    const allowed = await canAccessRecebimentoCartao(userId);
+
+    if (!allowed) {
+      return res.status(403).json({
+        ok: false,
+        error: 'Acesso permitido apenas para usuários administrativos.',
+      });
+    }
+
+    const arquivoId = String(req.query.arquivoId || '');
+    const data = String(req.query.data || '');
+
+    if (!/^[0-9a-f]{64}$/.test(arquivoId) || !/^\d{4}-\d{2}-\d{2}$/.test(data)) {
+      return res.status(400).json({
+        ok: false,
+        error: 'Informe arquivoId e data (AAAA-MM-DD).',
+      });
+    }
+
+    const result = await runStoneRecebimentoDetalhes(arquivoId, data);
+
+    return res.json(result);
+  } catch (error: any) {
+    console.error('❌ Erro ao buscar detalhes do recebimento cartão:', error);
+
+    return res.status(500).json({
+      ok: false,
+      error: error?.message || 'Erro ao buscar detalhes do dia.',
+    });
+  }
+});
+
 app.post(
   '/api/financeiro/recebimento-cartao/processar',
   uploadRecebimentoCartao.single('file'),
@@ -7352,122 +7681,199 @@ app.get('/finance', async (req, res) => {
   }
 });
 
-app.post('/stock/sync', async (req, res) => {
-  const data = req.body;
-  const shouldReset = req.query.reset !== 'false';
-
-  console.log(
-    `📦 Recebendo lote de estoque... Resetar Banco: ${shouldReset}`
-  );
+/*
+ * Converte as linhas enviadas pelo sync_estoque.py para o formato da
+ * tabela Stock. Usado pela carga completa e pela carga delta.
+ */
+function formatStockSyncRows(data: any[]) {
+  const safeNum = (value: any): number =>
+    estoqueDetalhadoToNumber(value);
 
-  if (!Array.isArray(data)) {
-    return res.status(400).json({
-      error: 'Formato inválido. Envie uma lista.',
-    });
-  }
+  const safeStr = (
+    value: any,
+    fallback = ''
+  ): string => {
+    if (value === null || value === undefined) {
+      return fallback;
+    }
 
-  try {
-    const safeNum = (value: any): number =>
-      estoqueDetalhadoToNumber(value);
+    return String(value).trim();
+  };
 
-    const safeStr = (
-      value: any,
-      fallback = ''
-    ): string => {
-      if (value === null || value === undefined) {
-        return fallback;
-      }
+  const expandedInputRows = data.flatMap(
+    (item: any) => expandStockInputRows(item)
+  );
 
-      return String(value).trim();
-    };
+  return deduplicateStockRows(
+    expandedInputRows.map((item: any) => {
+      const emLinhaValue = safeStr(
+        item.EM_LINHA ??
+          item.em_linha ??
+          item.emLinha ??
+          item.linha,
+        ''
+      );
 
-    const expandedInputRows = data.flatMap(
-      (item: any) => expandStockInputRows(item)
-    );
+      const clusterValue = safeStr(
+        item.CLUSTER ??
+          item.cluster ??
+          item.Cluster,
+        ''
+      );
 
-    const formattedData = deduplicateStockRows(
-      expandedInputRows.map((item: any) => {
-        const emLinhaValue = safeStr(
-          item.EM_LINHA ??
-            item.em_linha ??
-            item.emLinha ??
-            item.linha,
-          ''
-        );
+      return {
+        cnpj: safeStr(
+          item.CNPJ_ORIGEM ?? item.cnpj
+        ),
+
+        storeName: safeStr(
+          item.NOME_FANTASIA ?? item.storeName,
+          'LOJA'
+        ),
+
+        productCode: safeStr(
+          item.CODIGO_PRODUTO ?? item.productCode
+        ),
+
+        reference: safeStr(
+          item.REFERENCIA ?? item.reference
+        ),
+
+        description: safeStr(
+          item.DESCRICAO ?? item.description,
+          'SEM DESCRIÇÃO'
+        ),
+
+        category: safeStr(
+          item.CATEGORIA ?? item.category,
+          'GERAL'
+        ),
+
+        quantity: safeNum(
+          item.__stockQuantity ??
+            item.QUANTIDADE ??
+            item.quantity
+        ),
+
+        costPrice: safeNum(
+          item.PRECO_CUSTO ?? item.costPrice
+        ),
+
+        salePrice: safeNum(
+          item.PRECO_VENDA ?? item.salePrice
+        ),
+
+        averageCost: safeNum(
+          item.CUSTO_MEDIO ??
+            item.averageCost
+        ),
 
-        const clusterValue = safeStr(
-          item.CLUSTER ??
-            item.cluster ??
-            item.Cluster,
-          ''
-        );
+        acquisitionCost: safeNum(
+          item.CUSTO_SERIAL_ENTRADA ??
+            item.acquisitionCost ??
+            item.ACQUISITION_COST
+        ),
 
-        return {
-          cnpj: safeStr(
-            item.CNPJ_ORIGEM ?? item.cnpj
-          ),
+        serial: safeStr(
+          item.SERIAL ?? item.serial
+        ),
 
-          storeName: safeStr(
-            item.NOME_FANTASIA ?? item.storeName,
-            'LOJA'
-          ),
+        emLinha: emLinhaValue,
+        cluster: clusterValue,
 
-          productCode: safeStr(
-            item.CODIGO_PRODUTO ?? item.productCode
-          ),
+        stockType: normalizeStockType(
+          item.__stockType ?? extractStockType(item)
+        ),
+      };
+    })
+  );
+}
 
-          reference: safeStr(
-            item.REFERENCIA ?? item.reference
-          ),
+/*
+ * Atualiza o histórico de cada IMEI recebido (loja atual, custo de
+ * aquisição e contagem de transferências).
+ */
+async function trackStockImeiHistory(
+  rows: ReturnType<typeof formatStockSyncRows>
+) {
+  for (const item of rows) {
+    if (item.serial && item.serial.trim() !== '') {
+      const serialClean = item.serial.trim();
+
+      const existing =
+        await prisma.imeiHistory.findUnique({
+          where: {
+            serial: serialClean,
+          },
+        });
 
-          description: safeStr(
-            item.DESCRICAO ?? item.description,
-            'SEM DESCRIÇÃO'
-          ),
+      if (!existing) {
+        await prisma.imeiHistory.create({
+          data: {
+            serial: serialClean,
+            productCode: item.productCode,
+            description: item.description,
+            currentStore: item.storeName,
+
+            acquisitionCost:
+              item.acquisitionCost > 0
+                ? item.acquisitionCost
+                : null,
+          },
+        });
+      } else {
+        const historyUpdate: any = {};
 
-          category: safeStr(
-            item.CATEGORIA ?? item.category,
-            'GERAL'
-          ),
+        if (item.acquisitionCost > 0) {
+          historyUpdate.acquisitionCost =
+            item.acquisitionCost;
+        }
 
-          quantity: safeNum(
-            item.__stockQuantity ??
-              item.QUANTIDADE ??
-              item.quantity
-          ),
+        if (
+          existing.currentStore !==
+          item.storeName
+        ) {
+          historyUpdate.currentStore =
+            item.storeName;
 
-          costPrice: safeNum(
-            item.PRECO_CUSTO ?? item.costPrice
-          ),
+          historyUpdate.entryDateStore =
+            new Date();
 
-          salePrice: safeNum(
-            item.PRECO_VENDA ?? item.salePrice
-          ),
+          historyUpdate.transferCount =
+            existing.transferCount + 1;
+        }
 
-          averageCost: safeNum(
-            item.CUSTO_MEDIO ??
-              item.averageCost
-          ),
+        if (
+          Object.keys(historyUpdate).length > 0
+        ) {
+          await prisma.imeiHistory.update({
+            where: {
+              serial: serialClean,
+            },
+            data: historyUpdate,
+          });
+        }
+      }
+    }
+  }
+}
 
-          acquisitionCost: safeNum(
-            item.CUSTO_SERIAL_ENTRADA ??
-              item.acquisitionCost ??
-              item.ACQUISITION_COST
-          ),
+app.post('/stock/sync', async (req, res) => {
+  const data = req.body;
+  const shouldReset = req.query.reset !== 'false';
 
-          serial: safeStr(
-            item.SERIAL ?? item.serial
-          ),
+  console.log(
+    `📦 Recebendo lote de estoque... Resetar Banco: ${shouldReset}`
+  );
 
-          emLinha: emLinhaValue,
-          cluster: clusterValue,
+  if (!Array.isArray(data)) {
+    return res.status(400).json({
+      error: 'Formato inválido. Envie uma lista.',
+    });
+  }
 
-          stockType: normalizeStockType(
-            item.__stockType ?? extractStockType(item)
-          ),
-        };
-      })
-    );
+  try {
+    const formattedData = formatStockSyncRows(data);
 
     /*
  * A limpeza e a inserção precisam acontecer na mesma transação.
@@ -7537,88 +7943,129 @@ await prisma.$transaction(
     // =======================================================
     // INTELIGÊNCIA DE RASTREAMENTO DE IMEI
     // =======================================================
-    for (const item of formattedData) {
-      if (item.serial && item.serial.trim() !== '') {
-        const serialClean = item.serial.trim();
+    await trackStockImeiHistory(formattedData);
 
-        const existing =
-          await prisma.imeiHistory.findUnique({
-            where: {
-              serial: serialClean,
-            },
-          });
+    console.log(
+      `✅ Lote processado com sucesso: ${formattedData.length} registros.`
+    );
 
-        if (!existing) {
-          await prisma.imeiHistory.create({
-            data: {
-              serial: serialClean,
-              productCode: item.productCode,
-              description: item.description,
-              currentStore: item.storeName,
-
-              acquisitionCost:
-                item.acquisitionCost > 0
-                  ? item.acquisitionCost
-                  : null,
-            },
-          });
-        } else {
-          const historyUpdate: any = {};
+    console.log(
+      '🔎 Exemplo do primeiro item salvo:',
+      formattedData[0]
+    );
 
-          if (item.acquisitionCost > 0) {
-            historyUpdate.acquisitionCost =
-              item.acquisitionCost;
-          }
+    return res.json({
+      success: true,
+      count: formattedData.length,
+    });
+  } catch (error: any) {
+    console.error(
+      '❌ ERRO CRÍTICO NO PRISMA:',
+      error
+    );
 
-          if (
-            existing.currentStore !==
-            item.storeName
-          ) {
-            historyUpdate.currentStore =
-              item.storeName;
+    return res.status(500).json({
+      error: 'Erro ao sincronizar estoque.',
+      details: error.message,
+    });
+  }
+});
 
-            historyUpdate.entryDateStore =
-              new Date();
+// ==========================================
+// 📦 CARGA DELTA DO ESTOQUE (sync_estoque.py)
+// ==========================================
+/*
+ * Corpo:
+ *   {
+ *     upserts: [linhas no mesmo formato do /stock/sync],
+ *     deletes: [{ CNPJ_ORIGEM, CODIGO_PRODUTO, TIPO_ESTOQUE, SERIAL }]
+ *   }
+ *
+ * A chave de uma linha é (cnpj, productCode, stockType, serial). Para cada
+ * chave presente em upserts ou deletes, as linhas atuais são removidas; as
+ * linhas de upserts são inseridas em seguida, tudo na mesma transação.
+ * Reenviar o mesmo lote (timeout/retry) produz o mesmo resultado.
+ */
+type StockSyncKey = {
+  cnpj: string;
+  productCode: string;
+  stockType: StockType;
+  serial: string;
+};
 
-            historyUpdate.transferCount =
-              existing.transferCount + 1;
-          }
+function stockSyncKey(item: any): StockSyncKey {
+  const text = (value: any): string =>
+    value === null || value === undefined ? '' : String(value).trim();
 
-          if (
-            Object.keys(historyUpdate).length > 0
-          ) {
-            await prisma.imeiHistory.update({
-              where: {
-                serial: serialClean,
-              },
-              data: historyUpdate,
-            });
-          }
+  return {
+    cnpj: text(item?.cnpj ?? item?.CNPJ_ORIGEM),
+    productCode: text(item?.productCode ?? item?.CODIGO_PRODUTO),
+    stockType: normalizeStockType(
+      item?.stockType ?? item?.TIPO_ESTOQUE ?? 'ESTOQUE'
+    ),
+    serial: text(item?.serial ?? item?.SERIAL),
+  };
+}
+
+app.post('/stock/sync/delta', async (req, res) => {
+  const upserts = req.body?.upserts ?? [];
+  const deletes = req.body?.deletes ?? [];
+
+  if (!Array.isArray(upserts) || !Array.isArray(deletes)) {
+    return res.status(400).json({
+      error: 'Formato inválido. Envie { upserts: [], deletes: [] }.',
+    });
+  }
+
+  try {
+    const formattedData = formatStockSyncRows(upserts);
+
+    const keys = new Map<string, StockSyncKey>();
+    for (const item of [...formattedData, ...deletes]) {
+      const key = stockSyncKey(item);
+      keys.set(
+        [key.cnpj, key.productCode, key.stockType, key.serial].join('|'),
+        key
+      );
+    }
+
+    await prisma.$transaction(
+      async (tx) => {
+        for (const key of keys.values()) {
+          await tx.stock.deleteMany({ where: key });
         }
-      }
-    }  
 
-    console.log(
-      `✅ Lote processado com sucesso: ${formattedData.length} registros.`
+        if (formattedData.length > 0) {
+          await tx.stock.createMany({
+            data: formattedData,
+          });
+        }
+      },
+      {
+        maxWait: 10000,
+        timeout: 30000,
+      }
     );
 
+    await trackStockImeiHistory(formattedData);
+
     console.log(
-      '🔎 Exemplo do primeiro item salvo:',
-      formattedData[0]
+      `✅ Delta de estoque aplicado: ${formattedData.length} inserções/atualizações, ${deletes.length} remoções.`
     );
 
     return res.json({
       success: true,
-      count: formattedData.length,
+      upserted: formattedData.length,
+      deleted: deletes.length,
     });
   } catch (error: any) {
     console.error(
-      '❌ ERRO CRÍTICO NO PRISMA:',
+      '❌ ERRO CRÍTICO NO PRISMA (delta de estoque):',
       error
     );
 
     return res.status(500).json({
-      error: 'Erro ao sincronizar estoque.',
+      error: 'Erro ao aplicar delta de estoque.',
       details: error.message,
     });
   }
@@ -0,0 +1,10 @@
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+# Os scripts de sincronização e o motor Stone são módulos soltos, sem
+# pacote: os testes importam direto das pastas deles.
+for pasta in (BACKEND_DIR / "scripts", BACKEND_DIR / "src" / "modules" / "finance"):
+    if str(pasta) not in sys.path:
+        sys.path.insert(0, str(pasta))
@@ -0,0 +1,86 @@
+"""
+Cache de resultados do motor Stone: resultado, detalhes por dia e abas
+lidas de um arquivo vivem e morrem juntos, e a rota de detalhes nunca fica
+presa a um resultado em cache sem os detalhes.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import stone_benchmark
+import stone_recebimentos_engine as engine
+
+
+@pytest.fixture
+def planilha(tmp_path, monkeypatch):
+    monkeypatch.setenv("STONE_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(engine, "RESULT_CACHE_ENABLED", True)
+    monkeypatch.setattr(engine, "DETAILS_INLINE", False)
+    monkeypatch.setattr(engine, "log", lambda *args, **kwargs: None)
+    monkeypatch.setattr(engine, "_DETAILS_BY_DIGEST", {})
+
+    path = tmp_path / "base.xlsx"
+    stone_benchmark.gravar_planilha(stone_benchmark.gerar_planilha(60), path)
+    return path
+
+
+def primeiro_dia(response):
+    return next(dia["data"] for dia in response["diario"] if dia["qtdPrevista"])
+
+
+def test_detalhes_podados_forcam_recalculo(planilha):
+    response = engine.process_file(planilha)
+    digest = response["arquivoId"]
+    dia = primeiro_dia(response)
+
+    engine.details_cache_path(digest).unlink()
+    engine.frames_cache_path(digest).unlink()
+    engine._DETAILS_BY_DIGEST.clear()
+
+    engine.process_file(planilha)
+
+    assert engine.details_cache_path(digest).exists()
+    engine._DETAILS_BY_DIGEST.clear()
+    assert engine.lookup_day_details(digest, dia)["previsto"]
+
+
+def test_poda_remove_a_unidade_inteira(planilha):
+    digest = engine.process_file(planilha)["arquivoId"]
+    unidade = engine.cache_unit_paths(digest)
+    assert len(unidade) == 3
+
+    # O resultado foi lido agora; as outras entradas ficaram velhas.
+    for path in unidade:
+        os.utime(path, (1, 1))
+    engine.read_cache_entry(engine.result_cache_path(digest), engine.load_result_cache)
+    assert all(path.stat().st_mtime > 1 for path in unidade)
+
+    engine.prune_result_cache(max_bytes=0)
+
+    assert engine.cache_unit_paths(digest) == []
+
+
+def test_poda_preserva_a_unidade_mais_recente(planilha, tmp_path):
+    digest = engine.process_file(planilha)["arquivoId"]
+    antiga = engine.get_result_cache_dir() / f"{'0' * 64}.p1.frames.pkl.gz"
+    antiga.write_bytes(b"x" * 10)
+    os.utime(antiga, (1, 1))
+
+    tamanho = sum(path.stat().st_size for path in engine.cache_unit_paths(digest))
+    engine.prune_result_cache(max_bytes=tamanho)
+
+    assert not antiga.exists()
+    assert len(engine.cache_unit_paths(digest)) == 3
+
+
+def test_sem_cache_em_disco_detalhes_vao_no_json():
+    codigo = "import stone_recebimentos_engine as e; print(e.DETAILS_INLINE)"
+    ambiente = {**os.environ, "STONE_RESULT_CACHE": "false", "PYTHONPATH": os.path.dirname(engine.__file__)}
+    ambiente.pop("STONE_DETALHES_INLINE", None)
+
+    saida = subprocess.run([sys.executable, "-c", codigo], env=ambiente, capture_output=True, text=True, check=True)
+
+    assert saida.stdout.strip() == "True"
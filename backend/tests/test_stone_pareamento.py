@@ -0,0 +1,119 @@
+"""
+Pareamento parcela a parcela do motor Stone (build_pareamento), com foco no
+tamanho do grafo de candidatos quando muitas parcelas dividem o mesmo valor.
+"""
+
+import pandas as pd
+
+from stone_recebimentos_engine import (
+    MATCH_MAX_CANDIDATOS,
+    _agrupar,
+    _candidatos_tolerancia,
+    _centavos,
+    _dias_inteiros,
+    build_pareamento,
+)
+
+BASE = pd.Timestamp("2025-03-10")
+
+
+def previstas(datas, valores):
+    return pd.DataFrame(
+        {
+            "LINHA_ORIGEM": range(len(valores)),
+            "DOCUMENTO": "DOC",
+            "PRODUTO": "CREDITO",
+            "PARCELA_ATUAL": 1,
+            "TOTAL_PARCELAS": 1,
+            "DATA_PREVISTA_RECEBIMENTO": datas,
+            "VALOR_LIQUIDO": valores,
+        }
+    )
+
+
+def extrato(datas, valores):
+    return pd.DataFrame(
+        {
+            "LINHA_ORIGEM": range(len(valores)),
+            "DATA_EXTRATO": datas,
+            "VALOR_EXTRATO": valores,
+            "DESCRICAO": "RECEBIMENTO",
+        }
+    )
+
+
+def test_exato_antes_da_tolerancia():
+    validas = previstas([BASE, BASE], [10.00, 20.00])
+    extr = extrato([BASE + pd.Timedelta(days=1), BASE], [10.01, 20.00])
+
+    pareados, previstos_sem_par, extrato_sem_par = build_pareamento(validas, extr)
+
+    assert pareados["TIPO_PAREAMENTO"].tolist() == ["TOLERANCIA", "EXATO"]
+    assert pareados["LINHA_EXTRATO"].tolist() == [0, 1]
+    assert pareados["DIAS_DIFERENCA"].tolist() == [1, 0]
+    assert previstos_sem_par.empty and extrato_sem_par.empty
+
+
+def test_valor_pesa_mais_que_data():
+    validas = previstas([BASE], [50.00])
+    extr = extrato(
+        [BASE + pd.Timedelta(days=2), BASE + pd.Timedelta(days=1)],
+        [50.00, 50.01],
+    )
+
+    pareados, _, extrato_sem_par = build_pareamento(validas, extr)
+
+    assert pareados["LINHA_EXTRATO"].tolist() == [0]
+    assert extrato_sem_par["LINHA_ORIGEM"].tolist() == [1]
+
+
+def test_componente_pequeno_maximiza_pares():
+    # O guloso pareia a parcela 0 com o lançamento 0, único candidato da
+    # parcela 1; a atribuição ótima leva a parcela 0 ao lançamento 1.
+    validas = previstas([BASE, BASE], [10.00, 10.02])
+    extr = extrato([BASE, BASE], [10.01, 9.99])
+
+    pareados, previstos_sem_par, _ = build_pareamento(validas, extr, tolerancia_valor=0.01)
+
+    assert len(pareados) == 2
+    assert previstos_sem_par.empty
+
+
+def test_valores_iguais_em_massa_nao_explodem_candidatos():
+    n = 8000
+    datas_previstas = [BASE] * n
+    datas_extrato = [BASE + pd.Timedelta(days=1)] * (n // 2) + [BASE - pd.Timedelta(days=2)] * (n // 2)
+    validas = previstas(datas_previstas, [10.00] * (n // 2) + [10.01] * (n // 2))
+    extr = extrato(datas_extrato, [10.01] * (n // 2) + [10.00] * (n // 2))
+
+    previsto = pd.DataFrame(
+        {
+            "I": range(n),
+            "DIA": _dias_inteiros(validas["DATA_PREVISTA_RECEBIMENTO"]),
+            "CENTAVOS": _centavos(validas["VALOR_LIQUIDO"]),
+        }
+    )
+    lancamentos = pd.DataFrame(
+        {
+            "J": range(n),
+            "DIA": _dias_inteiros(extr["DATA_EXTRATO"]),
+            "CENTAVOS": _centavos(extr["VALOR_EXTRATO"]),
+        }
+    )
+    grupos_prev, _ = _agrupar(previsto, "I")
+    grupos_extr, _ = _agrupar(lancamentos, "J")
+    candidatos = _candidatos_tolerancia(grupos_prev, grupos_extr, 3, 1)
+
+    # Antes eram n * n arestas; agora uma por par de grupos (dia, centavos).
+    assert len(candidatos) <= len(grupos_prev) * MATCH_MAX_CANDIDATOS
+    assert len(candidatos) == 4
+
+    pareados, previstos_sem_par, extrato_sem_par = build_pareamento(validas, extr)
+
+    assert len(pareados) == n
+    assert previstos_sem_par.empty and extrato_sem_par.empty
+    assert pareados["LINHA_ORIGEM"].is_unique
+    assert pareados["LINHA_EXTRATO"].is_unique
+    assert (pareados["TIPO_PAREAMENTO"] == "TOLERANCIA").all()
+    # O guloso prefere o mesmo valor com data diferente a um centavo de diferença.
+    assert (pareados["VALOR_DIFERENCA"] == 0).all()
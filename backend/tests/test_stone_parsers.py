@@ -0,0 +1,152 @@
+"""
+Equivalência entre os parsers vetorizados do motor Stone
+(parse_money_series / parse_date_series) e os escalares que eles
+substituem (parse_money / _parse_single_date aplicados linha a linha).
+"""
+
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from stone_recebimentos_engine import (
+    _parse_single_date,
+    parse_date_series,
+    parse_money,
+    parse_money_series,
+)
+
+VALORES_DINHEIRO = [
+    1234.56,
+    0,
+    -7,
+    np.int64(42),
+    np.float32(1.5),
+    True,
+    "R$ 1.234,56",
+    "r$ 99,90",
+    "R$ 1.000,00",
+    "(12,00)",
+    "(1.234,56)",
+    "(12))",
+    "1.234.567,89",
+    "1,5",
+    "1.5",
+    "+3,25",
+    "-0,01",
+    "--5",
+    "+-5",
+    " 12 ",
+    "1 234,50",
+    "1e3",
+    "1_000",
+    "inf",
+    "nan",
+    "abc",
+    "R$",
+    "",
+    "   ",
+    "١٢٣",
+    "12\x00",
+    None,
+    np.nan,
+    pd.NaT,
+    date(2024, 1, 1),
+]
+
+VALORES_DATA = [
+    datetime(2024, 3, 5, 14, 30),
+    date(2024, 3, 5),
+    pd.Timestamp("2024-03-05 23:59"),
+    45000,
+    45000.7,
+    20000,
+    80000,
+    80001,
+    1_700_000_000,
+    1_700_000_000_123,
+    20240305,
+    20240305.5,
+    19991231,
+    np.int64(45123),
+    float("inf"),
+    -45000,
+    "05/03/2024",
+    "5/3/2024",
+    "05/03/2024 14:30",
+    "05/03/2024 14:30:59",
+    "05-03-2024",
+    "05.03.2024",
+    "2024-03-05",
+    "2024/03/05 10:00",
+    "2024-03-05T10:00:00",
+    "20240305",
+    "1700000000",
+    "1700000000123",
+    "31/02/2024",
+    "13/13/2024",
+    "março 2024",
+    "lixo",
+    "",
+    "  ",
+    None,
+    np.nan,
+    pd.NaT,
+]
+
+
+def colunas_de_teste(valores):
+    """
+    A lista inteira (tipos misturados), cada valor isolado e colunas só
+    de texto, só de números e com tipo nativo do pandas.
+    """
+    yield pd.Series(valores, dtype=object)
+    for valor in valores:
+        yield pd.Series([valor, None], dtype=object)
+
+    textos = [v for v in valores if isinstance(v, str)]
+    numeros = [v for v in valores if isinstance(v, (int, float, np.integer, np.floating))]
+    yield pd.Series(textos, dtype=object)
+    yield pd.Series(textos, dtype="string")
+    yield pd.Series(numeros, dtype=object)
+    yield pd.Series(numeros)
+    yield pd.Series([], dtype=object)
+
+
+@pytest.mark.parametrize("serie", list(colunas_de_teste(VALORES_DINHEIRO)))
+def test_parse_money_series_igual_ao_escalar(serie):
+    esperado = serie.apply(parse_money)
+    pd.testing.assert_series_equal(parse_money_series(serie), esperado)
+
+
+@pytest.mark.parametrize("serie", list(colunas_de_teste(VALORES_DATA)))
+def test_parse_date_series_igual_ao_escalar(serie):
+    esperado = serie.apply(_parse_single_date)
+    pd.testing.assert_series_equal(parse_date_series(serie), esperado)
+
+
+def test_parse_date_series_coluna_datetime_nativa():
+    serie = pd.Series(pd.to_datetime(["2024-03-05 14:30", None, "2023-12-31 00:01"]))
+    pd.testing.assert_series_equal(parse_date_series(serie), serie.apply(_parse_single_date))
+
+
+def test_parse_money_series_coluna_grande_aleatoria():
+    rng = np.random.default_rng(7)
+    centavos = rng.integers(-10_000_000, 10_000_000, size=5000)
+    formatos = [
+        lambda c: c / 100,
+        lambda c: f"R$ {c / 100:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
+        lambda c: f"({abs(c) / 100:.2f})".replace(".", ","),
+        lambda c: f"{c / 100:.2f}",
+        lambda c: None,
+        lambda c: "x",
+    ]
+    serie = pd.Series(
+        [formatos[i % len(formatos)](int(c)) for i, c in enumerate(centavos)],
+        dtype=object,
+    )
+    pd.testing.assert_series_equal(
+        parse_money_series(serie),
+        serie.apply(parse_money),
+    )
@@ -0,0 +1,350 @@
+"""
+Escolha da compra original por serial (sync_estoque.classificar_compras /
+resolver_custos_dos_movimentos) contra as funções linha a linha que a
+versão vetorizada substituiu, copiadas abaixo como referência.
+
+Os quadros aleatórios não têm None/NaN: a versão por linha deixava o NaN
+virar o texto "nan" e a vetorizada o trata como vazio (último teste).
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sync_estoque
+from sync_estoque import (
+    normalizar_codigo_produto,
+    normalizar_serial,
+    normalizar_texto_custo,
+    numero_api,
+    valor_booleano_verdadeiro,
+)
+
+
+def classificar_compra_original(linha):
+    operacao = normalizar_texto_custo(linha.get("operacao"))
+    tipo_transacao = normalizar_texto_custo(linha.get("tipo_transacao"))
+    natureza = normalizar_texto_custo(linha.get("natureza_operacao"))
+    cfop = normalizar_texto_custo(linha.get("id_cfop"))
+    desc_cfop = normalizar_texto_custo(linha.get("desc_cfop"))
+    conjunto = f"{natureza} {desc_cfop} {cfop}"
+
+    if valor_booleano_verdadeiro(linha.get("cancelado")):
+        return False, 99, "CANCELADO"
+
+    if valor_booleano_verdadeiro(linha.get("excluido")):
+        return False, 99, "EXCLUIDO"
+
+    eh_entrada = (
+        operacao == "E"
+        or operacao.startswith("E ")
+        or "(E)" in operacao
+        or "ENTRADA" in operacao
+    )
+    if not eh_entrada:
+        return False, 99, "NAO_E_ENTRADA"
+
+    if tipo_transacao in {"D", "T", "J"}:
+        return False, 99, "TRANSFERENCIA_OU_AJUSTE"
+
+    if any(termo in conjunto for termo in sync_estoque.TERMOS_NAO_COMPRA):
+        return False, 99, "NATUREZA_NAO_E_COMPRA"
+
+    if any(termo in conjunto for termo in sync_estoque.TERMOS_COMPRA):
+        return True, 0, "COMPRA_EXPLICITA"
+
+    cfop_numerico = re.sub(r"\D", "", cfop)
+    if cfop_numerico.startswith(("1", "2", "3")):
+        return True, 1, "COMPRA_POR_CFOP"
+
+    return True, 2, "ENTRADA_NAO_CLASSIFICADA"
+
+
+def extrair_custo_compra(linha):
+    preco_unitario = numero_api(linha.get("preco_unitario"))
+    if preco_unitario > 0:
+        return round(preco_unitario, 4), "preco_unitario"
+
+    quantidade = abs(numero_api(linha.get("quantidade")))
+    divisor = quantidade if quantidade > 0 else 1.0
+
+    valor_total_unitario = numero_api(linha.get("valor_total")) / divisor
+    if valor_total_unitario > 0:
+        return round(valor_total_unitario, 4), "valor_total/quantidade"
+
+    valor_liquido_unitario = numero_api(linha.get("valor_liquido")) / divisor
+    if valor_liquido_unitario > 0:
+        return round(valor_liquido_unitario, 4), "valor_liquido/quantidade"
+
+    return 0.0, ""
+
+
+def data_ordenacao_movimento(linha):
+    for campo in ("data_lancamento", "data_documento", "dt_insert"):
+        valor = linha.get(campo)
+        if valor is None or str(valor).strip() == "":
+            continue
+        convertido = pd.to_datetime(valor, errors="coerce")
+        if not pd.isna(convertido):
+            return convertido
+    return pd.Timestamp.max
+
+
+def resolver_linha_a_linha(documentos, movimentos_serial, produto_por_serial):
+    """
+    resolver_custos_dos_movimentos original, devolvendo o registro de cada
+    serial (sem atualizado_em) em vez de gravar em custo_imei.
+    """
+    candidatos_por_serial = {}
+    chaves_documentos = {}
+
+    for _, movimento in movimentos_serial.iterrows():
+        serial = normalizar_serial(
+            movimento.get("serial_normalizado") or movimento.get("serial")
+        )
+        cnpj = str(
+            movimento.get("cnpj_consultado") or movimento.get("cnpj_emp") or ""
+        ).strip()
+        identificador = str(movimento.get("identificador") or "").strip()
+        transacao = normalizar_codigo_produto(movimento.get("transacao"))
+        data_inicial = str(movimento.get("janela_data_inicial") or "")
+        data_final = str(movimento.get("janela_data_final") or "")
+
+        if not serial or not cnpj or not identificador:
+            continue
+
+        chave = (cnpj, identificador, transacao, data_inicial, data_final)
+        chaves_documentos.setdefault(chave, set()).add(serial)
+
+    for (cnpj, identificador, transacao, _, _), seriais in chaves_documentos.items():
+        documento = documentos.get((cnpj, identificador))
+
+        if documento is None or documento.empty:
+            continue
+
+        if "transacao" in documento.columns and transacao:
+            transacoes = documento["transacao"].map(normalizar_codigo_produto)
+            por_transacao = documento[transacoes == transacao].copy()
+            if not por_transacao.empty:
+                documento = por_transacao
+
+        for serial in seriais:
+            codigo_esperado = produto_por_serial.get(serial, "")
+            linhas_serial = documento
+
+            if codigo_esperado and "cod_produto" in documento.columns:
+                codigos = documento["cod_produto"].map(normalizar_codigo_produto)
+                por_produto = documento[codigos == codigo_esperado].copy()
+                if not por_produto.empty:
+                    linhas_serial = por_produto
+
+            for _, linha in linhas_serial.iterrows():
+                valida, prioridade, tipo_candidato = classificar_compra_original(linha)
+                if not valida:
+                    continue
+
+                custo, campo_origem = extrair_custo_compra(linha)
+                if custo <= 0:
+                    continue
+
+                candidatos_por_serial.setdefault(serial, []).append(
+                    {
+                        "codigo_produto": (
+                            normalizar_codigo_produto(linha.get("cod_produto"))
+                            or codigo_esperado
+                        ),
+                        "custo": custo,
+                        "documento": str(linha.get("documento") or "").strip(),
+                        "serie": str(linha.get("serie") or "").strip(),
+                        "data_entrada": str(
+                            linha.get("data_lancamento")
+                            or linha.get("data_documento")
+                            or ""
+                        ).strip(),
+                        "cnpj": cnpj,
+                        "identificador": identificador,
+                        "transacao": (
+                            normalizar_codigo_produto(linha.get("transacao"))
+                            or transacao
+                        ),
+                        "campo_origem": campo_origem,
+                        "prioridade": prioridade,
+                        "tipo_candidato": tipo_candidato,
+                        "data_ordenacao": data_ordenacao_movimento(linha),
+                    }
+                )
+
+    registros = {}
+    for serial, candidatos in candidatos_por_serial.items():
+        candidatos.sort(
+            key=lambda item: (
+                item["prioridade"],
+                item["data_ordenacao"],
+                item["documento"],
+            )
+        )
+        escolhido = candidatos[0]
+        registros[serial] = (
+            escolhido["codigo_produto"],
+            escolhido["custo"],
+            escolhido["documento"],
+            escolhido["serie"],
+            escolhido["data_entrada"],
+            escolhido["cnpj"],
+            escolhido["identificador"],
+            escolhido["transacao"],
+            f"{escolhido['campo_origem']}::{escolhido['tipo_candidato']}",
+        )
+    return registros
+
+
+@pytest.fixture
+def resolver(monkeypatch, tmp_path):
+    """
+    resolver_custos_dos_movimentos com os documentos dados no lugar do
+    cache/API. Devolve o registro gravado em custo_imei para cada serial.
+    """
+    monkeypatch.setattr(sync_estoque, "CUSTO_IMEI_CACHE", tmp_path / "custos.sqlite")
+    monkeypatch.setattr(sync_estoque, "log", lambda *args, **kwargs: None)
+
+    def executar(documentos, movimentos, produto_por_serial):
+        monkeypatch.setattr(
+            sync_estoque,
+            "obter_documentos_movimento",
+            lambda conexao, janelas: {
+                chave: documentos[chave] for chave in janelas if chave in documentos
+            },
+        )
+        conexao = sync_estoque.inicializar_cache_custos()
+        conexao.execute("DELETE FROM custo_imei")
+        try:
+            sync_estoque.resolver_custos_dos_movimentos(conexao, movimentos, produto_por_serial)
+            linhas = conexao.execute(
+                "SELECT serial_normalizado, codigo_produto, custo_aquisicao, documento, "
+                "serie, data_entrada, cnpj_compra, identificador, transacao, campo_origem "
+                "FROM custo_imei"
+            ).fetchall()
+        finally:
+            conexao.close()
+        return {linha[0]: tuple(linha[1:]) for linha in linhas}
+
+    return executar
+
+
+VALORES_DOCUMENTO = {
+    "operacao": ["E", "E", "E", "E - Entrada", "Entrada (E)", "Saída", ""],
+    "tipo_transacao": ["", "", "C", "N", "D", "T"],
+    "natureza_operacao": [
+        "Compra p/ revenda", "COMPRA", "", "", "Aquisição", "Venda",
+        "Transferência", "Devolução", "Bonificação",
+    ],
+    "desc_cfop": ["", "", "Compra para comercialização", "Outras entradas", "Remessa"],
+    "id_cfop": ["1102", "5102", "2.102", "", "abc", "3949"],
+    "cancelado": ["N", "", "0", "N", "S"],
+    "excluido": ["N", "", "N", "Sim"],
+    "preco_unitario": ["", "0", "100,50", 99.9, "1.234,56", 100.5, "100,50"],
+    "quantidade": ["1", "2", "0", "-2", 3],
+    "valor_total": ["", "201,00", 300, "0"],
+    "valor_liquido": ["", "150", "0,5"],
+    # Poucas datas distintas, vazias e inválidas: força empates e fallback.
+    "data_lancamento": ["2024-01-05", "", "2024-01-05 10:00:00", "ontem", "2023-12-31"],
+    "data_documento": ["2024-01-05", "", "2024-01-04", "2023-12-31"],
+    "dt_insert": ["", "2024-01-01", "2024-01-05"],
+    "cod_produto": ["10", "10.0", "20", "", "ABC"],
+    "transacao": ["1", "2", "", "1.0"],
+    "serie": ["1", "", " 2 "],
+}
+SERIAIS = ["111111111111111", "2222-2222-2222-222", "333333333333333", "444444444444444", ""]
+IDENTIFICADORES = ["ID-1", "ID-2", "ID-3", ""]
+
+
+def cenario_aleatorio(rng: np.random.Generator):
+    def escolher(valores):
+        return valores[int(rng.integers(0, len(valores)))]
+
+    documentos = {}
+    for cnpj in ("1", "2"):
+        for identificador in IDENTIFICADORES[:-1]:
+            if rng.random() < 0.15:
+                continue
+            n = int(rng.integers(1, 8))
+            colunas = [c for c in VALORES_DOCUMENTO if rng.random() < 0.9]
+            dados = {c: [escolher(VALORES_DOCUMENTO[c]) for _ in range(n)] for c in colunas}
+            dados["documento"] = [escolher(["100", "200", " 300 "]) for _ in range(n)]
+            documentos[(cnpj, identificador)] = pd.DataFrame(dados)
+
+    m = int(rng.integers(2, 16))
+    movimentos = pd.DataFrame(
+        {
+            "serial": [escolher(SERIAIS) for _ in range(m)],
+            "cnpj_consultado": [escolher(["1", "2", ""]) for _ in range(m)],
+            "cnpj_emp": [escolher(["1", "2"]) for _ in range(m)],
+            "identificador": [escolher(IDENTIFICADORES) for _ in range(m)],
+            "transacao": [escolher(["1", "2", "", "3"]) for _ in range(m)],
+            "janela_data_inicial": [escolher(["2024-01-01", "2023-07-01"]) for _ in range(m)],
+            "janela_data_final": ["2024-06-30"] * m,
+        }
+    )
+
+    produto_por_serial = {
+        normalizar_serial(serial): escolher(["10", "20", "30", ""])
+        for serial in SERIAIS
+        if serial and rng.random() < 0.7
+    }
+    return documentos, movimentos, produto_por_serial
+
+
+CENARIOS = [cenario_aleatorio(np.random.default_rng(seed)) for seed in range(150)]
+
+
+@pytest.mark.parametrize("cenario", CENARIOS)
+def test_candidato_escolhido_igual_ao_linha_a_linha(resolver, cenario):
+    documentos, movimentos, produto_por_serial = cenario
+
+    esperado = resolver_linha_a_linha(documentos, movimentos, produto_por_serial)
+
+    assert resolver(documentos, movimentos, produto_por_serial) == esperado
+
+
+def test_classificacao_por_linha_igual_a_original():
+    documento = pd.concat(
+        [documentos[chave] for documentos, _, _ in CENARIOS for chave in documentos],
+        ignore_index=True,
+    ).fillna("")
+
+    classificado = sync_estoque.classificar_compras(documento)
+
+    for (_, linha), (_, nova) in zip(documento.iterrows(), classificado.iterrows()):
+        valida, prioridade, tipo = classificar_compra_original(linha)
+        assert (nova["valida"], nova["prioridade"], nova["tipo_candidato"]) == (
+            valida, prioridade, tipo,
+        )
+        assert (nova["custo"], nova["campo_origem"]) == extrair_custo_compra(linha)
+        assert nova["data_ordenacao"] == data_ordenacao_movimento(linha)
+
+
+def test_ausentes_viram_vazio_e_nao_texto_nan(resolver):
+    # Comportamento novo e intencional: a versão por linha gravava
+    # data_entrada "nan" e não caía para data_documento.
+    documentos = {
+        ("1", "ID-1"): pd.DataFrame(
+            {
+                "operacao": ["E"],
+                "natureza_operacao": ["Compra"],
+                "preco_unitario": [10.0],
+                "data_lancamento": [np.nan],
+                "data_documento": ["2024-01-04"],
+                "serie": [np.nan],
+                "documento": ["100"],
+            }
+        )
+    }
+    movimentos = pd.DataFrame(
+        {"serial": ["111111111111111"], "cnpj_emp": ["1"], "identificador": ["ID-1"]}
+    )
+
+    registro = resolver(documentos, movimentos, {})["111111111111111"]
+
+    assert registro[3:5] == ("", "2024-01-04")
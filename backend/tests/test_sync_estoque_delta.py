@@ -0,0 +1,244 @@
+"""
+Carga delta do estoque (sync_estoque.enviar_para_api) contra um servidor
+local que emula /stock/sync e /stock/sync/delta do server.ts.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+
+import sync_estoque
+
+
+def chave_stock(linha: dict) -> tuple:
+    # Mesma chave do stockSyncKey do server.ts.
+    return (
+        str(linha.get("CNPJ_ORIGEM")),
+        str(linha.get("CODIGO_PRODUTO")),
+        str(linha.get("TIPO_ESTOQUE") or "ESTOQUE"),
+        str(linha.get("SERIAL") or "").strip(),
+    )
+
+
+class ServidorEstoque:
+    """
+    Tabela Stock em memória. `status_delta` simula falha (500) ou um
+    backend antigo sem a rota delta (404); `deltas_ate_falhar` aceita só
+    esse número de lotes delta e responde 500 aos seguintes.
+    """
+
+    def __init__(self):
+        self.linhas: list[dict] = []
+        self.requisicoes: list[tuple[str, object]] = []
+        self.status_delta = 200
+        self.deltas_ate_falhar: int | None = None
+
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                corpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                servidor.requisicoes.append((url.path, corpo))
+                status = servidor.aplicar(url, corpo)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+        self.http = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.http.server_port}/stock/sync"
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+
+    def aplicar(self, url, corpo) -> int:
+        if url.path == "/stock/sync":
+            if parse_qs(url.query).get("reset") == ["true"]:
+                self.linhas = []
+            self.linhas.extend(corpo)
+            return 200
+
+        if url.path == "/stock/sync/delta":
+            if self.status_delta != 200:
+                return self.status_delta
+            if self.deltas_ate_falhar is not None:
+                if self.deltas_ate_falhar == 0:
+                    return 500
+                self.deltas_ate_falhar -= 1
+            chaves = {chave_stock(linha) for linha in corpo["upserts"] + corpo["deletes"]}
+            self.linhas = [l for l in self.linhas if chave_stock(l) not in chaves]
+            self.linhas.extend(corpo["upserts"])
+            return 200
+
+        return 404
+
+    def estado(self) -> list[dict]:
+        return sorted(self.linhas, key=lambda l: json.dumps(l, sort_keys=True))
+
+
+def linha(serial, codigo=10, custo=100.0, quantidade=1, cnpj="123"):
+    return {
+        "CNPJ_ORIGEM": cnpj,
+        "CODIGO_PRODUTO": codigo,
+        "TIPO_ESTOQUE": "ESTOQUE",
+        "SERIAL": serial,
+        "QUANTIDADE": quantidade,
+        "CUSTO": custo,
+    }
+
+
+def ordenar(linhas: list[dict]) -> list[dict]:
+    return sorted(linhas, key=lambda l: json.dumps(l, sort_keys=True))
+
+
+@pytest.fixture
+def servidor(tmp_path, monkeypatch):
+    servidor = ServidorEstoque()
+    monkeypatch.setattr(sync_estoque, "API_STOCK_SYNC_URL", servidor.url)
+    monkeypatch.setattr(sync_estoque, "STOCK_SYNC_SNAPSHOT", tmp_path / "estoque_enviado.sqlite3")
+    monkeypatch.setattr(sync_estoque, "STOCK_SYNC_MODO", "delta")
+    monkeypatch.setattr(sync_estoque.time, "sleep", lambda _: None)
+    monkeypatch.setattr(sync_estoque, "log", lambda _: None)
+    yield servidor
+    servidor.http.shutdown()
+    servidor.http.server_close()
+
+
+def snapshot_esperado(linhas: list[dict]) -> dict[str, str]:
+    return sync_estoque.agrupar_registros_por_chave(linhas)[1]
+
+
+PRIMEIRA = [
+    linha("A"),
+    linha("B"),
+    linha("", codigo=20, quantidade=3),
+    linha("", codigo=20, quantidade=2, cnpj="456"),
+]
+
+
+def test_primeiro_envio_completo_e_depois_so_o_delta(servidor):
+    assert sync_estoque.enviar_para_api(pd.DataFrame(PRIMEIRA)) is True
+
+    assert [caminho for caminho, _ in servidor.requisicoes] == ["/stock/sync"]
+    assert servidor.estado() == ordenar(PRIMEIRA)
+    assert sync_estoque.carregar_snapshot_envio(servidor.url) == snapshot_esperado(PRIMEIRA)
+
+    # A mudou de custo, B saiu, C chegou; o resto ficou igual.
+    segunda = [
+        linha("A", custo=150.0),
+        linha("", codigo=20, quantidade=3),
+        linha("", codigo=20, quantidade=2, cnpj="456"),
+        linha("C"),
+    ]
+    servidor.requisicoes.clear()
+    assert sync_estoque.enviar_para_api(pd.DataFrame(segunda)) is True
+
+    assert len(servidor.requisicoes) == 2
+    (caminho_deletes, deletes), (caminho_upserts, upserts) = servidor.requisicoes
+    assert caminho_upserts == caminho_deletes == "/stock/sync/delta"
+    assert deletes == {
+        "upserts": [],
+        "deletes": [
+            {"CNPJ_ORIGEM": "123", "CODIGO_PRODUTO": 10, "TIPO_ESTOQUE": "ESTOQUE", "SERIAL": "B"},
+        ],
+    }
+    assert upserts == {"upserts": [linha("A", custo=150.0), linha("C")], "deletes": []}
+    assert servidor.estado() == ordenar(segunda)
+    assert sync_estoque.carregar_snapshot_envio(servidor.url) == snapshot_esperado(segunda)
+
+    # Sem mudança nenhuma, nada é enviado.
+    servidor.requisicoes.clear()
+    assert sync_estoque.enviar_para_api(pd.DataFrame(segunda)) is True
+    assert servidor.requisicoes == []
+
+
+def test_snapshot_so_avanca_depois_do_delta_aplicado(servidor):
+    assert sync_estoque.enviar_para_api(pd.DataFrame(PRIMEIRA)) is True
+
+    segunda = PRIMEIRA[1:] + [linha("C")]
+    servidor.status_delta = 500
+    assert sync_estoque.enviar_para_api(pd.DataFrame(segunda)) is False
+    assert sync_estoque.carregar_snapshot_envio(servidor.url) == snapshot_esperado(PRIMEIRA)
+    assert servidor.estado() == ordenar(PRIMEIRA)
+
+    # O envio seguinte repete o mesmo delta.
+    servidor.status_delta = 200
+    servidor.requisicoes.clear()
+    assert sync_estoque.enviar_para_api(pd.DataFrame(segunda)) is True
+    assert [corpo for _, corpo in servidor.requisicoes] == [
+        {
+            "upserts": [],
+            "deletes": [
+                {"CNPJ_ORIGEM": "123", "CODIGO_PRODUTO": 10, "TIPO_ESTOQUE": "ESTOQUE", "SERIAL": "A"},
+            ],
+        },
+        {"upserts": [linha("C")], "deletes": []},
+    ]
+    assert servidor.estado() == ordenar(segunda)
+    assert sync_estoque.carregar_snapshot_envio(servidor.url) == snapshot_esperado(segunda)
+
+
+def test_backend_sem_rota_delta_recebe_carga_completa(servidor):
+    assert sync_estoque.enviar_para_api(pd.DataFrame(PRIMEIRA)) is True
+
+    segunda = PRIMEIRA + [linha("C")]
+    servidor.status_delta = 404
+    servidor.requisicoes.clear()
+    assert sync_estoque.enviar_para_api(pd.DataFrame(segunda)) is True
+
+    assert [caminho for caminho, _ in servidor.requisicoes] == ["/stock/sync/delta", "/stock/sync"]
+    assert servidor.estado() == ordenar(segunda)
+    assert sync_estoque.carregar_snapshot_envio(servidor.url) == snapshot_esperado(segunda)
+
+
+def test_imei_que_mudou_de_loja_troca_de_chave_no_mesmo_lote(servidor):
+    assert sync_estoque.enviar_para_api(pd.DataFrame(PRIMEIRA)) is True
+
+    # A foi transferido para a loja 456 e B saiu do estoque.
+    segunda = [
+        linha("A", cnpj="456"),
+        linha("", codigo=20, quantidade=3),
+        linha("", codigo=20, quantidade=2, cnpj="456"),
+    ]
+    servidor.requisicoes.clear()
+    assert sync_estoque.enviar_para_api(pd.DataFrame(segunda)) is True
+
+    assert [corpo for _, corpo in servidor.requisicoes] == [
+        {
+            "upserts": [],
+            "deletes": [
+                {"CNPJ_ORIGEM": "123", "CODIGO_PRODUTO": 10, "TIPO_ESTOQUE": "ESTOQUE", "SERIAL": "B"},
+            ],
+        },
+        {
+            "upserts": [linha("A", cnpj="456")],
+            "deletes": [
+                {"CNPJ_ORIGEM": "123", "CODIGO_PRODUTO": 10, "TIPO_ESTOQUE": "ESTOQUE", "SERIAL": "A"},
+            ],
+        },
+    ]
+    assert servidor.estado() == ordenar(segunda)
+
+
+def test_falha_no_meio_do_delta_nao_duplica_imei(servidor, monkeypatch):
+    monkeypatch.setattr(sync_estoque, "STOCK_SYNC_DELTA_LOTE", 1)
+    seriais = ["A", "B", "C", "D"]
+    assert sync_estoque.enviar_para_api(pd.DataFrame([linha(s) for s in seriais])) is True
+
+    # Todos mudam de loja; o servidor aceita dois lotes e falha no terceiro.
+    servidor.deltas_ate_falhar = 2
+    assert sync_estoque.enviar_para_api(pd.DataFrame([linha(s, cnpj="456") for s in seriais])) is False
+
+    lojas_por_serial: dict[str, list[str]] = {}
+    for registro in servidor.linhas:
+        lojas_por_serial.setdefault(registro["SERIAL"], []).append(registro["CNPJ_ORIGEM"])
+
+    assert sorted(lojas_por_serial) == seriais
+    assert all(len(lojas) == 1 for lojas in lojas_por_serial.values())
+    assert sorted(lojas_por_serial.values()).count(["456"]) == 2
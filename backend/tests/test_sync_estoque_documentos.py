@@ -0,0 +1,138 @@
+"""
+Cache de documentos LinxMovimento no SQLite (sync_estoque.compactar_documento /
+carregar_documentos_cache): formato colunar, migração da tabela antiga
+documento_movimento e leitura em lotes.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sync_estoque
+
+
+@pytest.fixture
+def conexao(monkeypatch, tmp_path):
+    monkeypatch.setattr(sync_estoque, "CUSTO_IMEI_CACHE", tmp_path / "custos.sqlite")
+    conexao = sync_estoque.inicializar_cache_custos()
+    yield conexao
+    conexao.close()
+
+
+def documento_misto() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "documento": ["100", "100", None],
+            "quantidade": [1, 2, 3],
+            "preco_unitario": [99.9, np.nan, 1234.56],
+            "cancelado": [False, True, False],
+            "cod_produto": ["10", np.nan, "ÁÇÉ"],
+            "vazia": [np.nan, np.nan, np.nan],
+            "data_lancamento": [pd.Timestamp("2024-01-05"), pd.NaT, pd.Timestamp("2024-02-01 10:00")],
+        }
+    )
+
+
+def ausentes_como_none(documento: pd.DataFrame) -> pd.DataFrame:
+    # None ou NaN conforme o dtype que o pandas inferir; compara como None.
+    documento = documento.astype(object)
+    return documento.where(documento.notna(), None)
+
+
+def registros_de(documento: pd.DataFrame) -> list[dict]:
+    return ausentes_como_none(documento).to_dict("records")
+
+
+def test_compactar_e_descompactar_preserva_o_documento():
+    documento = documento_misto()
+
+    lido = sync_estoque.descompactar_documento(sync_estoque.compactar_documento(documento))
+    volta = ausentes_como_none(lido)
+
+    assert volta.columns.tolist() == documento.columns.tolist()
+    assert volta["documento"].tolist() == ["100", "100", None]
+    assert volta["quantidade"].tolist() == [1, 2, 3]
+    assert volta["preco_unitario"].tolist() == [99.9, None, 1234.56]
+    assert volta["cancelado"].tolist() == [False, True, False]
+    assert volta["cod_produto"].tolist() == ["10", None, "ÁÇÉ"]
+    assert volta["vazia"].tolist() == [None, None, None]
+    assert volta["data_lancamento"].tolist() == ["2024-01-05 00:00:00", None, "2024-02-01 10:00:00"]
+
+    # O que a classificação de compras lê não muda com o formato.
+    pd.testing.assert_frame_equal(
+        sync_estoque.classificar_compras(lido),
+        sync_estoque.classificar_compras(documento),
+    )
+
+
+def test_documento_legado_e_lido_e_regravado_no_formato_colunar(conexao):
+    registros = [
+        {"documento": "100", "cod_produto": "10", "preco_unitario": "99,90", "serie": None},
+        {"documento": "100", "cod_produto": "20", "preco_unitario": 5, "serie": "1"},
+    ]
+    conexao.execute(
+        "INSERT INTO documento_movimento VALUES (?, ?, ?, ?)",
+        ("1", "ID-1", json.dumps(registros), "2024-01-01T00:00:00"),
+    )
+    conexao.commit()
+
+    documentos = sync_estoque.carregar_documentos_cache(conexao, {("1", "ID-1")})
+
+    assert registros_de(documentos[("1", "ID-1")]) == registros
+    assert conexao.execute("SELECT COUNT(*) FROM documento_movimento").fetchone()[0] == 0
+    versao, payload = conexao.execute(
+        "SELECT versao, payload FROM documento_movimento_colunar "
+        "WHERE cnpj_emp = '1' AND identificador = 'ID-1'"
+    ).fetchone()
+    assert versao == sync_estoque.DOCUMENTO_MOVIMENTO_VERSAO
+    assert registros_de(sync_estoque.descompactar_documento(payload)) == registros
+
+    # A segunda leitura já vem da tabela colunar.
+    de_novo = sync_estoque.carregar_documentos_cache(conexao, {("1", "ID-1")})
+    assert registros_de(de_novo[("1", "ID-1")]) == registros
+
+
+def test_versao_diferente_ou_payload_invalido_nao_sao_usados(conexao):
+    sync_estoque.gravar_documentos_movimento(
+        conexao,
+        {("1", "ID-1"): documento_misto(), ("1", "ID-2"): documento_misto()},
+    )
+    conexao.execute(
+        "UPDATE documento_movimento_colunar SET versao = versao + 1 WHERE identificador = 'ID-1'"
+    )
+    conexao.execute(
+        "UPDATE documento_movimento_colunar SET payload = ? WHERE identificador = 'ID-2'",
+        (b"nao e zlib",),
+    )
+    conexao.commit()
+
+    assert sync_estoque.carregar_documentos_cache(conexao, {("1", "ID-1"), ("1", "ID-2")}) == {}
+
+
+def test_pre_carga_com_mais_identificadores_que_um_lote(conexao):
+    colunares = {
+        ("1", f"ID-{i:04d}"): pd.DataFrame({"documento": [str(i)], "quantidade": [i]})
+        for i in range(1000)
+    }
+    legados = {
+        ("2", f"LEG-{i:04d}"): [{"documento": str(i), "quantidade": i}]
+        for i in range(900)
+    }
+    sync_estoque.gravar_documentos_movimento(conexao, colunares)
+    conexao.executemany(
+        "INSERT INTO documento_movimento VALUES (?, ?, ?, '2024-01-01T00:00:00')",
+        [(cnpj, identificador, json.dumps(registros)) for (cnpj, identificador), registros in legados.items()],
+    )
+    conexao.commit()
+
+    # Outra loja com o mesmo identificador não entra no resultado.
+    pedidas = set(colunares) | set(legados) | {("9", "ID-0001")}
+    documentos = sync_estoque.carregar_documentos_cache(conexao, pedidas)
+
+    assert set(documentos) == set(colunares) | set(legados)
+    assert documentos[("1", "ID-0999")].to_dict("records") == [{"documento": "999", "quantidade": 999}]
+    assert documentos[("2", "LEG-0899")].to_dict("records") == legados[("2", "LEG-0899")]
+    assert conexao.execute("SELECT COUNT(*) FROM documento_movimento").fetchone()[0] == 0
+    assert conexao.execute("SELECT COUNT(*) FROM documento_movimento_colunar").fetchone()[0] == 1900
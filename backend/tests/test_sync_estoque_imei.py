@@ -0,0 +1,122 @@
+"""
+Desdobramento do estoque em uma linha por IMEI
+(sync_estoque.desdobrar_por_imei / custos_por_serial).
+"""
+
+import pandas as pd
+import pytest
+
+import sync_estoque
+
+IMEI_1 = "111111111111111"
+IMEI_2 = "222222222222222"
+IMEI_3 = "333333333333333"
+IMEI_4 = "444444444444444"
+
+COMPRA_IMEI_1 = {
+    "custo_aquisicao": "1.500,00",
+    "campo_origem": "custo_unitario",
+    "documento": "9001",
+    "cnpj_compra": "99",
+    "identificador": "ID-9001",
+    "transacao": "77",
+    "data_entrada": "2025-01-10",
+}
+
+
+@pytest.fixture(autouse=True)
+def silenciar_log(monkeypatch):
+    monkeypatch.setattr(sync_estoque, "log", lambda *args, **kwargs: None)
+
+
+def estoque():
+    return pd.DataFrame(
+        {
+            "CNPJ_ORIGEM": ["1", "1", "1", "1"],
+            "NOME_FANTASIA": ["LOJA 1"] * 4,
+            "CODIGO_PRODUTO": ["10", "20", "10", "30"],
+            "TIPO_ESTOQUE": ["ESTOQUE", "ESTOQUE", "AMOSTRA", "ESTOQUE"],
+            "QUANTIDADE": [2.0, 3.0, 1.0, 5.0],
+        },
+        index=[10, 11, 12, 13],
+    )
+
+
+def seriais():
+    return pd.DataFrame(
+        {
+            "CNPJ_ORIGEM": ["1", "1", "1", "1", "1", "1"],
+            "codigoproduto": ["10", "10", "10", "10", "10", "20"],
+            # Repetido, com espaços e vazio: limpos antes do corte.
+            "serial": [IMEI_1, f" {IMEI_2} ", IMEI_3, IMEI_1, "", IMEI_4],
+        }
+    )
+
+
+def mapa_custos():
+    return {
+        IMEI_1: COMPRA_IMEI_1,
+        IMEI_4: {"custo_aquisicao": 0, "documento": "9004"},
+    }
+
+
+def test_desdobra_ate_o_saldo_e_completa_com_o_restante():
+    resultado = sync_estoque.desdobrar_por_imei(estoque(), seriais(), mapa_custos())
+
+    assert resultado.index.tolist() == [10, 10, 11, 11, 12, 13]
+    assert resultado["SERIAL"].tolist() == [IMEI_1, IMEI_2, IMEI_4, "", "", ""]
+    assert resultado["QUANTIDADE"].tolist() == [1.0, 1.0, 1.0, 2.0, 1.0, 5.0]
+    assert resultado["TIPO_ESTOQUE"].tolist() == [
+        "ESTOQUE", "ESTOQUE", "ESTOQUE", "ESTOQUE", "AMOSTRA", "ESTOQUE",
+    ]
+    assert resultado["CUSTO_SERIAL_STATUS"].tolist() == [
+        "CUSTO_EXATO_ENCONTRADO",
+        "CUSTO_NAO_ENCONTRADO",
+        "CUSTO_NAO_ENCONTRADO",
+        "SEM_IMEI",
+        "SEM_IMEI",
+        "SEM_IMEI",
+    ]
+
+
+def test_amostra_nao_recebe_imei_do_estoque():
+    # Os seriais do produto 10 existem, mas a linha AMOSTRA segue agregada.
+    resultado = sync_estoque.desdobrar_por_imei(estoque(), seriais(), mapa_custos())
+    amostra = resultado.loc[[12]]
+
+    assert amostra["SERIAL"].tolist() == [""]
+    assert amostra["QUANTIDADE"].tolist() == [1.0]
+    assert amostra["CUSTO_SERIAL_ENTRADA"].tolist() == [0.0]
+
+
+def test_colunas_de_compra_vem_do_mapa_de_custos():
+    resultado = sync_estoque.desdobrar_por_imei(estoque(), seriais(), mapa_custos())
+    primeira = resultado.iloc[0]
+
+    assert primeira["CUSTO_SERIAL_ENTRADA"] == 1500.0
+    assert primeira["CUSTO_SERIAL_ORIGEM"] == "custo_unitario"
+    assert primeira["DOCUMENTO_COMPRA"] == "9001"
+    assert primeira["CNPJ_COMPRA"] == "99"
+    assert primeira["IDENTIFICADOR_COMPRA"] == "ID-9001"
+    assert primeira["TRANSACAO_COMPRA"] == "77"
+    assert primeira["DATA_COMPRA"] == "2025-01-10"
+
+    # Serial com custo zero no mapa: documento preenchido, status sem custo.
+    imei_4 = resultado.iloc[2]
+    assert imei_4["CUSTO_SERIAL_ENTRADA"] == 0.0
+    assert imei_4["DOCUMENTO_COMPRA"] == "9004"
+    assert imei_4["CUSTO_SERIAL_ORIGEM"] == ""
+
+    # Linhas sem IMEI ficam com as colunas de compra vazias.
+    for coluna in sync_estoque.CAMPOS_COMPRA_IMEI:
+        assert resultado.iloc[3:][coluna].tolist() == ["", "", ""]
+
+
+def test_custos_por_serial_consulta_o_mapa_pela_chave_normalizada():
+    entrada = pd.Series([f"{IMEI_1[:5]}-{IMEI_1[5:]}", IMEI_2], index=[7, 8])
+
+    custos = sync_estoque.custos_por_serial(entrada, mapa_custos())
+
+    assert custos.index.tolist() == [7, 8]
+    assert custos["CUSTO_SERIAL_ENTRADA"].tolist() == [1500.0, 0.0]
+    assert custos["DOCUMENTO_COMPRA"].tolist() == ["9001", ""]
@@ -0,0 +1,219 @@
+"""
+Índice local de LinxMovimentoSerial (sync_estoque.varrer_loja_indice): a
+cobertura gravada por loja precisa refletir só as faixas realmente baixadas.
+"""
+
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import sync_estoque
+
+CNPJ = "123"
+
+
+class ApiSeriais:
+    """
+    LinxMovimentoSerial em memória: `movimentos` por data, paginados por
+    timestamp. `falhar` lista as datas iniciais cujas chamadas dão erro.
+    """
+
+    def __init__(self, movimentos: list[dict], tamanho_pagina: int = 2):
+        self.movimentos = movimentos
+        self.tamanho_pagina = tamanho_pagina
+        self.falhar: set[str] = set()
+        self.chamadas: list[dict] = []
+
+    def __call__(self, metodo, parametros, timeout=180):
+        assert metodo == "LinxMovimentoSerial"
+        self.chamadas.append(parametros)
+
+        if parametros["data_inicial"] in self.falhar:
+            return None
+
+        ts = int(parametros["timestamp"])
+        pagina = [
+            movimento
+            for movimento in sorted(self.movimentos, key=lambda m: m["timestamp"])
+            if parametros["data_inicial"] <= movimento["data_documento"] <= parametros["data_fim"]
+            and movimento["timestamp"] > ts
+        ][: self.tamanho_pagina]
+        return pd.DataFrame(pagina)
+
+
+def movimento(serial, data, ts):
+    return {
+        "serial": serial,
+        "identificador": f"ID-{serial}",
+        "transacao": "1",
+        "data_documento": data,
+        "timestamp": ts,
+    }
+
+
+@pytest.fixture
+def api(monkeypatch):
+    api = ApiSeriais(
+        [
+            movimento("111111111111111", "2023-05-10", 10),
+            movimento("222222222222222", "2023-08-01", 20),
+            movimento("333333333333333", "2023-11-20", 30),
+            movimento("444444444444444", "2024-03-02", 500),
+        ]
+    )
+    monkeypatch.setattr(sync_estoque, "consultar_api_metodo", api)
+    monkeypatch.setattr(sync_estoque, "CNPJS", [CNPJ])
+    monkeypatch.setattr(sync_estoque, "log", lambda *args, **kwargs: None)
+    return api
+
+
+COBERTA = [date(2024, 1, 1), date(2024, 6, 30), 500]
+
+
+def varrer(faixas):
+    lotes: list[list[tuple]] = []
+    faixas = sync_estoque.varrer_loja_indice(
+        CNPJ,
+        faixas,
+        date(2023, 1, 1),
+        date(2024, 6, 30),
+        atualizar=False,
+        gravar_linhas=lotes.append,
+    )
+    return [linha for lote in lotes for linha in lote], faixas
+
+
+def test_falha_na_primeira_pagina_nao_vira_cobertura(api):
+    api.falhar.add("2023-01-01")
+
+    linhas, faixas = varrer([list(COBERTA)])
+
+    assert linhas == []
+    assert faixas == [COBERTA]
+
+
+def test_trecho_que_falhou_e_baixado_na_execucao_seguinte(api):
+    api.falhar.add("2023-01-01")
+    _, faixas = varrer([list(COBERTA)])
+
+    api.falhar.clear()
+    linhas, faixas = varrer(faixas)
+
+    assert sorted(linha[0] for linha in linhas) == [
+        "111111111111111",
+        "222222222222222",
+        "333333333333333",
+    ]
+    assert faixas == [[date(2023, 1, 1), date(2024, 6, 30), 30]]
+
+
+def test_falha_no_meio_da_paginacao_nao_vira_cobertura(api, monkeypatch):
+    chamar = api.__call__
+
+    def falhar_na_segunda_pagina(metodo, parametros, timeout=180):
+        if parametros["timestamp"] != "0":
+            return None
+        return chamar(metodo, parametros, timeout)
+
+    monkeypatch.setattr(sync_estoque, "consultar_api_metodo", falhar_na_segunda_pagina)
+
+    _, faixas = varrer([list(COBERTA)])
+
+    assert faixas == [COBERTA]
+
+
+def test_trecho_vazio_nao_limita_a_faixa_vizinha(api):
+    api.movimentos = [movimento("444444444444444", "2024-03-02", 500)]
+
+    linhas, faixas = varrer([list(COBERTA)])
+
+    assert linhas == []
+    assert faixas == [[date(2023, 1, 1), date(2024, 6, 30), 500]]
+
+
+def test_linhas_sao_entregues_pagina_a_pagina(api):
+    lotes: list[list[tuple]] = []
+
+    sync_estoque.varrer_loja_indice(
+        CNPJ,
+        [],
+        date(2023, 1, 1),
+        date(2024, 6, 30),
+        atualizar=False,
+        gravar_linhas=lotes.append,
+    )
+
+    assert [len(lote) for lote in lotes] == [2, 2]
+
+
+def test_atualizar_indice_grava_linhas_e_cobertura(api, monkeypatch, tmp_path):
+    monkeypatch.setattr(sync_estoque, "CUSTO_IMEI_CACHE", tmp_path / "custos.sqlite")
+    monkeypatch.setattr(sync_estoque, "CNPJS", [CNPJ, "456"])
+    conexao = sync_estoque.inicializar_cache_custos()
+
+    sync_estoque.atualizar_indice_seriais(conexao, date(2023, 1, 1), date(2024, 6, 30), set())
+
+    seriais = conexao.execute(
+        "SELECT cnpj_emp, COUNT(*) FROM movimento_serial GROUP BY cnpj_emp ORDER BY cnpj_emp"
+    ).fetchall()
+    cobertura = conexao.execute(
+        "SELECT cnpj_emp, data_inicial, data_final, ultimo_timestamp "
+        "FROM movimento_serial_cobertura ORDER BY cnpj_emp"
+    ).fetchall()
+
+    assert [tuple(linha) for linha in seriais] == [(CNPJ, 4), ("456", 4)]
+    assert [tuple(linha) for linha in cobertura] == [
+        (CNPJ, "2023-01-01", "2024-06-30", 500),
+        ("456", "2023-01-01", "2024-06-30", 500),
+    ]
+
+
+@pytest.fixture
+def busca_custos(api, monkeypatch, tmp_path):
+    """
+    obter_mapa_custos_imei com uma janela só, sem caches legados nem
+    auditoria. Devolve os seriais cujos movimentos foram avaliados.
+    """
+    monkeypatch.setattr(sync_estoque, "CUSTO_IMEI_CACHE", tmp_path / "custos.sqlite")
+    monkeypatch.setattr(sync_estoque, "CUSTO_IMEI_ATUALIZAR_API", True)
+    monkeypatch.setattr(
+        sync_estoque, "gerar_janelas_historicas", lambda: [(date(2023, 1, 1), date(2024, 6, 30))]
+    )
+    for nome in ("importar_caches_legados", "importar_mapas_csv", "salvar_auditoria_custos_imei"):
+        monkeypatch.setattr(sync_estoque, nome, lambda *args, **kwargs: None)
+
+    avaliados: list[set[str]] = []
+
+    def resolver(conexao, movimentos, produto_por_serial):
+        avaliados.append(set(movimentos["serial_normalizado"]))
+        return 0
+
+    monkeypatch.setattr(sync_estoque, "resolver_custos_dos_movimentos", resolver)
+
+    # Índice já cobrindo a janela e o serial em backoff, sem movimentos.
+    conexao = sync_estoque.inicializar_cache_custos()
+    sync_estoque.atualizar_indice_seriais(conexao, date(2023, 1, 1), date(2024, 6, 30), set())
+    sync_estoque.registrar_misses_custo(
+        conexao, {"555555555555555"}, 0, date(2023, 1, 1), date(2024, 6, 30), {}
+    )
+    conexao.close()
+
+    def buscar():
+        avaliados.clear()
+        sync_estoque.obter_mapa_custos_imei(
+            pd.DataFrame({"serial": ["555555555555555"], "codigoproduto": ["10"]})
+        )
+        return avaliados
+
+    return buscar
+
+
+def test_serial_em_backoff_fica_pulado_sem_movimento_novo(busca_custos):
+    assert busca_custos() == []
+
+
+def test_movimento_novo_tira_o_serial_do_backoff_na_mesma_execucao(api, busca_custos):
+    api.movimentos.append(movimento("555555555555555", "2024-05-15", 600))
+
+    assert busca_custos() == [{"555555555555555"}]
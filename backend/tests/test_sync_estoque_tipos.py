@@ -0,0 +1,166 @@
+"""
+Equivalência entre a classificação vetorizada de tipo de estoque
+(identificar_tipo_estoque / expandir_quantidades_por_tipo) e as versões
+linha a linha que ela substituiu, copiadas abaixo como referência.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sync_estoque
+from sync_estoque import _primeira_coluna_existente, normalizar_tipo_estoque, to_float
+
+
+def identificar_tipo_estoque_linha(row):
+    candidatos_exatos = [
+        "tipo_estoque",
+        "estoque_tipo",
+        "stock_type",
+        "tipo_saldo",
+        "deposito",
+        "nome_deposito",
+        "descricao_deposito",
+        "desc_deposito",
+        "deposito_descricao",
+        "local_estoque",
+        "origem_estoque",
+        "classificacao_estoque",
+        "status_estoque",
+        "aba_origem",
+        "sheet_name",
+    ]
+
+    for coluna in candidatos_exatos:
+        if coluna in row.index:
+            tipo = normalizar_tipo_estoque(row.get(coluna))
+            if tipo != "ESTOQUE":
+                return tipo
+
+    for coluna in row.index:
+        nome_coluna = str(coluna or "").strip().lower()
+        if any(termo in nome_coluna for termo in ["deposit", "estoque", "amostra", "doa", "mostruario"]):
+            tipo = normalizar_tipo_estoque(row.get(coluna))
+            if tipo != "ESTOQUE":
+                return tipo
+
+    return "ESTOQUE"
+
+
+def copiar_linha(row):
+    # row.copy() da versão original. No pandas 3 a linha de um quadro só de
+    # textos é str (e volta a ser ao ganhar rótulo novo), o que recusa a
+    # quantidade em float; por isso as colunas finais já entram como object.
+    colunas = list(row.index) + [c for c in ("TIPO_ESTOQUE", "QUANTIDADE") if c not in row.index]
+    return row.astype(object).reindex(colunas)
+
+
+def expandir_quantidades_por_tipo_linha(df):
+    if df is None or df.empty:
+        return df
+
+    col_estoque = _primeira_coluna_existente(df, [
+        "estoque", "qtd_estoque", "quantidade_estoque", "saldo_estoque"
+    ])
+    col_amostra = _primeira_coluna_existente(df, [
+        "amostra", "qtd_amostra", "quantidade_amostra", "saldo_amostra"
+    ])
+    col_doa = _primeira_coluna_existente(df, [
+        "doa", "qtd_doa", "quantidade_doa", "saldo_doa"
+    ])
+
+    if not any([col_estoque, col_amostra, col_doa]):
+        return df
+
+    linhas = []
+    for _, row in df.iterrows():
+        quantidade_generica = float(to_float([row.get("QUANTIDADE", row.get("quantidade", 0))]).iloc[0])
+
+        quantidades = {
+            "ESTOQUE": float(to_float([row.get(col_estoque, quantidade_generica) if col_estoque else quantidade_generica]).iloc[0]),
+            "AMOSTRA": float(to_float([row.get(col_amostra, 0) if col_amostra else 0]).iloc[0]),
+            "DOA": float(to_float([row.get(col_doa, 0) if col_doa else 0]).iloc[0]),
+        }
+
+        adicionou = False
+        for tipo, quantidade in quantidades.items():
+            if quantidade <= 0:
+                continue
+            nova = copiar_linha(row)
+            nova["TIPO_ESTOQUE"] = tipo
+            nova["QUANTIDADE"] = quantidade
+            linhas.append(nova)
+            adicionou = True
+
+        if not adicionou:
+            nova = copiar_linha(row)
+            nova["TIPO_ESTOQUE"] = normalizar_tipo_estoque(row.get("TIPO_ESTOQUE", "ESTOQUE"))
+            nova["QUANTIDADE"] = quantidade_generica
+            linhas.append(nova)
+
+    return pd.DataFrame(linhas)
+
+
+TEXTOS_TIPO = [
+    "Amostra", "DOA", "estoque", "Mostruário", "Demonstração", "Exposição",
+    "loja d.o.a", "DOA Central", "Central DOA", "DOAÇÃO", None, "", np.nan, 0,
+]
+QUANTIDADES = ["3", "1,5", "2.000,00", 0, -1, None, np.nan, "abc", 2.0, "0", 7]
+
+COLUNAS_TIPO = [
+    "tipo_estoque", "deposito", "nome_deposito", "local_estoque", "Depósito Loja",
+    "aba_origem", "observacao", "TIPO_ESTOQUE",
+]
+COLUNAS_QUANTIDADE = [
+    "estoque", "qtd_estoque", "Amostra", "saldo_amostra", "DOA", "qtd_doa",
+    "QUANTIDADE", "quantidade",
+]
+
+
+def quadro_aleatorio(rng: np.random.Generator) -> pd.DataFrame:
+    n = int(rng.integers(1, 12))
+    colunas = list(
+        rng.choice(COLUNAS_TIPO + COLUNAS_QUANTIDADE, size=int(rng.integers(1, 7)), replace=False)
+    )
+    dados = {"CODIGO_PRODUTO": [f"P{i}" for i in range(n)]}
+
+    for coluna in colunas:
+        valores = TEXTOS_TIPO if coluna in COLUNAS_TIPO else QUANTIDADES
+        dados[coluna] = [valores[i] for i in rng.integers(0, len(valores), n)]
+
+    return pd.DataFrame(dados, index=rng.permutation(np.arange(100, 100 + n)), dtype=object)
+
+
+def como_object(df: pd.DataFrame) -> pd.DataFrame:
+    # No pandas 3 o DataFrame montado pela referência infere colunas str e
+    # troca None por NaN; ausentes ficam todos None para comparar.
+    df = df.astype(object)
+    return df.where(df.notna(), None)
+
+
+QUADROS = [quadro_aleatorio(np.random.default_rng(seed)) for seed in range(120)]
+
+
+@pytest.mark.parametrize("quadro", QUADROS)
+def test_identificar_tipo_estoque_igual_ao_linha_a_linha(quadro):
+    esperado = quadro.apply(identificar_tipo_estoque_linha, axis=1)
+
+    resultado = sync_estoque.identificar_tipo_estoque(quadro)
+
+    assert resultado.index.equals(quadro.index)
+    assert resultado.tolist() == esperado.tolist()
+
+
+@pytest.mark.parametrize("quadro", QUADROS)
+def test_expandir_quantidades_igual_ao_linha_a_linha(quadro):
+    esperado = expandir_quantidades_por_tipo_linha(quadro)
+
+    resultado = sync_estoque.expandir_quantidades_por_tipo(quadro)
+
+    pd.testing.assert_frame_equal(como_object(resultado), como_object(esperado), check_dtype=False)
+
+
+def test_base_sem_colunas_de_quantidade_por_tipo_volta_intacta():
+    quadro = pd.DataFrame({"CODIGO_PRODUTO": ["A"], "QUANTIDADE": [3]})
+
+    assert sync_estoque.expandir_quantidades_por_tipo(quadro) is quadro
@@ -44,8 +44,20 @@ type DailyRow = {
   status: string;
   qtdPrevista: number;
   qtdExtrato: number;
-  detalhesPrevisto: string;
-  detalhesExtrato: string;
+  detalhesPrevisto?: string;
+  detalhesExtrato?: string;
+};
+
+type DetalheItem = {
+  detalhe: string;
+  valor: number;
+};
+
+type DetalhesDia = {
+  loading: boolean;
+  error?: string;
+  previsto: DetalheItem[];
+  extrato: DetalheItem[];
 };
 
 type RecebimentoResponse = {
@@ -54,6 +66,7 @@ type RecebimentoResponse = {
   persistedAt?: string;
   processedBy?: string;
   fileName?: string;
+  arquivoId?: string;
   resumo?: {
     totalProjetado: number;
     totalExtrato: number;
@@ -174,6 +187,10 @@ function splitDetails(details: string) {
     .filter(Boolean);
 }
 
+function formatDetalheItem(item: DetalheItem) {
+  return `${item.detalhe || 'Sem descrição'} — ${formatCurrency(item.valor)}`;
+}
+
 function differenceClass(value: number) {
   return value >= 0 ? 'text-green-700' : 'text-red-700';
 }
@@ -183,6 +200,7 @@ export default function RecebimentoCartao({ currentUser }: Props) {
   const [resultado, setResultado] = useState<RecebimentoResponse | null>(null);
   const [expandedMonths, setExpandedMonths] = useState<Record<string, boolean>>({});
   const [expandedDays, setExpandedDays] = useState<Record<string, boolean>>({});
+  const [detalhesDia, setDetalhesDia] = useState<Record<string, DetalhesDia>>({});
   const [query, setQuery] = useState('');
   const [statusFilter, setStatusFilter] = useState<'TODOS' | 'OK' | 'PGT MAIOR' | 'PGT MENOR'>('TODOS');
   const [loading, setLoading] = useState(false);
@@ -318,6 +336,10 @@ export default function RecebimentoCartao({ currentUser }: Props) {
     }
   }
 
+  useEffect(() => {
+    setDetalhesDia({});
+  }, [resultado?.arquivoId]);
+
   useEffect(() => {
     carregarUltimoResultado();
     // eslint-disable-next-line react-hooks/exhaustive-deps
@@ -474,8 +496,57 @@ export default function RecebimentoCartao({ currentUser }: Props) {
     setExpandedMonths((prev) => ({ ...prev, [mes]: !prev[mes] }));
   }
 
+  async function carregarDetalhesDia(data: string) {
+    if (!currentUser?.id || !resultado?.arquivoId) return;
+
+    setDetalhesDia((prev) => ({ ...prev, [data]: { loading: true, previsto: [], extrato: [] } }));
+
+    try {
+      const params = new URLSearchParams({
+        userId: String(currentUser.id),
+        arquivoId: resultado.arquivoId,
+        data,
+      });
+
+      const response = await fetch(`${API_URL}/api/financeiro/recebimento-cartao/detalhes?${params.toString()}`);
+      const payload = await response.json().catch(() => null);
+
+      if (!response.ok || !payload?.ok) {
+        throw new Error(payload?.error || 'Não foi possível carregar os detalhes do dia.');
+      }
+
+      setDetalhesDia((prev) => ({
+        ...prev,
+        [data]: {
+          loading: false,
+          previsto: payload.previsto || [],
+          extrato: payload.extrato || [],
+        },
+      }));
+    } catch (err: any) {
+      setDetalhesDia((prev) => ({
+        ...prev,
+        [data]: {
+          loading: false,
+          error: err?.message || 'Erro ao carregar detalhes do dia.',
+          previsto: [],
+          extrato: [],
+        },
+      }));
+    }
+  }
+
   function toggleDay(data: string) {
+    const abrindo = !expandedDays[data];
     setExpandedDays((prev) => ({ ...prev, [data]: !prev[data] }));
+
+    // Detalhes por dia vêm sob demanda; resultados antigos ainda trazem inline.
+    const day = dailyRows.find((row) => row.data === data);
+    const temInline = day?.detalhesPrevisto !== undefined || day?.detalhesExtrato !== undefined;
+
+    if (abrindo && !temInline && !detalhesDia[data]) {
+      carregarDetalhesDia(data);
+    }
   }
 
   if (!isAdminUser) {
@@ -795,6 +866,7 @@ export default function RecebimentoCartao({ currentUser }: Props) {
               setStatusFilter={setStatusFilter}
               toggleMonth={toggleMonth}
               toggleDay={toggleDay}
+              detalhesDia={detalhesDia}
             />
           </div>
         )}
@@ -920,6 +992,7 @@ type MotorProps = {
   setStatusFilter: React.Dispatch<React.SetStateAction<'TODOS' | 'OK' | 'PGT MAIOR' | 'PGT MENOR'>>;
   toggleMonth: (mes: string) => void;
   toggleDay: (data: string) => void;
+  detalhesDia: Record<string, DetalhesDia>;
 };
 
 function MotorConsolidado({
@@ -935,6 +1008,7 @@ function MotorConsolidado({
   setStatusFilter,
   toggleMonth,
   toggleDay,
+  detalhesDia,
 }: MotorProps) {
   return (
     <section className="space-y-4">
@@ -1087,6 +1161,15 @@ function MotorConsolidado({
                                         ) : (
                                           rowsForMonth.map((day) => {
                                             const isExpanded = Boolean(expandedDays[day.data]);
+                                            const detalhes = detalhesDia[day.data];
+                                            const previstoItems =
+                                              day.detalhesPrevisto !== undefined
+                                                ? splitDetails(day.detalhesPrevisto)
+                                                : (detalhes?.previsto || []).map(formatDetalheItem);
+                                            const extratoItems =
+                                              day.detalhesExtrato !== undefined
+                                                ? splitDetails(day.detalhesExtrato)
+                                                : (detalhes?.extrato || []).map(formatDetalheItem);
 
                                             return (
                                               <React.Fragment key={day.data}>
@@ -1121,7 +1204,9 @@ function MotorConsolidado({
                                                           title={`Detalhes previsto (${day.qtdPrevista})`}
                                                           icon={<CalendarDays size={14} />}
                                                           color="emerald"
-                                                          details={day.detalhesPrevisto}
+                                                          items={previstoItems}
+                                                          loading={detalhes?.loading}
+                                                          error={detalhes?.error}
                                                           emptyText="Sem detalhes previstos."
                                                         />
 
@@ -1129,7 +1214,9 @@ function MotorConsolidado({
                                                           title={`Detalhes extrato (${day.qtdExtrato})`}
                                                           icon={<Database size={14} />}
                                                           color="blue"
-                                                          details={day.detalhesExtrato}
+                                                          items={extratoItems}
+                                                          loading={detalhes?.loading}
+                                                          error={detalhes?.error}
                                                           emptyText="Sem detalhes no extrato."
                                                         />
                                                       </div>
@@ -1175,12 +1262,13 @@ type DetalhesBoxProps = {
   title: string;
   icon: React.ReactNode;
   color: 'emerald' | 'blue';
-  details: string;
+  items: string[];
+  loading?: boolean;
+  error?: string;
   emptyText: string;
 };
 
-function DetalhesBox({ title, icon, color, details, emptyText }: DetalhesBoxProps) {
-  const items = splitDetails(details);
+function DetalhesBox({ title, icon, color, items, loading, error, emptyText }: DetalhesBoxProps) {
   const colorClasses =
     color === 'emerald'
       ? 'border-emerald-100 bg-emerald-50/40 text-emerald-800'
@@ -1194,7 +1282,14 @@ function DetalhesBox({ title, icon, color, details, emptyText }: DetalhesBoxProp
       </div>
 
       <div className="max-h-52 space-y-1 overflow-y-auto text-xs text-slate-700">
-        {items.length === 0 ? (
+        {loading ? (
+          <div className="inline-flex items-center gap-2 text-slate-400">
+            <Loader2 className="animate-spin" size={14} />
+            Carregando...
+          </div>
+        ) : error ? (
+          <div className="text-red-600">{error}</div>
+        ) : items.length === 0 ? (
           <div className="text-slate-400">{emptyText}</div>
         ) : (
           items.map((item, index) => (